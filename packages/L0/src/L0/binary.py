@@ -0,0 +1,25 @@
+from util.binary import Codec
+
+from .syntax import (
+    Address,
+    Allocate,
+    Branch,
+    Call,
+    Copy,
+    Halt,
+    Immediate,
+    Load,
+    Primitive,
+    Procedure,
+    Program,
+    Store,
+)
+
+"""
+L0 programs in the binary IR format (see util.binary).
+"""
+
+CODEC = Codec(
+    "l0",
+    [Program, Procedure, Copy, Immediate, Primitive, Branch, Allocate, Load, Store, Address, Call, Halt],
+)
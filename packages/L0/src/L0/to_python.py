@@ -2,7 +2,8 @@ import ast
 from ast import stmt
 from functools import partial
 
-from util.encode import encode
+from util.symbols import encoded, with_symbols
+from util.traverse import Traversal, Visit
 
 from .syntax import (
     Address,
@@ -22,134 +23,163 @@ from .syntax import (
 
 
 def load(name: str) -> ast.Name:
-    return ast.Name(id=encode(name), ctx=ast.Load())
+    return ast.Name(id=encoded(name), ctx=ast.Load())
 
 
 def store(name: str) -> ast.Name:
-    return ast.Name(id=encode(name), ctx=ast.Store())
+    return ast.Name(id=encoded(name), ctx=ast.Store())
 
 
+@with_symbols
 def to_ast_statement(
     term: Statement,
 ) -> list[ast.stmt]:
-    _statement: partial[list[stmt]] = partial(to_ast_statement)
-
-    match term:
-        case Copy(destination=destination, source=source, then=then):
-            return [
-                ast.Assign(targets=[store(destination)], value=load(source)),
-                *_statement(then),
-            ]
-
-        case Immediate(destination=destination, value=value, then=then):
-            return [
-                ast.Assign(targets=[store(destination)], value=ast.Constant(value=value)),
-                *_statement(then),
-            ]
-
-        case Primitive(destination=destination, operator=operator, left=left, right=right, then=then):
-            match operator:
-                case "+":
-                    op = ast.Add()
-
-                case "-":
-                    op = ast.Sub()
-
-                case "*":  # pragma: no branch
-                    op = ast.Mult()
-
-            return [
-                ast.Assign(
-                    targets=[store(destination)],
-                    value=ast.BinOp(
-                        left=load(left),
-                        op=op,
-                        right=load(right),
-                    ),
-                ),
-                *_statement(then),
-            ]
-
-        case Branch(operator=operator, left=left, right=right, then=then, otherwise=otherwise):
-            match operator:
-                case "<":
-                    op = ast.Lt()
-
-                case "==":  # pragma: no branch
-                    op = ast.Eq()
-
-            return [
-                ast.If(
-                    test=ast.Compare(
-                        left=load(left),
-                        ops=[op],
-                        comparators=[load(right)],
-                    ),
-                    body=_statement(then),
-                    orelse=_statement(otherwise),
-                ),
-            ]
-
-        case Allocate(destination=destination, count=count, then=then):
-            return [
-                ast.Assign(
-                    targets=[store(destination)],
-                    value=ast.List(
-                        elts=[ast.Constant(None) for _ in range(count)],
-                        ctx=ast.Load(),
-                    ),
-                ),
-                *_statement(then),
-            ]
-
-        case Load(destination=destination, base=base, index=index, then=then):
-            return [
-                ast.Assign(
-                    targets=[store(destination)],
-                    value=ast.Subscript(
-                        value=load(base),
-                        slice=ast.Constant(index),
-                        ctx=ast.Load(),
-                    ),
-                ),
-                *_statement(then),
-            ]
-
-        case Store(base=base, index=index, value=value, then=then):
-            return [
-                ast.Assign(
-                    targets=[
-                        ast.Subscript(
-                            value=store(base),
-                            slice=ast.Constant(index),
-                            ctx=ast.Store(),
-                        )
-                    ],
-                    value=load(value),
-                ),
-                *_statement(then),
-            ]
-
-        case Address(destination=destination, name=name, then=then):
-            return [
-                ast.Assign(targets=[store(destination)], value=load(name)),
-                *_statement(then),
-            ]
-
-        case Call(target=target, arguments=arguments):
-            return [
-                ast.Return(
-                    value=ast.Call(
-                        func=load(target),
-                        args=[load(argument) for argument in arguments],
-                    )
+    # The handlers build each block backwards, appending a statement to the block of its
+    # then, so a long chain costs linear time rather than a copy per statement.
+    return _to_ast_statement(term)[::-1]
+
+
+def _copy(term: Copy) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(ast.Assign(targets=[store(term.destination)], value=load(term.source)))
+    return block
+
+
+def _immediate(term: Immediate) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(ast.Assign(targets=[store(term.destination)], value=ast.Constant(value=term.value)))
+    return block
+
+
+def _primitive(term: Primitive) -> Visit[list[ast.stmt]]:
+    match term.operator:
+        case "+":
+            op = ast.Add()
+
+        case "-":
+            op = ast.Sub()
+
+        case "*":  # pragma: no branch
+            op = ast.Mult()
+
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[store(term.destination)],
+            value=ast.BinOp(
+                left=load(term.left),
+                op=op,
+                right=load(term.right),
+            ),
+        )
+    )
+    return block
+
+
+def _branch(term: Branch) -> Visit[list[ast.stmt]]:
+    match term.operator:
+        case "<":
+            op = ast.Lt()
+
+        case "==":  # pragma: no branch
+            op = ast.Eq()
+
+    return [
+        ast.If(
+            test=ast.Compare(
+                left=load(term.left),
+                ops=[op],
+                comparators=[load(term.right)],
+            ),
+            body=(yield term.then)[::-1],
+            orelse=(yield term.otherwise)[::-1],
+        ),
+    ]
+
+
+def _allocate(term: Allocate) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[store(term.destination)],
+            value=ast.List(
+                elts=[ast.Constant(None) for _ in range(term.count)],
+                ctx=ast.Load(),
+            ),
+        )
+    )
+    return block
+
+
+def _load(term: Load) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[store(term.destination)],
+            value=ast.Subscript(
+                value=load(term.base),
+                slice=ast.Constant(term.index),
+                ctx=ast.Load(),
+            ),
+        )
+    )
+    return block
+
+
+def _store(term: Store) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[
+                ast.Subscript(
+                    value=store(term.base),
+                    slice=ast.Constant(term.index),
+                    ctx=ast.Store(),
                 )
-            ]
+            ],
+            value=load(term.value),
+        )
+    )
+    return block
 
-        case Halt(value=value):  # pragma: no branch
-            return [
-                ast.Return(value=load(value)),
-            ]
+
+def _address(term: Address) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(ast.Assign(targets=[store(term.destination)], value=load(term.name)))
+    return block
+
+
+def _call(term: Call) -> list[ast.stmt]:
+    return [
+        ast.Return(
+            value=ast.Call(
+                func=load(term.target),
+                args=[load(argument) for argument in term.arguments],
+            )
+        )
+    ]
+
+
+def _halt(term: Halt) -> list[ast.stmt]:
+    return [
+        ast.Return(value=load(term.value)),
+    ]
+
+
+_to_ast_statement = Traversal[list[ast.stmt]](
+    {
+        "copy": _copy,
+        "immediate": _immediate,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _allocate,
+        "load": _load,
+        "store": _store,
+        "address": _address,
+        "call": _call,
+        "halt": _halt,
+    }
+)
 
 
 def to_ast_procedure(procedure: Procedure) -> ast.stmt:
@@ -164,6 +194,7 @@ def to_ast_procedure(procedure: Procedure) -> ast.stmt:
             )
 
 
+@with_symbols
 def to_ast_program(
     program: Program,
 ) -> str:
@@ -0,0 +1,67 @@
+from L0.binary import CODEC
+from L0.syntax import (
+    Address,
+    Allocate,
+    Branch,
+    Call,
+    Copy,
+    Halt,
+    Immediate,
+    Load,
+    Primitive,
+    Procedure,
+    Program,
+    Store,
+)
+
+# one of each statement, over two procedures
+PROGRAM = Program(
+    procedures=[
+        Procedure(
+            name="l0", parameters=["a"], body=Address(destination="p", name="f", then=Call(target="p", arguments=["a"]))
+        ),
+        Procedure(
+            name="f",
+            parameters=("n",),
+            body=Copy(
+                destination="b",
+                source="n",
+                then=Immediate(
+                    destination="c",
+                    value=1 << 64,
+                    then=Primitive(
+                        destination="d",
+                        operator="*",
+                        left="b",
+                        right="c",
+                        then=Allocate(
+                            destination="e",
+                            count=1,
+                            then=Store(
+                                base="e",
+                                index=0,
+                                value="d",
+                                then=Load(
+                                    destination="g",
+                                    base="e",
+                                    index=0,
+                                    then=Branch(
+                                        operator="<",
+                                        left="g",
+                                        right="c",
+                                        then=Halt(value="g"),
+                                        otherwise=Call(target="f", arguments=[]),
+                                    ),
+                                ),
+                            ),
+                        ),
+                    ),
+                ),
+            ),
+        ),
+    ],
+)
+
+
+def test_round_trip_every_node():
+    assert CODEC.loads(CODEC.dumps(PROGRAM)) == PROGRAM
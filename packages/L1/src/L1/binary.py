@@ -0,0 +1,24 @@
+from util.binary import Codec
+
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Branch,
+    Copy,
+    Halt,
+    Immediate,
+    Load,
+    Primitive,
+    Program,
+    Store,
+)
+
+"""
+L1 programs in the binary IR format (see util.binary).
+"""
+
+CODEC = Codec(
+    "l1",
+    [Program, Copy, Abstract, Apply, Immediate, Primitive, Branch, Allocate, Load, Store, Halt],
+)
@@ -1,7 +1,7 @@
 import ast
-from functools import partial
 
-from util.encode import encode
+from util.symbols import encoded, with_symbols
+from util.traverse import Traversal, Visit
 
 from .syntax import (
     Abstract,
@@ -20,132 +20,165 @@ from .syntax import (
 
 
 def load(name: str) -> ast.Name:
-    return ast.Name(id=encode(name), ctx=ast.Load())
+    return ast.Name(id=encoded(name), ctx=ast.Load())
 
 
 def store(name: str) -> ast.Name:
-    return ast.Name(id=encode(name), ctx=ast.Store())
+    return ast.Name(id=encoded(name), ctx=ast.Store())
 
 
+@with_symbols
 def to_ast_statement(
     statement: Statement,
 ) -> list[ast.stmt]:
-    _statement = partial(to_ast_statement)
-
-    match statement:
-        case Copy(destination=destination, source=source, then=then):
-            return [
-                ast.Assign(targets=[store(destination)], value=load(source)),
-                *_statement(then),
-            ]
-
-        case Abstract(destination=destination, parameters=parameters, body=body, then=then):
-            return [
-                ast.FunctionDef(
-                    name=encode(destination),
-                    args=ast.arguments(args=[ast.arg(arg=parameter) for parameter in parameters]),
-                    body=_statement(body),
-                ),
-                *_statement(then),
-            ]
-
-        case Apply(target=target, arguments=arguments):
-            return [
-                ast.Return(
-                    ast.Call(
-                        func=load(target),
-                        args=[load(argument) for argument in arguments],
-                    )
+    # The handlers build each block backwards, appending a statement to the block of its
+    # then, so a long chain costs linear time rather than a copy per statement.
+    return _to_ast_statement(statement)[::-1]
+
+
+def _copy(term: Copy) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(ast.Assign(targets=[store(term.destination)], value=load(term.source)))
+    return block
+
+
+def _abstract(term: Abstract) -> Visit[list[ast.stmt]]:
+    body = (yield term.body)[::-1]
+    block = yield term.then
+    block.append(
+        ast.FunctionDef(
+            name=encoded(term.destination),
+            args=ast.arguments(args=[ast.arg(arg=parameter) for parameter in term.parameters]),
+            body=body,
+        )
+    )
+    return block
+
+
+def _apply(term: Apply) -> list[ast.stmt]:
+    return [
+        ast.Return(
+            ast.Call(
+                func=load(term.target),
+                args=[load(argument) for argument in term.arguments],
+            )
+        )
+    ]
+
+
+def _immediate(term: Immediate) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(ast.Assign(targets=[store(term.destination)], value=ast.Constant(value=term.value)))
+    return block
+
+
+def _primitive(term: Primitive) -> Visit[list[ast.stmt]]:
+    match term.operator:
+        case "+":
+            op = ast.Add()
+
+        case "-":
+            op = ast.Sub()
+
+        case "*":  # pragma: no branch
+            op = ast.Mult()
+
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[store(term.destination)],
+            value=ast.BinOp(left=load(term.left), op=op, right=load(term.right)),
+        )
+    )
+    return block
+
+
+def _branch(term: Branch) -> Visit[list[ast.stmt]]:
+    match term.operator:
+        case "<":
+            op = ast.Lt()
+
+        case "==":  # pragma: no branch
+            op = ast.Eq()
+
+    return [
+        ast.If(
+            ast.Compare(left=load(term.left), ops=[op], comparators=[load(term.right)]),
+            body=(yield term.then)[::-1],
+            orelse=(yield term.otherwise)[::-1],
+        ),
+    ]
+
+
+def _allocate(term: Allocate) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[store(term.destination)],
+            value=ast.List(
+                elts=[ast.Constant(None) for _ in range(term.count)],
+                ctx=ast.Load(),
+            ),
+        )
+    )
+    return block
+
+
+def _load(term: Load) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[store(term.destination)],
+            value=ast.Subscript(
+                value=load(term.base),
+                slice=ast.Constant(term.index),
+                ctx=ast.Load(),
+            ),
+        )
+    )
+    return block
+
+
+def _store(term: Store) -> Visit[list[ast.stmt]]:
+    block = yield term.then
+    block.append(
+        ast.Assign(
+            targets=[
+                ast.Subscript(
+                    value=load(term.base),
+                    slice=ast.Constant(term.index),
+                    ctx=ast.Store(),
                 )
-            ]
-
-        case Immediate(destination=destination, value=value, then=then):
-            return [
-                ast.Assign(targets=[store(destination)], value=ast.Constant(value=value)),
-                *_statement(then),
-            ]
-
-        case Primitive(destination=destination, operator=operator, left=left, right=right, then=then):
-            match operator:
-                case "+":
-                    op = ast.Add()
-
-                case "-":
-                    op = ast.Sub()
-
-                case "*":  # pragma: no branch
-                    op = ast.Mult()
-
-            return [
-                ast.Assign(
-                    targets=[store(destination)],
-                    value=ast.BinOp(left=load(left), op=op, right=load(right)),
-                ),
-                *_statement(then),
-            ]
-
-        case Branch(operator=operator, left=left, right=right, then=then, otherwise=otherwise):
-            match operator:
-                case "<":
-                    op = ast.Lt()
-
-                case "==":  # pragma: no branch
-                    op = ast.Eq()
-
-            return [
-                ast.If(
-                    ast.Compare(left=load(left), ops=[op], comparators=[load(right)]),
-                    body=_statement(then),
-                    orelse=_statement(otherwise),
-                ),
-            ]
-
-        case Allocate(destination=destination, count=count, then=then):
-            return [
-                ast.Assign(
-                    targets=[store(destination)],
-                    value=ast.List(
-                        elts=[ast.Constant(None) for _ in range(count)],
-                        ctx=ast.Load(),
-                    ),
-                ),
-                *_statement(then),
-            ]
-
-        case Load(destination=destination, base=base, index=index, then=then):
-            return [
-                ast.Assign(
-                    targets=[store(destination)],
-                    value=ast.Subscript(
-                        value=load(base),
-                        slice=ast.Constant(index),
-                        ctx=ast.Load(),
-                    ),
-                ),
-                *_statement(then),
-            ]
-
-        case Store(base=base, index=index, value=value, then=then):
-            return [
-                ast.Assign(
-                    targets=[
-                        ast.Subscript(
-                            value=load(base),
-                            slice=ast.Constant(index),
-                            ctx=ast.Store(),
-                        )
-                    ],
-                    value=load(value),
-                ),
-                *_statement(then),
-            ]
-
-        case Halt(value=value):  # pragma: no branch
-            return [
-                ast.Return(value=load(value)),
-            ]
+            ],
+            value=load(term.value),
+        )
+    )
+    return block
+
+
+def _halt(term: Halt) -> list[ast.stmt]:
+    return [
+        ast.Return(value=load(term.value)),
+    ]
+
+
+_to_ast_statement = Traversal[list[ast.stmt]](
+    {
+        "copy": _copy,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _immediate,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _allocate,
+        "load": _load,
+        "store": _store,
+        "halt": _halt,
+    }
+)
 
 
+@with_symbols
 def to_ast_program(
     program: Program,
 ) -> str:
@@ -0,0 +1,63 @@
+from L1.binary import CODEC
+from L1.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Branch,
+    Copy,
+    Halt,
+    Immediate,
+    Load,
+    Primitive,
+    Program,
+    Store,
+)
+
+# one of each statement
+PROGRAM = Program(
+    parameters=["a"],
+    body=Abstract(
+        destination="f",
+        parameters=("n", "k"),
+        body=Apply(target="k", arguments=["n"]),
+        then=Copy(
+            destination="b",
+            source="a",
+            then=Immediate(
+                destination="c",
+                value=-7,
+                then=Primitive(
+                    destination="d",
+                    operator="+",
+                    left="b",
+                    right="c",
+                    then=Allocate(
+                        destination="e",
+                        count=1,
+                        then=Store(
+                            base="e",
+                            index=0,
+                            value="d",
+                            then=Load(
+                                destination="g",
+                                base="e",
+                                index=0,
+                                then=Branch(
+                                    operator="==",
+                                    left="g",
+                                    right="c",
+                                    then=Halt(value="g"),
+                                    otherwise=Apply(target="f", arguments=["g", "f"]),
+                                ),
+                            ),
+                        ),
+                    ),
+                ),
+            ),
+        ),
+    ),
+)
+
+
+def test_round_trip_every_node():
+    assert CODEC.loads(CODEC.dumps(PROGRAM)) == PROGRAM
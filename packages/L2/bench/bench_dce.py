@@ -0,0 +1,84 @@
+"""
+Dead code elimination over nested lets, before and after it annotated free variables.
+
+The version before is loaded from BASELINE with git. It asks free_variables about the
+body and every live value of each Let, which walks whatever the memo tables have not
+kept; the pass now takes both from the children it has just rebuilt. Each level of the
+input binds a live name, used by the next level, and a dead one, so every Let is rebuilt.
+
+The memo tables are cleared before each run, and in the second half of the table turned
+off: before, the memo is all that keeps the pass from walking each body again at every
+enclosing Let. Time per level should stay flat as depth grows.
+
+Run with `uv run python packages/L2/bench/bench_dce.py`.
+"""
+
+import subprocess
+import time
+from pathlib import Path
+from types import ModuleType
+
+import L2.dead_code_elim
+from L2.syntax import Immediate, Let, Primitive, Reference, Term
+from util.hash_cons import intern
+from util.memo import IdentityMemo
+
+BASELINE = "c9da1c1"
+
+
+def baseline() -> ModuleType:
+    path = "packages/L2/src/L2/dead_code_elim.py"
+    source = subprocess.run(
+        ["git", "show", f"{BASELINE}:{path}"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+    ).stdout
+    module = ModuleType("L2._baseline_dead_code_elim")
+    module.__package__ = "L2"
+    # the source is this repository's own, at a revision of its history
+    exec(compile(source, path, "exec"), module.__dict__)  # noqa: S102
+    return module
+
+
+def nested(depth: int) -> Term:
+    # let v0 = x, dead0 = 0 in let v1 = (+ v0 x), dead1 = 1 in ... v(depth-1)
+    term: Term = Reference(name=f"v{depth - 1}")
+    for level in reversed(range(depth)):
+        value = (
+            Primitive(operator="+", left=Reference(name=f"v{level - 1}"), right=Reference(name="x"))
+            if level
+            else Reference(name="x")
+        )
+        term = Let(bindings=((f"v{level}", value), (f"dead{level}", Immediate(value=level))), body=term)
+    return intern(term)
+
+
+def run(module: ModuleType, term: Term, memo_size: int) -> float:
+    memos = [value for value in vars(module).values() if isinstance(value, IdentityMemo)]
+    sizes = [memo.max_size for memo in memos]
+    for memo in memos:
+        memo.clear()
+        memo.max_size = memo_size
+    try:
+        start = time.perf_counter()
+        module.dead_code_elimination_term(term)
+        return time.perf_counter() - start
+    finally:
+        for memo, size in zip(memos, sizes, strict=True):
+            memo.max_size = size
+
+
+def main() -> None:
+    old = baseline()
+
+    print(f"{'memo':<6}{'depth':>8}{'before (s)':>12}{'us/level':>10}{'after (s)':>12}{'us/level':>10}")
+    for label, memo_size, depths in [("on", 1 << 16, (1_000, 4_000, 16_000, 64_000)), ("off", 0, (500, 1_000, 2_000))]:
+        for depth in depths:
+            term = nested(depth)
+            before, after = run(old, term, memo_size), run(L2.dead_code_elim, term, memo_size)
+            print(
+                f"{label:<6}{depth:>8}{before:>12.3f}{before / depth * 1e6:>10.1f}"
+                f"{after:>12.3f}{after / depth * 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Peak RSS and pass throughput of the tree and flat representations of L2.
+
+Each measurement runs in a fresh interpreter, so peak RSS is that of one representation
+at one size. The synthetic program is one wide let whose bindings are small branching
+arithmetic terms over earlier bindings, built straight into each representation.
+
+Run with `uv run python packages/L2/bench/bench_flat.py`.
+"""
+
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+
+from L2.branch_elimination import branch_elimination_term
+from L2.constant_folding import constant_folding_term
+from L2.constant_propagation import constant_propagation_term
+from L2.dead_code_elim import dead_code_elimination_term
+from L2.flat import (
+    ALLOCATE,
+    BRANCH,
+    IMMEDIATE,
+    LESS,
+    LET,
+    MINUS,
+    PLUS,
+    PRIMITIVE,
+    REFERENCE,
+    TIMES,
+    FlatProgram,
+    branch_elimination_flat,
+    constant_folding_flat,
+    constant_propagation_flat,
+    dead_code_elimination_flat,
+    unflatten_program,
+)
+from L2.syntax import Allocate, Branch, Immediate, Let, Primitive, Program, Reference, Term
+
+SIZES = (10_000, 100_000, 1_000_000)
+NODES_PER_BINDING = 13
+
+
+def choices(count: int, seed: int = 0) -> list[tuple[int, int, int, int]]:
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(index + 1), rng.randrange(index + 1), rng.randrange(5), rng.randrange(100))
+        for index in range(count)
+    ]
+
+
+def name(index: int) -> str:
+    return "x" if index == 0 else f"v{index}"
+
+
+def tree_program(nodes: int) -> Program:
+    bindings: list[tuple[str, Term]] = []
+    for index, (left, right, constant, limit) in enumerate(choices(nodes // NODES_PER_BINDING)):
+        a, b = Reference(name=name(left)), Reference(name=name(right))
+        value = Branch(
+            operator="<",
+            left=a,
+            right=Immediate(value=limit),
+            consequent=Primitive(
+                operator="+", left=a, right=Primitive(operator="*", left=b, right=Immediate(value=constant))
+            ),
+            otherwise=Primitive(operator="-", left=Allocate(count=1), right=Immediate(value=constant)),
+        )
+        bindings.append((name(index + 1), value))
+    return Program(parameters=("x",), body=Let(bindings=tuple(bindings), body=Reference(name=name(len(bindings)))))
+
+
+def flat_program(nodes: int) -> FlatProgram:
+    flat = FlatProgram()
+    flat.parameters.append(flat.name("x"))
+    values: list[int] = []
+    names: list[int] = []
+    for index, (left, right, constant, limit) in enumerate(choices(nodes // NODES_PER_BINDING)):
+        a = flat.add(REFERENCE, flat.name(name(left)))
+        limit_node = flat.add(IMMEDIATE, limit)
+        a2 = flat.add(REFERENCE, flat.name(name(left)))
+        b = flat.add(REFERENCE, flat.name(name(right)))
+        times = flat.add(PRIMITIVE, TIMES, [b, flat.add(IMMEDIATE, constant)])
+        plus = flat.add(PRIMITIVE, PLUS, [a2, times])
+        minus = flat.add(PRIMITIVE, MINUS, [flat.add(ALLOCATE, 1), flat.add(IMMEDIATE, constant)])
+        values.append(flat.add(BRANCH, LESS, [a, limit_node, plus, minus]))
+        names.append(flat.name(name(index + 1)))
+    body = flat.add(REFERENCE, flat.name(name(len(values))))
+    flat.root = flat.add(LET, flat.bind(names), [*values, body])
+    return flat
+
+
+def peak_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(representation: str, nodes: int) -> None:
+    start = time.perf_counter()
+    if representation == "tree":
+        program = tree_program(nodes)
+        body = program.body
+        passes: list[tuple[str, Callable[[], object]]] = [
+            ("propagation", lambda: constant_propagation_term(body, env={})),
+            ("folding", lambda: constant_folding_term(body, context={})),
+            ("dce", lambda: dead_code_elimination_term(body)),
+            ("branches", lambda: branch_elimination_term(body)),
+        ]
+    else:
+        flat = flat_program(nodes)
+        passes = [
+            ("propagation", lambda: constant_propagation_flat(flat)),
+            ("folding", lambda: constant_folding_flat(flat)),
+            ("dce", lambda: dead_code_elimination_flat(flat)),
+            ("branches", lambda: branch_elimination_flat(flat)),
+        ]
+    report: dict[str, float] = {"build": time.perf_counter() - start, "program_mb": peak_mb()}
+
+    for pass_name, run in passes:
+        start = time.perf_counter()
+        run()
+        report[pass_name] = nodes / (time.perf_counter() - start) / 1e3
+
+    report["peak_mb"] = peak_mb()
+    print(json.dumps(report))
+
+
+def main() -> None:
+    # the two builders produce the same program
+    assert unflatten_program(flat_program(1000)) == tree_program(1000)
+
+    print(f"{'nodes':>9} {'repr':<5}{'build (s)':>10}{'RSS after build':>17}{'peak RSS':>10}", end="")
+    print("   k nodes/s: prop  fold   dce  branch")
+    for nodes in SIZES:
+        for representation in ("tree", "flat"):
+            output = subprocess.run(
+                [sys.executable, __file__, representation, str(nodes)], capture_output=True, text=True, check=True
+            ).stdout
+            r = json.loads(output)
+            print(
+                f"{nodes:>9} {representation:<5}{r['build']:>10.2f}{r['program_mb']:>14.0f} MB{r['peak_mb']:>7.0f} MB"
+                f"{r['propagation']:>18.0f}{r['folding']:>6.0f}{r['dce']:>6.0f}{r['branches']:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        child(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,108 @@
+"""
+Constant folding with its rules in a decision tree, versus the match statements it replaced.
+
+The version before is loaded from BASELINE with git. It tries the cases for a primitive's
+operator one after another; the rules now go through util.rewrite.Rules, which reads each
+position of the operands once. The input is many random arithmetic expressions over a
+few names and small constants, so every rule fires somewhere and many primitives match
+none. Both sides must fold it to the same term; the memo table is cleared before every run.
+
+The last column runs the current pass with EXTRA more rules, none of which fire on the
+input: only the tree's depth on the paths they share with the other rules grows, so it
+should cost about the same as with the rules the pass has.
+
+Run with `uv run python packages/L2/bench/bench_fold.py`.
+"""
+
+import random
+import subprocess
+import time
+from pathlib import Path
+from types import ModuleType
+
+import L2.constant_folding
+from L2.syntax import Begin, Immediate, Primitive, Reference, Term
+from util.hash_cons import cons, intern
+from util.rewrite import Node, Rules, Var
+
+BASELINE = "9ece2a3"
+EXTRA = 300
+
+
+def baseline() -> ModuleType:
+    path = "packages/L2/src/L2/constant_folding.py"
+    source = subprocess.run(
+        ["git", "show", f"{BASELINE}:{path}"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+    ).stdout
+    module = ModuleType("L2._baseline_constant_folding")
+    module.__package__ = "L2"
+    # the source is this repository's own, at a revision of its history
+    exec(compile(source, path, "exec"), module.__dict__)  # noqa: S102
+    return module
+
+
+def expression(generator: random.Random, depth: int) -> Term:
+    if depth == 0 or generator.random() < 0.2:
+        if generator.random() < 0.5:
+            return Reference(name=generator.choice("xyz"))
+        return Immediate(value=generator.randrange(3))
+    return Primitive(
+        operator=generator.choice("+-*"),
+        left=expression(generator, depth - 1),
+        right=expression(generator, depth - 1),
+    )
+
+
+def program(count: int) -> Term:
+    generator = random.Random(count)
+    expressions = [expression(generator, 8) for _ in range(count)]
+    return intern(Begin(effects=tuple(expressions[:-1]), value=expressions[-1]))
+
+
+def extended() -> Rules[Term]:
+    # (+ x (+ c y)) => (+ c (+ x y)) for constants c the input never has
+    a, b = Var("a"), Var("b")
+    extra = [
+        (
+            ("+", a, Node("primitive", operator="+", left=Node("immediate", value=c), right=b)),
+            lambda a, b, c=c: cons(
+                Primitive,
+                operator="+",
+                left=cons(Immediate, value=c),
+                right=cons(Primitive, operator="+", left=a, right=b),
+            ),
+        )
+        for c in range(1_000, 1_000 + EXTRA)
+    ]
+    return Rules[Term](L2.constant_folding.folding_rules() + extra)
+
+
+def run(module: ModuleType, term: Term, repeat: int = 5) -> tuple[float, Term]:
+    best, result = float("inf"), term
+    for _ in range(repeat):
+        module.constant_folding_memo.clear()
+        start = time.perf_counter()
+        result = module.constant_folding_term(term, context={})
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    old, rules = baseline(), extended()
+    current = L2.constant_folding._fold  # pyright: ignore[reportPrivateUsage]
+
+    print(f"{'expressions':>12}{'before (s)':>12}{'after (s)':>11}{'speedup':>9}{f'+{EXTRA} rules (s)':>17}")
+    for count in (250, 1_000, 4_000):
+        term = program(count)
+        (before, expected), (after, folded) = run(old, term), run(L2.constant_folding, term)
+        assert folded == expected
+        try:
+            L2.constant_folding._fold = rules  # pyright: ignore[reportPrivateUsage]
+            more, _ = run(L2.constant_folding, term)
+        finally:
+            L2.constant_folding._fold = current  # pyright: ignore[reportPrivateUsage]
+        print(f"{count:>12}{before:>12.3f}{after:>11.3f}{before / after:>9.2f}{more:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
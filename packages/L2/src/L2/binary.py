@@ -0,0 +1,25 @@
+from util.binary import Codec
+
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+
+"""
+L2 programs in the binary IR format (see util.binary).
+"""
+
+CODEC = Codec(
+    "l2",
+    [Program, Let, Reference, Abstract, Apply, Immediate, Primitive, Branch, Allocate, Load, Store, Begin],
+)
@@ -1,3 +1,7 @@
+from util.hash_cons import rebuild
+from util.memo import IdentityMemo
+from util.traverse import Traversal, Visit, each, memoized
+
 from .syntax import (
     Abstract,
     Allocate,
@@ -19,59 +23,95 @@ operands of the condition are known integer constants at compile time.
 
 """
 
+# Results by node identity: a subterm the optimizer's last round left alone is not walked
+# again.
+branch_elimination_memo = IdentityMemo[Term, Term]()
 
-def branch_elimination_term(term: Term) -> Term:
-    # Recursively eliminate statically-decidable Branch nodes from term
-    recur = branch_elimination_term
-
-    match term:
-        case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            # Recurse into the condition operands first — a nested pass may
-            # have turned them into Immediates that we can now evaluate.
-            left_r = recur(left)
-            right_r = recur(right)
-            match left_r, right_r:
-                case Immediate(value=i1), Immediate(value=i2):
-                    # Both sides of the condition are now known constants.
-                    # Evaluate the condition at compile time and return only
-                    # the branch arm that would have been taken — the other
-                    # arm is unreachable and is dropped entirely.
-                    condition = (i1 < i2) if operator == "<" else (i1 == i2)
-                    return recur(consequent if condition else otherwise)
-                case _:
-                    # Condition is not fully known — keep the Branch but still
-                    # recurse into both arms to clean up anything inside them.
-                    return Branch(
-                        operator=operator,
-                        left=left_r,
-                        right=right_r,
-                        consequent=recur(consequent),
-                        otherwise=recur(otherwise),
-                    )
-
-        case Let(bindings=bindings, body=body):
-            return Let(
-                bindings=tuple((name, recur(val)) for name, val in bindings),
-                body=recur(body),
+
+def _branch(term: Branch) -> Visit[Term]:
+    # Recurse into the condition operands first — a nested pass may
+    # have turned them into Immediates that we can now evaluate.
+    left_r = yield term.left
+    right_r = yield term.right
+    match left_r, right_r:
+        case Immediate(value=i1), Immediate(value=i2):
+            # Both sides of the condition are now known constants.
+            # Evaluate the condition at compile time and return only
+            # the branch arm that would have been taken — the other
+            # arm is unreachable and is dropped entirely.
+            condition = (i1 < i2) if term.operator == "<" else (i1 == i2)
+            return (yield term.consequent if condition else term.otherwise)
+        case _:
+            # Condition is not fully known — keep the Branch but still
+            # recurse into both arms to clean up anything inside them.
+            return rebuild(
+                term,
+                left=left_r,
+                right=right_r,
+                consequent=(yield term.consequent),
+                otherwise=(yield term.otherwise),
             )
 
-        case Abstract(parameters=parameters, body=body):
-            return Abstract(parameters=parameters, body=recur(body))
 
-        case Apply(target=target, arguments=arguments):
-            return Apply(target=recur(target), arguments=tuple(recur(a) for a in arguments))
+def _let(term: Let) -> Visit[Term]:
+    values = yield from each(val for _, val in term.bindings)
+    return rebuild(
+        term,
+        bindings=tuple((name, value) for (name, _), value in zip(term.bindings, values, strict=True)),
+        body=(yield term.body),
+    )
+
+
+def _abstract(term: Abstract) -> Visit[Term]:
+    return rebuild(term, body=(yield term.body))
+
+
+def _apply(term: Apply) -> Visit[Term]:
+    target = yield term.target
+    return rebuild(term, target=target, arguments=tuple((yield from each(term.arguments))))
+
+
+def _primitive(term: Primitive) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left), right=(yield term.right))
 
-        case Primitive(operator=operator, left=left, right=right):
-            return Primitive(operator=operator, left=recur(left), right=recur(right))
 
-        case Load(base=base, index=index):
-            return Load(base=recur(base), index=index)
+def _load(term: Load) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base))
 
-        case Store(base=base, index=index, value=value):
-            return Store(base=recur(base), index=index, value=recur(value))
 
-        case Begin(effects=effects, value=value):
-            return Begin(effects=tuple(recur(e) for e in effects), value=recur(value))
+def _store(term: Store) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base), value=(yield term.value))
 
-        case Immediate() | Reference() | Allocate():  # pragma: no branch
-            return term
+
+def _begin(term: Begin) -> Visit[Term]:
+    effects = yield from each(term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value))
+
+
+def _leaf(term: Immediate | Reference | Allocate) -> Term:
+    return term
+
+
+_branch_elimination = Traversal[Term](
+    memoized(
+        {
+            "branch": _branch,
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "primitive": _primitive,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+            "immediate": _leaf,
+            "reference": _leaf,
+            "allocate": _leaf,
+        },
+        branch_elimination_memo,
+    )
+)
+
+
+def branch_elimination_term(term: Term) -> Term:
+    # Recursively eliminate statically-decidable Branch nodes from term
+    return _branch_elimination(term)
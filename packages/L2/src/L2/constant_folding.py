@@ -1,5 +1,9 @@
-from collections.abc import Mapping
-from functools import partial
+from collections.abc import Callable, Mapping
+
+from util.hash_cons import cons, rebuild
+from util.memo import IdentityMemo
+from util.rewrite import Node, Pattern, Rules, Var
+from util.traverse import Traversal, Visit, each, memoized
 
 from .syntax import (
     Abstract,
@@ -19,197 +23,185 @@ from .syntax import (
 
 type Context = Mapping[Identifier, None]
 
+# Folded terms by node identity, for the empty context the optimizer always folds in.
+constant_folding_memo = IdentityMemo[Term, Term]()
+
 
 def constant_folding_term(
     term: Term,
     context: Context,
 ) -> Term:  # returns an L2 term
-    recur = partial(constant_folding_term, context=context)
-
-    match term:
-        case Let(bindings=bindings, body=body):
-            # Fold constants inside each binding's value, and in the body
-            folded_bindings = tuple((name, recur(val)) for name, val in bindings)
-            return Let(bindings=folded_bindings, body=recur(body))
-
-        case Reference(name=_name):
-            # Nothing to fold — a reference is already atomic
-            return term
-
-        case Abstract(parameters=parameters, body=body):
-            # Fold inside the lambda body
-            return Abstract(parameters=parameters, body=recur(body))
-
-        case Apply(target=target, arguments=arguments):
-            # Fold the function and each argument
-            return Apply(target=recur(target), arguments=tuple(recur(a) for a in arguments))
-
-        case Immediate():
-            # Already a constant — nothing to d
-            return term
-
-        case Primitive(operator=operator, left=left, right=right):
-            match operator:
-                case "+":
-                    match recur(left), recur(right):
-                        # Both sides are known constants — evaluate now
-                        case Immediate(value=i1), Immediate(value=i2):
-                            return Immediate(value=i1 + i2)
-
-                        # 0 + x  =>  x
-                        case Immediate(value=0), right:
-                            return right
-
-                        # x + 0  =>  x
-                        case left, Immediate(value=0):
-                            return left
-
-                        # (+ (+ i1 a) (+ i2 b))  =>  (+ (i1+i2) (+ a b))
-                        case [
-                            Primitive(operator="+", left=Immediate(value=i1), right=left),
-                            Primitive(operator="+", left=Immediate(value=i2), right=right),
-                        ]:
-                            return Primitive(
-                                operator="+",
-                                left=Immediate(value=i1 + i2),
-                                right=Primitive(operator="+", left=left, right=right),
-                            )
-
-                        # (+ (- i1 a) (- i2 b))  =>  (- (i1+i2) (+ a b))
-                        case [
-                            Primitive(operator="-", left=Immediate(value=i1), right=left),
-                            Primitive(operator="-", left=Immediate(value=i2), right=right),
-                        ]:
-                            return Primitive(
-                                operator="-",
-                                left=Immediate(value=i1 + i2),
-                                right=Primitive(operator="+", left=left, right=right),
-                            )
-
-                        # Canonicalise: move an immediate to the left so later
-                        # passes have a consistent shape to match against.
-                        case left, (Immediate() as right):
-                            return Primitive(operator="+", left=right, right=left)
-
-                        case left, right:  # pragma: no branch
-                            return Primitive(operator="+", left=left, right=right)
-
-                case "-":
-                    match recur(left), recur(right):
-                        # Both constants
-                        case Immediate(value=i1), Immediate(value=i2):
-                            return Immediate(value=i1 - i2)
-
-                        # x - 0  =>  x
-                        case left, Immediate(value=0):
-                            return left
-
-                        # x - x  =>  0  (same reference name)
-                        case Reference(name=n1), Reference(name=n2) if n1 == n2:
-                            return Immediate(value=0)
-
-                        # (- (- i1 a) (- i2 b))  =>  (- (i1-i2) (- a b))  … wait, sign algebra:
-                        # (i1 - a) - (i2 - b) = (i1 - i2) + (b - a)
-                        # Keep conservative: just pull constants out on the left.
-                        case [
-                            Primitive(operator="-", left=Immediate(value=i1), right=left),
-                            Primitive(operator="-", left=Immediate(value=i2), right=right),
-                        ]:
-                            return Primitive(
-                                operator="-",
-                                left=Immediate(value=i1 - i2),
-                                right=Primitive(operator="-", left=left, right=right),
-                            )
-
-                        # (- (+ i1 a) (+ i2 b))  =>  (+ (i1-i2) (- a b))
-                        case [
-                            Primitive(operator="+", left=Immediate(value=i1), right=left),
-                            Primitive(operator="+", left=Immediate(value=i2), right=right),
-                        ]:
-                            return Primitive(
-                                operator="+",
-                                left=Immediate(value=i1 - i2),
-                                right=Primitive(operator="-", left=left, right=right),
-                            )
-
-                        # Canonicalise: move a right-side immediate to the left
-                        # by negating, turning (- x k) => (+ (-k) x).
-                        # This lets subsequent passes treat subtraction of a
-                        # constant the same as addition of its negation.
-                        case left, Immediate(value=k):
-                            return Primitive(
-                                operator="+",
-                                left=Immediate(value=-k),
-                                right=left,
-                            )
-
-                        case left, right:  # pragma: no branch
-                            return Primitive(operator="-", left=left, right=right)
-
-                case "*":
-                    match recur(left), recur(right):
-                        # Both constants
-                        case Immediate(value=i1), Immediate(value=i2):
-                            return Immediate(value=i1 * i2)
-
-                        # 0 * x  =>  0  (and x * 0 below)
-                        case Immediate(value=0), _:
-                            return Immediate(value=0)
-
-                        case _, Immediate(value=0):
-                            return Immediate(value=0)
-
-                        # 1 * x  =>  x
-                        case Immediate(value=1), right:
-                            return right
-
-                        # x * 1  =>  x
-                        case left, Immediate(value=1):
-                            return left
-
-                        # (*(* i1 a)(* i2 b))  =>  (* (i1*i2) (* a b))
-                        case [
-                            Primitive(operator="*", left=Immediate(value=i1), right=left),
-                            Primitive(operator="*", left=Immediate(value=i2), right=right),
-                        ]:
-                            return Primitive(
-                                operator="*",
-                                left=Immediate(value=i1 * i2),
-                                right=Primitive(operator="*", left=left, right=right),
-                            )
-
-                        # Canonicalise: immediate to the left
-                        case left, (Immediate() as right):
-                            return Primitive(operator="*", left=right, right=left)
-
-                        case left, right:
-                            return Primitive(operator="*", left=left, right=right)
-
-        case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            folded_left = recur(left)
-            folded_right = recur(right)
-            # If both sides of the condition are known, evaluate the branch now
-            match folded_left, folded_right:
-                case Immediate(value=i1), Immediate(value=i2):
-                    condition = (i1 < i2) if operator == "<" else (i1 == i2)
-                    return recur(consequent) if condition else recur(otherwise)
-                case _:
-                    return Branch(
-                        operator=operator,
-                        left=folded_left,
-                        right=folded_right,
-                        consequent=recur(consequent),
-                        otherwise=recur(otherwise),
-                    )
-
-        case Allocate():
-            return term
-
-        case Load(base=base, index=index):
-            return Load(base=recur(base), index=index)
-
-        case Store(base=base, index=index, value=value):
-            return Store(base=recur(base), index=index, value=recur(value))
-
-        case Begin(effects=effects, value=value):
-            return Begin(effects=tuple(recur(e) for e in effects), value=recur(value))
+    if context:
+        return _constant_folding(term, context)
+    return _constant_folding_memoized(term, context)
+
+
+def _let(term: Let, context: Context) -> Visit[Term]:
+    # Fold constants inside each binding's value, and in the body
+    values = yield from each((val, context) for _, val in term.bindings)
+    folded_bindings = tuple((name, value) for (name, _), value in zip(term.bindings, values, strict=True))
+    return rebuild(term, bindings=folded_bindings, body=(yield term.body, context))
+
+
+def _atom(term: Reference | Immediate | Allocate, context: Context) -> Term:
+    # Nothing to fold — a reference, a constant or an allocation is already atomic
+    return term
+
+
+def _abstract(term: Abstract, context: Context) -> Visit[Term]:
+    # Fold inside the lambda body
+    return rebuild(term, body=(yield term.body, context))
+
+
+def _apply(term: Apply, context: Context) -> Visit[Term]:
+    # Fold the function and each argument
+    target = yield term.target, context
+    arguments = yield from each((a, context) for a in term.arguments)
+    return rebuild(term, target=target, arguments=tuple(arguments))
+
+
+def _immediate(value: Pattern) -> Node:
+    return Node("immediate", value=value)
+
+
+def _reference(name: Pattern) -> Node:
+    return Node("reference", name=name)
+
+
+def _operation(operator: str, left: Pattern, right: Pattern) -> Node:
+    return Node("primitive", operator=operator, left=left, right=right)
+
+
+def _constant(value: int) -> Term:
+    return cons(Immediate, value=value)
+
+
+def _combine(operator: str, left: Term, right: Term) -> Term:
+    return cons(Primitive, operator=operator, left=left, right=right)
+
+
+def folding_rules(
+    combine: Callable[[str, Term, Term], Term] = _combine,
+) -> list[tuple[tuple[Pattern, ...], Callable[..., Term]]]:
+    # Each rule is the operator and the folded operands it applies to, and what replaces
+    # them; the first that matches wins. combine builds the operations a rule makes.
+    a, b, i1, i2, k, n, _ = (Var(name) for name in ("a", "b", "i1", "i2", "k", "n", "_"))
+
+    return [
+        # Both sides are known constants — evaluate now
+        (("+", _immediate(i1), _immediate(i2)), lambda i1, i2: _constant(i1 + i2)),
+        # 0 + x  =>  x
+        (("+", _immediate(0), b), lambda b: b),
+        # x + 0  =>  x
+        (("+", a, _immediate(0)), lambda a: a),
+        # (+ (+ i1 a) (+ i2 b))  =>  (+ (i1+i2) (+ a b))
+        (
+            ("+", _operation("+", _immediate(i1), a), _operation("+", _immediate(i2), b)),
+            lambda i1, i2, a, b: combine("+", _constant(i1 + i2), combine("+", a, b)),
+        ),
+        # (+ (- i1 a) (- i2 b))  =>  (- (i1+i2) (+ a b))
+        (
+            ("+", _operation("-", _immediate(i1), a), _operation("-", _immediate(i2), b)),
+            lambda i1, i2, a, b: combine("-", _constant(i1 + i2), combine("+", a, b)),
+        ),
+        # Canonicalise: move an immediate to the left so later
+        # passes have a consistent shape to match against.
+        (("+", a, Var("b", _immediate(_))), lambda a, b: combine("+", b, a)),
+        # Both constants
+        (("-", _immediate(i1), _immediate(i2)), lambda i1, i2: _constant(i1 - i2)),
+        # x - 0  =>  x
+        (("-", a, _immediate(0)), lambda a: a),
+        # x - x  =>  0  (same reference name)
+        (("-", _reference(n), _reference(n)), lambda n: _constant(0)),
+        # (- (- i1 a) (- i2 b))  =>  (- (i1-i2) (- a b)),
+        # since (i1 - a) - (i2 - b) = (i1 - i2) - (a - b)
+        (
+            ("-", _operation("-", _immediate(i1), a), _operation("-", _immediate(i2), b)),
+            lambda i1, i2, a, b: combine("-", _constant(i1 - i2), combine("-", a, b)),
+        ),
+        # (- (+ i1 a) (+ i2 b))  =>  (+ (i1-i2) (- a b))
+        (
+            ("-", _operation("+", _immediate(i1), a), _operation("+", _immediate(i2), b)),
+            lambda i1, i2, a, b: combine("+", _constant(i1 - i2), combine("-", a, b)),
+        ),
+        # Canonicalise: move a right-side immediate to the left
+        # by negating, turning (- x k) => (+ (-k) x).
+        # This lets subsequent passes treat subtraction of a
+        # constant the same as addition of its negation.
+        (("-", a, _immediate(k)), lambda a, k: combine("+", _constant(-k), a)),
+        # Both constants
+        (("*", _immediate(i1), _immediate(i2)), lambda i1, i2: _constant(i1 * i2)),
+        # 0 * x  =>  0  and  x * 0  =>  0
+        (("*", _immediate(0), _), lambda: _constant(0)),
+        (("*", _, _immediate(0)), lambda: _constant(0)),
+        # 1 * x  =>  x
+        (("*", _immediate(1), b), lambda b: b),
+        # x * 1  =>  x
+        (("*", a, _immediate(1)), lambda a: a),
+        # (*(* i1 a)(* i2 b))  =>  (* (i1*i2) (* a b))
+        (
+            ("*", _operation("*", _immediate(i1), a), _operation("*", _immediate(i2), b)),
+            lambda i1, i2, a, b: combine("*", _constant(i1 * i2), combine("*", a, b)),
+        ),
+        # Canonicalise: immediate to the left
+        (("*", a, Var("b", _immediate(_))), lambda a, b: combine("*", b, a)),
+    ]
+
+
+# The simplifications of a primitive, given its operator and folded operands.
+_fold = Rules[Term](folding_rules())
+
+
+def _primitive(term: Primitive, context: Context) -> Visit[Term]:
+    left, right = (yield term.left, context), (yield term.right, context)
+    folded = _fold(term.operator, left, right)
+    return folded if folded is not None else rebuild(term, left=left, right=right)
+
+
+def _branch(term: Branch, context: Context) -> Visit[Term]:
+    folded_left = yield term.left, context
+    folded_right = yield term.right, context
+    # If both sides of the condition are known, evaluate the branch now
+    match folded_left, folded_right:
+        case Immediate(value=i1), Immediate(value=i2):
+            condition = (i1 < i2) if term.operator == "<" else (i1 == i2)
+            return (yield term.consequent if condition else term.otherwise, context)
+        case _:
+            return rebuild(
+                term,
+                left=folded_left,
+                right=folded_right,
+                consequent=(yield term.consequent, context),
+                otherwise=(yield term.otherwise, context),
+            )
+
+
+def _load(term: Load, context: Context) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, context))
+
+
+def _store(term: Store, context: Context) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, context), value=(yield term.value, context))
+
+
+def _begin(term: Begin, context: Context) -> Visit[Term]:
+    effects = yield from each((e, context) for e in term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value, context))
+
+
+_handlers = {
+    "let": _let,
+    "reference": _atom,
+    "abstract": _abstract,
+    "apply": _apply,
+    "immediate": _atom,
+    "primitive": _primitive,
+    "branch": _branch,
+    "allocate": _atom,
+    "load": _load,
+    "store": _store,
+    "begin": _begin,
+}
+
+_constant_folding = Traversal[Term](_handlers)
+_constant_folding_memoized = Traversal[Term](memoized(_handlers, constant_folding_memo))
@@ -1,6 +1,13 @@
-from collections.abc import Mapping
-from functools import partial
+from collections.abc import Callable, Mapping
+from inspect import isgeneratorfunction
+from typing import Any
 
+from util.hash_cons import cons, rebuild
+from util.memo import IdentityMemo
+from util.scoped_map import ScopedMap
+from util.traverse import Traversal, Visit, each
+
+from .dead_code_elim import free_variables
 from .syntax import (
     Abstract,
     Allocate,
@@ -24,75 +31,143 @@ substitutes in the immediate.
 
 Lets extend the environment whenever a binding folds to a constant
 bastracts "shadow" parameters so they arent replaced wrong in the lambda body
+
+A term none of whose free variables has a constant in the env comes out the same in any
+such env, so its result is kept by node and reused: in the optimizer's later rounds only
+the terms the round before rebuilt are walked again.
 """
 
 # Maps variable names to their known constant integer values.
 type Env = Mapping[Identifier, int]
+# The env during a walk, extended and restored as it enters and leaves binders.
+type Scope = ScopedMap[Identifier, int]
+
+# Propagated terms by node identity, for terms the env has no constant for.
+constant_propagation_memo = IdentityMemo[Term, Term]()
+
+
+def _unaffected(term: Term, env: Scope) -> bool:
+    # no free variable of term has a constant in env; looks through the smaller of the two
+    if not env:
+        return True
+    fvs = free_variables(term)
+    if len(env) < len(fvs):
+        return not any(name in fvs for name in env)
+    return not any(name in env for name in fvs)
+
+
+def env_memoized[H: Callable[..., Any]](handlers: Mapping[str, H], memo: IdentityMemo[Term, Term]) -> dict[str, H]:
+    # handlers, taking a Scope, with each generator handler's result kept in memo for a term
+    # the env has no constant for: util.traverse.memoized for a walk that carries an env
+    def wrap(handler: Callable[[Term, Scope], Visit[Term]]) -> Callable[[Term, Scope], Visit[Term]]:
+        def visit(term: Term, env: Scope) -> Visit[Term]:
+            if not _unaffected(term, env):
+                return (yield from handler(term, env))
+            cached = memo.get(term)
+            if cached is None:
+                cached = memo.put(term, (yield from handler(term, env)))
+            return cached
+
+        return visit
+
+    return {tag: wrap(handler) if isgeneratorfunction(handler) else handler for tag, handler in handlers.items()}  # pyright: ignore[reportReturnType]
+
+
+def _reference(term: Reference, env: Scope) -> Term:
+    # Replace with the known constant if we have one
+    if term.name in env:
+        return cons(Immediate, value=env[term.name])
+    return term
+
+
+def _let(term: Let, env: Scope) -> Visit[Term]:
+    # Process bindings left-to-right, extending the env as constants
+    # are discovered so later bindings can benefit immediately.
+    mark = env.mark()
+    new_bindings: list[tuple[Identifier, Term]] = []
+    for name, val in term.bindings:
+        propagated = yield val, env
+        new_bindings.append((name, propagated))
+        if isinstance(propagated, Immediate):
+            env.bind(name, propagated.value)
+        else:
+            # whatever constant an outer binding of the name had, it is not this one
+            env.hide(name)
+    body = yield term.body, env
+    # The constants go out of scope with the Let
+    env.undo(mark)
+    return rebuild(term, bindings=tuple(new_bindings), body=body)
+
+
+def _abstract(term: Abstract, env: Scope) -> Visit[Term]:
+    # Parameters shadow any enclosing constants — hide them in the body
+    mark = env.mark()
+    for parameter in term.parameters:
+        env.hide(parameter)
+    body = yield term.body, env
+    env.undo(mark)
+    return rebuild(term, body=body)
+
+
+def _apply(term: Apply, env: Scope) -> Visit[Term]:
+    return rebuild(
+        term,
+        target=(yield term.target, env),
+        arguments=tuple((yield from each((a, env) for a in term.arguments))),
+    )
+
+
+def _leaf(term: Immediate | Allocate, env: Scope) -> Term:
+    return term
+
+
+def _primitive(term: Primitive, env: Scope) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left, env), right=(yield term.right, env))
+
+
+def _branch(term: Branch, env: Scope) -> Visit[Term]:
+    return rebuild(
+        term,
+        left=(yield term.left, env),
+        right=(yield term.right, env),
+        consequent=(yield term.consequent, env),
+        otherwise=(yield term.otherwise, env),
+    )
+
+
+def _load(term: Load, env: Scope) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, env))
+
+
+def _store(term: Store, env: Scope) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, env), value=(yield term.value, env))
+
+
+def _begin(term: Begin, env: Scope) -> Visit[Term]:
+    effects = yield from each((e, env) for e in term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value, env))
+
+
+_constant_propagation = Traversal[Term](
+    env_memoized(
+        {
+            "reference": _reference,
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "immediate": _leaf,
+            "primitive": _primitive,
+            "branch": _branch,
+            "allocate": _leaf,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+        },
+        constant_propagation_memo,
+    )
+)
 
 
 def constant_propagation_term(term: Term, env: Env) -> Term:
     """Return a new term with every known-constant reference substituted."""
-    recur = partial(constant_propagation_term, env=env)
-
-    match term:
-        case Reference(name=name):
-            # Replace with the known constant if we have one
-            if name in env:
-                return Immediate(value=env[name])
-            return term
-
-        case Let(bindings=bindings, body=body):
-            # Process bindings left-to-right, extending the env as constants
-            # are discovered so later bindings can benefit immediately.
-            new_env = dict(env)
-            new_bindings: list[tuple[Identifier, Term]] = []
-            for name, val in bindings:
-                propagated = constant_propagation_term(val, new_env)
-                new_bindings.append((name, propagated))
-                if isinstance(propagated, Immediate):
-                    new_env[name] = propagated.value
-            return Let(
-                bindings=tuple(new_bindings),
-                body=constant_propagation_term(body, new_env),
-            )
-
-        case Abstract(parameters=parameters, body=body):
-            # Parameters shadow any enclosing constants — remove them from env
-            inner_env = {k: v for k, v in env.items() if k not in parameters}
-            return Abstract(
-                parameters=parameters,
-                body=constant_propagation_term(body, inner_env),
-            )
-
-        case Apply(target=target, arguments=arguments):
-            return Apply(
-                target=recur(target),
-                arguments=tuple(recur(a) for a in arguments),
-            )
-
-        case Immediate():
-            return term
-
-        case Primitive(operator=operator, left=left, right=right):
-            return Primitive(operator=operator, left=recur(left), right=recur(right))
-
-        case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            return Branch(
-                operator=operator,
-                left=recur(left),
-                right=recur(right),
-                consequent=recur(consequent),
-                otherwise=recur(otherwise),
-            )
-
-        case Allocate():
-            return term
-
-        case Load(base=base, index=index):
-            return Load(base=recur(base), index=index)
-
-        case Store(base=base, index=index, value=value):
-            return Store(base=recur(base), index=index, value=recur(value))
-
-        case Begin(effects=effects, value=value):
-            return Begin(effects=tuple(recur(e) for e in effects), value=recur(value))
+    return _constant_propagation(term, ScopedMap(env))
@@ -2,6 +2,7 @@ from collections.abc import Callable, Sequence
 from functools import partial
 
 from L1 import syntax as L1
+from util.trusted import trusted
 
 from L2 import syntax as L2
 
@@ -37,7 +38,8 @@ def cps_convert_term(
                 # rest of the body thinks its called name? need to reconcile
                 result = _term(
                     value,
-                    lambda value: L1.Copy(  # use copy for this reconcling
+                    lambda value: trusted(
+                        L1.Copy,  # use copy for this reconcling
                         destination=name,
                         source=value,
                         then=result,
@@ -54,17 +56,19 @@ def cps_convert_term(
             tmp = fresh("t")
             k = fresh("k")
 
-            return L1.Abstract(
+            return trusted(
+                L1.Abstract,
                 destination=tmp,
                 parameters=[*parameters, k],
-                body=_term(body, lambda body: L1.Apply(target=k, arguments=[body])),
+                body=_term(body, lambda body: trusted(L1.Apply, target=k, arguments=[body])),
                 then=m(tmp),
             )
 
         case L2.Apply(target=target, arguments=arguments):
             tmp = fresh("t")
             k = fresh("k")
-            return L1.Abstract(  # package it all in an abstract to make it expanded and explicit
+            return trusted(
+                L1.Abstract,  # package it all in an abstract to make it expanded and explicit
                 destination=k,
                 parameters=[tmp],
                 body=m(tmp),
@@ -72,7 +76,8 @@ def cps_convert_term(
                     target,
                     lambda target: _terms(
                         arguments,
-                        lambda arguments: L1.Apply(
+                        lambda arguments: trusted(
+                            L1.Apply,
                             target=target,
                             arguments=[*arguments, k],
                         ),
@@ -85,7 +90,8 @@ def cps_convert_term(
         case L2.Immediate(value=value):  # k needs a this, we need a uniquified name for it
             # looking at immediates in L1 they need a destination, a value, a then (a statement in L2)
             tmp = fresh("t")  # need to store here for consistency
-            return L1.Immediate(
+            return trusted(
+                L1.Immediate,
                 destination=tmp,  # needs a fresh identifier using t to match with the given tests can chang it in tests if wanted
                 value=value,
                 then=m(tmp),  # what happens next. need to materialize it an actual L1 statement
@@ -102,7 +108,8 @@ def cps_convert_term(
                 left,
                 m=lambda left: _term(  # We dig into the left side first
                     right,
-                    m=lambda right: L1.Primitive(  # then we dig into the right but it has to hold the full Primitive
+                    m=lambda right: trusted(
+                        L1.Primitive,  # then we dig into the right but it has to hold the full Primitive
                         destination=tmp,
                         operator=operator,
                         left=left,
@@ -117,7 +124,8 @@ def cps_convert_term(
             # Branching and then Merging
             j = fresh("j")  # the join point function name to merge the branches context
             tmp = fresh("t")  # what j receives as its argument
-            return L1.Abstract(  # the join point function that merges the branches context
+            return trusted(
+                L1.Abstract,  # the join point function that merges the branches context
                 destination=j,
                 parameters=[tmp],
                 body=m(
@@ -127,15 +135,18 @@ def cps_convert_term(
                     left,
                     lambda left: _term(
                         right,
-                        lambda right: L1.Branch(  # the actual term we are returning
+                        lambda right: trusted(
+                            L1.Branch,  # the actual term we are returning
                             operator=operator,
                             left=left,
                             right=right,  # we've linked the left and right now we need to link the consequent and otherwise in some sense
                             # We use Apply to link the continuations of the branches to the rest of the program, we need to make them into continuations first though
                             then=_term(
-                                consequent, lambda consequent: L1.Apply(target=j, arguments=[consequent])
+                                consequent, lambda consequent: trusted(L1.Apply, target=j, arguments=[consequent])
                             ),  # sorta
-                            otherwise=_term(otherwise, lambda otherwise: L1.Apply(target=j, arguments=[otherwise])),
+                            otherwise=_term(
+                                otherwise, lambda otherwise: trusted(L1.Apply, target=j, arguments=[otherwise])
+                            ),
                         ),
                     ),
                 ),
@@ -143,7 +154,8 @@ def cps_convert_term(
 
         case L2.Allocate(count=count):
             tmp = fresh("t")  # need to store here for consistency
-            return L1.Allocate(
+            return trusted(
+                L1.Allocate,
                 destination=tmp,  # needs a fresh identifier using t to match with the given tests can chang it in tests if wanted
                 count=count,
                 then=m(tmp),  # what happens next. need to materialize it an actual L1 statement
@@ -153,7 +165,8 @@ def cps_convert_term(
             tmp = fresh("t")
             return _term(
                 base,
-                m=lambda base: L1.Load(
+                m=lambda base: trusted(
+                    L1.Load,
                     destination=tmp,
                     base=base,
                     index=index,
@@ -168,11 +181,13 @@ def cps_convert_term(
                 base,
                 m=lambda base: _term(  # We dig into the base
                     value,
-                    m=lambda value: L1.Store(  # we then can return a store
+                    m=lambda value: trusted(
+                        L1.Store,  # we then can return a store
                         base=base,
                         index=index,
                         value=value,
-                        then=L1.Immediate(  # due to stores needing to have a value (of 0) but also the true value
+                        then=trusted(
+                            L1.Immediate,  # due to stores needing to have a value (of 0) but also the true value
                             # We make an immediate, also because the store lacks the explicit zero in the first place
                             destination=tmp,
                             value=0,
@@ -229,12 +244,14 @@ def cps_convert_program(
 
     match program:
         case L2.Program(parameters=parameters, body=body):  # pragma: no branch
-            return L1.Program(
+            return trusted(
+                L1.Program,
                 parameters=parameters,
                 body=_term(
                     body,  # all the program code we need to analyze
-                    lambda value: L1.Halt(  # lambda value is the body cps identifier
-                        value=value
+                    lambda value: trusted(
+                        L1.Halt,  # lambda value is the body cps identifier
+                        value=value,
                     ),  # when we start k is a simple where it gives a value and then halts
                 ),
             )
@@ -0,0 +1,455 @@
+from collections import Counter
+from collections.abc import Callable, Mapping, Sequence
+from inspect import isgeneratorfunction
+from threading import Lock
+from typing import Any
+
+from util.budget import CHARGE_EVERY, charge
+from util.hash_cons import children, cons, rebuild
+from util.memo import IdentityMemo
+from util.sequential_name_generator import SequentialNameGenerator
+from util.traverse import Traversal, Visit, each, memoized
+
+from .dead_code_elim import free_variables, is_pure
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Identifier,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+Common subexpression elimination: an expression evaluated more than once, with the same
+value each time, is evaluated once and bound by a Let, and its other evaluations become
+references to the binding.
+
+The expressions considered are the Primitives is_pure accepts, which have the same value
+wherever their free variables mean the same, and Loads from a Reference, which have it
+until something may store to the cell they read: a Store to the same index through a
+base that may be the same cell, or an Apply, which may do anything. Two names may be the
+same cell unless each is bound once, by a Let, to an Allocate of its own. Inside a lambda
+a Load is never available, since the body runs later; a pure expression is.
+
+An expression is hoisted to the innermost term that evaluates it first, before anything
+that may change it and on every path through the term, and that holds every evaluation
+of it that comes after, while it is still available. The Let goes around that term. Where
+the first evaluation is the value of a Let's binding, the binding's name is used instead.
+Equal expressions are found by identity, so the term is hash-consed, as optimize_program's
+is.
+
+The evaluations removed and the bindings added are counted in cse_statistics, for the
+command line's --stats, which threads may add to at once; workers in other processes
+count their own, for parallel to merge.
+"""
+
+
+# held while counting; a module global rather than an attribute, so that statistics
+# still pickle
+_counting = Lock()
+
+
+class CSEStatistics:
+    def __init__(self) -> None:
+        self.removed = 0
+        self.hoisted = 0
+
+    def clear(self) -> None:
+        self.removed = 0
+        self.hoisted = 0
+
+    def add(self, removed: int, hoisted: int) -> None:
+        with _counting:
+            self.removed += removed
+            self.hoisted += hoisted
+
+    def merge(self, other: CSEStatistics) -> None:
+        self.add(other.removed, other.hoisted)
+
+    def report(self) -> str:
+        return f"cse: {self.removed} redundant evaluation(s) removed, {self.hoisted} binding(s) added"
+
+
+cse_statistics = CSEStatistics()
+
+# What a store may have written, for a Load to be checked against: whether anything was
+# called, and the stores, each with its base's name (None if the base is not a Reference)
+# and its index.
+type Writes = tuple[bool, frozenset[tuple[Identifier | None, int]]]
+
+# Of a term, by the ids of the repeated expressions: those it evaluates first, on every
+# path and before anything that may change them, in the order it evaluates them; how
+# often it evaluates each while that one is still available from its start; and what it
+# may write.
+type Summary = tuple[dict[int, None], dict[int, int], Writes]
+
+_NO_WRITES: Writes = (False, frozenset())
+
+
+class _Elimination:
+    def __init__(
+        self,
+        term: Term,
+        free_variables: Callable[[Term], frozenset[Identifier]],
+        is_pure: Callable[[Term], bool],
+    ) -> None:
+        self.free_variables = free_variables
+        # one walk of the tree for the expressions that occur more than once, the names
+        # bound once to an Allocate, and every name in the term
+        counts = Counter[int]()
+        candidates: dict[int, Term] = {}
+        binders = Counter[Identifier]()
+        allocated: set[Identifier] = set()
+        self._taken: set[Identifier] = set()
+
+        stack = [term]
+        visited = 0
+        while stack:
+            visited += 1
+            if visited == CHARGE_EVERY:
+                charge(visited)
+                visited = 0
+            match node := stack.pop():
+                case Primitive() if is_pure(node):
+                    counts[id(node)] += 1
+                    candidates[id(node)] = node
+                case Load(base=Reference()):
+                    counts[id(node)] += 1
+                    candidates[id(node)] = node
+                case Let(bindings=bindings):
+                    for name, value in bindings:
+                        binders[name] += 1
+                        if isinstance(value, Allocate):
+                            allocated.add(name)
+                case Abstract(parameters=parameters):
+                    binders.update(parameters)
+                case Reference(name=name):
+                    self._taken.add(name)
+                case _:
+                    pass
+            stack.extend(children(node))
+        charge(visited)
+
+        self.expressions = {key: candidates[key] for key, count in counts.items() if count > 1}
+        self.allocations = {name for name in allocated if binders[name] == 1}
+        self._taken.update(binders)
+        self._fresh = SequentialNameGenerator()
+        self._summary = Traversal[Summary](memoized(_SUMMARIES, IdentityMemo[Term, Summary]()))
+
+        # the repeated expressions available where the rewrite is, with their bindings
+        self.available: dict[int, Reference] = {}
+        self.replaced = 0
+        self.hoisted = 0
+
+    def summary(self, term: Term) -> Summary:
+        return self._summary(term, self)
+
+    def fresh(self) -> Identifier:
+        name = self._fresh("cse")
+        while name in self._taken:
+            name = self._fresh("cse")
+        self._taken.add(name)
+        return name
+
+    def aliases(self, name: Identifier, other: Identifier | None) -> bool:
+        # name and other may be the same cell
+        return other is None or name == other or not (name in self.allocations and other in self.allocations)
+
+    def killed(self, key: int, writes: Writes) -> bool:
+        # the expression may have another value after writes
+        calls, stores = writes
+        if not (calls or stores):
+            return False
+        match self.expressions[key]:
+            case Load(base=Reference(name=name), index=index):
+                return calls or any(index == stored and self.aliases(name, base) for base, stored in stores)
+            case _:
+                return False
+
+    def kill(self, writes: Writes) -> None:
+        for key in [key for key in self.available if self.killed(key, writes)]:
+            del self.available[key]
+
+    def shadow(self, names: frozenset[Identifier]) -> None:
+        # a binder hides the outer names its scope uses: what was available of them is not
+        for key in [key for key in self.available if not names.isdisjoint(self.free_variables(self.expressions[key]))]:
+            del self.available[key]
+
+    def hoists(self, term: Term) -> list[int]:
+        # the expressions to bind around term, in the order it evaluates them
+        first, uses, _ = self.summary(term)
+        chosen = [key for key in first if uses[key] > 1 and key not in self.available]
+        if not chosen:
+            return []
+
+        # left to a part of term that evaluates them first and holds every evaluation
+        parts = [self.summary(child) for child in children(term)]
+        chosen = [key for key in chosen if not any(key in part[0] and part[1][key] == uses[key] for part in parts)]
+        if isinstance(term, Let):
+            chosen = [key for key in chosen if not self._bound_first(term, key)]
+
+        # an expression inside one that is bound is evaluated once for every evaluation
+        # of that one that remains
+        counts = {key: uses[key] for key in chosen}
+        for key in reversed(chosen):
+            if counts[key] > 1:
+                for inner, count in self.summary(self.expressions[key])[1].items():
+                    if inner != key and inner in counts:
+                        counts[inner] -= (counts[key] - 1) * count
+        return [key for key in chosen if counts[key] > 1]
+
+    def _bound_first(self, term: Let, key: int) -> bool:
+        # term first evaluates the expression as the value of one of its bindings
+        return next((id(value) == key for _, value in term.bindings if key in self.summary(value)[1]), False)
+
+
+# Summaries
+
+
+def _sequence(parts: Sequence[Summary], state: _Elimination) -> Summary:
+    # parts evaluated one after another
+    first: dict[int, None] = {}
+    uses: dict[int, int] = {}
+    calls, stores = _NO_WRITES
+    for part_first, part_uses, (part_calls, part_stores) in parts:
+        for key in part_first:
+            if key not in first and not state.killed(key, (calls, stores)):
+                first[key] = None
+        for key, count in part_uses.items():
+            if not state.killed(key, (calls, stores)):
+                uses[key] = uses.get(key, 0) + count
+        calls, stores = calls or part_calls, stores | part_stores
+    return first, uses, (calls, stores)
+
+
+def _summarize_leaf(term: Reference | Immediate | Allocate, state: _Elimination) -> Summary:
+    return {}, {}, _NO_WRITES
+
+
+def _summarize(term: Primitive | Load | Apply | Store | Begin, state: _Elimination) -> Visit[Summary]:
+    first, uses, (calls, stores) = _sequence((yield from each((child, state) for child in children(term))), state)
+    match term:
+        case Apply():
+            calls = True
+        case Store(base=base, index=index):
+            stores |= {(base.name if isinstance(base, Reference) else None, index)}
+        case _ if id(term) in state.expressions:
+            first[id(term)] = None
+            uses[id(term)] = uses.get(id(term), 0) + 1
+        case _:
+            pass
+    return first, uses, (calls, stores)
+
+
+def _summarize_let(term: Let, state: _Elimination) -> Visit[Summary]:
+    first, uses, writes = _sequence((yield from each((child, state) for child in children(term))), state)
+    # what uses the names the Let binds cannot be bound outside it
+    names = frozenset(name for name, _ in term.bindings)
+    inside = {key for key in uses if not names.isdisjoint(free_variables(state.expressions[key]))}
+    return (
+        {key: None for key in first if key not in inside},
+        {key: count for key, count in uses.items() if key not in inside},
+        writes,
+    )
+
+
+def _summarize_abstract(term: Abstract, state: _Elimination) -> Visit[Summary]:
+    # the body runs later, so nothing in it is evaluated first; a pure expression in it
+    # that does not use the parameters can still be replaced
+    _, uses, _ = yield term.body, state
+    parameters = frozenset(term.parameters)
+    return (
+        {},
+        {
+            key: count
+            for key, count in uses.items()
+            if isinstance(state.expressions[key], Primitive)
+            and parameters.isdisjoint(free_variables(state.expressions[key]))
+        },
+        _NO_WRITES,
+    )
+
+
+def _summarize_branch(term: Branch, state: _Elimination) -> Visit[Summary]:
+    # the condition is evaluated, then one of the arms
+    first, uses, writes = _sequence([(yield term.left, state), (yield term.right, state)], state)
+    (_, consequent, (consequent_calls, consequent_stores)) = yield term.consequent, state
+    (_, otherwise, (otherwise_calls, otherwise_stores)) = yield term.otherwise, state
+    for key in consequent.keys() | otherwise.keys():
+        if not state.killed(key, writes):
+            uses[key] = uses.get(key, 0) + max(consequent.get(key, 0), otherwise.get(key, 0))
+    calls, stores = writes
+    return (
+        first,
+        uses,
+        (calls or consequent_calls or otherwise_calls, stores | consequent_stores | otherwise_stores),
+    )
+
+
+_SUMMARIES: Mapping[str, Callable[..., Any]] = {
+    "reference": _summarize_leaf,
+    "let": _summarize_let,
+    "abstract": _summarize_abstract,
+    "apply": _summarize,
+    "immediate": _summarize_leaf,
+    "primitive": _summarize,
+    "branch": _summarize_branch,
+    "allocate": _summarize_leaf,
+    "load": _summarize,
+    "store": _summarize,
+    "begin": _summarize,
+}
+
+
+# Rewriting
+
+
+def _eliminating[H: Callable[..., Any]](handlers: Mapping[str, H]) -> dict[str, H]:
+    # handlers with an available expression replaced by its binding, and the expressions
+    # to hoist around a term bound before it
+    def wrap(handler: Callable[..., Visit[Term]]) -> Callable[..., Visit[Term]]:
+        def visit(term: Term, state: _Elimination) -> Visit[Term]:
+            available = state.available.get(id(term))
+            if available is not None:
+                state.replaced += 1
+                return available
+
+            hoisted = state.hoists(term)
+            if not hoisted:
+                return (yield from handler(term, state))
+
+            bindings: list[tuple[Identifier, Term]] = []
+            references: list[tuple[int, Reference]] = []
+            for key in hoisted:
+                value = yield state.expressions[key], state
+                name = state.fresh()
+                state.available[key] = reference = cons(Reference, name=name)
+                references.append((key, reference))
+                bindings.append((name, value))
+            body = yield from handler(term, state)
+            for key, reference in references:
+                if state.available.get(key) is reference:
+                    del state.available[key]
+            state.hoisted += len(bindings)
+            return cons(Let, bindings=tuple(bindings), body=body)
+
+        return visit
+
+    return {tag: wrap(handler) if isgeneratorfunction(handler) else handler for tag, handler in handlers.items()}  # pyright: ignore[reportReturnType]
+
+
+def _leaf(term: Reference | Immediate | Allocate, state: _Elimination) -> Term:
+    return term
+
+
+def _let(term: Let, state: _Elimination) -> Visit[Term]:
+    bound: list[tuple[int, Reference]] = []
+    bindings: list[tuple[Identifier, Term]] = []
+    for name, value in term.bindings:
+        key = id(value)
+        new = yield value, state
+        state.shadow(frozenset((name,)))
+        # a repeated expression is available as the name it is first bound to
+        if key in state.expressions and key not in state.available and name not in free_variables(value):
+            state.available[key] = reference = cons(Reference, name=name)
+            bound.append((key, reference))
+        bindings.append((name, new))
+    body = yield term.body, state
+    for key, reference in bound:
+        if state.available.get(key) is reference:
+            del state.available[key]
+    return rebuild(term, bindings=tuple(bindings), body=body)
+
+
+def _abstract(term: Abstract, state: _Elimination) -> Visit[Term]:
+    # the body runs later, when no Load is known to be available
+    outside = state.available
+    state.available = {
+        key: reference for key, reference in outside.items() if isinstance(state.expressions[key], Primitive)
+    }
+    state.shadow(frozenset(term.parameters))
+    body = yield term.body, state
+    state.available = outside
+    return rebuild(term, body=body)
+
+
+def _apply(term: Apply, state: _Elimination) -> Visit[Term]:
+    target = yield term.target, state
+    arguments = tuple((yield from each((argument, state) for argument in term.arguments)))
+    state.kill((True, frozenset()))
+    return rebuild(term, target=target, arguments=arguments)
+
+
+def _primitive(term: Primitive, state: _Elimination) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left, state), right=(yield term.right, state))
+
+
+def _branch(term: Branch, state: _Elimination) -> Visit[Term]:
+    left, right = (yield term.left, state), (yield term.right, state)
+    # each arm starts from what the condition leaves, and after them only what both leave
+    # is available
+    before = state.available
+    state.available = dict(before)
+    consequent = yield term.consequent, state
+    after = state.available
+    state.available = dict(before)
+    otherwise = yield term.otherwise, state
+    state.available = {key: reference for key, reference in state.available.items() if after.get(key) is reference}
+    return rebuild(term, left=left, right=right, consequent=consequent, otherwise=otherwise)
+
+
+def _load(term: Load, state: _Elimination) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, state))
+
+
+def _store(term: Store, state: _Elimination) -> Visit[Term]:
+    base, value = (yield term.base, state), (yield term.value, state)
+    state.kill((False, frozenset({(term.base.name if isinstance(term.base, Reference) else None, term.index)})))
+    return rebuild(term, base=base, value=value)
+
+
+def _begin(term: Begin, state: _Elimination) -> Visit[Term]:
+    effects = yield from each((effect, state) for effect in term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value, state))
+
+
+_cse = Traversal[Term](
+    _eliminating(
+        {
+            "reference": _leaf,
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "immediate": _leaf,
+            "primitive": _primitive,
+            "branch": _branch,
+            "allocate": _leaf,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+        }
+    )
+)
+
+
+def cse_term(
+    term: Term,
+    free_variables: Callable[[Term], frozenset[Identifier]] = free_variables,
+    is_pure: Callable[[Term], bool] = is_pure,
+) -> Term:
+    # term with each expression it evaluates again while available bound once; the
+    # analyses are the optimizer's, which keeps their results for the whole term
+    state = _Elimination(term, free_variables, is_pure)
+    if not state.expressions:
+        return term
+    result = _cse(term, state)
+    cse_statistics.add(state.replaced - state.hoisted, state.hoisted)
+    return result
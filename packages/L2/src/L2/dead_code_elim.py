@@ -1,3 +1,7 @@
+from util.hash_cons import rebuild
+from util.memo import IdentityMemo
+from util.traverse import Traversal, Visit, each, memoized
+
 from .syntax import (
     Abstract,
     Allocate,
@@ -30,6 +34,11 @@ needs to be bottom up as discussed in class
 
 # Helpers
 
+# Results by node identity, so a subterm shared in a hash-consed tree (or re-examined by
+# every enclosing Let) is analysed once.
+free_variables_memo = IdentityMemo[Term, frozenset[Identifier]]()
+is_pure_memo = IdentityMemo[Term, bool]()
+
 
 def free_variables(term: Term) -> frozenset[Identifier]:
     """Return the set of variable names that are *used but not defined* in term.
@@ -38,124 +47,332 @@ def free_variables(term: Term) -> frozenset[Identifier]:
     not introduced (bound) by that same term.  This tells us which names a
     term depends on from its surrounding context.
     """
-    match term:
-        case Reference(name=name):
-            # A bare variable reference — the name itself is free.
-            return frozenset({name})
-
-        case Let(bindings=bindings, body=body):
-            # A Let introduces new names, so we must be careful:
-            #   - Each binding's *value* can use names from outer scope or
-            #     from bindings that appear earlier in the same Let.
-            #   - The names introduced by the bindings are NOT free in the
-            #     Let as a whole — they are "consumed" internally.
-            #
-            # We walk the bindings left-to-right, tracking which names have
-            # been introduced so far in `bound`.
-            #
-            # Example:  let a = x        # free in value: {x}
-            #               b = a + y    # free in value: {a, y}, but a is bound -> {y}
-            #           in  b + z        # free in body:  {b, z}, but b is bound -> {z}
-            #
-            # Overall free variables: {x, y, z}
-            bound: set[Identifier] = set()
-            fvs: set[Identifier] = set()
-            for name, val in bindings:
-                # Collect free variables of this value, minus names already bound
-                fvs |= free_variables(val) - bound
-                # Mark this name as bound for subsequent bindings and the body
-                bound.add(name)
-            # The body can use anything from outer scope except what Let binds
-            fvs |= free_variables(body) - bound
-            return frozenset(fvs)
-
-        case Abstract(parameters=parameters, body=body):
-            # A lambda binds its parameters inside the body.
-            # Free variables of the lambda = free variables of the body
-            # minus the parameter names (they are provided by the caller).
-            #
-            # Example:  lambda (x, y): x + z
-            #   free in body: {x, y, z}  minus parameters {x, y}  ->  {z}
-            return free_variables(body) - frozenset(parameters)
-
-        case Apply(target=target, arguments=arguments):
-            # A function call: collect free variables from the function
-            # expression and from every argument.
-            result: set[Identifier] = set(free_variables(target))
-            for a in arguments:
-                result |= free_variables(a)
-            return frozenset(result)
-
-        case Immediate():
-            # A literal integer constant — no variables at all.
-            return frozenset()
-
-        case Primitive(left=left, right=right):
-            # An arithmetic expression — union of both operands' free variables.
-            return free_variables(left) | free_variables(right)
-
-        case Branch(left=left, right=right, consequent=consequent, otherwise=otherwise):
-            # A conditional — variables can appear in the condition operands
-            # and in either branch arm, so union all four.
-            return free_variables(left) | free_variables(right) | free_variables(consequent) | free_variables(otherwise)
-
-        case Allocate():
-            # Allocation takes a fixed count — no variable references.
-            return frozenset()
-
-        case Load(base=base):
-            # The address to load from may contain variable references.
-            return free_variables(base)
-
-        case Store(base=base, value=value):
-            # Both the address and the value being stored may reference variables.
-            # (index is a compile-time Nat literal, not a variable)
-            return free_variables(base) | free_variables(value)
-
-        case Begin(effects=effects, value=value):
-            # A sequence of effects followed by a final value.
-            # Variables can appear in any effect or in the final value.
-            result = set(free_variables(value))
-            for e in effects:
-                result |= free_variables(e)
-            return frozenset(result)
-
-    raise ValueError(f"Unhandled term variant: {term!r}")
+    return _free_variables(term)
+
+
+def _fv_reference(term: Reference) -> frozenset[Identifier]:
+    # A bare variable reference — the name itself is free.
+    return frozenset({term.name})
+
+
+def _fv_let(term: Let) -> Visit[frozenset[Identifier]]:
+    # A Let introduces new names, so we must be careful:
+    #   - Each binding's *value* can use names from outer scope or
+    #     from bindings that appear earlier in the same Let.
+    #   - The names introduced by the bindings are NOT free in the
+    #     Let as a whole — they are "consumed" internally.
+    #
+    # We walk the bindings left-to-right, tracking which names have
+    # been introduced so far in `bound`.
+    #
+    # Example:  let a = x        # free in value: {x}
+    #               b = a + y    # free in value: {a, y}, but a is bound -> {y}
+    #           in  b + z        # free in body:  {b, z}, but b is bound -> {z}
+    #
+    # Overall free variables: {x, y, z}
+    bound: set[Identifier] = set()
+    fvs: set[Identifier] = set()
+    for name, val in term.bindings:
+        # Collect free variables of this value, minus names already bound
+        fvs |= (yield val) - bound
+        # Mark this name as bound for subsequent bindings and the body
+        bound.add(name)
+    # The body can use anything from outer scope except what Let binds
+    fvs |= (yield term.body) - bound
+    return frozenset(fvs)
+
+
+def _fv_abstract(term: Abstract) -> Visit[frozenset[Identifier]]:
+    # A lambda binds its parameters inside the body.
+    # Free variables of the lambda = free variables of the body
+    # minus the parameter names (they are provided by the caller).
+    #
+    # Example:  lambda (x, y): x + z
+    #   free in body: {x, y, z}  minus parameters {x, y}  ->  {z}
+    return (yield term.body) - frozenset(term.parameters)
+
+
+def _fv_apply(term: Apply) -> Visit[frozenset[Identifier]]:
+    # A function call: collect free variables from the function
+    # expression and from every argument.
+    result: set[Identifier] = set((yield term.target))
+    for a in term.arguments:
+        result |= yield a
+    return frozenset(result)
+
+
+def _fv_constant(term: Immediate | Allocate) -> frozenset[Identifier]:
+    # A literal integer constant, or an allocation of a fixed count — no
+    # variable references at all.
+    return frozenset()
+
+
+def _fv_primitive(term: Primitive) -> Visit[frozenset[Identifier]]:
+    # An arithmetic expression — union of both operands' free variables.
+    return (yield term.left) | (yield term.right)
+
+
+def _fv_branch(term: Branch) -> Visit[frozenset[Identifier]]:
+    # A conditional — variables can appear in the condition operands
+    # and in either branch arm, so union all four.
+    return (yield term.left) | (yield term.right) | (yield term.consequent) | (yield term.otherwise)
+
+
+def _fv_load(term: Load) -> Visit[frozenset[Identifier]]:
+    # The address to load from may contain variable references.
+    return (yield term.base)
+
+
+def _fv_store(term: Store) -> Visit[frozenset[Identifier]]:
+    # Both the address and the value being stored may reference variables.
+    # (index is a compile-time Nat literal, not a variable)
+    return (yield term.base) | (yield term.value)
+
+
+def _fv_begin(term: Begin) -> Visit[frozenset[Identifier]]:
+    # A sequence of effects followed by a final value.
+    # Variables can appear in any effect or in the final value.
+    result = set((yield term.value))
+    for e in term.effects:
+        result |= yield e
+    return frozenset(result)
+
+
+_free_variables = Traversal[frozenset[Identifier]](
+    memoized(
+        {
+            "reference": _fv_reference,
+            "let": _fv_let,
+            "abstract": _fv_abstract,
+            "apply": _fv_apply,
+            "immediate": _fv_constant,
+            "primitive": _fv_primitive,
+            "branch": _fv_branch,
+            "allocate": _fv_constant,
+            "load": _fv_load,
+            "store": _fv_store,
+            "begin": _fv_begin,
+        },
+        free_variables_memo,
+    )
+)
 
 
 def is_pure(term: Term) -> bool:
-    match term:
-        case Immediate() | Reference():
-            # Literals and variable reads have no side-effects.
-            return True
-
-        case Primitive(left=left, right=right):
-            # Arithmetic is pure only if both operands are pure.
-            # (No division — so no division-by-zero side-effect to worry about.)
-            return is_pure(left) and is_pure(right)
-
-        case Abstract():
-            # Building a closure captures variables but does not execute the
-            # body — so the act of forming the closure is itself pure.
-            return True
-
-        case Let(bindings=bindings, body=body):
-            # A Let is pure only if every bound value is pure AND the body is
-            # pure.  If any binding is impure we must keep the whole thing.
-            return all(is_pure(v) for _, v in bindings) and is_pure(body)
-
-        case Apply() | Allocate() | Load() | Store() | Begin() | Branch():
-            # All of these can have side-effects — treat as impure.
-            return False
+    if getattr(term, "tag", None) not in _is_pure.handlers:
+        # Unknown variant — be conservative and say "not pure" so we
+        # never accidentally drop something important.
+        return False
+    return _is_pure(term)
+
 
-        case _:
-            # Unknown variant — be conservative and say "not pure" so we
-            # never accidentally drop something important.
+def _pure(term: Immediate | Reference | Abstract) -> bool:
+    # Literals and variable reads have no side-effects.
+    # Building a closure captures variables but does not execute the
+    # body — so the act of forming the closure is itself pure.
+    return True
+
+
+def _pure_primitive(term: Primitive) -> Visit[bool]:
+    # Arithmetic is pure only if both operands are pure.
+    # (No division — so no division-by-zero side-effect to worry about.)
+    return (yield term.left) and (yield term.right)
+
+
+def _pure_let(term: Let) -> Visit[bool]:
+    # A Let is pure only if every bound value is pure AND the body is
+    # pure.  If any binding is impure we must keep the whole thing.
+    for _, v in term.bindings:
+        if not (yield v):
             return False
+    return (yield term.body)
+
+
+def _impure(term: Apply | Allocate | Load | Store | Begin | Branch) -> bool:
+    # All of these can have side-effects — treat as impure.
+    return False
+
+
+_is_pure = Traversal[bool](
+    memoized(
+        {
+            "immediate": _pure,
+            "reference": _pure,
+            "abstract": _pure,
+            "primitive": _pure_primitive,
+            "let": _pure_let,
+            "apply": _impure,
+            "allocate": _impure,
+            "load": _impure,
+            "store": _impure,
+            "begin": _impure,
+            "branch": _impure,
+        },
+        is_pure_memo,
+    )
+)
 
 
 # main
 
+# A reduced term with its free variables and purity. The pass works them out bottom-up
+# as it rebuilds each node, from its children's, so deciding which bindings are live
+# never walks a subtree again; they go into the memos above for the other passes.
+type Reduced = tuple[Term, frozenset[Identifier], bool]
+
+# Reduced terms by node identity: a subterm the optimizer's last iteration left alone is
+# not walked again.
+dead_code_elimination_memo = IdentityMemo[Term, Reduced]()
+
+_NO_VARIABLES: frozenset[Identifier] = frozenset()
+
+
+def _annotated(term: Term, fvs: frozenset[Identifier], pure: bool) -> Reduced:
+    return term, free_variables_memo.put(term, fvs), is_pure_memo.put(term, pure)
+
+
+def _let(term: Let) -> Visit[Reduced]:
+    # Step 1: recurse bottom-up
+    reduced_body, body_fvs, body_pure = yield term.body
+    reduced_values: list[Reduced] = yield from each(val for _, val in term.bindings)
+
+    # Step 2: decide which bindings are live
+
+    live_bindings: list[tuple[Identifier, Reduced]] = []
+
+    # Seed `live` with names that are actually needed by the body.
+    live = set(body_fvs)
+
+    for (name, _), reduced in zip(reversed(term.bindings), reversed(reduced_values), strict=True):
+        _, fvs, pure = reduced
+        if name in live or not pure:
+            live_bindings.append((name, reduced))
+            live |= fvs
+    live_bindings.reverse()
+
+    # Step 3: reassemble
+    if not live_bindings:
+        return reduced_body, body_fvs, body_pure
+
+    # free in the Let: each value's free variables but the names bound before it, and
+    # the body's but all of them
+    bound: set[Identifier] = set()
+    let_fvs: set[Identifier] = set()
+    for name, (_, fvs, _) in live_bindings:
+        let_fvs |= fvs - bound
+        bound.add(name)
+    let_fvs |= body_fvs - bound
+
+    return _annotated(
+        rebuild(term, bindings=tuple((name, val) for name, (val, _, _) in live_bindings), body=reduced_body),
+        frozenset(let_fvs),
+        body_pure and all(pure for _, (_, _, pure) in live_bindings),
+    )
+
+
+def _abstract(term: Abstract) -> Visit[Reduced]:
+    # Recurse into the lambda body — dead bindings can hide inside lambdas.
+    body, fvs, _ = yield term.body
+    return _annotated(
+        rebuild(term, body=body),
+        fvs - frozenset(term.parameters),
+        True,
+    )
+
+
+def _apply(term: Apply) -> Visit[Reduced]:
+    # Recurse into the function and each argument.
+    target, fvs, _ = yield term.target
+    arguments: list[Reduced] = yield from each(term.arguments)
+    return _annotated(
+        rebuild(term, target=target, arguments=tuple(argument for argument, _, _ in arguments)),
+        fvs.union(*(argument_fvs for _, argument_fvs, _ in arguments)),
+        False,
+    )
+
+
+def _primitive(term: Primitive) -> Visit[Reduced]:
+    # Recurse into both operands.
+    left, left_fvs, left_pure = yield term.left
+    right, right_fvs, right_pure = yield term.right
+    return _annotated(
+        rebuild(term, left=left, right=right),
+        left_fvs | right_fvs,
+        left_pure and right_pure,
+    )
+
+
+def _branch(term: Branch) -> Visit[Reduced]:
+    # Recurse into the condition operands and both arms.
+    left, left_fvs, _ = yield term.left
+    right, right_fvs, _ = yield term.right
+    consequent, consequent_fvs, _ = yield term.consequent
+    otherwise, otherwise_fvs, _ = yield term.otherwise
+    return _annotated(
+        rebuild(term, left=left, right=right, consequent=consequent, otherwise=otherwise),
+        left_fvs | right_fvs | consequent_fvs | otherwise_fvs,
+        False,
+    )
+
+
+def _load(term: Load) -> Visit[Reduced]:
+    base, fvs, _ = yield term.base
+    return _annotated(rebuild(term, base=base), fvs, False)
+
+
+def _store(term: Store) -> Visit[Reduced]:
+    base, base_fvs, _ = yield term.base
+    value, value_fvs, _ = yield term.value
+    return _annotated(rebuild(term, base=base, value=value), base_fvs | value_fvs, False)
+
+
+def _begin(term: Begin) -> Visit[Reduced]:
+    # Every effect in a Begin is intentionally side-effectful, so we
+    # never drop them — but we still recurse inside each one in case
+    # there are dead Let-bindings nested within an effect expression.
+    effects: list[Reduced] = yield from each(term.effects)
+    value, fvs, _ = yield term.value
+    return _annotated(
+        rebuild(term, effects=tuple(effect for effect, _, _ in effects), value=value),
+        fvs.union(*(effect_fvs for _, effect_fvs, _ in effects)),
+        False,
+    )
+
+
+# Atomic terms — nothing to eliminate, return as-is.
+
+
+def _immediate(term: Immediate) -> Reduced:
+    return term, _NO_VARIABLES, True
+
+
+def _reference(term: Reference) -> Reduced:
+    return term, frozenset((term.name,)), True
+
+
+def _allocate(term: Allocate) -> Reduced:
+    return term, _NO_VARIABLES, False
+
+
+_dead_code_elimination = Traversal[Reduced](
+    memoized(
+        {
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "primitive": _primitive,
+            "branch": _branch,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+            "immediate": _immediate,
+            "reference": _reference,
+            "allocate": _allocate,
+        },
+        dead_code_elimination_memo,
+    )
+)
+
 
 def dead_code_elimination_term(term: Term) -> Term:
     """Recursively eliminate dead Let-bindings from *term*.
@@ -164,77 +381,4 @@ def dead_code_elimination_term(term: Term) -> Term:
     term kinds just recurse into their sub-terms to clean up anything nested
     inside them.
     """
-    match term:
-        case Let(bindings=bindings, body=body):
-            # Step 1: recurse bottom-up
-            reduced_body = dead_code_elimination_term(body)
-            reduced_bindings = tuple((name, dead_code_elimination_term(val)) for name, val in bindings)
-
-            # Step 2: decide which bindings are live
-
-            live_bindings: list[tuple[Identifier, Term]] = []
-
-            # Seed `live` with names that are actually needed by the body.
-            live: frozenset[Identifier] = free_variables(reduced_body)
-
-            for name, val in reversed(reduced_bindings):
-                if name in live or not is_pure(val):
-                    live_bindings.insert(0, (name, val))
-                    live = live | free_variables(val)
-
-            # Step 3: reassemble
-            if not live_bindings:
-                return reduced_body
-            return Let(bindings=tuple(live_bindings), body=reduced_body)
-
-        case Abstract(parameters=parameters, body=body):
-            # Recurse into the lambda body — dead bindings can hide inside lambdas.
-            return Abstract(parameters=parameters, body=dead_code_elimination_term(body))
-
-        case Apply(target=target, arguments=arguments):
-            # Recurse into the function and each argument.
-            return Apply(
-                target=dead_code_elimination_term(target),
-                arguments=tuple(dead_code_elimination_term(a) for a in arguments),
-            )
-
-        case Primitive(operator=operator, left=left, right=right):
-            # Recurse into both operands.
-            return Primitive(
-                operator=operator,
-                left=dead_code_elimination_term(left),
-                right=dead_code_elimination_term(right),
-            )
-
-        case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            # Recurse into the condition operands and both arms.
-            return Branch(
-                operator=operator,
-                left=dead_code_elimination_term(left),
-                right=dead_code_elimination_term(right),
-                consequent=dead_code_elimination_term(consequent),
-                otherwise=dead_code_elimination_term(otherwise),
-            )
-
-        case Load(base=base, index=index):
-            return Load(base=dead_code_elimination_term(base), index=index)
-
-        case Store(base=base, index=index, value=value):
-            return Store(
-                base=dead_code_elimination_term(base),
-                index=index,
-                value=dead_code_elimination_term(value),
-            )
-
-        case Begin(effects=effects, value=value):
-            # Every effect in a Begin is intentionally side-effectful, so we
-            # never drop them — but we still recurse inside each one in case
-            # there are dead Let-bindings nested within an effect expression.
-            return Begin(
-                effects=tuple(dead_code_elimination_term(e) for e in effects),
-                value=dead_code_elimination_term(value),
-            )
-
-        case Immediate() | Reference() | Allocate():  # pragma: no branch
-            # Atomic terms — nothing to eliminate, return as-is.
-            return term
+    return _dead_code_elimination(term)[0]
@@ -0,0 +1,639 @@
+from array import array
+from collections.abc import Callable, Iterable, Sequence
+
+from util.budget import Budget, active_budget
+from util.scoped_map import ScopedMap
+from util.symbols import SymbolTable, active_symbols
+from util.trusted import trusted
+
+from .pass_manager import parse_pipeline
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+A flat, array-backed encoding of L2 programs, and the optimizer passes over it.
+
+Nodes are numbered so that children come before their parents, and each node is a row
+across a struct of arrays:
+
+  tags      what kind of node it is (LET, REFERENCE, ...)
+  operands  the immediate value, the name of a reference, an operator code, an
+            allocation count or a load/store index; for LET and ABSTRACT, the offset
+            of its names in binders
+  starts    where its children start in edges
+  counts    how many children it has
+
+edges holds child node numbers, in the order the fields appear in L2.syntax (a Let's
+values then its body, a Begin's effects then its value, ...). binders holds the names a
+Let or Abstract binds, each run prefixed by its length. Names are ids in a symbol table
+(util.symbols, by default the one the compilation has applied), and immediates too
+large for 64 bits live in a side table.
+
+A million-node program takes about 17 bytes per node plus 4 per edge, instead of a
+pydantic object per node. The passes below mirror the tree passes in constant_folding,
+constant_propagation, dead_code_elim and branch_elimination: converting a program,
+running a flat pass and converting back gives exactly what the tree pass gives. Each
+pass sweeps the rows in order, appends its output to a new program and then lays that
+out again in canonical postorder, so equal programs have equal arrays.
+
+The passes are registered by the names of the tree passes, and optimize_flat_program runs
+a pipeline of them as pass_manager runs one of those, written the same way, with the
+same limits and under a budget.
+"""
+
+LET, REFERENCE, ABSTRACT, APPLY, IMMEDIATE, BIG_IMMEDIATE, PRIMITIVE, BRANCH, ALLOCATE, LOAD, STORE, BEGIN = range(12)
+
+PRIMITIVES = ("+", "-", "*")
+COMPARISONS = ("<", "==")
+PLUS, MINUS, TIMES = range(3)
+LESS, EQUAL = range(2)
+
+_SMALLEST = -(1 << 63)
+_LARGEST = (1 << 63) - 1
+
+
+class FlatProgram:
+    def __init__(self, symbols: SymbolTable | None = None) -> None:
+        self.tags = array("B")
+        self.operands = array("q")
+        self.starts = array("I")
+        self.counts = array("I")
+        self.edges = array("I")
+        self.binders = array("I")
+        self.bigs: list[int] = []
+        # Symbol tables only grow, so programs derived from one another share one.
+        self.symbols = symbols if symbols is not None else active_symbols() or SymbolTable()
+        self.parameters = array("I")
+        self.root = 0
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def __eq__(self, other: object) -> bool:
+        match other:
+            case FlatProgram():
+                return (
+                    self.root == other.root
+                    and self.tags == other.tags
+                    and self.operands == other.operands
+                    and self.counts == other.counts
+                    and self.edges == other.edges
+                    and self.binders == other.binders
+                    and self.bigs == other.bigs
+                    and self.parameters == other.parameters
+                    and (self.symbols is other.symbols or self.symbols.names == other.symbols.names)
+                )
+
+            case _:
+                return NotImplemented
+
+    __hash__ = None  # pyright: ignore[reportAssignmentType]
+
+    def derive(self) -> FlatProgram:
+        # An empty program over the same names and parameters, for a pass to build into.
+        derived = FlatProgram(self.symbols)
+        derived.parameters = self.parameters
+        return derived
+
+    def name(self, name: str) -> int:
+        return self.symbols.intern(name)
+
+    def add(self, tag: int, operand: int = 0, children: Iterable[int] = ()) -> int:
+        self.tags.append(tag)
+        self.operands.append(operand)
+        self.starts.append(len(self.edges))
+        self.edges.extend(children)
+        self.counts.append(len(self.edges) - self.starts[-1])
+        return len(self.tags) - 1
+
+    def bind(self, names: Sequence[int]) -> int:
+        # Stores a run of binder names and returns its offset, for use as an operand.
+        offset = len(self.binders)
+        self.binders.append(len(names))
+        self.binders.extend(names)
+        return offset
+
+    def immediate(self, value: int) -> int:
+        if _SMALLEST <= value <= _LARGEST:
+            return self.add(IMMEDIATE, value)
+        self.bigs.append(value)
+        return self.add(BIG_IMMEDIATE, len(self.bigs) - 1)
+
+    def value(self, node: int) -> int | None:
+        # The value of an immediate, or None for any other node.
+        tag = self.tags[node]
+        if tag == IMMEDIATE:
+            return self.operands[node]
+        if tag == BIG_IMMEDIATE:
+            return self.bigs[self.operands[node]]
+        return None
+
+    def children(self, node: int) -> memoryview:
+        start = self.starts[node]
+        return memoryview(self.edges)[start : start + self.counts[node]]
+
+    def bound(self, node: int) -> memoryview:
+        # The names a LET or ABSTRACT binds.
+        offset = self.operands[node]
+        return memoryview(self.binders)[offset + 1 : offset + 1 + self.binders[offset]]
+
+    def copy(self, source: FlatProgram, node: int, children: Iterable[int]) -> int:
+        # Adds a node like source's node, over new children.
+        tag = source.tags[node]
+        if tag in (LET, ABSTRACT):
+            return self.add(tag, self.bind(source.bound(node)), children)
+        if tag in (IMMEDIATE, BIG_IMMEDIATE):
+            return self.immediate(source.value(node))  # pyright: ignore[reportArgumentType]
+        return self.add(tag, source.operands[node], children)
+
+    def compact(self, root: int) -> FlatProgram:
+        # The part of this program reachable from root, in canonical postorder.
+        compacted = self.derive()
+        starts, counts, edges = self.starts, self.counts, self.edges
+        placed = array("q", [-1]) * len(self)
+        stack: list[int] = [root]
+
+        # A node is pushed as ~node once its children are on the stack above it.
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                node = ~node
+                start = starts[node]
+                placed[node] = compacted.copy(
+                    self, node, [placed[child] for child in edges[start : start + counts[node]]]
+                )
+            elif placed[node] < 0:
+                start = starts[node]
+                stack.append(~node)
+                stack.extend(reversed(edges[start : start + counts[node]]))
+
+        compacted.root = placed[root]
+        return compacted
+
+
+# Conversion
+
+
+def _subterms(term: Term) -> list[Term]:
+    match term:
+        case Let(bindings=bindings, body=body):
+            return [*(value for _, value in bindings), body]
+
+        case Abstract(body=body):
+            return [body]
+
+        case Apply(target=target, arguments=arguments):
+            return [target, *arguments]
+
+        case Primitive(left=left, right=right):
+            return [left, right]
+
+        case Branch(left=left, right=right, consequent=consequent, otherwise=otherwise):
+            return [left, right, consequent, otherwise]
+
+        case Load(base=base):
+            return [base]
+
+        case Store(base=base, value=value):
+            return [base, value]
+
+        case Begin(effects=effects, value=value):
+            return [*effects, value]
+
+        case Reference() | Immediate() | Allocate():  # pragma: no branch
+            return []
+
+
+def _row(flat: FlatProgram, term: Term, children: list[int]) -> int:
+    match term:
+        case Let(bindings=bindings):
+            return flat.add(LET, flat.bind([flat.name(name) for name, _ in bindings]), children)
+
+        case Reference(name=name):
+            return flat.add(REFERENCE, flat.name(name))
+
+        case Abstract(parameters=parameters):
+            return flat.add(ABSTRACT, flat.bind([flat.name(name) for name in parameters]), children)
+
+        case Apply():
+            return flat.add(APPLY, 0, children)
+
+        case Immediate(value=value):
+            return flat.immediate(value)
+
+        case Primitive(operator=operator):
+            return flat.add(PRIMITIVE, PRIMITIVES.index(operator), children)
+
+        case Branch(operator=operator):
+            return flat.add(BRANCH, COMPARISONS.index(operator), children)
+
+        case Allocate(count=count):
+            return flat.add(ALLOCATE, count)
+
+        case Load(index=index):
+            return flat.add(LOAD, index, children)
+
+        case Store(index=index):
+            return flat.add(STORE, index, children)
+
+        case Begin():  # pragma: no branch
+            return flat.add(BEGIN, 0, children)
+
+
+def flatten_program(program: Program) -> FlatProgram:
+    flat = FlatProgram()
+    flat.parameters.extend(flat.name(name) for name in program.parameters)
+
+    stack: list[tuple[Term, bool]] = [(program.body, False)]
+    rows: list[int] = []
+
+    while stack:
+        term, expanded = stack.pop()
+        subterms = _subterms(term)
+        if not expanded and subterms:
+            stack.append((term, True))
+            stack.extend((subterm, False) for subterm in reversed(subterms))
+            continue
+        children = rows[len(rows) - len(subterms) :]
+        del rows[len(rows) - len(subterms) :]
+        rows.append(_row(flat, term, children))
+
+    flat.root = rows[0]
+    return flat
+
+
+def unflatten_program(flat: FlatProgram) -> Program:
+    names = flat.symbols.names
+    terms: list[Term] = []
+
+    for node in range(len(flat)):
+        children = [terms[child] for child in flat.children(node)]
+        operand = flat.operands[node]
+
+        tag = flat.tags[node]
+        if tag == LET:
+            bound = [names[name] for name in flat.bound(node)]
+            bindings = tuple(zip(bound, children, strict=False))
+            terms.append(trusted(Let, bindings=bindings, body=children[-1]))
+
+        elif tag == REFERENCE:
+            terms.append(trusted(Reference, name=names[operand]))
+
+        elif tag == ABSTRACT:
+            parameters = tuple(names[name] for name in flat.bound(node))
+            terms.append(trusted(Abstract, parameters=parameters, body=children[0]))
+
+        elif tag == APPLY:
+            terms.append(trusted(Apply, target=children[0], arguments=tuple(children[1:])))
+
+        elif tag in (IMMEDIATE, BIG_IMMEDIATE):
+            terms.append(trusted(Immediate, value=flat.value(node)))
+
+        elif tag == PRIMITIVE:
+            terms.append(
+                trusted(Primitive, operator=PRIMITIVES[operand], left=children[0], right=children[1]),
+            )
+
+        elif tag == BRANCH:
+            left, right, consequent, otherwise = children
+            terms.append(
+                trusted(
+                    Branch,
+                    operator=COMPARISONS[operand],
+                    left=left,
+                    right=right,
+                    consequent=consequent,
+                    otherwise=otherwise,
+                )
+            )
+
+        elif tag == ALLOCATE:
+            terms.append(trusted(Allocate, count=operand))
+
+        elif tag == LOAD:
+            terms.append(trusted(Load, base=children[0], index=operand))
+
+        elif tag == STORE:
+            terms.append(trusted(Store, base=children[0], index=operand, value=children[1]))
+
+        else:
+            assert tag == BEGIN
+            terms.append(trusted(Begin, effects=tuple(children[:-1]), value=children[-1]))
+
+    return trusted(Program, parameters=tuple(names[name] for name in flat.parameters), body=terms[flat.root])
+
+
+# Passes
+
+
+def constant_folding_flat(flat: FlatProgram) -> FlatProgram:
+    out = flat.derive()
+    folded = [0] * len(flat)
+
+    starts, counts, edges = flat.starts, flat.counts, flat.edges
+
+    for node in range(len(flat)):
+        start = starts[node]
+        children = [folded[child] for child in edges[start : start + counts[node]]]
+
+        tag = flat.tags[node]
+        if tag == PRIMITIVE:
+            folded[node] = _fold_primitive(out, flat.operands[node], children[0], children[1])
+
+        elif tag == BRANCH:
+            left, right, consequent, otherwise = children
+            i1, i2 = out.value(left), out.value(right)
+            if i1 is not None and i2 is not None:
+                condition = (i1 < i2) if flat.operands[node] == LESS else (i1 == i2)
+                folded[node] = consequent if condition else otherwise
+            else:
+                folded[node] = out.add(BRANCH, flat.operands[node], children)
+
+        else:
+            folded[node] = out.copy(flat, node, children)
+
+    return out.compact(folded[flat.root])
+
+
+def _operands(out: FlatProgram, node: int, operator: int) -> tuple[int, int] | None:
+    # (i, rest) when node is (operator i rest) with an immediate i on the left.
+    if out.tags[node] != PRIMITIVE or out.operands[node] != operator:
+        return None
+    left, right = out.children(node)
+    value = out.value(left)
+    return None if value is None else (value, right)
+
+
+def _fold_primitive(out: FlatProgram, operator: int, left: int, right: int) -> int:
+    i1, i2 = out.value(left), out.value(right)
+
+    if operator == PLUS:
+        if i1 is not None and i2 is not None:
+            return out.immediate(i1 + i2)
+        if i1 == 0:
+            return right
+        if i2 == 0:
+            return left
+        if (a := _operands(out, left, PLUS)) and (b := _operands(out, right, PLUS)):
+            return out.add(PRIMITIVE, PLUS, [out.immediate(a[0] + b[0]), out.add(PRIMITIVE, PLUS, [a[1], b[1]])])
+        if (a := _operands(out, left, MINUS)) and (b := _operands(out, right, MINUS)):
+            return out.add(PRIMITIVE, MINUS, [out.immediate(a[0] + b[0]), out.add(PRIMITIVE, PLUS, [a[1], b[1]])])
+        if i2 is not None:
+            return out.add(PRIMITIVE, PLUS, [right, left])
+        return out.add(PRIMITIVE, PLUS, [left, right])
+
+    if operator == MINUS:
+        if i1 is not None and i2 is not None:
+            return out.immediate(i1 - i2)
+        if i2 == 0:
+            return left
+        if out.tags[left] == REFERENCE and out.tags[right] == REFERENCE and out.operands[left] == out.operands[right]:
+            return out.immediate(0)
+        if (a := _operands(out, left, MINUS)) and (b := _operands(out, right, MINUS)):
+            return out.add(PRIMITIVE, MINUS, [out.immediate(a[0] - b[0]), out.add(PRIMITIVE, MINUS, [a[1], b[1]])])
+        if (a := _operands(out, left, PLUS)) and (b := _operands(out, right, PLUS)):
+            return out.add(PRIMITIVE, PLUS, [out.immediate(a[0] - b[0]), out.add(PRIMITIVE, MINUS, [a[1], b[1]])])
+        if i2 is not None:
+            return out.add(PRIMITIVE, PLUS, [out.immediate(-i2), left])
+        return out.add(PRIMITIVE, MINUS, [left, right])
+
+    assert operator == TIMES
+    if i1 is not None and i2 is not None:
+        return out.immediate(i1 * i2)
+    if i1 == 0 or i2 == 0:
+        return out.immediate(0)
+    if i1 == 1:
+        return right
+    if i2 == 1:
+        return left
+    if (a := _operands(out, left, TIMES)) and (b := _operands(out, right, TIMES)):
+        return out.add(PRIMITIVE, TIMES, [out.immediate(a[0] * b[0]), out.add(PRIMITIVE, TIMES, [a[1], b[1]])])
+    if i2 is not None:
+        return out.add(PRIMITIVE, TIMES, [right, left])
+    return out.add(PRIMITIVE, TIMES, [left, right])
+
+
+def branch_elimination_flat(flat: FlatProgram) -> FlatProgram:
+    out = flat.derive()
+    eliminated = [0] * len(flat)
+
+    starts, counts, edges = flat.starts, flat.counts, flat.edges
+
+    for node in range(len(flat)):
+        start = starts[node]
+        children = [eliminated[child] for child in edges[start : start + counts[node]]]
+
+        if flat.tags[node] == BRANCH:
+            left, right, consequent, otherwise = children
+            i1, i2 = out.value(left), out.value(right)
+            if i1 is not None and i2 is not None:
+                condition = (i1 < i2) if flat.operands[node] == LESS else (i1 == i2)
+                eliminated[node] = consequent if condition else otherwise
+                continue
+
+        eliminated[node] = out.copy(flat, node, children)
+
+    return out.compact(eliminated[flat.root])
+
+
+_EMPTY: frozenset[int] = frozenset()
+
+
+def dead_code_elimination_flat(flat: FlatProgram) -> FlatProgram:
+    out = flat.derive()
+    reduced = [0] * len(flat)
+    # free variables and purity of every node of out, as free_variables and is_pure define them
+    free: list[frozenset[int]] = []
+    pure = bytearray()
+
+    def add(node: int) -> int:
+        children = out.children(node)
+        tag = out.tags[node]
+        if tag == LET:
+            *values, body = children
+            bound: set[int] = set()
+            fvs: set[int] = set()
+            for name, value in zip(out.bound(node), values, strict=True):
+                fvs |= free[value] - bound
+                bound.add(name)
+            fvs |= free[body] - bound
+            free.append(frozenset(fvs))
+            pure.append(all(pure[child] for child in children))
+
+        elif tag == REFERENCE:
+            free.append(frozenset((out.operands[node],)))
+            pure.append(True)
+
+        elif tag == ABSTRACT:
+            free.append(free[children[0]] - frozenset(out.bound(node)))
+            pure.append(True)
+
+        elif tag in (IMMEDIATE, BIG_IMMEDIATE):
+            free.append(_EMPTY)
+            pure.append(True)
+
+        else:
+            free.append(_EMPTY.union(*(free[child] for child in children)))
+            pure.append(tag == PRIMITIVE and pure[children[0]] and pure[children[1]])
+
+        return node
+
+    starts, counts, edges = flat.starts, flat.counts, flat.edges
+
+    for node in range(len(flat)):
+        start = starts[node]
+        children = [reduced[child] for child in edges[start : start + counts[node]]]
+
+        if flat.tags[node] != LET:
+            reduced[node] = add(out.copy(flat, node, children))
+            continue
+
+        *values, body = children
+        live = set(free[body])
+        kept: list[tuple[int, int]] = []
+        for name, value in reversed(list(zip(flat.bound(node), values, strict=True))):
+            if name in live or not pure[value]:
+                kept.append((name, value))
+                live |= free[value]
+        kept.reverse()
+
+        if not kept:
+            reduced[node] = body
+        else:
+            operand = out.bind([name for name, _ in kept])
+            reduced[node] = add(out.add(LET, operand, [*(value for _, value in kept), body]))
+
+    return out.compact(reduced[flat.root])
+
+
+def constant_propagation_flat(flat: FlatProgram) -> FlatProgram:
+    out = flat.derive()
+    # finished children, pushed in order; a node's frame pops them when it is rebuilt
+    results: list[int] = []
+    # the known constants, by name; each node undoes what it bound once it is rebuilt
+    env = ScopedMap[int, int]()
+    # (node, mark, step): step counts how many of the node's children have been visited,
+    # mark is where env stood before the node was entered
+    stack: list[tuple[int, int, int]] = [(flat.root, 0, 0)]
+
+    while stack:
+        node, mark, step = stack.pop()
+        children = flat.children(node)
+        tag = flat.tags[node]
+
+        if step < len(children):
+            if step == 0:
+                mark = env.mark()
+            if tag == LET and step > 0:
+                # the previous binding is done; a constant extends the env of the rest, and
+                # anything else shadows whatever constant the name had
+                value = out.value(results[-1])
+                if value is not None:
+                    env.bind(flat.bound(node)[step - 1], value)
+                else:
+                    env.hide(flat.bound(node)[step - 1])
+            if tag == ABSTRACT:
+                for parameter in flat.bound(node):
+                    env.hide(parameter)
+            stack.append((node, mark, step + 1))
+            stack.append((children[step], 0, 0))
+            continue
+
+        if tag == REFERENCE and flat.operands[node] in env:
+            results.append(out.immediate(env[flat.operands[node]]))
+            continue
+
+        if children:
+            env.undo(mark)
+        rebuilt = results[len(results) - len(children) :]
+        del results[len(results) - len(children) :]
+        results.append(out.copy(flat, node, rebuilt))
+
+    return out.compact(results[0])
+
+
+# Pipelines
+
+
+class FlatPass:
+    def __init__(self, name: str, run: Callable[[FlatProgram], FlatProgram]) -> None:
+        self.name = name
+        self.run = run
+
+    def __repr__(self) -> str:
+        return f"FlatPass({self.name!r})"
+
+
+type FlatPipeline = Sequence[tuple[FlatPass, int]]
+
+# by the names of the tree passes they mirror, so a pipeline of them reads the same
+FLAT_PASSES = {
+    step.name: step
+    for step in [
+        FlatPass("propagate", constant_propagation_flat),
+        FlatPass("fold", constant_folding_flat),
+        FlatPass("dce", dead_code_elimination_flat),
+        FlatPass("branch", branch_elimination_flat),
+    ]
+}
+
+# each to a fixed point, as -O2 runs its passes; parsed with optimize.PASSES instead, the
+# same pipeline over trees
+SEPARATE = "propagate:100,fold:100,dce:100,branch:100"
+DEFAULT_FLAT_PIPELINE = parse_pipeline(SEPARATE, FLAT_PASSES)
+
+
+def optimize_flat_term(flat: FlatProgram) -> FlatProgram:
+    """Apply each pass once, in SEPARATE's order: propagate, fold, dce, branch."""
+    for step, _ in DEFAULT_FLAT_PIPELINE:
+        flat = step.run(flat)
+    return flat
+
+
+def optimize_flat_program(
+    flat: FlatProgram, pipeline: FlatPipeline = DEFAULT_FLAT_PIPELINE, budget: Budget | None = None
+) -> FlatProgram:
+    # As run_pipeline runs a pipeline: the passes in order, over and over until a round
+    # changes nothing, each at most its limit. The passes leave programs in canonical
+    # layout, so a pass changed nothing when its output equals its input. A flat pass is a
+    # single sweep, so under a budget it is charged its rows as it starts rather than cut
+    # short; once the budget is exhausted the passes with runs left are skipped.
+    budget = budget if budget is not None else active_budget()
+    flat = flat.compact(flat.root)
+    remaining = [limit for _, limit in pipeline]
+
+    changed = True
+    while changed:
+        changed = False
+        for index, (step, _) in enumerate(pipeline):
+            if not remaining[index]:
+                continue
+
+            if budget is not None:
+                if budget.exhausted:
+                    budget.skipped.extend(
+                        later.name for (later, _), left in zip(pipeline, remaining, strict=True) if left
+                    )
+                    return flat
+                budget.spend(len(flat))
+            remaining[index] -= 1
+
+            optimized = step.run(flat)
+            if optimized != flat:
+                flat = optimized
+                changed = True
+
+    return flat
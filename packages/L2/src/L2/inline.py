@@ -0,0 +1,419 @@
+from collections import Counter
+from collections.abc import Callable
+
+from util.budget import CHARGE_EVERY, charge
+from util.hash_cons import children, cons, rebuild
+from util.memo import IdentityMemo
+from util.scoped_map import ScopedMap
+from util.sequential_name_generator import SequentialNameGenerator
+from util.traverse import Traversal, Visit, each, memoized
+
+from .dead_code_elim import free_variables
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Identifier,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+Inlining: a call to a known lambda becomes the lambda's body.
+
+A lambda is known where it is applied directly, `((lambda (x) ...) e)`, or where a name
+a Let binds to it is in scope. The call becomes a copy of the body, with every binder in
+it renamed fresh so the names stay unique, and with each parameter bound to its argument
+by a Let, in order, so the arguments are evaluated once and before the body, as a call
+evaluates them. An argument that is a Reference or an Immediate is substituted for its
+parameter instead, since it costs nothing to evaluate twice. The copy is then walked in
+turn, so a call it makes to a lambda passed in as an argument is inlined too.
+
+Whether a call is inlined is up to a cost model, counted in nodes:
+
+- a lambda applied directly, or bound to a name referenced once, is always inlined: the
+  lambda is not needed afterwards, and dead code elimination takes it away, so the
+  program does not grow;
+- any other known lambda is inlined if its body is at most INLINE_SIZE nodes and the
+  run's allowance for growth covers it. The allowance is GROWTH times the size of the
+  term the run starts from, and each such inlining spends its body's size.
+
+The body of a lambda refers to names bound where the lambda is, and a call is inlined
+only where each of those still means the same binder. Recursive functions are not
+inlined: eliminate_letrec makes their calls through a Load, which is not a known lambda.
+
+A Let bound by a Let's binding is merged into it, `let f = (let x = e in (lambda ...))`
+becoming `let x = e, f = (lambda ...)`, so a lambda an inlined call returns is known to
+the calls after it. It is merged only where no later binding, nor the body, refers to an
+x bound outside.
+
+Which names Lets bind to lambdas and which names are called is summarized by node and
+kept, with each term's size; a term with no call that could be inlined is returned as it
+is without a walk, which is what the optimizer's later rounds find.
+"""
+
+# Largest body, in nodes, that a lambda referenced more than once may have to be inlined.
+INLINE_SIZE = 32
+# How much a run may grow the term, as a fraction of its size.
+GROWTH = 0.25
+
+# What inlining needs to know of a term, by node identity: its size in nodes of the tree
+# (a subtree shared in a hash-consed term counted each time it appears), the names Lets
+# in it bind to lambdas (or to Lets, which may end in one), the names it calls, and
+# whether it applies a lambda directly.
+type Summary = tuple[int, frozenset[Identifier], frozenset[Identifier], bool]
+
+summary_memo = IdentityMemo[Term, Summary]()
+
+_NO_NAMES: frozenset[Identifier] = frozenset()
+
+
+def _summarize(term: Term) -> Visit[Summary]:
+    parts: list[Summary] = yield from each(children(term))
+    size = 1 + sum(part[0] for part in parts)
+    functions = _NO_NAMES.union(*(part[1] for part in parts if part[1]))
+    called = _NO_NAMES.union(*(part[2] for part in parts if part[2]))
+    direct = any(part[3] for part in parts)
+    match term:
+        case Let(bindings=bindings):
+            functions |= {name for name, value in bindings if isinstance(value, Abstract | Let)}
+        case Apply(target=Abstract()):
+            direct = True
+        case Apply(target=Reference(name=name)):
+            called |= {name}
+        case _:
+            pass
+    return size, functions, called, direct
+
+
+_summary = Traversal[Summary](
+    memoized(
+        dict.fromkeys(
+            [
+                "let",
+                "reference",
+                "abstract",
+                "apply",
+                "immediate",
+                "primitive",
+                "branch",
+                "allocate",
+                "load",
+                "store",
+                "begin",
+            ],
+            _summarize,
+        ),
+        summary_memo,
+    )
+)
+
+
+def _candidates(term: Term) -> bool:
+    # whether any call in term might be inlined: one applying a lambda, or calling a name
+    # some Let binds to one
+    _, functions, called, direct = _summary(term)
+    return direct or not functions.isdisjoint(called)
+
+
+class _Inlining:
+    # What a walk knows: the lambdas bound in scope, the order in which the names in scope
+    # were bound, how often each name is referenced, and how much more the term may grow.
+    def __init__(self, term: Term, free_variables: Callable[[Term], frozenset[Identifier]]) -> None:
+        self.free_variables = free_variables
+        self.lambdas = ScopedMap[Identifier, tuple[Abstract, int]]()
+        self.bound = ScopedMap[Identifier, int]()
+        self.binders = 0
+        self.uses = Counter[Identifier]()
+        self.growth = max(INLINE_SIZE, int(_summary(term)[0] * GROWTH))
+        self._taken: set[Identifier] = set()
+        self._fresh = SequentialNameGenerator()
+
+        stack = [term]
+        visited = 0
+        while stack:
+            visited += 1
+            if visited == CHARGE_EVERY:
+                charge(visited)
+                visited = 0
+            match node := stack.pop():
+                case Reference(name=name):
+                    self.uses[name] += 1
+                case Let(bindings=bindings):
+                    self._taken.update(name for name, _ in bindings)
+                case Abstract(parameters=parameters):
+                    self._taken.update(parameters)
+                case _:
+                    pass
+            stack.extend(children(node))
+        charge(visited)
+        self._taken.update(self.uses)
+
+    def rename(self, name: Identifier) -> Identifier:
+        # a name not used anywhere in the term
+        fresh = self._fresh(name)
+        while fresh in self._taken:
+            fresh = self._fresh(name)
+        self._taken.add(fresh)
+        return fresh
+
+    def mark(self) -> tuple[int, int]:
+        return self.lambdas.mark(), self.bound.mark()
+
+    def bind(self, name: Identifier, value: Term | None) -> None:
+        self.binders += 1
+        self.bound.bind(name, self.binders)
+        if isinstance(value, Abstract):
+            self.lambdas.bind(name, (value, self.binders))
+        else:
+            self.lambdas.hide(name)
+
+    def undo(self, mark: tuple[int, int]) -> None:
+        self.lambdas.undo(mark[0])
+        self.bound.undo(mark[1])
+
+    def inlinable(self, target: Term, arguments: tuple[Term, ...]) -> Abstract | None:
+        # the lambda a call to target is to be replaced with the body of, if any
+        match target:
+            case Abstract(parameters=parameters) if len(parameters) == len(arguments):
+                return target
+
+            case Reference(name=name) if name in self.lambdas:
+                function, binder = self.lambdas[name]
+                if len(function.parameters) != len(arguments) or any(
+                    self.bound.get(free, 0) > binder for free in self.free_variables(function)
+                ):
+                    return None
+                if self.uses[name] == 1:
+                    return function
+                cost = _summary(function.body)[0]
+                if cost <= INLINE_SIZE and cost <= self.growth:
+                    self.growth -= cost
+                    return function
+                return None
+
+            case _:
+                return None
+
+
+# Copying a body: binders renamed fresh and references renamed with them, or to the
+# arguments substituted for parameters.
+
+type Renaming = ScopedMap[Identifier, Term]
+
+
+def _copy_reference(term: Reference, renaming: Renaming, state: _Inlining) -> Term:
+    copied = renaming.get(term.name, term)
+    if isinstance(copied, Reference):
+        state.uses[copied.name] += 1
+    return copied
+
+
+def _copy_leaf(term: Immediate | Allocate, renaming: Renaming, state: _Inlining) -> Term:
+    return term
+
+
+def _copy_let(term: Let, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    mark = renaming.mark()
+    bindings: list[tuple[Identifier, Term]] = []
+    for name, value in term.bindings:
+        value = yield value, renaming, state
+        fresh = state.rename(name)
+        renaming.bind(name, cons(Reference, name=fresh))
+        bindings.append((fresh, value))
+    body = yield term.body, renaming, state
+    renaming.undo(mark)
+    return cons(Let, bindings=tuple(bindings), body=body)
+
+
+def _copy_abstract(term: Abstract, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    mark = renaming.mark()
+    parameters: list[Identifier] = []
+    for parameter in term.parameters:
+        fresh = state.rename(parameter)
+        renaming.bind(parameter, cons(Reference, name=fresh))
+        parameters.append(fresh)
+    body = yield term.body, renaming, state
+    renaming.undo(mark)
+    return cons(Abstract, parameters=tuple(parameters), body=body)
+
+
+def _copy_apply(term: Apply, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    return rebuild(
+        term,
+        target=(yield term.target, renaming, state),
+        arguments=tuple((yield from each((argument, renaming, state) for argument in term.arguments))),
+    )
+
+
+def _copy_primitive(term: Primitive, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left, renaming, state), right=(yield term.right, renaming, state))
+
+
+def _copy_branch(term: Branch, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    return rebuild(
+        term,
+        left=(yield term.left, renaming, state),
+        right=(yield term.right, renaming, state),
+        consequent=(yield term.consequent, renaming, state),
+        otherwise=(yield term.otherwise, renaming, state),
+    )
+
+
+def _copy_load(term: Load, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, renaming, state))
+
+
+def _copy_store(term: Store, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, renaming, state), value=(yield term.value, renaming, state))
+
+
+def _copy_begin(term: Begin, renaming: Renaming, state: _Inlining) -> Visit[Term]:
+    effects = yield from each((effect, renaming, state) for effect in term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value, renaming, state))
+
+
+_copy = Traversal[Term](
+    {
+        "reference": _copy_reference,
+        "let": _copy_let,
+        "abstract": _copy_abstract,
+        "apply": _copy_apply,
+        "immediate": _copy_leaf,
+        "primitive": _copy_primitive,
+        "branch": _copy_branch,
+        "allocate": _copy_leaf,
+        "load": _copy_load,
+        "store": _copy_store,
+        "begin": _copy_begin,
+    }
+)
+
+
+def _beta(function: Abstract, arguments: tuple[Term, ...], state: _Inlining) -> Term:
+    # the body of function, copied, with its parameters bound to arguments
+    renaming: Renaming = ScopedMap()
+    bindings: list[tuple[Identifier, Term]] = []
+    for parameter, argument in zip(function.parameters, arguments, strict=True):
+        if isinstance(argument, Reference | Immediate):
+            renaming.bind(parameter, argument)
+        else:
+            fresh = state.rename(parameter)
+            renaming.bind(parameter, cons(Reference, name=fresh))
+            bindings.append((fresh, argument))
+    body = _copy(function.body, renaming, state)
+    return cons(Let, bindings=tuple(bindings), body=body) if bindings else body
+
+
+# Inlining
+
+
+def _reference(term: Reference, state: _Inlining) -> Term:
+    return term
+
+
+def _leaf(term: Immediate | Allocate, state: _Inlining) -> Term:
+    return term
+
+
+def _mergeable(inner: Let, outer: Let, index: int, state: _Inlining) -> bool:
+    # inner, the value of outer's binding at index, can give its bindings to outer
+    names = {name for name, _ in inner.bindings}
+    return names.isdisjoint(name for name, _ in outer.bindings) and not any(
+        not names.isdisjoint(state.free_variables(later))
+        for later in [*(value for _, value in outer.bindings[index + 1 :]), outer.body]
+    )
+
+
+def _let(term: Let, state: _Inlining) -> Visit[Term]:
+    mark = state.mark()
+    bindings: list[tuple[Identifier, Term]] = []
+    for index, (name, value) in enumerate(term.bindings):
+        value = yield value, state
+        if isinstance(value, Let) and _mergeable(value, term, index, state):
+            for inner, inner_value in value.bindings:
+                state.bind(inner, inner_value)
+                bindings.append((inner, inner_value))
+            value = value.body
+        state.bind(name, value)
+        bindings.append((name, value))
+    body = yield term.body, state
+    state.undo(mark)
+    return rebuild(term, bindings=tuple(bindings), body=body)
+
+
+def _abstract(term: Abstract, state: _Inlining) -> Visit[Term]:
+    mark = state.mark()
+    for parameter in term.parameters:
+        state.bind(parameter, None)
+    body = yield term.body, state
+    state.undo(mark)
+    return rebuild(term, body=body)
+
+
+def _apply(term: Apply, state: _Inlining) -> Visit[Term]:
+    target = yield term.target, state
+    arguments = tuple((yield from each((argument, state) for argument in term.arguments)))
+    function = state.inlinable(target, arguments)
+    if function is None:
+        return rebuild(term, target=target, arguments=arguments)
+    return (yield _beta(function, arguments, state), state)
+
+
+def _primitive(term: Primitive, state: _Inlining) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left, state), right=(yield term.right, state))
+
+
+def _branch(term: Branch, state: _Inlining) -> Visit[Term]:
+    return rebuild(
+        term,
+        left=(yield term.left, state),
+        right=(yield term.right, state),
+        consequent=(yield term.consequent, state),
+        otherwise=(yield term.otherwise, state),
+    )
+
+
+def _load(term: Load, state: _Inlining) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, state))
+
+
+def _store(term: Store, state: _Inlining) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, state), value=(yield term.value, state))
+
+
+def _begin(term: Begin, state: _Inlining) -> Visit[Term]:
+    effects = yield from each((effect, state) for effect in term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value, state))
+
+
+_inline = Traversal[Term](
+    {
+        "reference": _reference,
+        "let": _let,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _leaf,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _leaf,
+        "load": _load,
+        "store": _store,
+        "begin": _begin,
+    }
+)
+
+
+def inline_term(term: Term, free_variables: Callable[[Term], frozenset[Identifier]] = free_variables) -> Term:
+    # term with the calls the cost model picks replaced by the bodies they call; the
+    # analysis is the optimizer's, which keeps its result for the whole term
+    if not _candidates(term):
+        return term
+    return _inline(term, _Inlining(term, free_variables))
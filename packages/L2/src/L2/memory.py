@@ -0,0 +1,350 @@
+from collections import Counter
+from collections.abc import Callable, Mapping
+from inspect import isgeneratorfunction
+from typing import Any
+
+from util.budget import CHARGE_EVERY, charge
+from util.hash_cons import children, cons, rebuild
+from util.memo import IdentityMemo
+from util.sequential_name_generator import SequentialNameGenerator
+from util.traverse import Traversal, Visit, each, memoized
+
+from .dead_code_elim import is_pure
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Identifier,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+Memory dataflow over the slots of cells, each a base and a static index: a value stored
+to a slot is forwarded to the Loads of it that follow, and a store that is overwritten
+before anything may read it is deleted.
+
+A slot is named by its base, a Reference, and its index. Two names may be the same cell
+unless each is bound once, by a Let, to an Allocate of its own; a Load or Store through
+a base that is not a Reference may be any cell. A Store, as an effect of a Begin, makes
+its value the slot's for the rest of the Begin, until a store that may be to the same
+slot, an Apply, which may do anything, or, for a Load inside a lambda, which runs later,
+ever. A value that is not a constant or a variable is bound by a Let when it is first
+forwarded, around the rest of the Begin, so that it is still evaluated once.
+
+A store that is an effect of a Begin is dead when a later effect of the same Begin, or
+its value, stores to the same slot through the same name, and nothing in between may
+read it: a Load that may be of it and is not forwarded, or an Apply. What it stores is
+still evaluated unless it is pure.
+"""
+
+
+# Results by node identity, as for is_pure: the tags of the nodes in a term that read,
+# write or may do either (load, store and apply).
+accesses_memo = IdentityMemo[Term, frozenset[str]]()
+
+_NONE: frozenset[str] = frozenset()
+
+
+def accesses(term: Term) -> frozenset[str]:
+    return _accesses(term)
+
+
+def _accesses_leaf(term: Reference | Immediate | Allocate) -> frozenset[str]:
+    return _NONE
+
+
+def _accesses_node(term: Term) -> Visit[frozenset[str]]:
+    found = frozenset({term.tag}) if isinstance(term, Load | Store | Apply) else _NONE
+    for child in children(term):
+        found |= yield child
+    return found
+
+
+_accesses = Traversal[frozenset[str]](
+    memoized(
+        {
+            "reference": _accesses_leaf,
+            "let": _accesses_node,
+            "abstract": _accesses_node,
+            "apply": _accesses_node,
+            "immediate": _accesses_leaf,
+            "primitive": _accesses_node,
+            "branch": _accesses_node,
+            "allocate": _accesses_leaf,
+            "load": _accesses_node,
+            "store": _accesses_node,
+            "begin": _accesses_node,
+        },
+        accesses_memo,
+    )
+)
+
+
+type Slot = tuple[Identifier | None, int]
+
+
+class _Stored:
+    # a Store that is an effect of a Begin: its value, the name it is bound to once it
+    # is forwarded, and whether it is dead
+    def __init__(self, base: Term, index: int, value: Term) -> None:
+        self.base = base
+        self.index = index
+        self.value = value
+        self.name: Identifier | None = None
+        self.dead = False
+
+
+class _Dataflow:
+    def __init__(self, term: Term) -> None:
+        # one walk of the tree for the names bound once to an Allocate and every name in it
+        binders = Counter[Identifier]()
+        allocated: set[Identifier] = set()
+        self._taken: set[Identifier] = set()
+        stack = [term]
+        visited = 0
+        while stack:
+            visited += 1
+            if visited == CHARGE_EVERY:
+                charge(visited)
+                visited = 0
+            match node := stack.pop():
+                case Let(bindings=bindings):
+                    for name, value in bindings:
+                        binders[name] += 1
+                        if isinstance(value, Allocate):
+                            allocated.add(name)
+                case Abstract(parameters=parameters):
+                    binders.update(parameters)
+                case Reference(name=name):
+                    self._taken.add(name)
+                case _:
+                    pass
+            stack.extend(children(node))
+        charge(visited)
+        self._binders = binders
+        self.allocations = {name for name in allocated if binders[name] == 1}
+        self._taken.update(binders)
+        self._fresh = SequentialNameGenerator()
+
+        # the stores whose values are known at each slot where the walk is, and, for each
+        # Begin it is in, its stores not yet read, by slot
+        self.known: dict[Slot, _Stored] = {}
+        self.pending: list[dict[Slot, _Stored]] = []
+
+    def fresh(self) -> Identifier:
+        name = self._fresh("stored")
+        while name in self._taken:
+            name = self._fresh("stored")
+        self._taken.add(name)
+        return name
+
+    def aliases(self, slot: Slot, other: Slot) -> bool:
+        # the slots may be the same
+        (name, index), (base, stored) = slot, other
+        if index != stored:
+            return False
+        return (
+            name is None or base is None or name == base or not (name in self.allocations and base in self.allocations)
+        )
+
+    def lasting(self, value: Term) -> bool:
+        # value means the same wherever it is in scope
+        return isinstance(value, Immediate) or (isinstance(value, Reference) and self._binders[value.name] <= 1)
+
+    def read(self, slot: Slot | None) -> None:
+        # memory is read at slot, or anywhere for None
+        for pending in self.pending:
+            for key in [key for key in pending if slot is None or self.aliases(key, slot)]:
+                del pending[key]
+
+    def write(self, slot: Slot | None) -> None:
+        # memory is written at slot, or anywhere for None
+        for key in [key for key in self.known if slot is None or self.aliases(key, slot)]:
+            del self.known[key]
+
+    def forget(self, names: frozenset[Identifier]) -> None:
+        # names are bound again or go out of scope, and what is known of them with them
+        for key, stored in list(self.known.items()):
+            if key[0] in names or (isinstance(stored.value, Reference) and stored.value.name in names):
+                del self.known[key]
+
+    def close(self, items: list[Term | _Stored]) -> None:
+        # a Begin's bindings are made: a value of its stores that would need one is not
+        # known after it
+        closed = {id(item) for item in items if isinstance(item, _Stored) and not self.lasting(item.value)}
+        for key, stored in list(self.known.items()):
+            if id(stored) in closed:
+                del self.known[key]
+
+
+def _slot(base: Term, index: int) -> Slot:
+    return (base.name if isinstance(base, Reference) else None, index)
+
+
+def _skipping[H: Callable[..., Any]](handlers: Mapping[str, H]) -> dict[str, H]:
+    # handlers with a term that neither reads nor writes memory left as it is
+    def wrap(handler: Callable[..., Visit[Term]]) -> Callable[..., Visit[Term]]:
+        def visit(term: Term, state: _Dataflow) -> Visit[Term]:
+            if not accesses(term):
+                return term
+            return (yield from handler(term, state))
+
+        return visit
+
+    return {tag: wrap(handler) if isgeneratorfunction(handler) else handler for tag, handler in handlers.items()}  # pyright: ignore[reportReturnType]
+
+
+def _leaf(term: Reference | Immediate | Allocate, state: _Dataflow) -> Term:
+    return term
+
+
+def _let(term: Let, state: _Dataflow) -> Visit[Term]:
+    bindings: list[tuple[Identifier, Term]] = []
+    for name, value in term.bindings:
+        bindings.append((name, (yield value, state)))
+        state.forget(frozenset((name,)))
+    body = yield term.body, state
+    state.forget(frozenset(name for name, _ in term.bindings))
+    return rebuild(term, bindings=tuple(bindings), body=body)
+
+
+def _abstract(term: Abstract, state: _Dataflow) -> Visit[Term]:
+    # the body runs later: nothing is known there, and what it reads is read then
+    known, pending = state.known, state.pending
+    state.known, state.pending = {}, []
+    body = yield term.body, state
+    state.known, state.pending = known, pending
+    return rebuild(term, body=body)
+
+
+def _apply(term: Apply, state: _Dataflow) -> Visit[Term]:
+    target = yield term.target, state
+    arguments = yield from each((argument, state) for argument in term.arguments)
+    state.read(None)
+    state.write(None)
+    return rebuild(term, target=target, arguments=tuple(arguments))
+
+
+def _primitive(term: Primitive, state: _Dataflow) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left, state), right=(yield term.right, state))
+
+
+def _branch(term: Branch, state: _Dataflow) -> Visit[Term]:
+    left, right = (yield term.left, state), (yield term.right, state)
+    # each arm starts from what the condition leaves, and after them a slot's value is
+    # known only if both leave it the same
+    before = state.known
+    state.known = dict(before)
+    consequent = yield term.consequent, state
+    after = state.known
+    state.known = dict(before)
+    otherwise = yield term.otherwise, state
+    state.known = {slot: stored for slot, stored in state.known.items() if after.get(slot) is stored}
+    return rebuild(term, left=left, right=right, consequent=consequent, otherwise=otherwise)
+
+
+def _load(term: Load, state: _Dataflow) -> Visit[Term]:
+    base = yield term.base, state
+    slot = _slot(term.base, term.index)
+    stored = state.known.get(slot) if slot[0] is not None else None
+    if stored is None:
+        state.read(slot)
+        return rebuild(term, base=base)
+    if state.lasting(stored.value):
+        return stored.value
+    if stored.name is None:
+        stored.name = state.fresh()
+    return cons(Reference, name=stored.name)
+
+
+def _store(term: Store, state: _Dataflow) -> Visit[Term]:
+    base, value = (yield term.base, state), (yield term.value, state)
+    state.write(_slot(term.base, term.index))
+    return rebuild(term, base=base, value=value)
+
+
+def _begin(term: Begin, state: _Dataflow) -> Visit[Term]:
+    pending: dict[Slot, _Stored] = {}
+    state.pending.append(pending)
+    # the effects, and the value, each walked, or the store it is
+    items: list[Term | _Stored] = []
+    for index, item in enumerate((*term.effects, term.value)):
+        match item:
+            case Store(base=Reference() as base, index=stored_index, value=value):
+                stored = _Stored(base, stored_index, (yield value, state))
+                slot = _slot(base, stored_index)
+                state.write(slot)
+                if slot in pending:
+                    pending[slot].dead = True
+                if index < len(term.effects):
+                    pending[slot] = stored
+                    state.known[slot] = stored
+                items.append(stored)
+            case _:
+                items.append((yield item, state))
+    state.pending.pop()
+    state.close(items)
+    # nor one that is a name this Begin binds, which is out of scope after it
+    state.forget(frozenset(item.name for item in items if isinstance(item, _Stored) and item.name is not None))
+
+    # from the end, each binding around the effects after it and the value
+    *effects, value = (_effect(item) for item in items)
+    assert value is not None
+    after: list[Term] = []
+    for item, effect in zip(reversed(items[:-1]), reversed(effects), strict=True):
+        if effect is not None:
+            after.append(effect)
+        if isinstance(item, _Stored) and item.name is not None:
+            value = cons(Let, bindings=((item.name, item.value),), body=_sequence(after, value))
+            after = []
+    return rebuild(term, effects=tuple(reversed(after)), value=value) if after else value
+
+
+def _effect(item: Term | _Stored) -> Term | None:
+    # what of an item of a Begin is left: a dead store's value for its effects, and a
+    # bound value by its name
+    if not isinstance(item, _Stored):
+        return item
+    value = cons(Reference, name=item.name) if item.name is not None else item.value
+    if not item.dead:
+        return cons(Store, base=item.base, index=item.index, value=value)
+    return None if item.name is not None or is_pure(value) else value
+
+
+def _sequence(effects: list[Term], value: Term) -> Term:
+    # effects, in reverse, then value
+    return cons(Begin, effects=tuple(reversed(effects)), value=value) if effects else value
+
+
+_dataflow = Traversal[Term](
+    _skipping(
+        {
+            "reference": _leaf,
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "immediate": _leaf,
+            "primitive": _primitive,
+            "branch": _branch,
+            "allocate": _leaf,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+        }
+    )
+)
+
+
+def memory_term(term: Term) -> Term:
+    # term with stored values forwarded to the loads of them and dead stores deleted
+    if "store" not in accesses(term):
+        return term
+    return _dataflow(term, _Dataflow(term))
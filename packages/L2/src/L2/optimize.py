@@ -1,7 +1,22 @@
+import os
+from collections.abc import Sequence
+from functools import partial
+
+from util.budget import Budget
+from util.hash_cons import intern
+from util.trusted import trusted
+
 from .branch_elimination import branch_elimination_term
 from .constant_folding import constant_folding_term
 from .constant_propagation import constant_propagation_term
-from .dead_code_elim import dead_code_elimination_term
+from .cse import cse_term
+from .dead_code_elim import dead_code_elimination_term, free_variables, is_pure
+from .inline import inline_term
+from .memory import memory_term
+from .parallel import MIN_REGION, optimize_regions
+from .pass_manager import AnalysisCache, Pass, Pipeline, parse_pipeline, run_pipeline
+from .scalar_replacement import scalar_replacement_term
+from .sccp import sccp_term
 from .syntax import (
     Program,
     Term,
@@ -10,41 +25,150 @@ from .syntax import (
 """
 controls the optimization overall, the number of repetitions, to a fixed point (until it stops changing)
 Order of operation
-  1. Constant propagation
-  2. Constant folding
-  3. Dead code elimination
-  4. Branch elimination
+  1. Inlining of calls to known lambdas
+  2. Scalar replacement of the cells that do not escape
+  3. Store-to-load forwarding and dead-store elimination for the cells that do
+  4. Sparse conditional constant propagation: constant propagation, constant folding
+     and branch elimination in one pass
+  5. Common subexpression elimination of pure primitives and loads
+  6. Dead code elimination
+The three passes sccp stands for are still registered, for --passes.
+
+Inlining, scalar replacement and cse are marked expensive: each walks the term to take a
+census before it rewrites it, and inlining may grow it. Under a budget that is half spent
+they are skipped, and the rest of the pipeline still gives a correct program.
+
+The passes and analyses are registered below, and LEVELS are the pipelines -O0 to -O3
+stand for; see pass_manager for how a pipeline runs, and parallel for how the functions of
+a program are optimized at the same time first when there are workers to spare.
 """
 
+ANALYSES = {
+    "free-variables": free_variables,
+    "purity": is_pure,
+}
+
+PASSES = {
+    step.name: step
+    for step in [
+        # a reference becomes a constant: fewer free variables, no less pure
+        Pass(
+            "propagate",
+            lambda term, analyses: constant_propagation_term(term, env={}),
+            invalidates=["free-variables"],
+        ),
+        # x - x drops a variable and 0 * e drops e, effects and all
+        Pass(
+            "fold",
+            lambda term, analyses: constant_folding_term(term, context={}),
+            invalidates=["free-variables", "purity"],
+        ),
+        # only pure bindings go, so what is left is as pure as before. It works out free
+        # variables and purity itself as it rebuilds, into the analyses' memos, so the
+        # next pass to require them finds them there
+        Pass(
+            "dce",
+            lambda term, analyses: dead_code_elimination_term(term),
+            invalidates=["free-variables"],
+        ),
+        # a decided Branch, never pure itself, becomes one of its arms
+        Pass(
+            "branch",
+            lambda term, analyses: branch_elimination_term(term),
+            invalidates=["free-variables", "purity"],
+        ),
+        # propagate, fold and branch at once
+        Pass(
+            "sccp",
+            lambda term, analyses: sccp_term(term),
+            invalidates=["free-variables", "purity"],
+        ),
+        # a call becomes the body it calls, which may be pure, and an argument substituted
+        # for an unused parameter is no longer referenced
+        Pass(
+            "inline",
+            lambda term, analyses: inline_term(term, analyses.reader("free-variables")),
+            requires=["free-variables"],
+            invalidates=["free-variables", "purity"],
+            expensive=True,
+        ),
+        # the same free variables and the same effects, each evaluated fewer times
+        Pass(
+            "cse",
+            lambda term, analyses: cse_term(term, analyses.reader("free-variables"), analyses.reader("purity")),
+            requires=["free-variables", "purity"],
+            expensive=True,
+        ),
+        # a cell's name and its loads and stores go, and with them a Begin's effects
+        Pass(
+            "scalar",
+            lambda term, analyses: scalar_replacement_term(term),
+            invalidates=["free-variables", "purity"],
+            expensive=True,
+        ),
+        # a forwarded Load's base is no longer used there, and a Begin may lose its effects
+        Pass(
+            "memory",
+            lambda term, analyses: memory_term(term),
+            invalidates=["free-variables", "purity"],
+        ),
+    ]
+}
+
+LEVELS = {
+    # nothing
+    0: "",
+    # calls inlined, cells made variables and stores forwarded, constants and branches
+    # settled in one run, repeated expressions bound once, then dead code
+    1: "inline,scalar,memory,sccp,cse,dce",
+    # to a fixed point, each pass run at most 100 times but inlining, which may grow the
+    # program every run, at most 4
+    2: "inline:4,scalar:100,memory:100,sccp:100,cse:100,dce:100",
+    # as 2, with inlining run up to 16 times: each run may grow the program by a quarter,
+    # so the later runs inline the calls -O2 leaves, for a larger program that makes fewer
+    # calls and a longer compile
+    3: "inline:16,scalar:100,memory:100,sccp:100,cse:100,dce:100",
+}
+
+_ONCE = parse_pipeline(LEVELS[1], PASSES)
+DEFAULT_PIPELINE = parse_pipeline(LEVELS[2], PASSES)
+
+
 # Single-pass optimisation of a Term
 
 
 def optimize_term(term: Term) -> Term:
     """Apply all passes once, in order."""
-    # 1. Propagate known constants downward
-    term = constant_propagation_term(term, env={})
-    # 2. Fold constant expressions
-    term = constant_folding_term(term, context={})
-    # 3. Eliminate dead (unreferenced, pure) bindings
-    term = dead_code_elimination_term(term)
-    # 4. Eliminate branches whose condition is now statically known
-    term = branch_elimination_term(term)
-    return term
+    return run_pipeline(term, _ONCE, AnalysisCache(ANALYSES))
 
 
-# main running of it
-# currently set to do an arbitrary max of 100 iterations but you could make it more
-# use 100 to prevent any weird infinite loop stuff
-def optimize_program(program: Program, max_iterations: int = 100) -> Program:
-    # Should run until we no longer see meaningful change
-    for _ in range(max_iterations):  # pragma: no branch
-        optimized_body = optimize_term(program.body)
-        new_program = Program(parameters=program.parameters, body=optimized_body)
-
-        # check if it's changed at all after the pass
-        if new_program.model_dump() == program.model_dump():
-            break  # they didnt change so break out of the loop
+def _optimize_region(steps: Sequence[tuple[str, int]], body: Term, budget: Budget | None) -> Term:
+    # a pipeline given by its passes' names, which is all a worker process can be sent
+    return run_pipeline(body, [(PASSES[name], limit) for name, limit in steps], AnalysisCache(ANALYSES), budget)
 
-        program = new_program
 
-    return program
+# main running of it
+# each pass in the pipeline has its own limit on how many times it runs, which is what
+# stops a weird infinite loop; -O2's is 100
+def optimize_program(
+    program: Program,
+    pipeline: Pipeline = DEFAULT_PIPELINE,
+    budget: Budget | None = None,
+    workers: int = 1,
+    minimum: int = MIN_REGION,
+) -> Program:
+    # The body is hash-consed, and the passes build nodes with cons, so equal subterms
+    # are one object. A pass hands back any subterm it leaves alone as the same object,
+    # so the memoized analyses reuse their results across subterms and iterations, and
+    # the pipeline knows when it has reached a fixed point.
+    body = intern(program.body)
+    # 0 is a worker per core
+    workers = workers or os.process_cpu_count() or 1
+    if workers > 1:
+        # the pipeline's passes must be registered in PASSES, for workers to find them by name
+        steps = [(step.name, limit) for step, limit in pipeline]
+        body = optimize_regions(body, partial(_optimize_region, steps), workers, budget, minimum)
+    optimized = run_pipeline(body, pipeline, AnalysisCache(ANALYSES), budget)
+    if optimized is program.body:
+        return program
+    return trusted(Program, parameters=program.parameters, body=optimized)
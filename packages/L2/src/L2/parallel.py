@@ -0,0 +1,134 @@
+import sys
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+
+from util.budget import Budget
+from util.hash_cons import children, intern, rebuild, substitute
+
+from .binary import CODEC
+from .cse import CSEStatistics, cse_statistics
+from .syntax import Abstract, Term
+
+"""
+Optimizes the functions of a program at the same time.
+
+A region is a lambda that is not inside another one. Nothing outside a lambda changes
+how its body is optimized on its own, and nothing in one region depends on another, so
+each body goes through the pipeline separately, on a pool of workers. The regions are
+put back where they were, in order, and the optimizer then runs the pipeline over the
+whole program as before, which finds the regions settled apart from the constants and
+dead code that reach them from outside.
+
+That is not the fixed point a single worker reaches. A region has the pipeline's runs to
+itself and then the whole program's, so a pass with a small limit (inlining, under -O2)
+may run more times in it, and the passes meet the region's code in another order. The
+result is still a correct program, and the same however many workers there are, or
+whichever finishes first, but it may differ from the result with one worker.
+
+The workers are threads on a free-threaded build. Where the GIL would let only one of
+them run at a time they are processes, and each region goes to its worker and back in
+the binary IR format, and is interned again at each end. A lambda with fewer than MIN_REGION nodes
+is left to the pass over the whole program, since sending it would cost more than
+optimizing it.
+
+Threads share the process's tables: the hash-consing table and the analyses' memos, and,
+as each runs in a copy of the caller's context, the compilation's symbol table. Each is
+safe to share (see util.symbols, util.hash_cons and util.memo), so a fresh name one
+region takes is not another's, and equal nodes are one object. They count into the
+caller's cse_statistics too; a process sends its counts back with its region.
+
+Under a budget, each region runs under a share of it: the same deadline and the visits
+left when the regions start, so the visits spent may exceed the budget by up to one
+share per worker. What the regions spent is merged back.
+"""
+
+# Lambdas smaller than this, in nodes, are not worth a worker.
+MIN_REGION = 1024
+
+type Optimize = Callable[[Term, Budget | None], Term]
+
+
+def free_threaded() -> bool:
+    return not sys._is_gil_enabled()  # pyright: ignore[reportPrivateUsage]
+
+
+def size(term: Term) -> int:
+    # distinct nodes in term
+    seen: set[int] = set()
+    stack = [term]
+    while stack:
+        node = stack.pop()
+        if id(node) not in seen:
+            seen.add(id(node))
+            stack.extend(children(node))
+    return len(seen)
+
+
+def regions(term: Term, minimum: int = MIN_REGION) -> list[Abstract]:
+    # the lambdas in term not inside another, in order, each once, of at least minimum nodes
+    found: list[Abstract] = []
+    seen: set[int] = set()
+    stack = [term]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, Abstract):
+            if size(node) >= minimum:
+                found.append(node)
+        else:
+            stack.extend(reversed(children(node)))
+    return found
+
+
+def _encoded(
+    optimize: Optimize, data: bytes, budget: Budget | None
+) -> tuple[bytes, Budget | None, CSEStatistics]:  # pragma: no cover
+    # optimize run in another process, on a body in the binary format, interned again as
+    # the passes expect. What the process counts is not the caller's, so it goes back with
+    # the result
+    cse_statistics.clear()
+    return CODEC.dumps(optimize(intern(CODEC.loads(data)), budget)), budget, cse_statistics
+
+
+def optimize_regions(
+    term: Term, optimize: Optimize, workers: int, budget: Budget | None = None, minimum: int = MIN_REGION
+) -> Term:
+    # term with the body of each region replaced by optimize's result for it. optimize
+    # must be picklable (a module-level function or a partial of one) for processes.
+    found = regions(term, minimum)
+    if len(found) < 2:
+        return term
+
+    shares = [budget.share() if budget is not None else None for _ in found]
+    # the largest regions first, so that a large one started last does not keep the rest waiting
+    order = sorted(range(len(found)), key=lambda index: -size(found[index]))
+    bodies: list[Term] = [region.body for region in found]
+
+    if free_threaded():
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {
+                index: pool.submit(copy_context().run, optimize, bodies[index], shares[index]) for index in order
+            }
+            bodies = [futures[index].result() for index in range(len(found))]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            run = partial(_encoded, optimize)
+            futures = {index: pool.submit(run, CODEC.dumps(bodies[index]), shares[index]) for index in order}
+            for index in range(len(found)):
+                data, shares[index], counted = futures[index].result()
+                bodies[index] = intern(CODEC.loads(data))
+                cse_statistics.merge(counted)
+
+    if budget is not None:
+        for share in shares:
+            assert share is not None
+            budget.merge(share)
+
+    return substitute(
+        term,
+        {id(region): rebuild(region, body=body) for region, body in zip(found, bodies, strict=True)},
+    )
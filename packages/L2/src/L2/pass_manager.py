@@ -0,0 +1,160 @@
+from collections.abc import Callable, Collection, Mapping, Sequence
+from contextlib import nullcontext
+from typing import Any
+
+from util.budget import Budget, BudgetExhausted, active_budget
+
+from .syntax import Term
+
+"""
+Runs optimization passes over a term in a pipeline, with the analyses they use cached.
+
+An analysis is a function of a whole term (its free variables, whether it is pure, ...).
+AnalysisCache keeps each one's result for the term the pipeline is at, and a pass that
+needs one reads it from there, through a reader it can also ask of the terms inside: an
+analysis remembers its result for every node it walked, so working it out for the whole
+term first answers the pass's questions about the parts. A pass is registered with the
+analyses it requires, which are worked out before it runs, and the ones it invalidates:
+when it changes the term, those results are dropped and the others are kept for the new
+term, since the pass promises they still hold. A pass that changes nothing returns its
+input, which keeps every result.
+
+A pipeline is a sequence of passes, each with a limit on how many times it may run. It
+runs its passes in order, over and over, until a whole round changes nothing; a pass
+that has used up its limit is skipped. As a string it is the pass names separated by
+commas, each with an optional `:limit` (1 if omitted), e.g. `fold:10,dce`.
+
+Under a util.budget.Budget the pipeline gives up gracefully rather than run long. A pass
+marked expensive is skipped once half the budget is spent. A pass that runs out of it
+part way is dropped and the term it started from is kept. Once the budget is exhausted,
+the remaining passes are skipped and the pipeline stops before its fixed point. The
+result is always a correct program, optimized less.
+"""
+
+type Analysis = Callable[[Term], Any]
+
+
+class AnalysisCache:
+    def __init__(self, analyses: Mapping[str, Analysis]) -> None:
+        self.analyses = analyses
+        self.hits = 0
+        self.misses = 0
+        # each analysis's result, with the term it describes
+        self._results: dict[str, tuple[Term, Any]] = {}
+
+    def get(self, name: str, term: Term) -> Any:
+        entry = self._results.get(name)
+        if entry is not None and entry[0] is term:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        result = self.analyses[name](term)
+        self._results[name] = term, result
+        return result
+
+    def reader(self, name: str) -> Analysis:
+        # the analysis for a pass to ask of any term: the result kept for the term the
+        # pipeline is at, else the analysis itself, which remembers its results by node
+        analysis = self.analyses[name]
+
+        def read(term: Term) -> Any:
+            entry = self._results.get(name)
+            if entry is not None and entry[0] is term:
+                self.hits += 1
+                return entry[1]
+            return analysis(term)
+
+        return read
+
+    def advance(self, before: Term, after: Term, invalidated: Collection[str]) -> None:
+        # a pass turned before into after: what it did not invalidate describes after too
+        for name, (term, result) in list(self._results.items()):
+            if term is before and name not in invalidated:
+                self._results[name] = after, result
+            else:
+                del self._results[name]
+
+
+class Pass:
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Term, AnalysisCache], Term],
+        requires: Collection[str] = (),
+        invalidates: Collection[str] = (),
+        expensive: bool = False,
+    ) -> None:
+        self.name = name
+        self.run = run
+        self.requires = frozenset(requires)
+        self.invalidates = frozenset(invalidates)
+        self.expensive = expensive
+
+    def __repr__(self) -> str:
+        return f"Pass({self.name!r})"
+
+
+type Pipeline = Sequence[tuple[Pass, int]]
+
+
+def parse_pipeline[P](text: str, passes: Mapping[str, P]) -> Sequence[tuple[P, int]]:
+    # passes are usually Passes, but may be any pass by name, as flat's are
+    pipeline: list[tuple[P, int]] = []
+    for step in filter(None, (step.strip() for step in text.split(","))):
+        name, _, limit = step.partition(":")
+        if name not in passes:
+            raise ValueError(f"unknown pass {name!r}, expected one of {', '.join(passes)}")
+        if limit and not (limit.isdecimal() and int(limit) > 0):
+            raise ValueError(f"pass {name!r} has limit {limit!r}, expected a positive integer")
+        pipeline.append((passes[name], int(limit or 1)))
+    return pipeline
+
+
+def run_pipeline(term: Term, pipeline: Pipeline, analyses: AnalysisCache, budget: Budget | None = None) -> Term:
+    # without a budget of its own, a pipeline run inside another's keeps to that one
+    budget = budget if budget is not None else active_budget()
+    with budget.applied() if budget is not None else nullcontext():
+        return _run_pipeline(term, pipeline, analyses, budget)
+
+
+def _run_pipeline(term: Term, pipeline: Pipeline, analyses: AnalysisCache, budget: Budget | None) -> Term:
+    remaining = [limit for _, limit in pipeline]
+
+    changed = True
+    while changed:
+        changed = False
+        for index, (step, _) in enumerate(pipeline):
+            if not remaining[index]:
+                continue
+
+            if budget is not None:
+                if budget.exhausted:
+                    # this pass and every other with runs left
+                    budget.skipped.extend(
+                        later.name for (later, _), left in zip(pipeline, remaining, strict=True) if left
+                    )
+                    return term
+                if step.expensive and budget.used >= 0.5:
+                    # used only grows, so it is skipped for good, and recorded once
+                    budget.skipped.append(step.name)
+                    remaining[index] = 0
+                    continue
+            remaining[index] -= 1
+
+            try:
+                for name in step.requires:
+                    analyses.get(name, term)
+                result = step.run(term, analyses)
+            except BudgetExhausted:
+                # only raised under a budget, which the next step finds exhausted
+                assert budget is not None
+                budget.cut.append(step.name)
+                continue
+
+            # passes return a term they leave alone as it is
+            if result is not term:
+                analyses.advance(term, result, step.invalidates)
+                term = result
+                changed = True
+
+    return term
@@ -0,0 +1,493 @@
+from collections import Counter
+from collections.abc import Callable, Mapping
+from inspect import isgeneratorfunction
+from typing import Any
+
+from util.budget import CHARGE_EVERY, charge
+from util.hash_cons import children, cons, rebuild
+from util.memo import IdentityMemo
+from util.sequential_name_generator import SequentialNameGenerator
+from util.traverse import Traversal, Visit, each, memoized
+
+from .dead_code_elim import free_variables
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Identifier,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+Escape analysis and scalar replacement: a cell from an Allocate that nothing outside the
+code that reads and writes it can see becomes plain variables, one value per store.
+
+A cell escapes unless its name is bound once, by a Let, to the Allocate, and every use
+of the name is the base of a Load or Store at an index the Allocate has: passed to a
+call, stored, returned or used any other way, the cell could be read or written where
+the pass cannot follow. Of a cell that does not escape, a Load becomes the value last
+stored at its index, and a Store, as an effect of a Begin, becomes a Let of the value
+around the rest of the Begin, or nothing when the value is a constant or a variable.
+
+A known function, a lambda bound once by a Let and only ever called, with as many
+arguments as it has parameters, reads and writes the cells in its body where it is
+called. It gets a parameter for each index of a cell it or the known functions it calls
+use, and each call passes the values there, so a loop written as a self-recursive
+letrec, like sum's, carries them from one iteration to the next. What a call writes is
+not passed back: after it, those indices have no value.
+
+A cell is left as it is where its value is not known when it is read: before a store to
+it, after a call that writes it, after a Branch whose arms store different values, or
+once the variable holding it is out of scope; or where it is stored to other than as an
+effect of a Begin, or inside a lambda that is not a known function. The pass then runs
+again without that cell.
+"""
+
+
+# Results by node identity, as for is_pure: whether a term allocates anywhere in it.
+allocates_memo = IdentityMemo[Term, bool]()
+
+
+def allocates(term: Term) -> bool:
+    return _allocates(term)
+
+
+def _allocates_leaf(term: Reference | Immediate) -> bool:
+    return False
+
+
+def _allocate(term: Allocate) -> bool:
+    return True
+
+
+def _allocates_node(term: Term) -> Visit[bool]:
+    for child in children(term):
+        if (yield child):
+            return True
+    return False
+
+
+_allocates = Traversal[bool](
+    memoized(
+        {
+            "reference": _allocates_leaf,
+            "let": _allocates_node,
+            "abstract": _allocates_node,
+            "apply": _allocates_node,
+            "immediate": _allocates_leaf,
+            "primitive": _allocates_node,
+            "branch": _allocates_node,
+            "allocate": _allocate,
+            "load": _allocates_node,
+            "store": _allocates_node,
+            "begin": _allocates_node,
+        },
+        allocates_memo,
+    )
+)
+
+
+# Escape analysis
+
+type Slot = tuple[Identifier, int]
+
+
+class _Census:
+    # what the names bound in a term are used for, from one walk of its distinct nodes
+    def __init__(self, term: Term) -> None:
+        self.allocations: dict[Identifier, int] = {}
+        self.lambdas: dict[Identifier, Abstract] = {}
+        self.binders = Counter[Identifier]()
+        # names used other than as the base of a Load or Store or as a call's target
+        self.escaped: set[Identifier] = set()
+        # names loaded from other than as a call's target
+        self.loaded: set[Identifier] = set()
+        self.stored: set[Identifier] = set()
+        # the highest index a Load or Store uses through each name
+        self.highest: dict[Identifier, int] = {}
+        # the numbers of arguments each name is called with, directly or through a Load
+        self.called: dict[Identifier, set[int]] = {}
+        self.called_directly: set[Identifier] = set()
+
+        seen: set[int] = set()
+        stack = [term]
+        visited = 0
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            visited += 1
+            if visited == CHARGE_EVERY:
+                charge(visited)
+                visited = 0
+            match node:
+                case Let(bindings=bindings, body=body):
+                    for name, value in bindings:
+                        self.binders[name] += 1
+                        if isinstance(value, Allocate):
+                            self.allocations[name] = value.count
+                        elif isinstance(value, Abstract):
+                            self.lambdas[name] = value
+                        self._value(value)
+                    self._value(body)
+                case Abstract(parameters=parameters, body=body):
+                    self.binders.update(parameters)
+                    self._value(body)
+                case Load(base=Reference(name=name), index=index):
+                    self.highest[name] = max(self.highest.get(name, index), index)
+                case Store(base=Reference(name=name), index=index, value=value):
+                    self.highest[name] = max(self.highest.get(name, index), index)
+                    self.stored.add(name)
+                    self._value(value)
+                case Apply(target=target, arguments=arguments):
+                    match target:
+                        case Reference(name=name):
+                            self.called.setdefault(name, set()).add(len(arguments))
+                            self.called_directly.add(name)
+                        case Load(base=Reference(name=name), index=0):
+                            self.called.setdefault(name, set()).add(len(arguments))
+                        case _:
+                            self._value(target)
+                    for argument in arguments:
+                        self._value(argument)
+                case _:
+                    for child in children(node):
+                        self._value(child)
+            stack.extend(children(node))
+        charge(visited)
+
+    def _value(self, child: Term) -> None:
+        # child is used for its value
+        match child:
+            case Reference(name=name):
+                self.escaped.add(name)
+            case Load(base=Reference(name=name)):
+                self.loaded.add(name)
+            case _:
+                pass
+
+    def cells(self) -> dict[Identifier, int]:
+        # the allocations that do not escape, with their sizes
+        return {
+            name: count
+            for name, count in self.allocations.items()
+            if self.binders[name] == 1
+            and name not in self.escaped
+            and name not in self.called_directly
+            and self.highest.get(name, -1) < count
+        }
+
+    def functions(self) -> dict[Identifier, Abstract]:
+        # the known functions
+        return {
+            name: function
+            for name, function in self.lambdas.items()
+            if self.binders[name] == 1
+            and name not in self.escaped
+            and name not in self.loaded
+            and name not in self.stored
+            and self.highest.get(name, 0) == 0
+            and self.called.get(name, set()) <= {len(function.parameters)}
+        }
+
+
+def non_escaping(term: Term) -> dict[Identifier, int]:
+    # the names bound in term to an Allocate whose cell does not escape, with their sizes
+    return _Census(term).cells()
+
+
+# Replacement
+
+
+class _Escapes(Exception):
+    def __init__(self, cell: Identifier) -> None:
+        super().__init__(cell)
+        self.cell = cell
+
+
+def _accesses(
+    term: Term, cells: Mapping[Identifier, int], functions: Mapping[Identifier, Abstract]
+) -> tuple[set[Slot], set[Slot], set[Identifier]]:
+    # the indices of cells term reads and writes, and the known functions it calls, outside
+    # any lambda in it
+    reads: set[Slot] = set()
+    writes: set[Slot] = set()
+    calls: set[Identifier] = set()
+    stack = [term]
+    while stack:
+        match node := stack.pop():
+            case Abstract():
+                continue
+            case Load(base=Reference(name=name), index=index) if name in cells:
+                reads.add((name, index))
+            case Store(base=Reference(name=name), index=index) if name in cells:
+                writes.add((name, index))
+            case Apply(target=Reference(name=name) | Load(base=Reference(name=name), index=0)) if name in functions:
+                calls.add(name)
+            case _:
+                pass
+        stack.extend(children(node))
+    return reads, writes, calls
+
+
+class _Replacement:
+    def __init__(self, term: Term) -> None:
+        census = _Census(term)
+        self.cells = census.cells()
+        self._functions = census.functions()
+        self._binders = census.binders
+        self._names = census.binders.keys() | census.escaped
+
+        # of the known functions that use cells, the indices each reads or writes, in the
+        # order of their parameters, and those it writes
+        self.touches: dict[Identifier, list[Slot]] = {}
+        self.writes: dict[Identifier, frozenset[Slot]] = {}
+
+        # where the rewrite is: the value at each index of each cell, None where it is not
+        # known, and the cells bound in the function it is in
+        self.values: dict[Slot, Term | None] = {}
+        self.frame: set[Identifier] = set()
+
+    def start(self) -> None:
+        # ready to rewrite with the cells not given up
+        relevant = self.cells.keys() | self._functions.keys()
+        reads: dict[Identifier, set[Slot]] = {}
+        writes: dict[Identifier, set[Slot]] = {}
+        calls: dict[Identifier, set[Identifier]] = {}
+        for name, function in self._functions.items():
+            if not relevant.isdisjoint(free_variables(function)):
+                reads[name], writes[name], calls[name] = _accesses(function.body, self.cells, self._functions)
+
+        # what a function's callees use, it uses
+        changed = True
+        while changed:
+            changed = False
+            for name, callees in calls.items():
+                for callee in callees & calls.keys():
+                    if not (reads[callee] <= reads[name] and writes[callee] <= writes[name]):
+                        reads[name] |= reads[callee]
+                        writes[name] |= writes[callee]
+                        changed = True
+
+        self.touches = {name: sorted(reads[name] | writes[name]) for name in reads if reads[name] | writes[name]}
+        self.writes = {name: frozenset(writes[name]) for name in self.touches}
+        self.relevant = self.cells.keys() | self.touches.keys()
+        self.values = {}
+        self.frame = set()
+        self._taken = set(self._names)
+        self._fresh = SequentialNameGenerator()
+
+    def unaffected(self, term: Term) -> bool:
+        return not allocates(term) and self.relevant.isdisjoint(free_variables(term))
+
+    def fresh(self, name: Identifier) -> Identifier:
+        fresh = self._fresh(name)
+        while fresh in self._taken:
+            fresh = self._fresh(name)
+        self._taken.add(fresh)
+        return fresh
+
+    def read(self, slot: Slot) -> Term:
+        value = self.values.get(slot)
+        if value is None:
+            raise _Escapes(slot[0])
+        return value
+
+    def lasting(self, value: Term) -> bool:
+        # value means the same wherever it is in scope
+        return isinstance(value, Immediate) or (isinstance(value, Reference) and self._binders[value.name] <= 1)
+
+    def forget(self, names: frozenset[Identifier]) -> None:
+        # names go out of scope, and the values that are them with them
+        for slot, value in self.values.items():
+            if isinstance(value, Reference) and value.name in names:
+                self.values[slot] = None
+
+
+def _skipping[H: Callable[..., Any]](handlers: Mapping[str, H]) -> dict[str, H]:
+    # handlers with a term that allocates nothing and uses no cell or function that is
+    # rewritten left as it is
+    def wrap(handler: Callable[..., Visit[Term]]) -> Callable[..., Visit[Term]]:
+        def visit(term: Term, state: _Replacement) -> Visit[Term]:
+            if state.unaffected(term):
+                return term
+            return (yield from handler(term, state))
+
+        return visit
+
+    return {tag: wrap(handler) if isgeneratorfunction(handler) else handler for tag, handler in handlers.items()}  # pyright: ignore[reportReturnType]
+
+
+def _leaf(term: Reference | Immediate | Allocate, state: _Replacement) -> Term:
+    return term
+
+
+def _let(term: Let, state: _Replacement) -> Visit[Term]:
+    bindings: list[tuple[Identifier, Term]] = []
+    for name, value in term.bindings:
+        if name in state.cells:
+            # the Allocate goes, and its cell has nothing in it yet
+            state.frame.add(name)
+            for index in range(state.cells[name]):
+                state.values.pop((name, index), None)
+        elif name in state.touches:
+            assert isinstance(value, Abstract)
+            bindings.append((name, (yield from _function(value, state.touches[name], state))))
+        else:
+            bindings.append((name, (yield value, state)))
+    body = yield term.body, state
+    state.forget(frozenset(name for name, _ in term.bindings))
+    if not bindings:
+        return body
+    return rebuild(term, bindings=tuple(bindings), body=body)
+
+
+def _function(term: Abstract, slots: list[Slot], state: _Replacement) -> Visit[Term]:
+    # a known function with a parameter for each index it uses, which it starts with
+    parameters = tuple(state.fresh(cell) for cell, _ in slots)
+    values, frame = state.values, state.frame
+    state.values = {slot: cons(Reference, name=parameter) for slot, parameter in zip(slots, parameters, strict=True)}
+    state.frame = {cell for cell, _ in slots}
+    body = yield term.body, state
+    state.values, state.frame = values, frame
+    return rebuild(term, parameters=(*term.parameters, *parameters), body=body)
+
+
+def _abstract(term: Abstract, state: _Replacement) -> Visit[Term]:
+    # the body runs later, where no cell bound outside it can be followed
+    values, frame = state.values, state.frame
+    state.values, state.frame = {}, set()
+    body = yield term.body, state
+    state.values, state.frame = values, frame
+    return rebuild(term, body=body)
+
+
+def _apply(term: Apply, state: _Replacement) -> Visit[Term]:
+    match term.target:
+        case Reference(name=name) | Load(base=Reference(name=name), index=0) if name in state.touches:
+            arguments = yield from each((argument, state) for argument in term.arguments)
+            passed = [state.read(slot) for slot in state.touches[name]]
+            for slot in state.writes[name]:
+                state.values[slot] = None
+            return rebuild(term, arguments=(*arguments, *passed))
+        case _:
+            target = yield term.target, state
+            arguments = yield from each((argument, state) for argument in term.arguments)
+            return rebuild(term, target=target, arguments=tuple(arguments))
+
+
+def _primitive(term: Primitive, state: _Replacement) -> Visit[Term]:
+    return rebuild(term, left=(yield term.left, state), right=(yield term.right, state))
+
+
+def _branch(term: Branch, state: _Replacement) -> Visit[Term]:
+    left, right = (yield term.left, state), (yield term.right, state)
+    # each arm starts from what the condition leaves, and after them an index keeps its
+    # value only if both leave it the same
+    before = state.values
+    state.values = dict(before)
+    consequent = yield term.consequent, state
+    after = state.values
+    state.values = dict(before)
+    otherwise = yield term.otherwise, state
+    state.values = {slot: value if after.get(slot) is value else None for slot, value in state.values.items()}
+    return rebuild(term, left=left, right=right, consequent=consequent, otherwise=otherwise)
+
+
+def _load(term: Load, state: _Replacement) -> Visit[Term]:
+    match term.base:
+        case Reference(name=name) if name in state.cells:
+            return state.read((name, term.index))
+        case _:
+            return rebuild(term, base=(yield term.base, state))
+
+
+def _store(term: Store, state: _Replacement) -> Visit[Term]:
+    match term.base:
+        case Reference(name=name) if name in state.cells:
+            # not an effect of a Begin, so its result is used
+            raise _Escapes(name)
+        case _:
+            return rebuild(term, base=(yield term.base, state), value=(yield term.value, state))
+
+
+def _begin(term: Begin, state: _Replacement) -> Visit[Term]:
+    # the effects left and, for each store to a cell, the binding of its value, in order
+    items: list[Term | tuple[Identifier, Term]] = []
+    bound: list[Identifier] = []
+    for effect in term.effects:
+        match effect:
+            case Store(base=Reference(name=cell), index=index, value=value) if cell in state.cells:
+                if cell not in state.frame:
+                    raise _Escapes(cell)
+                stored = yield value, state
+                if not state.lasting(stored):
+                    name = state.fresh(cell)
+                    items.append((name, stored))
+                    bound.append(name)
+                    stored = cons(Reference, name=name)
+                state.values[(cell, index)] = stored
+            case _:
+                items.append((yield effect, state))
+    value = yield term.value, state
+    state.forget(frozenset(bound))
+    if not bound:
+        effects = tuple(item for item in items if not isinstance(item, tuple))
+        return rebuild(term, effects=effects, value=value) if effects else value
+
+    # each binding goes around the effects after it and the value
+    effects: list[Term] = []
+    for item in reversed(items):
+        if isinstance(item, tuple):
+            value = cons(
+                Let,
+                bindings=(item,),
+                body=cons(Begin, effects=tuple(reversed(effects)), value=value) if effects else value,
+            )
+            effects = []
+        else:
+            effects.append(item)
+    return cons(Begin, effects=tuple(reversed(effects)), value=value) if effects else value
+
+
+_replace = Traversal[Term](
+    _skipping(
+        {
+            "reference": _leaf,
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "immediate": _leaf,
+            "primitive": _primitive,
+            "branch": _branch,
+            "allocate": _leaf,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+        }
+    )
+)
+
+
+def scalar_replacement_term(term: Term) -> Term:
+    # term with each cell that does not escape, and that can be followed, replaced by
+    # the values stored in it
+    if not allocates(term):
+        return term
+    state = _Replacement(term)
+    while state.cells:
+        state.start()
+        try:
+            return _replace(term, state)
+        except _Escapes as escape:
+            del state.cells[escape.cell]
+    return term
@@ -0,0 +1,173 @@
+from util.hash_cons import cons, rebuild
+from util.memo import IdentityMemo
+from util.rewrite import Rules
+from util.scoped_map import ScopedMap
+from util.traverse import Traversal, Visit, each
+
+from .constant_folding import folding_rules
+from .constant_propagation import Scope, env_memoized
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Identifier,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+Sparse conditional constant propagation: constant propagation, constant folding and
+branch elimination as one analysis, in one walk.
+
+Each value has a place in the usual lattice: unreachable, one constant, or any value.
+A reference to a name bound to a constant is that constant; an operation on constants
+is folded with constant folding's rules, and so is a constant; a Branch whose condition
+is decided keeps only the arm it takes, and the other is never visited, so nothing
+in it reaches the env. SCCP's worklist revisits a value when one it depends on moves
+down the lattice. In an L2 term every name is bound once, before the scope that uses
+it, and a value depends only on values bound outside it; so walking each Let's
+bindings in order sees every value after all that it depends on, and a single walk
+gets to the fixed point the worklist would. The values are the terms: an Immediate is
+a constant and any other term is any value. Once a name's references are replaced by
+its constant, its binding is dead, and goes.
+
+It also knows more in a Branch's arms than the separate passes: in the consequent of
+`(if (== x k) ...)`, x is k.
+
+The rules a fold fires can build operations (reassociating constants to the front,
+say) that other rules apply to; each is simplified as it is built, so what the walk
+returns needs no second run. Results are kept by node for terms the env has no
+constant for, as in constant propagation.
+"""
+
+# Results by node identity, for terms the env has no constant for.
+sccp_memo = IdentityMemo[Term, Term]()
+
+
+def _simplify(operator: str, left: Term, right: Term) -> Term:
+    # the operation on simplified operands, simplified in turn
+    simplified = _fold(operator, left, right)
+    return simplified if simplified is not None else cons(Primitive, operator=operator, left=left, right=right)
+
+
+# Constant folding's rules, with each operation they build simplified as it is built.
+_fold = Rules[Term](folding_rules(combine=_simplify))
+
+
+def _reference(term: Reference, env: Scope) -> Term:
+    if term.name in env:
+        return cons(Immediate, value=env[term.name])
+    return term
+
+
+def _leaf(term: Immediate | Allocate, env: Scope) -> Term:
+    return term
+
+
+def _let(term: Let, env: Scope) -> Visit[Term]:
+    # each binding's value in the env of the ones before it; a constant's binding goes,
+    # since every reference to it is replaced
+    mark = env.mark()
+    bindings: list[tuple[Identifier, Term]] = []
+    for name, value in term.bindings:
+        value = yield value, env
+        if isinstance(value, Immediate):
+            env.bind(name, value.value)
+        else:
+            bindings.append((name, value))
+            env.hide(name)
+    body = yield term.body, env
+    env.undo(mark)
+    return rebuild(term, bindings=tuple(bindings), body=body) if bindings else body
+
+
+def _abstract(term: Abstract, env: Scope) -> Visit[Term]:
+    mark = env.mark()
+    for parameter in term.parameters:
+        env.hide(parameter)
+    body = yield term.body, env
+    env.undo(mark)
+    return rebuild(term, body=body)
+
+
+def _apply(term: Apply, env: Scope) -> Visit[Term]:
+    return rebuild(
+        term,
+        target=(yield term.target, env),
+        arguments=tuple((yield from each((argument, env) for argument in term.arguments))),
+    )
+
+
+def _primitive(term: Primitive, env: Scope) -> Visit[Term]:
+    left, right = (yield term.left, env), (yield term.right, env)
+    folded = _fold(term.operator, left, right)
+    return folded if folded is not None else rebuild(term, left=left, right=right)
+
+
+def _branch(term: Branch, env: Scope) -> Visit[Term]:
+    left, right = (yield term.left, env), (yield term.right, env)
+
+    match left, right:
+        case Immediate(value=i1), Immediate(value=i2):
+            # the other arm is unreachable
+            taken = (i1 < i2) if term.operator == "<" else (i1 == i2)
+            return (yield term.consequent if taken else term.otherwise, env)
+
+        case (Reference(name=name), Immediate(value=value)) | (Immediate(value=value), Reference(name=name)) if (
+            term.operator == "=="
+        ):
+            # the consequent runs only where name is value
+            mark = env.mark()
+            env.bind(name, value)
+            consequent = yield term.consequent, env
+            env.undo(mark)
+
+        case _:
+            consequent = yield term.consequent, env
+
+    return rebuild(term, left=left, right=right, consequent=consequent, otherwise=(yield term.otherwise, env))
+
+
+def _load(term: Load, env: Scope) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, env))
+
+
+def _store(term: Store, env: Scope) -> Visit[Term]:
+    return rebuild(term, base=(yield term.base, env), value=(yield term.value, env))
+
+
+def _begin(term: Begin, env: Scope) -> Visit[Term]:
+    effects = yield from each((effect, env) for effect in term.effects)
+    return rebuild(term, effects=tuple(effects), value=(yield term.value, env))
+
+
+_sccp = Traversal[Term](
+    env_memoized(
+        {
+            "reference": _reference,
+            "let": _let,
+            "abstract": _abstract,
+            "apply": _apply,
+            "immediate": _leaf,
+            "primitive": _primitive,
+            "branch": _branch,
+            "allocate": _leaf,
+            "load": _load,
+            "store": _store,
+            "begin": _begin,
+        },
+        sccp_memo,
+    )
+)
+
+
+def sccp_term(term: Term) -> Term:
+    # term with every constant propagated and folded and every decided branch taken
+    return _sccp(term, ScopedMap[Identifier, int]({}))
@@ -0,0 +1,113 @@
+import pytest
+from L2.alpha import alpha_hash, canonical_program
+from L2.binary import CODEC
+from L2.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+    Term,
+)
+
+
+def program(a: str, x: str, f: str, n: str) -> Program:
+    # every kind of node, with the binders named by the arguments
+    return Program(
+        parameters=[a],
+        body=Let(
+            bindings=[
+                (x, Allocate(count=1)),
+                (f, Abstract(parameters=[n], body=Load(base=Reference(name=x), index=0))),
+                (n, Apply(target=Reference(name=f), arguments=[Reference(name=a)])),
+            ],
+            body=Begin(
+                effects=[Store(base=Reference(name=x), index=0, value=Reference(name=n))],
+                value=Branch(
+                    operator="<",
+                    left=Reference(name=n),
+                    right=Immediate(value=1),
+                    consequent=Primitive(operator="+", left=Reference(name=n), right=Reference(name="free")),
+                    otherwise=Immediate(value=0),
+                ),
+            ),
+        ),
+    )
+
+
+def test_hash_ignores_binder_names():
+    assert alpha_hash(program("a", "x", "f", "n")) == alpha_hash(program("b", "y", "g", "m"))
+
+
+def test_hash_let_is_sequential():
+    # the second value sees the first binding
+    first = Let(bindings=[("x", Immediate(value=1)), ("y", Reference(name="x"))], body=Reference(name="y"))
+    second = Let(bindings=[("a", Immediate(value=1)), ("b", Reference(name="a"))], body=Reference(name="b"))
+    free = Let(bindings=[("a", Immediate(value=1)), ("b", Reference(name="x"))], body=Reference(name="b"))
+
+    assert alpha_hash(first) == alpha_hash(second)
+    assert alpha_hash(first) != alpha_hash(free)
+
+
+@pytest.mark.parametrize(
+    "left, right",
+    [
+        (Reference(name="a"), Reference(name="b")),
+        (
+            Abstract(parameters=["x", "y"], body=Reference(name="x")),
+            Abstract(parameters=["x", "y"], body=Reference(name="y")),
+        ),
+        (
+            Let(bindings=[("x", Immediate(value=1))], body=Reference(name="x")),
+            Let(bindings=[("x", Immediate(value=1))], body=Immediate(value=1)),
+        ),
+    ],
+)
+def test_hash_distinguishes(left: Term, right: Term):
+    assert alpha_hash(left) != alpha_hash(right)
+
+
+def test_hash_deep():
+    body: Term = Reference(name="x")
+    for _ in range(10_000):
+        body = Let(bindings=[("x", body)], body=Reference(name="x"))
+
+    assert alpha_hash(body) == alpha_hash(body)
+
+
+def test_canonical_program_is_identical_for_renamings():
+    first = canonical_program(program("a", "x", "f", "n"))
+    second = canonical_program(program("b", "y", "g", "m"))
+
+    assert first == second
+    assert CODEC.dumps(first) == CODEC.dumps(second)
+    # parameters first, then each binder in the order it is reached
+    assert first.parameters == ["v0"]
+    assert isinstance(first.body, Let)
+    assert [name for name, _ in first.body.bindings] == ["v1", "v2", "v3"]
+    assert alpha_hash(first) == alpha_hash(program("a", "x", "f", "n"))
+
+
+def test_canonical_program_scoping():
+    shadowing = Program(
+        parameters=["x"],
+        body=Let(
+            bindings=[("x", Reference(name="x")), ("x", Abstract(parameters=["x"], body=Reference(name="x")))],
+            body=Reference(name="x"),
+        ),
+    )
+
+    assert canonical_program(shadowing) == Program(
+        parameters=["v0"],
+        body=Let(
+            bindings=[("v1", Reference(name="v0")), ("v2", Abstract(parameters=["v3"], body=Reference(name="v3")))],
+            body=Reference(name="v2"),
+        ),
+    )
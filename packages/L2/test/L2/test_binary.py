@@ -0,0 +1,51 @@
+from L2.binary import CODEC
+from L2.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+
+# one of each node, mixing list and tuple sequences
+PROGRAM = Program(
+    parameters=("a", "b"),
+    body=Let(
+        bindings=[
+            ("x", Allocate(count=2)),
+            (
+                "f",
+                Abstract(
+                    parameters=["n"], body=Primitive(operator="-", left=Reference(name="n"), right=Immediate(value=-1))
+                ),
+            ),
+        ],
+        body=Begin(
+            effects=(Store(base=Reference(name="x"), index=1, value=Reference(name="a")),),
+            value=Branch(
+                operator="<",
+                left=Load(base=Reference(name="x"), index=1),
+                right=Immediate(value=-(1 << 70)),
+                consequent=Apply(target=Reference(name="f"), arguments=[Reference(name="b")]),
+                otherwise=Apply(target=Reference(name="f"), arguments=()),
+            ),
+        ),
+    ),
+)
+
+
+def test_round_trip_every_node():
+    assert CODEC.loads(CODEC.dumps(PROGRAM)) == PROGRAM
+
+
+def test_lazy_view():
+    program = CODEC.view(CODEC.dumps(PROGRAM))
+
+    assert program.body.body.value.consequent.arguments[0].name == "b"
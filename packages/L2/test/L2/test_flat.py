@@ -0,0 +1,234 @@
+import random
+
+import pytest
+from L2.branch_elimination import branch_elimination_term
+from L2.constant_folding import constant_folding_term
+from L2.constant_propagation import constant_propagation_term
+from L2.dead_code_elim import dead_code_elimination_term
+from L2.flat import (
+    FLAT_PASSES,
+    PLUS,
+    PRIMITIVE,
+    SEPARATE,
+    FlatProgram,
+    branch_elimination_flat,
+    constant_folding_flat,
+    constant_propagation_flat,
+    dead_code_elimination_flat,
+    flatten_program,
+    optimize_flat_program,
+    unflatten_program,
+)
+from L2.optimize import PASSES, optimize_program
+from L2.pass_manager import parse_pipeline
+from L2.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+    Term,
+)
+from util.budget import Budget
+from util.symbols import SymbolTable
+
+NAMES = ("a", "b", "c", "d")
+VALUES = (0, 1, 2, 3, -1, 1 << 70)
+
+
+def generate(rng: random.Random, depth: int) -> Term:
+    # A random, not necessarily well-scoped, L2 term; the passes do not care.
+    if depth == 0 or rng.random() < 0.2:
+        match rng.randrange(3):
+            case 0:
+                return Reference(name=rng.choice(NAMES))
+            case 1:
+                return Immediate(value=rng.choice(VALUES))
+            case _:
+                return Allocate(count=rng.randrange(3))
+
+    def sub() -> Term:
+        return generate(rng, depth - 1)
+
+    match rng.randrange(9):
+        case 0:
+            bindings = tuple((rng.choice(NAMES), sub()) for _ in range(rng.randrange(3)))
+            return Let(bindings=bindings, body=sub())
+        case 1:
+            return Abstract(parameters=tuple(rng.sample(NAMES, rng.randrange(3))), body=sub())
+        case 2:
+            return Apply(target=sub(), arguments=tuple(sub() for _ in range(rng.randrange(3))))
+        case 3 | 4:
+            return Primitive(operator=rng.choice(["+", "-", "*"]), left=sub(), right=sub())
+        case 5:
+            return Branch(
+                operator=rng.choice(["<", "=="]),
+                left=sub(),
+                right=sub(),
+                consequent=sub(),
+                otherwise=sub(),
+            )
+        case 6:
+            return Load(base=sub(), index=rng.randrange(3))
+        case 7:
+            return Store(base=sub(), index=rng.randrange(3), value=sub())
+        case _:
+            return Begin(effects=tuple(sub() for _ in range(rng.randrange(1, 3))), value=sub())
+
+
+PROGRAMS = [Program(parameters=("a", "b"), body=generate(random.Random(seed), 6)) for seed in range(200)]
+
+
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_flat_round_trip(program: Program):
+    assert unflatten_program(flatten_program(program)) == program
+
+
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_flat_passes_match_tree_passes(program: Program):
+    flat = flatten_program(program)
+    body = program.body
+
+    assert unflatten_program(constant_folding_flat(flat)).body == constant_folding_term(body, context={})
+    assert unflatten_program(constant_propagation_flat(flat)).body == constant_propagation_term(body, env={})
+    assert unflatten_program(dead_code_elimination_flat(flat)).body == dead_code_elimination_term(body)
+    assert unflatten_program(branch_elimination_flat(flat)).body == branch_elimination_term(body)
+
+
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_optimize_flat_matches_optimize(program: Program):
+    # the one pipeline, over trees and over the flat encoding
+    expected = optimize_program(program, parse_pipeline(SEPARATE, PASSES))
+    assert unflatten_program(optimize_flat_program(flatten_program(program))) == expected
+
+
+def test_optimize_flat_pipeline():
+    # (let ((a 1)) (let ((b (+ a 1))) (+ b x)))
+    program = Program(
+        parameters=("x",),
+        body=Let(
+            bindings=(("a", Immediate(value=1)),),
+            body=Let(
+                bindings=(("b", Primitive(operator="+", left=Reference(name="a"), right=Immediate(value=1))),),
+                body=Primitive(operator="+", left=Reference(name="b"), right=Reference(name="x")),
+            ),
+        ),
+    )
+    flat = flatten_program(program)
+
+    # the limits hold as they do over trees: one run each folds b but leaves it bound
+    for text in ["propagate:1,fold:1", "propagate,fold,dce,branch"]:
+        optimized = optimize_flat_program(flat, parse_pipeline(text, FLAT_PASSES))
+        assert unflatten_program(optimized) == optimize_program(program, parse_pipeline(text, PASSES))
+    once = optimize_flat_program(flat, parse_pipeline("propagate:1,fold:1", FLAT_PASSES))
+    assert unflatten_program(once).body == Let(
+        bindings=(("a", Immediate(value=1)),),
+        body=Let(
+            bindings=(("b", Immediate(value=2)),),
+            body=Primitive(operator="+", left=Reference(name="b"), right=Reference(name="x")),
+        ),
+    )
+    assert unflatten_program(optimize_flat_program(flat)).body == Primitive(
+        operator="+", left=Immediate(value=2), right=Reference(name="x")
+    )
+
+
+def test_optimize_flat_budget():
+    flat = flatten_program(PROGRAMS[0])
+    budget = Budget(visits=len(flat))
+
+    # the first pass spends it all, and the rest are skipped
+    optimized = optimize_flat_program(flat, budget=budget)
+
+    assert optimized == constant_propagation_flat(flat)
+    assert budget.skipped == ["propagate", "fold", "dce", "branch"]
+
+
+def test_flat_layout():
+    # (let ((x 1)) (+ x 2)), children before parents
+    program = Program(
+        parameters=("y",),
+        body=Let(
+            bindings=(("x", Immediate(value=1)),),
+            body=Primitive(operator="+", left=Reference(name="x"), right=Immediate(value=2)),
+        ),
+    )
+
+    flat = flatten_program(program)
+
+    assert len(flat) == 5
+    assert flat.root == 4
+    assert list(flat.children(flat.root)) == [0, 3]
+    assert [flat.symbols.name(name) for name in flat.bound(flat.root)] == ["x"]
+    assert [flat.value(node) for node in range(5)] == [1, None, 2, None, None]
+
+
+def test_flat_big_immediates():
+    program = Program(
+        parameters=(),
+        body=Primitive(operator="*", left=Immediate(value=1 << 40), right=Immediate(value=1 << 40)),
+    )
+
+    folded = constant_folding_flat(flatten_program(program))
+
+    assert folded.bigs == [1 << 80]
+    assert unflatten_program(folded).body == Immediate(value=1 << 80)
+
+
+def test_flat_equality():
+    program = PROGRAMS[0]
+
+    assert flatten_program(program) == flatten_program(program)
+    assert flatten_program(program) != flatten_program(PROGRAMS[1])
+    assert flatten_program(program) != program
+    assert FlatProgram() == FlatProgram()
+    # programs over different symbol tables compare by the names the tables hold
+    assert FlatProgram(SymbolTable()) == FlatProgram(SymbolTable())
+
+
+def nested(outer: str, inner: str, inner_right: str) -> Term:
+    # (outer (inner 2 a) (inner_right 3 b))
+    return Primitive(
+        operator=outer,  # pyright: ignore[reportArgumentType]
+        left=Primitive(operator=inner, left=Immediate(value=2), right=Reference(name="a")),  # pyright: ignore[reportArgumentType]
+        right=Primitive(operator=inner_right, left=Immediate(value=3), right=Reference(name="b")),  # pyright: ignore[reportArgumentType]
+    )
+
+
+@pytest.mark.parametrize(
+    "term",
+    [
+        nested("+", "+", "+"),
+        nested("+", "-", "-"),
+        nested("-", "-", "-"),
+        nested("-", "+", "+"),
+        nested("*", "*", "*"),
+        nested("*", "*", "+"),
+        nested("-", "-", "+"),
+        Primitive(operator="*", left=Reference(name="a"), right=Immediate(value=3)),
+    ],
+)
+def test_flat_folding_reassociates_like_tree(term: Term):
+    flat = flatten_program(Program(parameters=(), body=term))
+
+    assert unflatten_program(constant_folding_flat(flat)).body == constant_folding_term(term, context={})
+
+
+def test_flat_compact_keeps_sharing():
+    flat = FlatProgram()
+    one = flat.immediate(1)
+    flat.root = flat.add(PRIMITIVE, PLUS, [one, one])
+
+    compacted = flat.compact(flat.root)
+
+    assert len(compacted) == 2
+    assert unflatten_program(compacted).body == Primitive(
+        operator="+", left=Immediate(value=1), right=Immediate(value=1)
+    )
@@ -12,11 +12,23 @@ All terms are built directly with the Pydantic model constructors from
 syntax.py — no helper wrappers — to avoid any type-coercion surprises.
 """
 
-from L2.branch_elimination import branch_elimination_term
-from L2.constant_folding import constant_folding_term
-from L2.constant_propagation import constant_propagation_term
-from L2.dead_code_elim import dead_code_elimination_term, free_variables, is_pure
-from L2.optimize import optimize_program
+from L2.branch_elimination import branch_elimination_memo, branch_elimination_term
+from L2.constant_folding import constant_folding_memo, constant_folding_term
+from L2.constant_propagation import constant_propagation_memo, constant_propagation_term
+from L2.cse import cse_statistics, cse_term
+from L2.dead_code_elim import (
+    dead_code_elimination_memo,
+    dead_code_elimination_term,
+    free_variables,
+    free_variables_memo,
+    is_pure,
+    is_pure_memo,
+)
+from L2.inline import inline_term
+from L2.memory import accesses, memory_term
+from L2.optimize import optimize_program, optimize_term
+from L2.scalar_replacement import allocates, non_escaping, scalar_replacement_term
+from L2.sccp import sccp_memo, sccp_term
 from L2.syntax import (
     Abstract,
     Allocate,
@@ -31,6 +43,7 @@ from L2.syntax import (
     Reference,
     Store,
 )
+from util.hash_cons import intern
 
 # ===========================================================================
 # 1. Constant Folding
@@ -533,6 +546,12 @@ class TestConstantPropagation:
         term = Immediate(value=7)
         assert constant_propagation_term(term, env={}) == Immediate(value=7)
 
+    def test_let_non_constant_binding_shadows(self):
+        # let x = 1 in let x = (f) in x  — the inner x is not 1
+        inner = Let(bindings=(("x", Apply(target=Reference(name="f"), arguments=())),), body=Reference(name="x"))
+        term = Let(bindings=(("x", Immediate(value=1)),), body=inner)
+        assert constant_propagation_term(term, env={}) == term
+
     def test_propagates_into_primitive(self):
         # x + y with x=3 in env  =>  3 + y
         term = Primitive(operator="+", left=Reference(name="x"), right=Reference(name="y"))
@@ -1406,7 +1425,928 @@ class TestBranchElimination:
 
 
 # ===========================================================================
-# 7. Full optimize_program — integration tests
+# 7. Sparse conditional constant propagation
+# ===========================================================================
+
+
+class TestSCCP:
+    def test_folded_binding_propagates_in_one_run(self):
+        # let a = 1 in let b = (+ a 2) in (* b x)
+        term = Let(
+            bindings=(("a", Immediate(value=1)),),
+            body=Let(
+                bindings=(("b", Primitive(operator="+", left=Reference(name="a"), right=Immediate(value=2))),),
+                body=Primitive(operator="*", left=Reference(name="b"), right=Reference(name="x")),
+            ),
+        )
+        # and with every reference to them replaced, the bindings go
+        assert sccp_term(term) == Primitive(operator="*", left=Immediate(value=3), right=Reference(name="x"))
+
+    def test_operations_built_by_rules_are_simplified(self):
+        # (+ (+ 1 (+ 2 a)) (+ 3 (+ 4 b))): the first rule builds (+ (+ 2 a) (+ 4 b)), which another applies to
+        def plus(left, right):
+            return Primitive(operator="+", left=left, right=right)
+
+        term = plus(
+            plus(Immediate(value=1), plus(Immediate(value=2), Reference(name="a"))),
+            plus(Immediate(value=3), plus(Immediate(value=4), Reference(name="b"))),
+        )
+        expected = plus(Immediate(value=4), plus(Immediate(value=6), plus(Reference(name="a"), Reference(name="b"))))
+
+        assert sccp_term(term) == expected
+        # folding alone takes a second run
+        assert constant_folding_term(term, context={}) != expected
+        assert constant_folding_term(constant_folding_term(term, context={}), context={}) == expected
+
+    def test_decided_branch_takes_one_arm(self):
+        # (if (< a 2) (let ((b a)) (+ b 1)) y) where a is 1
+        term = Let(
+            bindings=(("a", Immediate(value=1)),),
+            body=Branch(
+                operator="<",
+                left=Reference(name="a"),
+                right=Immediate(value=2),
+                consequent=Let(
+                    bindings=(("b", Reference(name="a")),),
+                    body=Primitive(operator="+", left=Reference(name="b"), right=Immediate(value=1)),
+                ),
+                otherwise=Reference(name="y"),
+            ),
+        )
+        assert sccp_term(term) == Immediate(value=2)
+
+    def test_equality_is_known_in_the_consequent(self):
+        def branch(operator, left, right):
+            plus = Primitive(operator="+", left=Reference(name="x"), right=Immediate(value=1))
+            return Branch(operator=operator, left=left, right=right, consequent=plus, otherwise=plus)
+
+        x, three = Reference(name="x"), Immediate(value=3)
+        four = Immediate(value=4)
+        for left, right in [(x, three), (three, x)]:
+            optimized = sccp_term(branch("==", left, right))
+            assert isinstance(optimized, Branch)
+            assert optimized.consequent == four
+            # and only there
+            assert optimized.otherwise == Primitive(operator="+", left=Immediate(value=1), right=x)
+        # x < 3 says nothing of x
+        assert sccp_term(branch("<", x, three)).consequent != four
+
+    def test_shadowing(self):
+        # let a = 1 in ((lambda (a) a) (let a = y in a))
+        inner = Apply(
+            target=Abstract(parameters=("a",), body=Reference(name="a")),
+            arguments=(Let(bindings=(("a", Reference(name="y")),), body=Reference(name="a")),),
+        )
+        assert sccp_term(Let(bindings=(("a", Immediate(value=1)),), body=inner)) == inner
+
+    def test_other_terms(self):
+        term = Let(
+            bindings=(("a", Immediate(value=2)),),
+            body=Begin(
+                effects=(Store(base=Allocate(count=1), index=0, value=Reference(name="a")),),
+                value=Load(base=Reference(name="a"), index=0),
+            ),
+        )
+        assert sccp_term(term) == Begin(
+            effects=(Store(base=Allocate(count=1), index=0, value=Immediate(value=2)),),
+            value=Load(base=Immediate(value=2), index=0),
+        )
+
+    def test_unchanged_term_is_returned(self):
+        term = intern(
+            Branch(
+                operator="<",
+                left=Reference(name="x"),
+                right=Immediate(value=1),
+                consequent=Reference(name="y"),
+                otherwise=Allocate(count=0),
+            )
+        )
+        assert sccp_term(term) is term
+
+    def test_memoized(self):
+        term = Primitive(operator="+", left=Reference(name="a"), right=Immediate(value=2))
+        first = sccp_term(term)
+        hits = sccp_memo.hits
+        assert sccp_term(term) is first
+        assert sccp_memo.hits == hits + 1
+
+
+# ===========================================================================
+# 8. Inlining
+# ===========================================================================
+
+
+def _call(target, *arguments):
+    return Apply(target=Reference(name=target) if isinstance(target, str) else target, arguments=arguments)
+
+
+def _square(parameter):
+    return Abstract(
+        parameters=(parameter,),
+        body=Primitive(operator="*", left=Reference(name=parameter), right=Reference(name=parameter)),
+    )
+
+
+class TestInline:
+    def test_direct_application_is_beta_reduced(self):
+        # ((lambda (x y) (+ x y)) (load a 0) 1)
+        function = Abstract(
+            parameters=("x", "y"),
+            body=Primitive(operator="+", left=Reference(name="x"), right=Reference(name="y")),
+        )
+        term = _call(function, Load(base=Reference(name="a"), index=0), Immediate(value=1))
+        # the argument that costs something is bound, once, under a fresh name
+        assert inline_term(term) == Let(
+            bindings=(("x0", Load(base=Reference(name="a"), index=0)),),
+            body=Primitive(operator="+", left=Reference(name="x0"), right=Immediate(value=1)),
+        )
+
+    def test_lambda_used_once_is_inlined(self):
+        # let make_adder = (lambda (x) (lambda (y) (+ x y))), adder = (make_adder m) in (adder n)
+        make_adder = Abstract(
+            parameters=("x",),
+            body=Abstract(
+                parameters=("y",),
+                body=Primitive(operator="+", left=Reference(name="x"), right=Reference(name="y")),
+            ),
+        )
+        term = Let(
+            bindings=(("make_adder", make_adder), ("adder", _call("make_adder", Reference(name="m")))),
+            body=_call("adder", Reference(name="n")),
+        )
+        adder = Abstract(
+            parameters=("y0",),
+            body=Primitive(operator="+", left=Reference(name="m"), right=Reference(name="y0")),
+        )
+        # the bindings are dead, for dead code elimination
+        assert inline_term(term) == Let(
+            bindings=(("make_adder", make_adder), ("adder", adder)),
+            body=Primitive(operator="+", left=Reference(name="m"), right=Reference(name="n")),
+        )
+
+    def test_small_lambda_is_inlined_at_each_call(self):
+        term = Let(
+            bindings=(("f", _square("x")),),
+            body=Primitive(operator="+", left=_call("f", Reference(name="a")), right=_call("f", Immediate(value=2))),
+        )
+        assert inline_term(term) == Let(
+            bindings=(("f", _square("x")),),
+            body=Primitive(
+                operator="+",
+                left=Primitive(operator="*", left=Reference(name="a"), right=Reference(name="a")),
+                right=Primitive(operator="*", left=Immediate(value=2), right=Immediate(value=2)),
+            ),
+        )
+
+    def test_large_lambda_used_twice_is_not_inlined(self):
+        body = Reference(name="x")
+        for _ in range(20):
+            body = Primitive(operator="+", left=Reference(name="x"), right=body)
+        term = intern(
+            Let(
+                bindings=(("f", Abstract(parameters=("x",), body=body)),),
+                body=Primitive(
+                    operator="+", left=_call("f", Reference(name="a")), right=_call("f", Reference(name="b"))
+                ),
+            )
+        )
+        assert inline_term(term) is term
+
+    def test_growth_is_limited(self):
+        # 20 calls to a lambda of 3 nodes, in a term of 47: the allowance is 32 nodes
+        term = Let(
+            bindings=(("f", _square("x")),),
+            body=Begin(
+                effects=tuple(_call("f", Reference(name="a")) for _ in range(19)), value=_call("f", Reference(name="a"))
+            ),
+        )
+        inlined = inline_term(term)
+        assert isinstance(inlined, Let) and isinstance(inlined.body, Begin)
+        calls = [effect for effect in (*inlined.body.effects, inlined.body.value) if isinstance(effect, Apply)]
+        assert len(calls) == 10
+
+    def test_lambda_argument_is_inlined_in_the_copy(self):
+        # let sq = (lambda (x) (* x x)), twice = (lambda (f y) (f (f y))) in (twice sq i)
+        twice = Abstract(parameters=("f", "y"), body=_call("f", _call("f", Reference(name="y"))))
+        term = Let(
+            bindings=(("sq", _square("x")), ("twice", twice)),
+            body=_call("twice", Reference(name="sq"), Reference(name="i")),
+        )
+        assert inline_term(term) == Let(
+            bindings=(("sq", _square("x")), ("twice", twice)),
+            body=Let(
+                bindings=(("x0", Primitive(operator="*", left=Reference(name="i"), right=Reference(name="i"))),),
+                body=Primitive(operator="*", left=Reference(name="x0"), right=Reference(name="x0")),
+            ),
+        )
+
+    def test_returned_lambda_is_known_after_its_let_is_merged(self):
+        # let adder = ((lambda (x) (lambda (y) (+ x y))) (load a 0)) in (adder 1)
+        make_adder = Abstract(
+            parameters=("x",),
+            body=Abstract(
+                parameters=("y",),
+                body=Primitive(operator="+", left=Reference(name="x"), right=Reference(name="y")),
+            ),
+        )
+        term = Let(
+            bindings=(("adder", _call(make_adder, Load(base=Reference(name="a"), index=0))),),
+            body=_call("adder", Immediate(value=1)),
+        )
+        adder = Abstract(
+            parameters=("y0",),
+            body=Primitive(operator="+", left=Reference(name="x0"), right=Reference(name="y0")),
+        )
+        assert inline_term(term) == Let(
+            bindings=(("x0", Load(base=Reference(name="a"), index=0)), ("adder", adder)),
+            body=Primitive(operator="+", left=Reference(name="x0"), right=Immediate(value=1)),
+        )
+
+    def test_let_is_not_merged_over_a_later_reference(self):
+        # let f = (let x = (load a 0) in (lambda (y) y)), g = x in (f g): g's x is another x
+        term = intern(
+            Let(
+                bindings=(
+                    (
+                        "f",
+                        Let(
+                            bindings=(("x", Load(base=Reference(name="a"), index=0)),),
+                            body=Abstract(parameters=("y",), body=Reference(name="y")),
+                        ),
+                    ),
+                    ("g", Reference(name="x")),
+                ),
+                body=_call("f", Reference(name="g")),
+            )
+        )
+        assert inline_term(term) is term
+
+    def test_lambda_whose_free_variable_is_rebound_is_not_inlined(self):
+        # let y = (load a 0), f = (lambda (x) (+ x y)) in (lambda (y) (f y))
+        function = Abstract(
+            parameters=("x",),
+            body=Primitive(operator="+", left=Reference(name="x"), right=Reference(name="y")),
+        )
+        term = intern(
+            Let(
+                bindings=(("y", Load(base=Reference(name="a"), index=0)), ("f", function)),
+                body=Abstract(parameters=("y",), body=_call("f", Reference(name="y"))),
+            )
+        )
+        assert inline_term(term) is term
+
+    def test_unknown_calls_are_kept(self):
+        # a call with the wrong number of arguments, through a Load, or to a parameter
+        term = intern(
+            Let(
+                bindings=(("f", _square("x")),),
+                body=Begin(
+                    effects=(
+                        _call("f", Immediate(value=1), Immediate(value=2)),
+                        _call(Load(base=Reference(name="f"), index=0), Immediate(value=1)),
+                        Store(base=Allocate(count=1), index=0, value=Immediate(value=1)),
+                    ),
+                    value=Abstract(
+                        parameters=("f",),
+                        body=Branch(
+                            operator="<",
+                            left=_call("f", Immediate(value=1)),
+                            right=Immediate(value=0),
+                            consequent=Reference(name="f"),
+                            otherwise=Immediate(value=0),
+                        ),
+                    ),
+                ),
+            )
+        )
+        assert inline_term(term) is term
+
+    def test_copies_rename_every_binder(self):
+        # let f = (lambda (x) (let z = (load x 0) in (lambda (w) (begin (store z 0 w) (if (< w 0) z w))))) in
+        # (+ (f a) (f b))
+        def body(x, z, w):
+            return Let(
+                bindings=((z, Load(base=Reference(name=x), index=0)),),
+                body=Abstract(
+                    parameters=(w,),
+                    body=Begin(
+                        effects=(Store(base=Reference(name=z), index=0, value=Reference(name=w)),),
+                        value=Branch(
+                            operator="<",
+                            left=Reference(name=w),
+                            right=Immediate(value=0),
+                            consequent=Reference(name=z),
+                            otherwise=Reference(name=w),
+                        ),
+                    ),
+                ),
+            )
+
+        function = Abstract(parameters=("x",), body=body("x", "z", "w"))
+        term = Let(
+            bindings=(("f", function),),
+            body=Primitive(operator="+", left=_call("f", Reference(name="a")), right=_call("f", Reference(name="b"))),
+        )
+        assert inline_term(term) == Let(
+            bindings=(("f", function),),
+            body=Primitive(operator="+", left=body("a", "z0", "w0"), right=body("b", "z1", "w1")),
+        )
+
+
+# ===========================================================================
+# 9. Common subexpression elimination
+# ===========================================================================
+
+
+def _add(left, right):
+    return Primitive(operator="+", left=left, right=right)
+
+
+def _ab():
+    return _add(Reference(name="a"), Reference(name="b"))
+
+
+def _load(name):
+    return Load(base=Reference(name=name), index=0)
+
+
+class TestCSE:
+    def test_repeated_primitive_is_bound_once(self):
+        # (* (+ a b) (+ a b))
+        term = intern(Primitive(operator="*", left=_ab(), right=_ab()))
+        assert cse_term(term) == Let(
+            bindings=(("cse0", _ab()),),
+            body=Primitive(operator="*", left=Reference(name="cse0"), right=Reference(name="cse0")),
+        )
+
+    def test_nothing_repeated_is_unchanged(self):
+        term = intern(Primitive(operator="*", left=_ab(), right=Reference(name="c")))
+        assert cse_term(term) is term
+
+    def test_impure_primitive_is_not_bound(self):
+        # (+ (+ a (f)) (+ a (f))) calls f twice
+        call = _add(Reference(name="a"), Apply(target=Reference(name="f"), arguments=()))
+        term = intern(_add(call, call))
+        assert cse_term(term) is term
+
+    def test_expression_inside_a_bound_one_is_not_bound_again(self):
+        # (+ (* (+ a b) c) (* (+ a b) c)): (+ a b) is evaluated once, inside the binding
+        product = Primitive(operator="*", left=_ab(), right=Reference(name="c"))
+        term = intern(_add(product, product))
+        assert cse_term(term) == Let(
+            bindings=(("cse0", product),),
+            body=_add(Reference(name="cse0"), Reference(name="cse0")),
+        )
+
+    def test_let_binding_is_reused(self):
+        # (let ((y (+ a b))) (* y (+ a b)))
+        term = intern(
+            Let(bindings=(("y", _ab()),), body=Primitive(operator="*", left=Reference(name="y"), right=_ab()))
+        )
+        assert cse_term(term) == Let(
+            bindings=(("y", _ab()),),
+            body=Primitive(operator="*", left=Reference(name="y"), right=Reference(name="y")),
+        )
+        # (let ((y (* (+ a b) 2))) (+ a b)): the binding only contains it
+        double = Primitive(operator="*", left=_ab(), right=Immediate(value=2))
+        inside = intern(Let(bindings=(("y", double),), body=_ab()))
+        assert cse_term(inside) == Let(
+            bindings=(("cse0", _ab()),),
+            body=Let(
+                bindings=(("y", Primitive(operator="*", left=Reference(name="cse0"), right=Immediate(value=2))),),
+                body=Reference(name="cse0"),
+            ),
+        )
+
+    def test_rebound_variable_is_not_replaced(self):
+        # (let ((y (+ a b))) (let ((a 1)) (+ a b)))
+        term = intern(Let(bindings=(("y", _ab()),), body=Let(bindings=(("a", Immediate(value=1)),), body=_ab())))
+        assert cse_term(term) is term
+
+    def test_loads_are_reused_until_a_store(self):
+        # (+ (load x 0) (load x 0)), and with (store x 0 1) between them
+        term = intern(_add(_load("x"), _load("x")))
+        assert cse_term(term) == Let(
+            bindings=(("cse0", _load("x")),),
+            body=_add(Reference(name="cse0"), Reference(name="cse0")),
+        )
+        stored = intern(
+            _add(
+                _load("x"),
+                Begin(effects=(Store(base=Reference(name="x"), index=0, value=Immediate(value=1)),), value=_load("x")),
+            )
+        )
+        assert cse_term(stored) is stored
+        # a pure expression does not read the cell
+        pure = intern(
+            _add(
+                _ab(), Begin(effects=(Store(base=Reference(name="x"), index=0, value=Immediate(value=1)),), value=_ab())
+            )
+        )
+        assert cse_term(pure) == Let(
+            bindings=(("cse0", _ab()),),
+            body=_add(
+                Reference(name="cse0"),
+                Begin(
+                    effects=(Store(base=Reference(name="x"), index=0, value=Immediate(value=1)),),
+                    value=Reference(name="cse0"),
+                ),
+            ),
+        )
+
+    def test_store_elsewhere_keeps_loads(self):
+        # x and y are allocated apart, so storing to y or to x's other index keeps (load x 0)
+        def around(effect):
+            return intern(
+                Let(
+                    bindings=(("x", Allocate(count=2)), ("y", Allocate(count=1))),
+                    body=_add(_load("x"), Begin(effects=(effect,), value=_load("x"))),
+                )
+            )
+
+        for effect in (
+            Store(base=Reference(name="y"), index=0, value=Immediate(value=1)),
+            Store(base=Reference(name="x"), index=1, value=Immediate(value=1)),
+        ):
+            assert cse_term(around(effect)) == Let(
+                bindings=(("x", Allocate(count=2)), ("y", Allocate(count=1))),
+                body=Let(
+                    bindings=(("cse0", _load("x")),),
+                    body=_add(Reference(name="cse0"), Begin(effects=(effect,), value=Reference(name="cse0"))),
+                ),
+            )
+
+    def test_store_through_a_parameter_may_alias(self):
+        # (lambda (p q) (+ (load p 0) (begin (store q 0 1) (load p 0)))): p and q may be one cell
+        term = intern(
+            Abstract(
+                parameters=("p", "q"),
+                body=_add(
+                    _load("p"),
+                    Begin(
+                        effects=(Store(base=Reference(name="q"), index=0, value=Immediate(value=1)),), value=_load("p")
+                    ),
+                ),
+            )
+        )
+        assert cse_term(term) is term
+
+    def test_call_kills_loads(self):
+        # (+ (load x 0) (begin (f) (load x 0)))
+        call = Apply(target=Reference(name="f"), arguments=())
+        term = intern(_add(_load("x"), Begin(effects=(call,), value=_load("x"))))
+        assert cse_term(term) is term
+        # (+ (load x 0) (if (< (f) 1) (load x 0) 0)): the condition calls f before the arm reads x
+        branch = intern(
+            _add(
+                _load("x"),
+                Branch(
+                    operator="<",
+                    left=call,
+                    right=Immediate(value=1),
+                    consequent=_load("x"),
+                    otherwise=Immediate(value=0),
+                ),
+            )
+        )
+        assert cse_term(branch) is branch
+
+    def test_branch_arms(self):
+        # (if (< a b) (+ a b) (+ a b)) evaluates (+ a b) once on either path
+        arms = intern(
+            Branch(operator="<", left=Reference(name="a"), right=Reference(name="b"), consequent=_ab(), otherwise=_ab())
+        )
+        assert cse_term(arms) is arms
+        # (if (< (load x 0) 1) (load x 0) 0) reads x again on one of them
+        condition = intern(
+            Branch(
+                operator="<",
+                left=_load("x"),
+                right=Immediate(value=1),
+                consequent=_load("x"),
+                otherwise=Immediate(value=0),
+            )
+        )
+        assert cse_term(condition) == Let(
+            bindings=(("cse0", _load("x")),),
+            body=Branch(
+                operator="<",
+                left=Reference(name="cse0"),
+                right=Immediate(value=1),
+                consequent=Reference(name="cse0"),
+                otherwise=Immediate(value=0),
+            ),
+        )
+
+    def test_lambda_body_reuses_pure_expressions_but_not_loads(self):
+        # (let ((y (+ a b))) (lambda () (+ a b))) and the same with (load x 0)
+        pure = intern(Let(bindings=(("y", _ab()),), body=Abstract(parameters=(), body=_ab())))
+        assert cse_term(pure) == Let(bindings=(("y", _ab()),), body=Abstract(parameters=(), body=Reference(name="y")))
+        load = intern(Let(bindings=(("y", _load("x")),), body=Abstract(parameters=(), body=_load("x"))))
+        assert cse_term(load) is load
+
+    def test_fresh_names_avoid_the_term_s(self):
+        term = intern(Let(bindings=(("cse0", _ab()),), body=_add(Reference(name="cse0"), _add(_load("x"), _load("x")))))
+        match cse_term(term):
+            case Let(body=Primitive(right=Let(bindings=((name, _),)))):
+                assert name == "cse1"
+            case result:  # pragma: no cover
+                raise AssertionError(result)
+
+    def test_statistics(self):
+        # (+ (* a b) (+ (* a b) (* a b))): one binding for three evaluations
+        product = Primitive(operator="*", left=Reference(name="a"), right=Reference(name="b"))
+        cse_statistics.clear()
+        cse_term(intern(_add(product, _add(product, product))))
+        assert (cse_statistics.removed, cse_statistics.hoisted) == (2, 1)
+        assert cse_statistics.report() == "cse: 2 redundant evaluation(s) removed, 1 binding(s) added"
+
+
+# ===========================================================================
+# 10. Scalar replacement
+# ===========================================================================
+
+
+def _store(name, value, index=0):
+    return Store(base=Reference(name=name), index=index, value=value)
+
+
+def _cell(body, count=1):
+    # (let ((x (allocate count))) body)
+    return Let(bindings=(("x", Allocate(count=count)),), body=body)
+
+
+def _loop(after):
+    # x counts to n in loop, a letrec as eliminate_letrec leaves it, and then after
+    body = Branch(
+        operator="<",
+        left=_load("x"),
+        right=Reference(name="n"),
+        consequent=Begin(
+            effects=(_store("x", _add(_load("x"), Immediate(value=1))),),
+            value=_call(Load(base=Reference(name="loop"), index=0)),
+        ),
+        otherwise=_load("x"),
+    )
+    return _cell(
+        Begin(
+            effects=(_store("x", Immediate(value=0)),),
+            value=Let(bindings=(("loop", Abstract(parameters=(), body=body)),), body=after),
+        )
+    )
+
+
+class TestScalarReplacement:
+    def test_cell_becomes_a_variable(self):
+        # (let ((x (allocate 1))) (begin (print) (store x 0 (+ a b)) (* (load x 0) (load x 0))))
+        effect = Apply(target=Reference(name="print"), arguments=())
+        term = intern(
+            _cell(
+                Begin(
+                    effects=(effect, _store("x", _ab())),
+                    value=Primitive(operator="*", left=_load("x"), right=_load("x")),
+                )
+            )
+        )
+        assert non_escaping(term) == {"x": 1}
+        assert scalar_replacement_term(term) == Begin(
+            effects=(effect,),
+            value=Let(
+                bindings=(("x0", _ab()),),
+                body=Primitive(operator="*", left=Reference(name="x0"), right=Reference(name="x0")),
+            ),
+        )
+
+    def test_constant_and_variable_stores_are_substituted(self):
+        # (let ((x (allocate 2))) (begin (store x 0 1) (store x 1 a) (store p 0 (load x 0))
+        #   (+ (load (f (load x 0)) 0) (load x 1))))
+        term = intern(
+            _cell(
+                Begin(
+                    effects=(
+                        _store("x", Immediate(value=1)),
+                        _store("x", Reference(name="a"), 1),
+                        _store("p", _load("x")),
+                    ),
+                    value=_add(Load(base=_call("f", _load("x")), index=0), Load(base=Reference(name="x"), index=1)),
+                ),
+                count=2,
+            )
+        )
+        assert scalar_replacement_term(term) == Begin(
+            effects=(_store("p", Immediate(value=1)),),
+            value=_add(Load(base=_call("f", Immediate(value=1)), index=0), Reference(name="a")),
+        )
+
+    def test_escaping_cells_are_kept(self):
+        for body in (
+            # passed to a call
+            Begin(effects=(_store("x", Immediate(value=1)),), value=_call("f", Reference(name="x"))),
+            # stored
+            Begin(effects=(_store("y", Reference(name="x")),), value=_load("x")),
+            # returned
+            Begin(effects=(_store("x", Immediate(value=1)),), value=Reference(name="x")),
+            # at an index it does not have
+            Begin(effects=(_store("x", Immediate(value=1), 1),), value=_load("x")),
+        ):
+            term = intern(_cell(body))
+            assert non_escaping(term) == {}
+            assert scalar_replacement_term(term) is term
+
+    def test_unknown_values_keep_the_cell(self):
+        arms = Branch(
+            operator="<",
+            left=Reference(name="a"),
+            right=Reference(name="b"),
+            consequent=_store("x", Immediate(value=1)),
+            otherwise=_store("x", Immediate(value=2)),
+        )
+        captured = Abstract(parameters=(), body=_load("x"))
+        writes = Abstract(
+            parameters=(), body=Begin(effects=(_store("x", Immediate(value=2)),), value=Immediate(value=0))
+        )
+        for body in (
+            # read before it is written
+            _load("x"),
+            # written differently by the arms of a Branch
+            Begin(
+                effects=(_store("x", Immediate(value=0)), Begin(effects=(arms,), value=Immediate(value=0))),
+                value=_load("x"),
+            ),
+            # read by a lambda that may run any time
+            Begin(effects=(_store("x", Immediate(value=1)),), value=_call("g", captured)),
+            # written by one
+            Begin(effects=(_store("x", Immediate(value=1)), _call("g", writes)), value=_load("x")),
+        ):
+            term = intern(_cell(body))
+            assert scalar_replacement_term(term) is term
+
+    def test_cell_local_to_a_lambda(self):
+        # (\ (a) (let ((x (allocate 1))) (begin (store x 0 a) (load x 0))))
+        term = intern(
+            Abstract(
+                parameters=("a",), body=_cell(Begin(effects=(_store("x", Reference(name="a")),), value=_load("x")))
+            )
+        )
+        assert scalar_replacement_term(term) == Abstract(parameters=("a",), body=Reference(name="a"))
+
+    def test_loop_carries_the_cell_as_a_parameter(self):
+        term = intern(_loop(_call(Load(base=Reference(name="loop"), index=0))))
+        loop = Load(base=Reference(name="loop"), index=0)
+        assert scalar_replacement_term(term) == Let(
+            bindings=(
+                (
+                    "loop",
+                    Abstract(
+                        parameters=("x0",),
+                        body=Branch(
+                            operator="<",
+                            left=Reference(name="x0"),
+                            right=Reference(name="n"),
+                            consequent=Let(
+                                bindings=(("x1", _add(Reference(name="x0"), Immediate(value=1))),),
+                                body=_call(loop, Reference(name="x1")),
+                            ),
+                            otherwise=Reference(name="x0"),
+                        ),
+                    ),
+                ),
+            ),
+            body=_call(loop, Immediate(value=0)),
+        )
+
+    def test_functions_pass_on_what_their_callees_use(self):
+        # loop and step, each calling the other: step writes x, and loop reads it and calls
+        # step, so both take it. x0 is taken, limit calls a known function that uses no
+        # cell, and step calls a lambda of its own.
+        loop, step = Load(base=Reference(name="loop"), index=0), Load(base=Reference(name="step"), index=0)
+        identity = Abstract(parameters=("y",), body=Reference(name="y"))
+
+        def functions(x, parameters, body):
+            # x is loop's parameters, its reads of x, and what it passes step
+            return (
+                ("double", Abstract(parameters=("y",), body=_add(Reference(name="y"), Reference(name="y")))),
+                ("limit", _call("double", Reference(name="x0"))),
+                (
+                    "loop",
+                    Abstract(
+                        parameters=x[0],
+                        body=Branch(
+                            operator="<",
+                            left=x[1],
+                            right=Reference(name="limit"),
+                            consequent=_call(step, *x[2]),
+                            otherwise=x[1],
+                        ),
+                    ),
+                ),
+                ("step", Abstract(parameters=parameters, body=body)),
+            )
+
+        term = intern(
+            _cell(
+                Begin(
+                    effects=(_store("x", Immediate(value=0)),),
+                    value=Let(
+                        bindings=functions(
+                            ((), _load("x"), ()),
+                            (),
+                            Begin(
+                                effects=(_store("x", _call(identity, _add(_load("x"), Immediate(value=1)))),),
+                                value=_call(loop),
+                            ),
+                        ),
+                        body=_call(loop),
+                    ),
+                )
+            )
+        )
+        assert scalar_replacement_term(term) == Let(
+            bindings=functions(
+                (("x1",), Reference(name="x1"), (Reference(name="x1"),)),
+                ("x2",),
+                Let(
+                    bindings=(("x3", _call(identity, _add(Reference(name="x2"), Immediate(value=1)))),),
+                    body=_call(loop, Reference(name="x3")),
+                ),
+            ),
+            body=_call(loop, Immediate(value=0)),
+        )
+
+    def test_read_after_a_call_that_writes_keeps_the_cell(self):
+        # the loop's last value of x is not passed back
+        call = _call(Load(base=Reference(name="loop"), index=0))
+        term = intern(_loop(Begin(effects=(call,), value=_load("x"))))
+        assert scalar_replacement_term(term) is term
+
+    def test_optimize_removes_the_loop_s_allocation(self):
+        program = Program(parameters=("n",), body=_loop(_call(Load(base=Reference(name="loop"), index=0))))
+        assert allocates(intern(program.body))
+        assert not allocates(optimize_program(program).body)
+
+
+# ===========================================================================
+# 11. Memory dataflow
+# ===========================================================================
+
+
+def _begin(*terms):
+    return Begin(effects=terms[:-1], value=terms[-1])
+
+
+def _cells(body):
+    # (let ((a (allocate 1)) (b (allocate 1))) body): a and b are different cells
+    return Let(bindings=(("a", Allocate(count=1)), ("b", Allocate(count=1))), body=body)
+
+
+class TestMemory:
+    def test_stored_value_is_forwarded(self):
+        # (begin (store a 0 v) (load a 0))
+        term = intern(_begin(_store("a", Reference(name="v")), _load("a")))
+        assert memory_term(term) == _begin(_store("a", Reference(name="v")), Reference(name="v"))
+
+    def test_stored_expression_is_bound_once(self):
+        # (begin (store a 0 (+ stored0 1)) (+ (load a 0) (load a 0))), where stored0 is taken
+        stored = _add(Reference(name="stored0"), Immediate(value=1))
+        term = intern(_begin(_store("a", stored), _add(_load("a"), _load("a"))))
+        assert memory_term(term) == Let(
+            bindings=(("stored1", stored),),
+            body=_begin(
+                _store("a", Reference(name="stored1")), _add(Reference(name="stored1"), Reference(name="stored1"))
+            ),
+        )
+
+    def test_overwritten_store_is_deleted(self):
+        # (begin (store a 0 1) (store a 0 2) (load a 0))
+        term = intern(_begin(_store("a", Immediate(value=1)), _store("a", Immediate(value=2)), _load("a")))
+        assert memory_term(term) == _begin(_store("a", Immediate(value=2)), Immediate(value=2))
+        # by the Begin's value too
+        last = intern(_begin(_store("a", Immediate(value=1)), _store("a", Immediate(value=2))))
+        assert memory_term(last) == _store("a", Immediate(value=2))
+
+    def test_deleted_store_keeps_its_effects(self):
+        # (begin (store a 0 (f)) (store a 0 2) (load a 0)): f is still called, and
+        # (begin (store a 0 (+ v 1)) (load a 0) (store a 0 2) 0) keeps the binding it forwards
+        call = Apply(target=Reference(name="f"), arguments=())
+        term = intern(_begin(_store("a", call), _store("a", Immediate(value=2)), _load("a")))
+        assert memory_term(term) == _begin(call, _store("a", Immediate(value=2)), Immediate(value=2))
+        stored = _add(Reference(name="v"), Immediate(value=1))
+        forwarded = intern(_begin(_store("a", stored), _load("a"), _store("a", Immediate(value=2)), Immediate(value=0)))
+        assert memory_term(forwarded) == Let(
+            bindings=(("stored0", stored),),
+            body=_begin(Reference(name="stored0"), _store("a", Immediate(value=2)), Immediate(value=0)),
+        )
+
+    def test_load_that_may_alias_keeps_the_store(self):
+        # (begin (store a 0 1) (load b 0) (store a 0 2) (load a 0)): b may be a unless
+        # both are allocated apart
+        body = _begin(_store("a", Immediate(value=1)), _load("b"), _store("a", Immediate(value=2)), _load("a"))
+        term = intern(body)
+        assert memory_term(term) == _begin(*body.effects, Immediate(value=2))
+        apart = intern(_cells(body))
+        assert memory_term(apart) == _cells(_begin(_load("b"), _store("a", Immediate(value=2)), Immediate(value=2)))
+
+    def test_store_that_may_alias_stops_forwarding(self):
+        # (begin (store a 0 1) (store b 0 2) (load a 0)), and (store (f) 0 2) for any cell
+        for other in (_store("b", Immediate(value=2)), Store(base=_call("f"), index=0, value=Immediate(value=2))):
+            term = intern(_begin(_store("a", Immediate(value=1)), other, _load("a")))
+            assert memory_term(term) is term
+        # to another index, or to another allocation, it does not
+        other_index = intern(_begin(_store("a", Immediate(value=1)), _store("a", Immediate(value=2), 1), _load("a")))
+        assert memory_term(other_index).value == Immediate(value=1)
+        apart = intern(_cells(_begin(_store("a", Immediate(value=1)), _store("b", Immediate(value=2)), _load("a"))))
+        assert memory_term(apart).body.value == Immediate(value=1)
+
+    def test_calls_are_opaque(self):
+        # (begin (store a 0 1) (f) (store a 0 2) (load a 0)): f may read a, and change it
+        call = Apply(target=Reference(name="f"), arguments=())
+        term = intern(_begin(_store("a", Immediate(value=1)), call, _load("a")))
+        assert memory_term(term) is term
+        overwritten = intern(
+            _begin(_store("a", Immediate(value=1)), call, _store("a", Immediate(value=2)), Immediate(value=0))
+        )
+        assert memory_term(overwritten) is overwritten
+
+    def test_lambda_body_runs_later(self):
+        # (begin (store a 0 1) (g (\ () (load a 0))) (store a 0 2) 0): the lambda's load is
+        # not of the first store, and the call to g may read it
+        reader = Abstract(parameters=(), body=_load("a"))
+        term = intern(
+            _begin(
+                _store("a", Immediate(value=1)), _call("g", reader), _store("a", Immediate(value=2)), Immediate(value=0)
+            )
+        )
+        assert memory_term(term) is term
+
+    def test_branch_arms(self):
+        # a value stored before the Branch is known in both arms; after it, only a value
+        # both arms leave
+        def branch(consequent, otherwise):
+            return Branch(
+                operator="<",
+                left=Reference(name="x"),
+                right=Reference(name="y"),
+                consequent=consequent,
+                otherwise=otherwise,
+            )
+
+        term = intern(_begin(_store("a", Immediate(value=1)), branch(_load("a"), Immediate(value=0))))
+        assert memory_term(term) == _begin(
+            _store("a", Immediate(value=1)), branch(Immediate(value=1), Immediate(value=0))
+        )
+        changed = intern(
+            _begin(
+                _store("a", Immediate(value=1)),
+                branch(_store("b", Immediate(value=2)), Immediate(value=0)),
+                _load("a"),
+            )
+        )
+        assert memory_term(changed) is changed
+
+    def test_scopes(self):
+        # (begin (store a 0 v) (let ((v 2)) (load a 0))): the v stored is not this v, nor
+        # is a value bound in an inner Begin known after it
+        shadowed = intern(
+            _begin(_store("a", Reference(name="v")), Let(bindings=(("v", Immediate(value=2)),), body=_load("a")))
+        )
+        assert memory_term(shadowed) is shadowed
+        other = intern(
+            _begin(_store("a", Reference(name="v")), Let(bindings=(("w", Immediate(value=2)),), body=_load("a")))
+        )
+        assert memory_term(other).value == Let(bindings=(("w", Immediate(value=2)),), body=Reference(name="v"))
+        stored = _add(Reference(name="v"), Immediate(value=1))
+        inner = intern(_begin(_begin(_store("a", stored), Immediate(value=0)), _load("a")))
+        assert memory_term(inner) is inner
+
+    def test_bound_name_does_not_outlive_its_begin(self):
+        # (begin (begin (store a 0 (+ v 1)) (store a 1 (load a 0)) 0) (load a 1)): a[1]
+        # holds stored0, which is bound only around the rest of the inner Begin
+        stored = _add(Reference(name="v"), Immediate(value=1))
+        load = Load(base=Reference(name="a"), index=1)
+        term = intern(_cells(_begin(_begin(_store("a", stored), _store("a", _load("a"), 1), Immediate(value=0)), load)))
+        assert memory_term(term) == _cells(
+            _begin(
+                Let(
+                    bindings=(("stored0", stored),),
+                    body=_begin(
+                        _store("a", Reference(name="stored0")),
+                        _store("a", Reference(name="stored0"), 1),
+                        Immediate(value=0),
+                    ),
+                ),
+                load,
+            )
+        )
+
+    def test_nothing_stored_is_unchanged(self):
+        term = intern(_add(_load("a"), _load("a")))
+        assert accesses(term) == {"load"}
+        assert memory_term(term) is term
+
+
+# ===========================================================================
+# 12. Full optimize_program — integration tests
 # ===========================================================================
 
 
@@ -1523,6 +2463,29 @@ class TestOptimizeProgram:
         )
         assert optimize_program(program) == expected
 
+    def test_known_calls_are_inlined(self):
+        # add_complex: (let ((make_adder (\ (x) (\ (y) (+ x y))))) (let ((adder (make_adder m))) (adder n)))
+        make_adder = Abstract(
+            parameters=("x",),
+            body=Abstract(
+                parameters=("y",),
+                body=Primitive(operator="+", left=Reference(name="x"), right=Reference(name="y")),
+            ),
+        )
+        program = Program(
+            parameters=("m", "n"),
+            body=Let(
+                bindings=(("make_adder", make_adder),),
+                body=Let(
+                    bindings=(("adder", _call("make_adder", Reference(name="m"))),),
+                    body=_call("adder", Reference(name="n")),
+                ),
+            ),
+        )
+        assert optimize_program(program).body == Primitive(
+            operator="+", left=Reference(name="m"), right=Reference(name="n")
+        )
+
     def test_idempotent(self):
         # Running the optimizer twice should give the same result as once
         program = Program(
@@ -1535,3 +2498,174 @@ class TestOptimizeProgram:
         once = optimize_program(program)
         twice = optimize_program(once)
         assert once == twice
+
+    def test_deeper_than_the_recursion_limit(self):
+        # x + (x + (... + (1 + 2))): every pass walks it, and the innermost x + (1 + 2)
+        # folds to 3 + x
+        body = Primitive(operator="+", left=Immediate(value=1), right=Immediate(value=2))
+        for _ in range(20_000):
+            body = Primitive(operator="+", left=Reference(name="x"), right=body)
+        result = optimize_term(body)
+        for _ in range(19_999):
+            match result:
+                case Primitive(right=right):
+                    result = right
+                case _:  # pragma: no cover
+                    raise AssertionError(result)
+        assert result == Primitive(operator="+", left=Immediate(value=3), right=Reference(name="x"))
+
+    def test_program_deeper_than_the_recursion_limit(self):
+        # as above, through the fixed point, which compares bodies by identity rather than ==
+        body = Primitive(operator="+", left=Immediate(value=1), right=Immediate(value=2))
+        for _ in range(20_000):
+            body = Primitive(operator="+", left=Reference(name="x"), right=body)
+        result = optimize_program(Program(parameters=("x",), body=body)).body
+        for _ in range(19_999):
+            match result:
+                case Primitive(right=right):
+                    result = right
+                case _:  # pragma: no cover
+                    raise AssertionError(result)
+        assert result == Primitive(operator="+", left=Immediate(value=3), right=Reference(name="x"))
+
+
+# ===========================================================================
+# 13. Hash-consing and memoized analyses
+# ===========================================================================
+
+
+class TestSharing:
+    def test_optimize_shares_equal_subterms(self):
+        # (+ (load x 0) (load x 0)) — both loads become one node; with no passes, which
+        # would bind them once
+        program = Program(
+            parameters=("x",),
+            body=Primitive(
+                operator="+",
+                left=Load(base=Reference(name="x"), index=0),
+                right=Load(base=Reference(name="x"), index=0),
+            ),
+        )
+        result = optimize_program(program, [])
+        match result.body:
+            case Primitive(left=left, right=right):
+                assert left is right
+            case _:  # pragma: no cover
+                raise AssertionError(result)
+
+    def test_free_variables_memoized(self):
+        term = Primitive(operator="+", left=Reference(name="a"), right=Reference(name="b"))
+        first = free_variables(term)
+        hits = free_variables_memo.hits
+        assert free_variables(term) is first
+        assert free_variables_memo.hits == hits + 1
+
+    def test_is_pure_memoized(self):
+        term = Primitive(operator="+", left=Reference(name="a"), right=Immediate(value=1))
+        assert is_pure(term)
+        hits = is_pure_memo.hits
+        assert is_pure(term)
+        assert is_pure_memo.hits == hits + 1
+
+    def test_dead_code_elimination_annotates_its_result(self):
+        # let a = y, b = (+ a z), dead = 1 in (+ b a) — free variables and purity of the
+        # result come from the pass, not a walk of it
+        term = Let(
+            bindings=(
+                ("a", Reference(name="y")),
+                ("b", Primitive(operator="+", left=Reference(name="a"), right=Reference(name="z"))),
+                ("dead", Immediate(value=1)),
+            ),
+            body=Primitive(operator="+", left=Reference(name="b"), right=Reference(name="a")),
+        )
+        result = dead_code_elimination_term(term)
+        assert result == Let(bindings=term.bindings[:2], body=term.body)
+
+        hits = free_variables_memo.hits, is_pure_memo.hits
+        assert free_variables(result) == {"y", "z"}
+        assert is_pure(result)
+        assert (free_variables_memo.hits, is_pure_memo.hits) == (hits[0] + 1, hits[1] + 1)
+
+    def test_dead_code_elimination_memoized(self):
+        term = Let(bindings=(("a", Allocate(count=1)),), body=Immediate(value=0))
+        first = dead_code_elimination_term(term)
+        hits = dead_code_elimination_memo.hits
+        assert dead_code_elimination_term(term) is first
+        assert dead_code_elimination_memo.hits == hits + 1
+
+    def test_passes_return_unchanged_terms(self):
+        # nothing to do for any pass: each hands back the term it was given
+        term = Let(
+            bindings=(("a", Apply(target=Reference(name="f"), arguments=(Reference(name="x"),))),),
+            body=Branch(
+                operator="<",
+                left=Reference(name="a"),
+                right=Immediate(value=1),
+                consequent=Begin(
+                    effects=(Store(base=Reference(name="x"), index=0, value=Reference(name="a")),),
+                    value=Immediate(value=0),
+                ),
+                otherwise=Abstract(
+                    parameters=("y",),
+                    body=Primitive(
+                        operator="-", left=Load(base=Reference(name="y"), index=0), right=Reference(name="a")
+                    ),
+                ),
+            ),
+        )
+        assert constant_propagation_term(term, env={}) is term
+        assert constant_folding_term(term, context={}) is term
+        assert dead_code_elimination_term(term) is term
+        assert branch_elimination_term(term) is term
+
+    def test_optimize_program_keeps_an_optimal_body(self):
+        program = Program(
+            parameters=("x",), body=Primitive(operator="+", left=Immediate(value=1), right=Reference(name="x"))
+        )
+        once = optimize_program(program)
+        assert optimize_program(once).body is once.body
+
+    def test_constant_propagation_memoized_where_env_has_nothing_for_it(self):
+        # (+ y 1) has no constant in {x: 1}, so its result is kept and reused; (+ x 1) does
+        unaffected = Primitive(operator="+", left=Reference(name="y"), right=Immediate(value=1))
+        affected = Primitive(operator="+", left=Reference(name="x"), right=Immediate(value=1))
+        first = constant_propagation_term(unaffected, env={"x": 1})
+        hits = constant_propagation_memo.hits
+        assert constant_propagation_term(unaffected, env={}) is first
+        assert constant_propagation_memo.hits == hits + 1
+
+        size = len(constant_propagation_memo)
+        assert constant_propagation_term(affected, env={"x": 1}) == Primitive(
+            operator="+", left=Immediate(value=1), right=Immediate(value=1)
+        )
+        assert len(constant_propagation_memo) == size
+
+    def test_constant_propagation_memo_checks_the_smaller_side(self):
+        # more constants than free variables, and the other way round
+        term = Primitive(operator="+", left=Reference(name="a"), right=Reference(name="b"))
+        assert constant_propagation_term(term, env={"c": 1, "d": 2, "e": 3}) is term
+        assert constant_propagation_term(term, env={"a": 1}) == Primitive(
+            operator="+", left=Immediate(value=1), right=Reference(name="b")
+        )
+
+    def test_branch_elimination_memoized(self):
+        term = Primitive(operator="+", left=Reference(name="a"), right=Immediate(value=2))
+        first = branch_elimination_term(term)
+        hits = branch_elimination_memo.hits
+        assert branch_elimination_term(term) is first
+        assert branch_elimination_memo.hits == hits + 1
+
+    def test_constant_folding_memoized(self):
+        term = Primitive(operator="+", left=Immediate(value=1), right=Immediate(value=2))
+        first = constant_folding_term(term, context={})
+        hits = constant_folding_memo.hits
+        assert constant_folding_term(term, context={}) is first
+        assert constant_folding_memo.hits == hits + 1
+
+    def test_constant_folding_with_context_not_memoized(self):
+        term = Primitive(operator="+", left=Immediate(value=1), right=Immediate(value=2))
+        size = len(constant_folding_memo)
+        hits = constant_folding_memo.hits
+        assert constant_folding_term(term, context={"y": None}) == Immediate(value=3)
+        assert constant_folding_memo.hits == hits
+        assert len(constant_folding_memo) == size
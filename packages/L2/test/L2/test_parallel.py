@@ -0,0 +1,159 @@
+import sys
+from functools import partial
+
+import L2.parallel
+import pytest
+from L2.cse import cse_statistics
+from L2.optimize import ANALYSES, DEFAULT_PIPELINE, PASSES, _optimize_region, optimize_program  # pyright: ignore[reportPrivateUsage]
+from L2.parallel import free_threaded, optimize_regions, regions, size
+from L2.pass_manager import AnalysisCache, parse_pipeline, run_pipeline
+from L2.syntax import Abstract, Apply, Immediate, Let, Primitive, Program, Reference, Term
+from util.budget import Budget
+from util.hash_cons import intern
+
+STEPS = [(step.name, limit) for step, limit in DEFAULT_PIPELINE]
+
+
+def function(start: int, depth: int, inner: Term | None = None, padding: int = 0) -> Abstract:
+    # (lambda (a) (let ((c0 start)) (let ((c1 (+ c0 1))) ... (+ a c(depth-1))))), which
+    # takes a round of the pipeline per binding to fold, with padding more (+ a ...) around
+    body: Term = Primitive(operator="+", left=Reference(name="a"), right=inner or Reference(name=f"c{depth - 1}"))
+    for _ in range(padding):
+        body = Primitive(operator="+", left=Reference(name="a"), right=body)
+    for index in reversed(range(1, depth)):
+        value = Primitive(operator="+", left=Reference(name=f"c{index - 1}"), right=Immediate(value=1))
+        body = Let(bindings=((f"c{index}", value),), body=body)
+    return Abstract(parameters=("a",), body=Let(bindings=(("c0", Immediate(value=start)),), body=body))
+
+
+def program(padding: int = 0) -> Program:
+    big = [function(index, 30, padding=padding) for index in range(3)]
+    return Program(
+        parameters=("x",),
+        body=Let(
+            bindings=(("f0", big[0]), ("f1", big[1]), ("small", function(0, 2)), ("f2", big[2]), ("g", big[0])),
+            body=Apply(target=Reference(name="f0"), arguments=(Reference(name="x"),)),
+        ),
+    )
+
+
+def test_regions():
+    let = program().body
+    assert isinstance(let, Let)
+    f0, f1, small, f2, _ = (value for _, value in let.bindings)
+
+    # in order, each once, and none too small
+    assert regions(let, minimum=100) == [f0, f1, f2]
+    assert regions(let, minimum=0) == [f0, f1, small, f2]
+    # a lambda inside another is part of it
+    outer = function(0, 2, inner=f0)
+    assert regions(Let(bindings=(("h", outer),), body=f1), minimum=0) == [outer, f1]
+    assert size(Immediate(value=1)) == 1
+
+
+def test_free_threaded():
+    assert free_threaded() is not sys._is_gil_enabled()  # pyright: ignore[reportPrivateUsage]
+
+
+@pytest.mark.parametrize("threads", [True, False])
+def test_optimize_regions(monkeypatch: pytest.MonkeyPatch, threads: bool):
+    monkeypatch.setattr(L2.parallel, "free_threaded", lambda: threads)
+    let = program().body
+    assert isinstance(let, Let)
+
+    optimized = optimize_regions(let, partial(_optimize_region, STEPS), 2, minimum=100)
+
+    assert isinstance(optimized, Let)
+    for (_, before), (_, after) in zip(let.bindings, optimized.bindings, strict=True):
+        assert isinstance(before, Abstract) and isinstance(after, Abstract)
+        if before is let.bindings[2][1]:
+            # too small to be a region
+            assert after is before
+        else:
+            assert after.body == run_pipeline(before.body, DEFAULT_PIPELINE, AnalysisCache(ANALYSES))
+    assert optimized.body is let.body
+
+
+def test_optimize_regions_budget(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(L2.parallel, "free_threaded", lambda: True)
+    let = program().body
+    budget = Budget(visits=0)
+
+    # every region skips the pipeline, and the skips are the budget's
+    assert optimize_regions(let, partial(_optimize_region, STEPS), 2, budget, minimum=100) is let
+    assert budget.report().endswith("skipped: inline, scalar, memory, sccp, cse, dce")
+
+
+def test_optimize_regions_needs_two():
+    let = program().body
+
+    assert optimize_regions(let, partial(_optimize_region, STEPS), 2, minimum=1 << 20) is let
+
+
+def test_optimize_program_workers(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(L2.parallel, "free_threaded", lambda: True)
+    # regions of at least MIN_REGION nodes
+    large = program(padding=L2.parallel.MIN_REGION)
+    expected = optimize_program(large)
+    assert expected != large
+
+    # the regions settle as the whole program does, so workers make no difference here
+    for workers in (0, 2, 3):
+        assert optimize_program(large, workers=workers) == expected
+
+
+@pytest.mark.parametrize("threads", [True, False])
+def test_workers_optimize_regions_first(monkeypatch: pytest.MonkeyPatch, threads: bool):
+    monkeypatch.setattr(L2.parallel, "free_threaded", lambda: threads)
+    small = Program(
+        parameters=("x",),
+        body=Let(
+            bindings=(("f", function(0, 3)), ("g", function(5, 3))),
+            body=Apply(target=Reference(name="f"), arguments=(Reference(name="x"),)),
+        ),
+    )
+    # one run of each, which folds one binding of a region
+    pipeline = parse_pipeline("propagate:1,fold:1", PASSES)
+
+    def constants(program: Program) -> list[Term]:
+        let = program.body
+        assert isinstance(let, Let)
+        found: list[Term] = []
+        for _, region in let.bindings:
+            assert isinstance(region, Abstract)
+            term = region.body
+            while isinstance(term, Let):
+                found += [value for _, value in term.bindings]
+                term = term.body
+        return found
+
+    one = optimize_program(small, pipeline, workers=1, minimum=1)
+    two = optimize_program(small, pipeline, workers=2, minimum=1)
+
+    # with workers each region has a run of its own first, so folds one more binding
+    assert constants(one)[2] == Primitive(operator="+", left=Immediate(value=1), right=Reference(name="c1"))
+    assert constants(two) == [Immediate(value=value) for value in (0, 1, 2, 5, 6, 7)]
+    # but the result does not depend on how many there are
+    assert optimize_program(small, pipeline, workers=3, minimum=1) == two
+
+
+@pytest.mark.parametrize("threads", [True, False])
+def test_optimize_regions_counts_cse(monkeypatch: pytest.MonkeyPatch, threads: bool):
+    monkeypatch.setattr(L2.parallel, "free_threaded", lambda: threads)
+
+    def twice(name: str) -> Abstract:
+        # (lambda (name) (+ (* name name) (* name name)))
+        square = Primitive(operator="*", left=Reference(name=name), right=Reference(name=name))
+        return Abstract(parameters=(name,), body=Primitive(operator="+", left=square, right=square))
+
+    let = intern(Let(bindings=(("f", twice("a")), ("g", twice("b"))), body=Reference(name="g")))
+    assert isinstance(let, Let)
+    cse_statistics.clear()
+
+    optimized = optimize_regions(let, partial(_optimize_region, [("cse", 1)]), 2, minimum=1)
+
+    # a product bound once in each region, by the worker, and counted where it was sent
+    assert isinstance(optimized, Let)
+    for _, region in optimized.bindings:
+        assert isinstance(region, Abstract) and isinstance(region.body, Let)
+    assert (cse_statistics.removed, cse_statistics.hoisted) == (2, 2)
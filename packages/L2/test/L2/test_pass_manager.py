@@ -0,0 +1,330 @@
+from collections.abc import Callable
+
+import pytest
+from L2.cse import cse_term
+from L2.inline import inline_term
+from L2.memory import memory_term
+from L2.optimize import ANALYSES, DEFAULT_PIPELINE, LEVELS, PASSES, optimize_program
+from L2.pass_manager import Analysis, AnalysisCache, Pass, parse_pipeline, run_pipeline
+from L2.scalar_replacement import scalar_replacement_term
+from L2.syntax import Abstract, Allocate, Apply, Begin, Immediate, Let, Load, Primitive, Program, Reference, Store, Term
+from util.budget import CHARGE_EVERY, Budget, BudgetExhausted
+from util.hash_cons import children, intern
+
+
+def counting(name: str, runs: list[str], rewrite: dict[Term, Term] | None = None) -> Pass:
+    # a pass that records its runs, and replaces a term found in rewrite
+    def run(term: Term, analyses: AnalysisCache) -> Term:
+        runs.append(name)
+        return (rewrite or {}).get(term, term)
+
+    return Pass(name, run)
+
+
+def test_parse_pipeline():
+    passes = {"a": Pass("a", lambda term, analyses: term), "b": Pass("b", lambda term, analyses: term)}
+
+    assert parse_pipeline("a:3, b", passes) == [(passes["a"], 3), (passes["b"], 1)]
+    assert parse_pipeline("", passes) == []
+    assert repr(passes["a"]) == "Pass('a')"
+
+
+@pytest.mark.parametrize(
+    ("text", "message"),
+    [
+        ("c", "unknown pass 'c', expected one of a"),
+        ("a:0", "pass 'a' has limit '0'"),
+        ("a:x", "pass 'a' has limit 'x'"),
+    ],
+)
+def test_parse_pipeline_errors(text: str, message: str):
+    with pytest.raises(ValueError, match=message):
+        parse_pipeline(text, {"a": Pass("a", lambda term, analyses: term)})
+
+
+def test_levels_parse():
+    for text in LEVELS.values():
+        parse_pipeline(text, PASSES)
+
+
+def test_run_pipeline_to_fixed_point():
+    one, two = Immediate(value=1), Immediate(value=2)
+    runs: list[str] = []
+    pipeline = [(counting("a", runs, {one: two}), 5), (counting("b", runs), 5)]
+
+    assert run_pipeline(one, pipeline, AnalysisCache({})) is two
+    # the first round changed the term, the second did not
+    assert runs == ["a", "b", "a", "b"]
+
+
+def test_run_pipeline_limits():
+    # a and b undo each other forever; their limits stop them
+    one, two = Immediate(value=1), Immediate(value=2)
+    runs: list[str] = []
+    pipeline = [(counting("a", runs, {one: two}), 3), (counting("b", runs, {two: one}), 2)]
+
+    assert run_pipeline(one, pipeline, AnalysisCache({})) is two
+    assert runs == ["a", "b", "a", "b", "a"]
+
+
+def test_analysis_cache():
+    term = Primitive(operator="+", left=Reference(name="x"), right=Immediate(value=1))
+    analyses = AnalysisCache(ANALYSES)
+
+    assert analyses.get("free-variables", term) == {"x"}
+    assert analyses.get("free-variables", term) == {"x"}
+    assert (analyses.hits, analyses.misses) == (1, 1)
+
+
+def test_analysis_cache_advance():
+    before, after = Reference(name="x"), Immediate(value=1)
+    analyses = AnalysisCache(ANALYSES)
+    analyses.get("free-variables", before)
+    analyses.get("purity", before)
+
+    analyses.advance(before, after, ["free-variables"])
+
+    # purity carried over without running; free variables worked out again
+    assert analyses.get("purity", after)
+    assert analyses.get("free-variables", after) == frozenset()
+    assert (analyses.hits, analyses.misses) == (1, 3)
+
+    # a result for some other term is dropped
+    analyses.advance(before, after, [])
+    assert analyses.get("purity", after)
+    assert analyses.misses == 4
+
+
+def test_requires_runs_analyses_first():
+    seen: list[object] = []
+
+    def run(term: Term, analyses: AnalysisCache) -> Term:
+        seen.append(analyses.get("free-variables", term))
+        return term
+
+    analyses = AnalysisCache(ANALYSES)
+    run_pipeline(Reference(name="x"), [(Pass("p", run, requires=["free-variables"]), 1)], analyses)
+
+    assert seen == [{"x"}]
+    assert (analyses.hits, analyses.misses) == (1, 1)
+
+
+def test_reader():
+    x = Reference(name="x")
+    term = Primitive(operator="+", left=x, right=Immediate(value=1))
+    analyses = AnalysisCache(ANALYSES)
+    analyses.get("free-variables", term)
+    read = analyses.reader("free-variables")
+
+    # the kept result for the whole term, and the analysis for a part, which is not kept
+    assert read(term) == {"x"}
+    assert read(x) == {"x"}
+    assert (analyses.hits, analyses.misses) == (1, 1)
+    assert read(term) == {"x"}
+    assert analyses.hits == 2
+
+
+@pytest.mark.parametrize("name", ["inline", "cse"])
+def test_passes_read_analyses(name: str):
+    # (let ((f (lambda (y) (+ y y)))) (+ (f x) (+ (* x x) (* x x)))): a call to inline and
+    # a product to bind once
+    x = Reference(name="x")
+    square = Primitive(operator="*", left=x, right=x)
+    term = intern(
+        Let(
+            bindings=(
+                (
+                    "f",
+                    Abstract(
+                        parameters=("y",),
+                        body=Primitive(operator="+", left=Reference(name="y"), right=Reference(name="y")),
+                    ),
+                ),
+            ),
+            body=Primitive(
+                operator="+",
+                left=Apply(target=Reference(name="f"), arguments=(x,)),
+                right=Primitive(operator="+", left=square, right=square),
+            ),
+        )
+    )
+    asked: list[Term] = []
+
+    def counting(analysis: Analysis) -> Analysis:
+        def run(term: Term) -> object:
+            asked.append(term)
+            return analysis(term)
+
+        return run
+
+    analyses = AnalysisCache({key: counting(analysis) for key, analysis in ANALYSES.items()})
+    step = PASSES[name]
+
+    assert run_pipeline(term, [(step, 1)], analyses) is not term
+    # what it requires is worked out for the whole term first, then it asks of the parts
+    assert asked[: len(step.requires)] == [term] * len(step.requires)
+    assert len(asked) > len(step.requires)
+
+
+def test_optimize_program_levels():
+    # let a = 1 in let b = (+ a 2) in b
+    program = Program(
+        parameters=(),
+        body=Let(
+            bindings=(("a", Immediate(value=1)),),
+            body=Let(
+                bindings=(("b", Primitive(operator="+", left=Reference(name="a"), right=Immediate(value=2))),),
+                body=Reference(name="b"),
+            ),
+        ),
+    )
+
+    assert optimize_program(program, parse_pipeline(LEVELS[0], PASSES)) == program
+    # the separate passes once through: b is 3 but still referenced, so only a goes
+    assert optimize_program(program, parse_pipeline("propagate,fold,dce,branch", PASSES)).body == Let(
+        bindings=(("b", Immediate(value=3)),), body=Reference(name="b")
+    )
+    # sccp gets there in one run
+    assert optimize_program(program, parse_pipeline(LEVELS[1], PASSES)).body == Immediate(value=3)
+    assert optimize_program(program, parse_pipeline(LEVELS[2], PASSES)).body == Immediate(value=3)
+
+
+def test_level_3_inlines_more():
+    # (let ((f (lambda (x) (* x (* x ... x))))) (+ (f a) (+ (f a) ...))): a lambda too
+    # large to inline at every call in the runs -O2 allows
+    x = Reference(name="x")
+    body: Term = x
+    for _ in range(10):
+        body = Primitive(operator="*", left=x, right=body)
+    calls: Term = Apply(target=Reference(name="f"), arguments=(Reference(name="a"),))
+    for _ in range(30):
+        calls = Primitive(
+            operator="+", left=Apply(target=Reference(name="f"), arguments=(Reference(name="a"),)), right=calls
+        )
+    program = Program(
+        parameters=("a",), body=Let(bindings=(("f", Abstract(parameters=("x",), body=body)),), body=calls)
+    )
+
+    def applies(term: Term) -> int:
+        return isinstance(term, Apply) + sum(applies(child) for child in children(term))
+
+    two = optimize_program(program, parse_pipeline(LEVELS[2], PASSES))
+    three = optimize_program(program, parse_pipeline(LEVELS[3], PASSES))
+    assert applies(three.body) < applies(two.body) < applies(program.body)
+
+
+def deep(depth: int) -> Term:
+    # (+ x (+ x ... (+ 1 2)))
+    term: Term = Primitive(operator="+", left=Immediate(value=1), right=Immediate(value=2))
+    for _ in range(depth):
+        term = Primitive(operator="+", left=Reference(name="x"), right=term)
+    return term
+
+
+def test_budget_cuts_a_pass_short():
+    term = deep(4 * CHARGE_EVERY)
+    budget = Budget(visits=2 * CHARGE_EVERY)
+
+    # inline runs out part way; its input is kept and nothing else runs
+    assert run_pipeline(term, DEFAULT_PIPELINE, AnalysisCache(ANALYSES), budget) is term
+    assert budget.cut == ["inline"]
+    # every pass with runs left, inline included
+    assert budget.skipped == ["inline", "scalar", "memory", "sccp", "cse", "dce"]
+    assert budget.report().endswith("cut short: inline; skipped: inline, scalar, memory, sccp, cse, dce")
+
+
+def test_budget_skips_expensive_passes():
+    one, two, three = Immediate(value=1), Immediate(value=2), Immediate(value=3)
+    runs: list[str] = []
+    budget = Budget(visits=10)
+    budget.spend(5)
+    pipeline = [(Pass("costly", lambda term, analyses: runs.append("costly") or term, expensive=True), 5)]
+    pipeline += [(counting("cheap", runs, {one: two, two: three}), 5)]
+
+    run_pipeline(one, pipeline, AnalysisCache({}), budget)
+
+    # three rounds, but the skip is recorded once
+    assert runs == ["cheap"] * 3
+    assert budget.skipped == ["costly"]
+
+
+@pytest.mark.parametrize("run", [inline_term, scalar_replacement_term, memory_term, cse_term])
+def test_budget_cuts_a_census_short(run: Callable[[Term], Term]):
+    # (let ((c (alloc 1)) (f (lambda (y) y))) (begin (store c 0 1) (f (+ (load c 0) deep)))):
+    # something for each pass to do, after a walk of the whole term
+    depth = 8 * CHARGE_EVERY
+    c = Reference(name="c")
+    term = intern(
+        Let(
+            bindings=(("c", Allocate(count=1)), ("f", Abstract(parameters=("y",), body=Reference(name="y")))),
+            body=Begin(
+                effects=(Store(base=c, index=0, value=Immediate(value=1)),),
+                value=Apply(
+                    target=Reference(name="f"),
+                    arguments=(Primitive(operator="+", left=Load(base=c, index=0), right=deep(depth)),),
+                ),
+            ),
+        )
+    )
+    # once first, so the analyses it asks are remembered and the walk is what is charged
+    run(term)
+    budget = Budget(visits=2 * CHARGE_EVERY)
+
+    with pytest.raises(BudgetExhausted), budget.applied():
+        run(term)
+
+    # stopped part way through a walk of twice depth nodes
+    assert budget.spent < depth
+
+
+def test_nested_pipeline_keeps_to_the_outer_budget():
+    inner = [(PASSES["fold"], 1)]
+    budget = Budget(visits=1 << 20)
+
+    def nested(term: Term, analyses: AnalysisCache) -> Term:
+        return run_pipeline(term, inner, AnalysisCache(ANALYSES))
+
+    run_pipeline(deep(10), [(Pass("nested", nested), 1)], AnalysisCache(ANALYSES), budget)
+
+    assert budget.spent > 0
+
+
+def test_optimize_program_budget():
+    program = Program(parameters=("x",), body=deep(3))
+    budget = Budget(visits=0)
+
+    assert optimize_program(program, DEFAULT_PIPELINE, budget) == program
+    assert budget.skipped
+
+
+def test_budget_skips_the_expensive_passes():
+    # (let ((f (lambda (y) (+ y 1)))) (+ (f x) (+ (* 2 3) (* 2 3))))
+    x, one = Reference(name="x"), Immediate(value=1)
+    six = Primitive(operator="*", left=Immediate(value=2), right=Immediate(value=3))
+    call = Apply(target=Reference(name="f"), arguments=(x,))
+    program = Program(
+        parameters=("x",),
+        body=Let(
+            bindings=(
+                ("f", Abstract(parameters=("y",), body=Primitive(operator="+", left=Reference(name="y"), right=one))),
+            ),
+            body=Primitive(operator="+", left=call, right=Primitive(operator="+", left=six, right=six)),
+        ),
+    )
+    budget = Budget(visits=1 << 20)
+    budget.spend(1 << 19)
+
+    # half spent: the call is left, but the constants are still folded
+    optimized = optimize_program(program, DEFAULT_PIPELINE, budget)
+    assert optimized.body == Let(
+        bindings=(
+            ("f", Abstract(parameters=("y",), body=Primitive(operator="+", left=one, right=Reference(name="y")))),
+        ),
+        body=Primitive(operator="+", left=Immediate(value=12), right=call),
+    )
+    assert budget.skipped == ["inline", "scalar", "cse"]
+    assert budget.report().endswith("skipped: inline, scalar, cse")
+    # and with nothing spent, the call is inlined
+    assert optimize_program(program).body == Primitive(
+        operator="+", left=Immediate(value=12), right=Primitive(operator="+", left=one, right=x)
+    )
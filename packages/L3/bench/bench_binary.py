@@ -0,0 +1,58 @@
+"""
+The binary IR format against JSON.
+
+Each row is a generated program (see bench_parse.generate); times are the best of three.
+The view column opens the encoding lazily and reads the last binding, the way a tool
+would inspect one function of a large program.
+
+Run with `uv run python packages/L3/bench/bench_binary.py`.
+"""
+
+import time
+from collections.abc import Callable
+
+from bench_parse import generate
+from L3.binary import CODEC
+from L3.from_json import program_from_json
+from L3.parse import parse_program
+
+
+def best(run: Callable[[], object]) -> float:
+    seconds = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        run()
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+
+def report(size: int) -> None:
+    program = parse_program(generate(size))
+    text = program.model_dump_json()
+    data = CODEC.dumps(program)
+    assert CODEC.loads(data) == program == program_from_json(text)
+
+    rows: list[tuple[str, int, Callable[[], object], Callable[[], object], Callable[[], object] | None]] = [
+        ("json", len(text), program.model_dump_json, lambda: program_from_json(text), None),
+        (
+            "binary",
+            len(data),
+            lambda: CODEC.dumps(program),
+            lambda: CODEC.loads(data),
+            lambda: CODEC.view(data).body.bindings[-1][1].materialize(),
+        ),
+    ]
+
+    for name, length, dump, load, view in rows:
+        viewed = f"{best(view) * 1e3:>9.2f}" if view is not None else f"{'-':>9}"
+        print(f"{size >> 20:>11} {name:<8} {length / 1e6:>9.2f} {best(dump):>9.3f} {best(load):>9.3f} {viewed}")
+
+
+def main() -> None:
+    print(f"{'source (MB)':>11} {'format':<8} {'size (MB)':>9} {'dump (s)':>9} {'load (s)':>9} {'view (ms)':>9}")
+    for size in (1 << 20, 4 << 20):
+        report(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Dynamic evaluation counts and running time of programs optimized with and without common
+subexpression elimination.
+
+Before is -O2 as it was, inlining, sccp and dead code elimination; after is -O2 now, with
+cse before dead code elimination. Each program is run by bench_inline's interpreter,
+which here also counts the Primitives and Loads it evaluates. Those counts are the
+measure: the interpreter copies its environment for every Let, so a binding costs it more
+than the Load or Primitive it saves, and its time shows that rather than what compiled
+code would gain.
+
+The inputs are the examples and a program that uses a cell and a product of its contents
+several times an iteration, as generated code does. Both sides must compute the same
+result.
+
+Run with `uv run python packages/L3/bench/bench_cse.py`.
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Any
+
+import L2.dead_code_elim
+import L2.inline
+import L2.sccp
+from bench_inline import ARGUMENTS, Interpreter, lower, parsed
+from bench_parse import EXAMPLES
+from bench_traverse import clear, measure, size
+from L2.cse import cse_statistics
+from L2.optimize import DEFAULT_PIPELINE, PASSES, optimize_program
+from L2.pass_manager import parse_pipeline
+from L2.syntax import Load, Primitive, Term
+
+BEFORE = parse_pipeline("inline:4,sccp:100,dce:100", PASSES)
+MODULES = [L2.dead_code_elim, L2.inline, L2.sccp]
+
+REPEATED = """
+(l3 (n)
+  (let ((x (allocate 1)) (acc (allocate 1)))
+    (begin
+      (store x 0 0)
+      (store acc 0 0)
+      (letrec ((loop (\\ ()
+                       (if (< (load x 0) n)
+                           (begin
+                             (store acc 0 (+ (load acc 0)
+                                             (+ (* (load x 0) (load x 0))
+                                                (* 3 (* (load x 0) (load x 0))))))
+                             (store x 0 (+ (load x 0) 1))
+                             (loop))
+                           (load acc 0)))))
+        (loop)))))
+"""
+
+
+class Counting(Interpreter):
+    def __init__(self) -> None:
+        super().__init__()
+        self.evaluations = 0
+
+    def evaluate(self, term: Term, env: Mapping[str, Any]) -> Any:
+        if isinstance(term, Primitive | Load):
+            self.evaluations += 1
+        return super().evaluate(term, env)
+
+
+def main() -> None:
+    sys.setrecursionlimit(100_000)
+    inputs = [(path.name, lower(parsed(path.read_text()))) for path in sorted(EXAMPLES.glob("*.l3"))]
+    inputs.append(("repeated", lower(parsed(REPEATED))))
+    arguments = dict(ARGUMENTS, repeated=[300])
+
+    print(
+        f"{'input':<16}{'nodes':>7}{'evals':>9}{'run (s)':>10}"
+        f"{'nodes':>8}{'evals':>9}{'run (s)':>10}{'removed':>9}{'speedup':>9}"
+    )
+    for name, l2 in inputs:
+        columns: list[str] = []
+        results: list[Any] = []
+        times: list[float] = []
+        for pipeline in (BEFORE, DEFAULT_PIPELINE):
+            clear(*MODULES)
+            cse_statistics.clear()
+            optimized = optimize_program(l2, pipeline)
+            interpreter = Counting()
+            results.append(interpreter.run(optimized, arguments[name]))
+            seconds = measure(lambda optimized=optimized, name=name: Interpreter().run(optimized, arguments[name]))
+            times.append(seconds)
+            columns.append(f"{size(optimized.body):>8}{interpreter.evaluations:>9}{seconds:>10.4f}")
+        assert results[0] == results[1], (name, results)
+        print(f"{name:<16}{columns[0][1:]}{columns[1]}{cse_statistics.removed:>9}{times[0] / times[1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
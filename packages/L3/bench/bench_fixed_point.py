@@ -0,0 +1,105 @@
+"""
+The optimizer's last, confirming iteration, before and after the passes kept unchanged nodes.
+
+On a program the optimizer has already finished with, one more iteration should change
+nothing; optimize_program runs it to find that out. The passes from BASELINE are loaded
+with git and followed by the == on whole programs the loop used then; the passes now
+hand back the body itself and the loop checks identity. Walk is a pass on the same
+traversal engine that visits every node and builds nothing: the least a read-only pass
+can cost, and the iteration runs four passes. The memo tables are cleared before every
+run, so neither side is answered from them.
+
+Run with `uv run python packages/L3/bench/bench_fixed_point.py`.
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+import L2.branch_elimination
+import L2.constant_folding
+import L2.constant_propagation
+import L2.dead_code_elim
+from bench_parse import generate
+from bench_traverse import baseline, clear, measure, size
+from L2.optimize import optimize_program, optimize_term
+from L2.syntax import Program as L2Program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.syntax import Program
+from L3.uniqify import uniqify_program
+from util.traverse import Traversal, Visit
+from util.trusted import trusted
+
+BASELINE = "870060d"
+PASSES = [L2.constant_propagation, L2.constant_folding, L2.dead_code_elim, L2.branch_elimination]
+
+
+def _visit(term: Any) -> Visit[None]:
+    for value in term.__dict__.values():
+        for item in value if isinstance(value, list | tuple) else (value,):  # pyright: ignore[reportUnknownVariableType]
+            child = item[1] if isinstance(item, tuple) else item  # a Let's (name, value)
+            if hasattr(child, "tag"):
+                yield child
+
+
+walk = Traversal[None](
+    dict.fromkeys(
+        [
+            "let",
+            "reference",
+            "abstract",
+            "apply",
+            "immediate",
+            "primitive",
+            "branch",
+            "allocate",
+            "load",
+            "store",
+            "begin",
+        ],
+        _visit,
+    )
+)
+
+
+def before(program: L2Program) -> Callable[[], object]:
+    propagation, folding, dce, branches = old = [baseline(module, BASELINE) for module in PASSES]
+
+    def run() -> object:
+        clear(*old)
+        body = propagation.constant_propagation_term(program.body, env={})
+        body = folding.constant_folding_term(body, context={})
+        body = dce.dead_code_elimination_term(body)
+        body = branches.branch_elimination_term(body)
+        assert trusted(L2Program, parameters=program.parameters, body=body) == program
+        return body
+
+    return run
+
+
+def after(program: L2Program) -> Callable[[], object]:
+    def run() -> object:
+        clear(*PASSES)
+        body = optimize_term(program.body)
+        assert body is program.body
+        return body
+
+    return run
+
+
+def main() -> None:
+    print(f"{'input':<18}{'nodes':>8}{'walk (s)':>10}{'before (s)':>12}{'after (s)':>11}{'after/walk':>12}")
+    for kilobytes in (32, 128):
+        # generate binds each name in terms of earlier ones, which needs letrec's scoping
+        l3 = parse_program(generate(kilobytes << 10).replace("(let (", "(letrec (", 1))
+        assert isinstance(l3, Program)
+        program = optimize_program(eliminate_letrec_program(uniqify_program(l3)[1]))
+
+        walked = measure(lambda program=program: walk(program.body))
+        old, new = measure(before(program)), measure(after(program))
+        name = f"generated {kilobytes}KB"
+        print(f"{name:<18}{size(program.body):>8}{walked:>10.3f}{old:>12.3f}{new:>11.3f}{new / walked:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+The fused front end versus check_program, uniqify_program and eliminate_letrec_program.
+
+Both sides start from the parsed program and end with the same L2 program. Peak memory is
+the most traced memory held at once during the run; nodes is how many IR nodes were
+built, which for the separate passes includes the uniqified L3 program they hand on.
+
+Run with `uv run python packages/L3/bench/bench_front_end.py`.
+"""
+
+import gc
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import L3.eliminate_letrec
+import L3.front_end
+import L3.uniqify
+from bench_parse import generate
+from L3.check import check_program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.front_end import front_end_program
+from L3.parse import parse_program
+from L3.syntax import Program
+from L3.uniqify import uniqify_program
+from util.trusted import trusted
+
+BUILDERS = [L3.eliminate_letrec, L3.front_end, L3.uniqify]
+
+
+def staged(program: Program) -> object:
+    check_program(program)
+    _, program = uniqify_program(program)
+    return eliminate_letrec_program(program)
+
+
+def fused(program: Program) -> object:
+    return front_end_program(program)[1]
+
+
+@contextmanager
+def counting() -> Iterator[list[int]]:
+    count = [0]
+
+    def counted(cls: type[Any], **fields: Any) -> Any:
+        count[0] += 1
+        return trusted(cls, **fields)
+
+    for module in BUILDERS:
+        vars(module)["trusted"] = counted
+    try:
+        yield count
+    finally:
+        for module in BUILDERS:
+            vars(module)["trusted"] = trusted
+
+
+def measure(run: Callable[[Program], object], program: Program) -> tuple[float, float, int]:
+    gc.collect()
+    start = time.perf_counter()
+    run(program)
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    run(program)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with counting() as count:
+        run(program)
+
+    return seconds, peak / 1e6, count[0]
+
+
+def main() -> None:
+    print(f"{'input':<18}{'':<8}{'seconds':>10}{'peak MB':>10}{'nodes':>10}")
+    for size in (128 << 10, 1 << 20):
+        # generate binds each name in terms of earlier ones, which needs letrec's scoping
+        program = parse_program(generate(size).replace("(let (", "(letrec (", 1))
+        assert isinstance(program, Program)
+        assert fused(program) == staged(program)
+
+        name = f"generated {size >> 10}KB"
+        rows = [("staged", measure(staged, program)), ("fused", measure(fused, program))]
+        for label, (seconds, peak, nodes) in rows:
+            print(f"{name:<18}{label:<8}{seconds:>10.3f}{peak:>10.1f}{nodes:>10}")
+            name = ""
+        (before, before_peak, before_nodes), (after, after_peak, after_nodes) = (row for _, row in rows)
+        print(
+            f"{'':<18}{'saved':<8}{1 - after / before:>10.0%}{1 - after_peak / before_peak:>10.0%}"
+            f"{1 - after_nodes / before_nodes:>10.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
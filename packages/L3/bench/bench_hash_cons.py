@@ -0,0 +1,127 @@
+"""
+optimize_program with and without hash-consing and the memoized analyses.
+
+The unshared column builds nodes with trusted instead of cons or rebuild, skips interning and turns
+the memo tables off, which is how the optimizer ran before. Retained memory is what the
+result holds on to, intern table included.
+
+Run with `uv run python packages/L3/bench/bench_hash_cons.py`.
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import L2.branch_elimination
+import L2.constant_folding
+import L2.constant_propagation
+import L2.dead_code_elim
+import L2.optimize
+from bench_parse import generate
+from L2.branch_elimination import branch_elimination_memo
+from L2.constant_folding import constant_folding_memo
+from L2.constant_propagation import constant_propagation_memo
+from L2.dead_code_elim import dead_code_elimination_memo, free_variables_memo, is_pure_memo
+from L2.optimize import optimize_program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.syntax import Program
+from L3.uniqify import uniqify_program
+from util.hash_cons import cons, intern, rebuild
+from util.memo import IdentityMemo
+from util.trusted import trusted
+
+PASSES = [L2.branch_elimination, L2.constant_folding, L2.constant_propagation, L2.dead_code_elim]
+MEMOS: list[IdentityMemo[Any, Any]] = [
+    branch_elimination_memo,
+    constant_folding_memo,
+    constant_propagation_memo,
+    dead_code_elimination_memo,
+    free_variables_memo,
+    is_pure_memo,
+]
+
+
+def nested(depth: int) -> str:
+    # A chain of lets, each using its predecessor, with the same arithmetic repeated throughout.
+    source = "x"
+    for index in reversed(range(depth)):
+        source = f"(let ((v{index} (+ (* x 3) (- y 1)))) (if (< v{index} 5) {source} (+ v{index} y)))"
+    return f"(l3 (x y) {source})"
+
+
+def rebuilt(node: Any, /, **fields: Any) -> Any:
+    # a fresh node every time, as the passes built them before rebuild
+    return trusted(type(node), **{**node.__dict__, **fields})
+
+
+@contextmanager
+def unshared() -> Iterator[None]:
+    sizes = [memo.max_size for memo in MEMOS]
+    for memo in MEMOS:
+        memo.max_size = 0
+    for module in PASSES:
+        vars(module)["cons"] = trusted
+        vars(module)["rebuild"] = rebuilt
+    vars(L2.optimize)["intern"] = lambda node: node  # pyright: ignore[reportUnknownLambdaType]
+    try:
+        yield
+    finally:
+        for memo, size in zip(MEMOS, sizes, strict=True):
+            memo.max_size = size
+        for module in PASSES:
+            vars(module)["cons"] = cons
+            vars(module)["rebuild"] = rebuild
+        vars(L2.optimize)["intern"] = intern
+
+
+def measure(run: Callable[[], object]) -> tuple[float, float]:
+    for memo in MEMOS:
+        memo.clear()
+    gc.collect()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+
+    for memo in MEMOS:
+        memo.clear()
+    gc.collect()
+    tracemalloc.start()
+    result = run()
+    for memo in MEMOS:
+        memo.clear()
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return seconds, retained / 1e6
+
+
+def main() -> None:
+    sys.setrecursionlimit(100_000)
+
+    inputs: list[tuple[str, Program]] = [
+        # generate binds each name in terms of earlier ones, which needs letrec's scoping
+        ("generated 128KB", uniqify_program(parse_program(generate(128 << 10).replace("(let (", "(letrec (", 1)))[1]),
+        ("nested lets x400", uniqify_program(parse_program(nested(400)))[1]),
+    ]
+
+    print(f"{'input':<20}{'unshared (s)':>14}{'shared (s)':>12}{'retained MB before':>20}{'after':>8}")
+    for name, l3 in inputs:
+
+        def run(l3: Program = l3) -> object:
+            return optimize_program(eliminate_letrec_program(l3))
+
+        with unshared():
+            before, before_mb = measure(run)
+        after, after_mb = measure(run)
+        print(f"{name:<20}{before:>14.3f}{after:>12.3f}{before_mb:>20.1f}{after_mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Dynamic call counts and running time of programs optimized with and without inlining.
+
+Before is -O2 as it was, sccp and dead code elimination; after is -O2 now, with inlining
+first. Each program is run by a small interpreter here, which counts the calls it makes
+and the nodes it evaluates, and its time is the interpreter's. L2's to_python cannot run
+a program with a letrec, since eliminate_letrec loads a letrec-bound function through
+its binding without storing it anywhere; the interpreter reads such a Load as the
+function itself.
+
+The inputs are the examples and a program of small helpers called from a loop: a
+recursive function's own calls go through a Load and are not inlined, so in the examples
+only add_complex has calls to inline. Both sides must compute the same result.
+
+Run with `uv run python packages/L3/bench/bench_inline.py`.
+"""
+
+import sys
+from collections.abc import Mapping, Sequence
+from typing import Any
+
+import L2.dead_code_elim
+import L2.inline
+import L2.sccp
+from bench_parse import EXAMPLES
+from bench_traverse import clear, measure, size
+from L2.optimize import DEFAULT_PIPELINE, PASSES, optimize_program
+from L2.pass_manager import parse_pipeline
+from L2.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+    Term,
+)
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.syntax import Program as L3Program
+from L3.uniqify import uniqify_program
+
+BEFORE = parse_pipeline("sccp:100,dce:100", PASSES)
+MODULES = [L2.dead_code_elim, L2.inline, L2.sccp]
+
+HELPERS = """
+(l3 (n)
+  (let ((square (\\ (x) (* x x)))
+        (twice (\\ (f x) (f (f x))))
+        (between (\\ (low x high) (if (< x low) low (if (< high x) high x)))))
+    (letrec ((loop (\\ (i acc)
+                     (if (< i n)
+                         (loop (+ i 1) (+ acc (between 0 (twice square i) 1000)))
+                         acc))))
+      (loop 0 0))))
+"""
+
+ARGUMENTS = {
+    "add_complex.l3": [3, 4],
+    "add_simple.l3": [3, 4],
+    "fact.l3": [20],
+    "fib.l3": [18],
+    "sum.l3": [300],
+    "helpers": [2000],
+}
+
+
+class Closure:
+    def __init__(self, parameters: Sequence[str], body: Term, env: dict[str, Any]) -> None:
+        self.parameters = parameters
+        self.body = body
+        self.env = env
+
+
+class Interpreter:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.steps = 0
+
+    def run(self, program: Program, arguments: Sequence[int]) -> Any:
+        return self.evaluate(program.body, dict(zip(program.parameters, arguments, strict=True)))
+
+    def evaluate(self, term: Term, env: Mapping[str, Any]) -> Any:
+        self.steps += 1
+        match term:
+            case Let(bindings=bindings, body=body):
+                # one scope for the bindings, so a closure sees the ones after it too
+                scope = dict(env)
+                for name, value in bindings:
+                    scope[name] = self.evaluate(value, scope)
+                return self.evaluate(body, scope)
+            case Reference(name=name):
+                return env[name]
+            case Abstract(parameters=parameters, body=body):
+                return Closure(parameters, body, env)  # pyright: ignore[reportArgumentType]
+            case Apply(target=target, arguments=arguments):
+                function = self.evaluate(target, env)
+                values = [self.evaluate(argument, env) for argument in arguments]
+                self.calls += 1
+                return self.evaluate(function.body, function.env | dict(zip(function.parameters, values, strict=True)))
+            case Immediate(value=value):
+                return value
+            case Primitive(operator=operator, left=left, right=right):
+                a, b = self.evaluate(left, env), self.evaluate(right, env)
+                return a + b if operator == "+" else a - b if operator == "-" else a * b
+            case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
+                a, b = self.evaluate(left, env), self.evaluate(right, env)
+                taken = a < b if operator == "<" else a == b
+                return self.evaluate(consequent if taken else otherwise, env)
+            case Allocate(count=count):
+                return [0] * count
+            case Load(base=base, index=index):
+                cell = self.evaluate(base, env)
+                return cell if isinstance(cell, Closure) else cell[index]
+            case Store(base=base, index=index, value=value):
+                cell = self.evaluate(base, env)
+                cell[index] = self.evaluate(value, env)
+                return 0
+            case Begin(effects=effects, value=value):  # pragma: no branch
+                for effect in effects:
+                    self.evaluate(effect, env)
+                return self.evaluate(value, env)
+
+
+def lower(l3: L3Program) -> Program:
+    return eliminate_letrec_program(uniqify_program(l3)[1])
+
+
+def parsed(source: str) -> L3Program:
+    result = parse_program(source)
+    assert isinstance(result, L3Program)
+    return result
+
+
+def main() -> None:
+    sys.setrecursionlimit(100_000)
+    inputs = [(path.name, lower(parsed(path.read_text()))) for path in sorted(EXAMPLES.glob("*.l3"))]
+    inputs.append(("helpers", lower(parsed(HELPERS))))
+
+    print(
+        f"{'input':<16}{'nodes':>7}{'calls':>9}{'steps':>9}{'run (s)':>10}"
+        f"{'nodes':>8}{'calls':>9}{'steps':>9}{'run (s)':>10}{'speedup':>9}"
+    )
+    for name, l2 in inputs:
+        arguments = ARGUMENTS[name]
+        columns: list[str] = []
+        results: list[Any] = []
+        times: list[float] = []
+        for pipeline in (BEFORE, DEFAULT_PIPELINE):
+            clear(*MODULES)
+            optimized = optimize_program(l2, pipeline)
+            interpreter = Interpreter()
+            results.append(interpreter.run(optimized, arguments))
+            seconds = measure(lambda optimized=optimized, arguments=arguments: Interpreter().run(optimized, arguments))
+            times.append(seconds)
+            columns.append(f"{size(optimized.body):>8}{interpreter.calls:>9}{interpreter.steps:>9}{seconds:>10.4f}")
+        assert results[0] == results[1], (name, results)
+        print(f"{name:<16}{columns[0][1:]}{columns[1]}{times[0] / times[1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+JSON ingestion versus parse_program on the same programs, reading from files.
+
+Each generated program is written once as L3 source and once as JSON, then loaded by
+both parser backends and by the JSON loader, in one piece and streamed.
+
+Run with `uv run python packages/L3/bench/bench_json.py`.
+"""
+
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+
+from bench_parse import EXAMPLES, generate
+from L3.from_json import program_from_json_file
+from L3.parse import parse_program, parse_program_file
+
+LOADERS: list[tuple[str, str, Callable[[Path], object]]] = [
+    ("lark", ".l3", lambda path: parse_program_file(path, "lark")),
+    ("sexp", ".l3", lambda path: parse_program_file(path, "sexp")),
+    ("json", ".json", lambda path: program_from_json_file(path)),
+    ("json stream", ".json", lambda path: program_from_json_file(path, stream=True)),
+]
+
+
+def measure(load: Callable[[Path], object], path: Path, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load(path)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    load(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        stems = [(path.with_suffix(""), 20) for path in sorted(EXAMPLES.glob("*.l3"))]
+        for size in (1 << 20, 4 << 20):
+            stem = Path(directory) / f"generated_{size >> 20}MB"
+            source = generate(size)
+            stem.with_suffix(".l3").write_text(source)
+            stem.with_suffix(".json").write_text(parse_program(source).model_dump_json())
+            stems.append((stem, 1))
+
+        print(f"{'input':<20}{'loader':<13}{'size (MB)':>10}{'time (s)':>10}{'peak (MB)':>11}")
+        for stem, repeat in stems:
+            for name, suffix, load in LOADERS:
+                path = stem.with_suffix(suffix)
+                seconds, peak = measure(load, path, repeat)
+                size = path.stat().st_size
+                print(f"{stem.name:<20}{name:<13}{size / 1e6:>10.2f}{seconds:>10.4f}{peak / 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+optimize_program with its functions optimized on a pool of workers, by worker count.
+
+The input is a letrec of FUNCTIONS functions, each a generated body of let-bound
+arithmetic with a chain of lets beside it that takes a round of the pipeline per
+binding, as in bench_worklist. The functions are the regions L2.parallel hands out; the
+pass over the whole program afterwards finds them settled. Every worker count must give
+the program one worker gives. The memo tables are cleared before every run.
+
+On a free-threaded build the workers are threads; elsewhere they are processes, which
+pay to start, to import the compiler and to send each function both ways, so they only
+win on large programs with more cores than one. Speedup is bounded by the core count
+printed in the header, and by the sequential pass over the whole program.
+
+Run with `uv run python packages/L3/bench/bench_parallel.py`.
+"""
+
+import os
+
+import L2.branch_elimination
+import L2.constant_folding
+import L2.constant_propagation
+import L2.dead_code_elim
+import L2.inline
+import L2.sccp
+from bench_parse import generate
+from bench_traverse import clear, measure, size
+from bench_worklist import slow
+from L2.optimize import optimize_program
+from L2.parallel import free_threaded, regions
+from L2.syntax import Program as L2Program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.syntax import Program
+from L3.uniqify import uniqify_program
+
+FUNCTIONS = 16
+MODULES = [L2.constant_propagation, L2.constant_folding, L2.dead_code_elim, L2.branch_elimination, L2.inline, L2.sccp]
+
+
+def function(kilobytes: int, seed: int) -> str:
+    # (lambda (x y) (letrec (...) (+ vN chain))); generate binds names in terms of earlier ones
+    body = generate(kilobytes << 10, seed).removeprefix("(l3 (x y) ").removesuffix(")")
+    head, _, last = body.replace("(let (", "(letrec (", 1).rpartition(" ")
+    return f"(lambda (x y) {head} (+ {last.rstrip(')')} {slow(40)})))"
+
+
+def program(kilobytes: int) -> Program:
+    functions = " ".join(f"(f{index} {function(kilobytes, index)})" for index in range(FUNCTIONS))
+    calls = "0"
+    for index in range(FUNCTIONS):
+        calls = f"(+ (f{index} x y) {calls})"
+    parsed = parse_program(f"(l3 (x y) (letrec ({functions}) {calls}))")
+    assert isinstance(parsed, Program)
+    return parsed
+
+
+def main() -> None:
+    cores = os.process_cpu_count()
+    print(f"{cores} core(s), {'threads' if free_threaded() else 'processes'}")
+    print(f"{'input':<16}{'nodes':>8}{'regions':>9}{'workers':>9}{'time (s)':>10}{'speedup':>9}")
+    for kilobytes in (4, 16):
+        l2 = eliminate_letrec_program(uniqify_program(program(kilobytes))[1])
+        nodes, found = size(l2.body), len(regions(l2.body))
+
+        def run(workers: int, l2: L2Program = l2) -> L2Program:
+            clear(*MODULES)
+            return optimize_program(l2, workers=workers)
+
+        expected, sequential = run(1), measure(lambda: run(1))
+        for workers in (1, 2, 4, 8):
+            if workers > 1:
+                assert run(workers) == expected
+            seconds = sequential if workers == 1 else measure(lambda workers=workers: run(workers))
+            name = f"{FUNCTIONS} x {kilobytes}KB"
+            print(f"{name:<16}{nodes:>8}{found:>9}{workers:>9}{seconds:>10.3f}{sequential / seconds:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
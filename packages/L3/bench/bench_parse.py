@@ -0,0 +1,69 @@
+"""
+Parser throughput: the original per-call Earley parser versus the cached LALR parser.
+
+Run with `uv run python packages/L3/bench/bench_parse.py`.
+"""
+
+import random
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from L3.parse import AstTransformer, parse_program
+from lark import Lark
+
+EXAMPLES = Path(__file__).parents[1] / "examples"
+EARLEY_LIMIT = 1 << 20  # Earley takes minutes per megabyte; skip it above this size
+GRAMMAR = Path(__file__).parents[1] / "src" / "L3" / "L3.lark"
+
+
+def earley_parse_program(source: str) -> object:
+    # The original implementation: rebuild an Earley parser, then transform the tree.
+    parser = Lark(GRAMMAR.read_text(), start="program")
+    return AstTransformer().transform(parser.parse(source))  # pyright: ignore[reportUnknownMemberType]
+
+
+def generate(size: int, seed: int = 0) -> str:
+    # A wide program of let-bound arithmetic, roughly `size` bytes long.
+    rng = random.Random(seed)
+    names = ["x", "y"]
+    chunks: list[str] = []
+    length = 0
+    while length < size:
+        name = f"v{len(names)}"
+        left, right = rng.choice(names), rng.choice(names)
+        value = f"(if (< {left} {rng.randint(0, 99)}) (+ {left} (* {right} 3)) (- {right} 1))"
+        chunk = f"({name} {value})"
+        chunks.append(chunk)
+        length += len(chunk)
+        names.append(name)
+    return f"(l3 (x y) (let ({' '.join(chunks)}) {names[-1]}))"
+
+
+def measure(parse: Callable[[str], object], source: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(source)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    inputs = [(path.name, path.read_text(), 20) for path in sorted(EXAMPLES.glob("*.l3")) if path.name != "sum.l3"]
+    inputs += [(f"generated {size >> 10}KB", generate(size), 1) for size in (1 << 19, 4 << 20)]
+
+    parse_program("(l3 () 0)")  # build the cached parser outside the timed region
+
+    print(f"{'input':<20}{'earley (s)':>14}{'lalr (s)':>14}{'speedup':>10}")
+    for name, source, repeat in inputs:
+        lalr = measure(parse_program, source, repeat)
+        if len(source) > EARLEY_LIMIT:
+            print(f"{name:<20}{'-':>14}{lalr:>14.5f}{'-':>10}")
+            continue
+        earley = measure(earley_parse_program, source, repeat)
+        print(f"{name:<20}{earley:>14.5f}{lalr:>14.5f}{earley / lalr:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Throughput and peak memory of the two parser backends, reading from files.
+
+Run with `uv run python packages/L3/bench/bench_reader.py`.
+"""
+
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from bench_parse import EXAMPLES, generate
+from L3.parse import Backend, parse_program_file
+
+BACKENDS: list[Backend] = ["lark", "sexp"]
+
+
+def measure(path: Path, backend: Backend, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_program_file(path, backend)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse_program_file(path, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [(path, 20) for path in sorted(EXAMPLES.glob("*.l3"))]
+        for size in (1 << 20, 8 << 20):
+            path = Path(directory) / f"generated_{size >> 20}MB.l3"
+            path.write_text(generate(size))
+            paths.append((path, 1))
+
+        print(f"{'input':<22}{'backend':<9}{'time (s)':>10}{'MB/s':>9}{'peak (MB)':>11}")
+        for path, repeat in paths:
+            size = path.stat().st_size
+            for backend in BACKENDS:
+                seconds, peak = measure(path, backend, repeat)
+                print(f"{path.name:<22}{backend:<9}{seconds:>10.4f}{size / seconds / 1e6:>9.2f}{peak / 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Dynamic allocations, loads and stores of programs optimized with and without scalar
+replacement, and the time to optimize them.
+
+Before is -O2 without the scalar pass; after is -O2 now. Each program is run by
+bench_inline's interpreter, which here also counts the Allocates, Loads and Stores it
+evaluates; the Loads of a letrec-bound function, which eliminate_letrec leaves and which
+read no cell, are not counted.
+
+The inputs are the examples and an iterative fib whose loop keeps three cells, as a
+loop written with mutable locals does. Both sides must compute the same result.
+
+Run with `uv run python packages/L3/bench/bench_scalar.py`.
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Any
+
+import L2.dead_code_elim
+import L2.inline
+import L2.scalar_replacement
+import L2.sccp
+from bench_inline import ARGUMENTS, Closure, Interpreter, lower, parsed
+from bench_parse import EXAMPLES
+from bench_traverse import clear, measure
+from L2.optimize import DEFAULT_PIPELINE, PASSES, optimize_program
+from L2.pass_manager import parse_pipeline
+from L2.syntax import Allocate, Load, Store, Term
+
+BEFORE = parse_pipeline("inline:4,sccp:100,cse:100,dce:100", PASSES)
+MODULES = [L2.dead_code_elim, L2.inline, L2.scalar_replacement, L2.sccp]
+
+FIB = """
+(l3 (n)
+  (let ((a (allocate 1)) (b (allocate 1)) (i (allocate 1)))
+    (begin
+      (store a 0 0)
+      (store b 0 1)
+      (store i 0 0)
+      (letrec ((loop (\\ ()
+                       (if (< (load i 0) n)
+                           (let ((next (+ (load a 0) (load b 0))))
+                             (begin
+                               (store a 0 (load b 0))
+                               (store b 0 next)
+                               (store i 0 (+ (load i 0) 1))
+                               (loop)))
+                           (load a 0)))))
+        (loop)))))
+"""
+
+
+class Counting(Interpreter):
+    def __init__(self) -> None:
+        super().__init__()
+        self.memory = 0
+
+    def evaluate(self, term: Term, env: Mapping[str, Any]) -> Any:
+        result = super().evaluate(term, env)
+        if isinstance(term, Allocate | Store) or (isinstance(term, Load) and not isinstance(result, Closure)):
+            self.memory += 1
+        return result
+
+
+def main() -> None:
+    sys.setrecursionlimit(100_000)
+    inputs = [(path.name, lower(parsed(path.read_text()))) for path in sorted(EXAMPLES.glob("*.l3"))]
+    inputs.append(("fib_loop", lower(parsed(FIB))))
+    arguments = dict(ARGUMENTS, fib_loop=[300])
+
+    print(f"{'input':<16}{'memory':>8}{'steps':>9}{'opt (s)':>10}{'memory':>9}{'steps':>9}{'opt (s)':>10}")
+    for name, l2 in inputs:
+        columns: list[str] = []
+        results: list[Any] = []
+        for pipeline in (BEFORE, DEFAULT_PIPELINE):
+            clear(*MODULES)
+            optimized = optimize_program(l2, pipeline)
+            interpreter = Counting()
+            results.append(interpreter.run(optimized, arguments[name]))
+
+            def optimize(pipeline: Any = pipeline, l2: Any = l2) -> None:
+                clear(*MODULES)
+                optimize_program(l2, pipeline)
+
+            seconds = measure(optimize)
+            columns.append(f"{interpreter.memory:>9}{interpreter.steps:>9}{seconds:>10.4f}")
+        assert results[0] == results[1], (name, results)
+        print(f"{name:<16}{columns[0][1:]}{columns[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+optimize_program with sccp and dead code elimination, versus the separate passes.
+
+Before is the pipeline -O2 was: constant propagation, constant folding, dead code
+elimination and branch elimination, each run to the fixed point the four reach
+together. After is sccp, which does the work of propagation, folding and branch
+elimination in one walk, and dead code elimination, as -O2 runs them after inlining.
+Each side's rounds are the times it ran its first pass, the last of them a round that
+changed nothing; the output columns count the nodes each leaves, which for sccp is never
+more.
+
+The inputs are the examples, the wide generated program of bench_parse, and the
+programs of bench_worklist, where a chain of lets takes a round of the separate passes
+per binding. The memo tables are cleared before every run.
+
+Run with `uv run python packages/L3/bench/bench_sccp.py`.
+"""
+
+import L2.branch_elimination
+import L2.constant_folding
+import L2.constant_propagation
+import L2.dead_code_elim
+import L2.sccp
+from bench_parse import EXAMPLES, generate
+from bench_traverse import clear, measure, size
+from bench_worklist import program
+from L2.optimize import PASSES, optimize_program
+from L2.pass_manager import AnalysisCache, Pass, Pipeline, parse_pipeline
+from L2.syntax import Program as L2Program
+from L2.syntax import Term
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.syntax import Program
+from L3.uniqify import uniqify_program
+
+SEPARATE = parse_pipeline("propagate:100,fold:100,dce:100,branch:100", PASSES)
+SCCP = parse_pipeline("sccp:100,dce:100", PASSES)
+MODULES = [L2.constant_propagation, L2.constant_folding, L2.dead_code_elim, L2.branch_elimination, L2.sccp]
+
+
+def lower(l3: Program) -> L2Program:
+    return eliminate_letrec_program(uniqify_program(l3)[1])
+
+
+def parsed(source: str) -> Program:
+    result = parse_program(source)
+    assert isinstance(result, Program)
+    return result
+
+
+def counted(pipeline: Pipeline) -> tuple[Pipeline, list[int]]:
+    # pipeline with its first pass counting its runs
+    runs = [0]
+    (first, limit), *rest = pipeline
+
+    def run(term: Term, analyses: AnalysisCache) -> Term:
+        runs[0] += 1
+        return first.run(term, analyses)
+
+    return [(Pass(first.name, run, first.requires, first.invalidates), limit), *rest], runs
+
+
+def main() -> None:
+    inputs = [(path.name, lower(parsed(path.read_text()))) for path in sorted(EXAMPLES.glob("*.l3"))]
+    # generate binds each name in terms of earlier ones, which needs letrec's scoping
+    inputs += [
+        (f"generated {kilobytes}KB", lower(parsed(generate(kilobytes << 10).replace("(let (", "(letrec (", 1))))
+        for kilobytes in (16, 64)
+    ]
+    inputs += [
+        (f"worklist {kilobytes}KB {'inside' if inside else 'beside'}", lower(program(kilobytes, 40, inside)))
+        for inside in (False, True)
+        for kilobytes in (16, 64)
+    ]
+
+    print(
+        f"{'input':<26}{'nodes':>8}{'before (s)':>12}{'rounds':>8}{'out':>8}"
+        f"{'after (s)':>11}{'rounds':>8}{'out':>8}{'speedup':>9}"
+    )
+    for name, l2 in inputs:
+        results: list[tuple[float, int, int]] = []
+        for pipeline in (SEPARATE, SCCP):
+            counting, runs = counted(pipeline)
+
+            def run(l2: L2Program = l2, counting: Pipeline = counting) -> L2Program:
+                clear(*MODULES)
+                return optimize_program(l2, counting)
+
+            optimized = run()
+            rounds = runs[0]
+            results.append((measure(run), rounds, size(optimized.body)))
+
+        (before, old_rounds, old_size), (after, new_rounds, new_size) = results
+        assert new_size <= old_size
+        print(
+            f"{name:<26}{size(l2.body):>8}{before:>12.4f}{old_rounds:>8}{old_size:>8}"
+            f"{after:>11.4f}{new_rounds:>8}{new_size:>8}{before / after:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
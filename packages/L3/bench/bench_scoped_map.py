@@ -0,0 +1,62 @@
+"""
+Scope handling with util.scoped_map versus a copy of the context at every binder.
+
+The copying passes are loaded from BASELINE, the last commit before scoped maps, with
+git. The input nests lets `depth` deep, each binding `width` names that stay in scope
+below it, so every binder sees a scope of up to depth * width names; copying it costs
+that much at each binder, binding into a scoped map costs only the binder's own names.
+
+Run with `uv run python packages/L3/bench/bench_scoped_map.py`.
+"""
+
+from collections.abc import Callable
+from functools import partial
+from types import ModuleType
+
+from bench_traverse import baseline, measure
+from L2 import constant_propagation
+from L2 import syntax as L2
+from L3 import check, uniqify
+from L3 import syntax as L3
+from L3.eliminate_letrec import eliminate_letrec_term
+from util.sequential_name_generator import SequentialNameGenerator
+
+BASELINE = "f8b9eb7"
+
+
+def nested(depth: int, width: int) -> L3.Term:
+    # let ((a0_0 1) ... (a0_w 1)) in let ((a1_0 a0_0) ...) in ... in a(d-1)_0
+    term: L3.Term = L3.Reference(name=f"a{depth - 1}_0")
+    for level in reversed(range(depth)):
+        value = L3.Reference(name=f"a{level - 1}_0") if level else L3.Immediate(value=1)
+        term = L3.Let(bindings=[(f"a{level}_{index}", value) for index in range(width)], body=term)
+    return term
+
+
+def runs(modules: list[ModuleType], term: L3.Term) -> dict[str, Callable[[], object]]:
+    checking, renaming, propagation = modules
+    # the same nesting in L2; the first level is constant, so propagation binds every name
+    l2: L2.Term = eliminate_letrec_term(term, {})
+    return {
+        "check_term": partial(checking.check_term, term, {}),
+        "uniqify_term": lambda: renaming.uniqify_term(term, {}, SequentialNameGenerator()),
+        "constant_propagation_term": partial(propagation.constant_propagation_term, l2, {}),
+    }
+
+
+def main() -> None:
+    new = [check, uniqify, constant_propagation]
+    old = [baseline(module, BASELINE) for module in new]
+
+    print(f"{'pass':<28}{'depth x width':>15}{'copying (s)':>14}{'scoped (s)':>12}{'speedup':>10}")
+    for depth, width in [(250, 40), (500, 40), (1000, 40), (2000, 40)]:
+        term = nested(depth, width)
+        before, after = runs(old, term), runs(new, term)
+        for name in before:
+            copying, scoped = measure(before[name]), measure(after[name])
+            shape = f"{depth} x {width}"
+            print(f"{name:<28}{shape:>15}{copying:>14.3f}{scoped:>12.3f}{copying / scoped:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
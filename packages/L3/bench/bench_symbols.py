@@ -0,0 +1,70 @@
+"""
+Code generation with names encoded through a compilation's symbol table versus util.encode.
+
+The program is a wide letrec whose bindings each read the two before it, so almost every
+node is a reference. Names come from uniqify, which registers them in the table applied
+around both it and to_ast_term, as a compilation does. The encode column is the part of
+to_ast_term spent spelling names.
+
+Run with `uv run python packages/L3/bench/bench_symbols.py`.
+"""
+
+import cProfile
+import pstats
+import time
+from collections.abc import Callable
+from functools import partial
+
+import L3.to_python
+from L3.syntax import LetRec, Primitive, Program, Reference
+from L3.to_python import to_ast_term
+from L3.uniqify import uniqify_program
+from util.encode import encode
+from util.symbols import SymbolTable, encoded
+
+
+def program(size: int) -> Program:
+    names = ["x", "y"]
+    bindings: list[tuple[str, Primitive]] = []
+    for index in range(size):
+        name = f"v{index}"
+        bindings.append(
+            (name, Primitive(operator="+", left=Reference(name=names[-1]), right=Reference(name=names[-2])))
+        )
+        names.append(name)
+    return Program(parameters=["x", "y"], body=LetRec(bindings=bindings, body=Reference(name=names[-1])))
+
+
+def measure(run: Callable[[], object], spell: Callable[[str], str]) -> tuple[float, float]:
+    vars(L3.to_python)["encoded"] = spell
+    try:
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+
+        profile = cProfile.Profile()
+        profile.runcall(run)
+    finally:
+        vars(L3.to_python)["encoded"] = encoded
+
+    stats = pstats.Stats(profile).stats  # pyright: ignore[reportAttributeAccessIssue, reportUnknownMemberType, reportUnknownVariableType]
+    total = sum(entry[3] for entry in stats.values())  # pyright: ignore[reportUnknownArgumentType, reportUnknownVariableType]
+    spelling = sum(entry[3] for function, entry in stats.items() if function[2] == "encode")  # pyright: ignore[reportUnknownArgumentType, reportUnknownVariableType]
+    return seconds, spelling / total  # pyright: ignore[reportUnknownVariableType]
+
+
+def main() -> None:
+    print(f"{'references':>11} {'names':>8}  {'util.encode':>12} {'encode %':>9}  {'table':>8} {'encode %':>9}")
+    for size in (10_000, 100_000, 1_000_000):
+        with SymbolTable().applied():
+            _, uniqified = uniqify_program(program(size))
+            # the backends' old behaviour: every emitted name is encoded from scratch
+            before, before_share = measure(partial(to_ast_term, uniqified.body), encode)
+            after, after_share = measure(partial(to_ast_term, uniqified.body), encoded)
+        print(
+            f"{2 * size + 1:>11} {size:>8}  {before:>11.2f}s {before_share:>8.0%}  {after:>7.2f}s {after_share:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
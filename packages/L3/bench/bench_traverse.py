@@ -0,0 +1,152 @@
+"""
+Passes on util.traverse versus the recursive passes they replaced.
+
+The recursive passes are loaded from BASELINE, the last commit before the port, with git.
+The per-node columns run each pass over a wide generated program, clearing the memo
+tables before every run so neither side is answered from them. The depth rows run the
+passes over a chain of nested lets and begins, where the recursive passes stop at the
+interpreter's recursion limit.
+
+Run with `uv run python packages/L3/bench/bench_traverse.py`.
+"""
+
+import importlib.util
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+import L2.constant_folding
+import L2.dead_code_elim
+import L3.check
+import L3.eliminate_letrec
+import L3.to_python
+import L3.uniqify
+from bench_parse import generate
+from L3.parse import parse_program
+from L3.syntax import Begin, Immediate, Let, Program, Reference, Term
+from util.sequential_name_generator import SequentialNameGenerator
+
+BASELINE = "626a852"
+DEPTH = 100_000
+
+
+def baseline(module: ModuleType, revision: str = BASELINE) -> ModuleType:
+    # module as it was at revision, loaded beside the current one
+    package, _, name = module.__name__.partition(".")
+    path = f"packages/{package}/src/{package}/{name}.py"
+    source = subprocess.run(
+        ["git", "show", f"{revision}:{path}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+    ).stdout
+    spec = importlib.util.spec_from_loader(f"{package}._{revision}_{name}", loader=None)
+    assert spec is not None
+    old = importlib.util.module_from_spec(spec)
+    old.__package__ = package
+    # the source is this repository's own, at a revision of its history
+    exec(compile(source, path, "exec"), old.__dict__)  # noqa: S102
+    return old
+
+
+def size(term: object) -> int:
+    count = 0
+    stack = [term]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, tuple | list):
+            stack.extend(item)  # pyright: ignore[reportUnknownArgumentType]
+        elif hasattr(item, "tag"):
+            count += 1
+            stack.extend(item.__dict__.values())
+    return count
+
+
+def deep(depth: int) -> Term:
+    # begin 0 (let ((v (begin 0 (let ... x)))) v)
+    term: Term = Reference(name="x")
+    for _ in range(depth):
+        term = Begin(effects=[Immediate(value=0)], value=Let(bindings=[("v", term)], body=Reference(name="v")))
+    return term
+
+
+def clear(*modules: ModuleType) -> None:
+    for module in modules:
+        for value in vars(module).values():
+            if hasattr(value, "clear") and type(value).__name__ == "IdentityMemo":
+                value.clear()
+
+
+def measure(run: Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def passes(modules: dict[str, ModuleType], term: Term, l2: Any) -> dict[str, Callable[[], object]]:
+    check, uniqify, eliminate_letrec, to_python, folding, dce = modules.values()
+
+    def fold() -> object:
+        clear(folding)
+        return folding.constant_folding_term(l2, context={})
+
+    def eliminate() -> object:
+        clear(dce)
+        return dce.dead_code_elimination_term(l2)
+
+    return {
+        "check_term": partial(check.check_term, term, {"x": None, "y": None}),
+        "uniqify_term": lambda: uniqify.uniqify_term(term, {"x": "x", "y": "y"}, SequentialNameGenerator()),
+        "eliminate_letrec_term": partial(eliminate_letrec.eliminate_letrec_term, term, {}),
+        "to_ast_term": partial(to_python.to_ast_term, term),
+        "constant_folding_term": fold,
+        "dead_code_elimination_term": eliminate,
+    }
+
+
+def main() -> None:
+    current = {
+        module.__name__: module
+        for module in [L3.check, L3.uniqify, L3.eliminate_letrec, L3.to_python, L2.constant_folding, L2.dead_code_elim]
+    }
+    old = {name: baseline(module) for name, module in current.items()}
+
+    # letrec rather than let so that every binding can see the ones before it
+    program = parse_program(generate(100_000).replace("(let (", "(letrec (", 1))
+    assert isinstance(program, Program)
+    l2 = L3.eliminate_letrec.eliminate_letrec_term(program.body, {})
+    nodes = size(program.body)
+
+    print(f"{nodes} nodes; ns per node, best of 3")
+    print(f"{'pass':<28}{'recursive':>12}{'traverse':>12}{'ratio':>8}")
+    old_runs, new_runs = passes(old, program.body, l2), passes(current, program.body, l2)
+    for name in old_runs:
+        before = measure(old_runs[name]) / nodes * 1e9
+        after = measure(new_runs[name]) / nodes * 1e9
+        print(f"{name:<28}{before:>12.0f}{after:>12.0f}{after / before:>8.2f}")
+
+    term = deep(DEPTH)
+    l2 = L3.eliminate_letrec.eliminate_letrec_term(term, {})
+    print(f"\nnesting depth {DEPTH} (recursion limit {sys.getrecursionlimit()}); seconds")
+    old_runs, new_runs = passes(old, term, l2), passes(current, term, l2)
+    for name in old_runs:
+        try:
+            old_runs[name]()
+            before = "ok"
+        except RecursionError:
+            before = "RecursionError"
+        after = measure(new_runs[name], repeat=1)
+        print(f"{name:<28}{before:>16}{after:>10.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Per-pass time and memory per node, with validated and with trusted node construction.
+
+The validated column swaps trusted for the models' own constructors in every pass, which
+is how the passes built nodes before.
+
+Run with `uv run python packages/L3/bench/bench_trusted.py`.
+"""
+
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Any
+
+import L2.branch_elimination
+import L2.constant_folding
+import L2.constant_propagation
+import L2.cps_convert
+import L2.dead_code_elim
+import L2.optimize
+import L3.eliminate_letrec
+import L3.uniqify
+from bench_parse import generate
+from L2.branch_elimination import branch_elimination_term
+from L2.constant_folding import constant_folding_term
+from L2.constant_propagation import constant_propagation_term
+from L2.cps_convert import cps_convert_program
+from L2.dead_code_elim import dead_code_elimination_term
+from L2.syntax import Program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.uniqify import uniqify_program
+from pydantic import BaseModel
+from util.sequential_name_generator import SequentialNameGenerator
+from util.trusted import trusted
+
+MODULES: list[ModuleType] = [
+    L2.branch_elimination,
+    L2.constant_folding,
+    L2.constant_propagation,
+    L2.cps_convert,
+    L2.dead_code_elim,
+    L2.optimize,
+    L3.eliminate_letrec,
+    L3.uniqify,
+]
+
+
+def validated[T: BaseModel](cls: type[T], /, **fields: Any) -> T:
+    return cls(**fields)
+
+
+@contextmanager
+def construction(build: Callable[..., Any]) -> Iterator[None]:
+    for module in MODULES:
+        vars(module)["trusted"] = build
+    try:
+        yield
+    finally:
+        for module in MODULES:
+            vars(module)["trusted"] = trusted
+
+
+def count(node: object) -> int:
+    nodes = 0
+    stack = [node]
+    while stack:
+        match stack.pop():
+            case BaseModel() as model:
+                nodes += 1
+                stack.extend(getattr(model, name) for name in type(model).model_fields)
+            case list() | tuple() as items:  # pyright: ignore[reportUnknownVariableType]
+                stack.extend(items)  # pyright: ignore[reportUnknownArgumentType]
+            case _:
+                pass
+    return nodes
+
+
+def measure(run: Callable[[], object], repeat: int) -> tuple[float, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = run()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, retained / count(result)
+
+
+def main() -> None:
+    # generate binds each name in terms of earlier ones, which needs letrec's scoping
+    source = generate(256 << 10).replace("(let (", "(letrec (", 1)
+    l3 = parse_program(source)
+    _, uniqified = uniqify_program(l3)
+    l2 = eliminate_letrec_program(uniqified)
+    body = l2.body
+
+    passes: list[tuple[str, Callable[[], object]]] = [
+        ("uniqify", lambda: uniqify_program(l3)[1]),
+        ("eliminate_letrec", lambda: eliminate_letrec_program(uniqified)),
+        ("constant_propagation", lambda: constant_propagation_term(body, env={})),
+        ("constant_folding", lambda: constant_folding_term(body, context={})),
+        ("dead_code_elimination", lambda: dead_code_elimination_term(body)),
+        ("branch_elimination", lambda: branch_elimination_term(body)),
+        (
+            "cps_convert",
+            lambda: cps_convert_program(Program(parameters=l2.parameters, body=body), SequentialNameGenerator()),
+        ),
+    ]
+
+    print(f"{count(l2)} L2 nodes")
+    print(
+        f"{'pass':<24}{'validated (s)':>15}{'trusted (s)':>13}{'speedup':>9}{'B/node before':>15}{'B/node after':>14}"
+    )
+    for name, run in passes:
+        with construction(validated):
+            before, before_bytes = measure(run, 5)
+        after, after_bytes = measure(run, 5)
+        print(
+            f"{name:<24}{before:>15.4f}{after:>13.4f}{before / after:>8.2f}x{before_bytes:>15.0f}{after_bytes:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
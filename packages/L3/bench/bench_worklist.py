@@ -0,0 +1,102 @@
+"""
+optimize_program's fixed point, before and after every pass kept its results by node.
+
+Before, constant propagation and branch elimination are loaded from BASELINE with git and
+walk the whole program in every round; folding and dead code elimination were memoized
+already. After, all four answer a subterm the previous round left alone from their memo,
+so a round walks only what the round before rebuilt and the Lets and other nodes above
+it. Both sides run the same -O2 pipeline from the same L2 program and must agree; the
+memo tables are cleared before every run.
+
+Each input puts a small region that takes many rounds to settle next to a lot of code
+that settles in the first: a chain of 40 lets where each round makes one more binding a
+constant. Beside, the settled code is one value of the Let around the chain, and a round
+after the first costs about the same however large it is. Inside, the chain is the body
+of the letrec of the settled code, so every round rebuilds that letrec's Let and Begin
+and probes the memo for each of their thousands of children: after is then linear in
+the settled code too, only with a smaller constant than before.
+
+Run with `uv run python packages/L3/bench/bench_worklist.py`.
+"""
+
+import L2.branch_elimination
+import L2.constant_folding
+import L2.constant_propagation
+import L2.dead_code_elim
+from bench_parse import generate
+from bench_traverse import baseline, clear, measure, size
+from L2.optimize import DEFAULT_PIPELINE, PASSES, optimize_program
+from L2.pass_manager import Pass, Pipeline
+from L2.syntax import Program as L2Program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.parse import parse_program
+from L3.syntax import Program
+from L3.uniqify import uniqify_program
+
+BASELINE = "cd1054d"
+MODULES = [L2.constant_propagation, L2.constant_folding, L2.dead_code_elim, L2.branch_elimination]
+
+
+def old_pipeline() -> Pipeline:
+    propagation, branches = baseline(L2.constant_propagation, BASELINE), baseline(L2.branch_elimination, BASELINE)
+    replaced = {
+        "propagate": Pass("propagate", lambda term, analyses: propagation.constant_propagation_term(term, env={})),
+        "branch": Pass("branch", lambda term, analyses: branches.branch_elimination_term(term)),
+    }
+    return [(replaced.get(step.name, PASSES[step.name]), limit) for step, limit in DEFAULT_PIPELINE]
+
+
+def slow(depth: int) -> str:
+    # (let ((a0 0)) (let ((a1 (+ a0 1))) ... a(depth-1))): propagation runs before folding,
+    # so each round makes one more binding a constant
+    source = f"a{depth - 1}"
+    for index in reversed(range(1, depth)):
+        source = f"(let ((a{index} (+ a{index - 1} 1))) {source})"
+    return f"(let ((a0 0)) {source})"
+
+
+def program(kilobytes: int, depth: int, inside: bool) -> Program:
+    # generate binds each name in terms of earlier ones, which needs letrec's scoping
+    source = generate(kilobytes << 10).replace("(let (", "(letrec (", 1)
+    # its body is the last name: (l3 (x y) (letrec (...) vN))
+    head, _, last = source.rpartition(" ")
+    last = last.rstrip(")")
+    if inside:
+        # the chain in the body of the letrec, so every round rebuilds it
+        source = f"{head} (+ {last} {slow(depth)})))"
+    else:
+        # the letrec as one value beside the chain
+        letrec = head.removeprefix("(l3 (x y) ")
+        source = f"(l3 (x y) (let ((w {letrec} {last}))) (+ w {slow(depth)})))"
+    parsed = parse_program(source)
+    assert isinstance(parsed, Program)
+    return parsed
+
+
+def main() -> None:
+    old = old_pipeline()
+    print(f"{'input':<30}{'nodes':>8}{'before (s)':>12}{'us/node':>9}{'after (s)':>11}{'us/node':>9}")
+    for inside in (False, True):
+        for kilobytes in (16, 32, 64, 128):
+            l2 = eliminate_letrec_program(uniqify_program(program(kilobytes, 40, inside))[1])
+            nodes = size(l2.body)
+
+            def before(l2: L2Program = l2) -> L2Program:
+                clear(*MODULES)
+                return optimize_program(l2, old)
+
+            def after(l2: L2Program = l2) -> L2Program:
+                clear(*MODULES)
+                return optimize_program(l2)
+
+            assert before() == after()
+            old_time, new_time = measure(before), measure(after)
+            name = f"generated {kilobytes}KB {'inside' if inside else 'beside'}"
+            print(
+                f"{name:<30}{nodes:>8}{old_time:>12.3f}{old_time / nodes * 1e6:>9.1f}"
+                f"{new_time:>11.3f}{new_time / nodes * 1e6:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+from collections import defaultdict
+from hashlib import blake2b
+
+from util.sequential_name_generator import SequentialNameGenerator
+from util.trusted import trusted
+
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Identifier,
+    Immediate,
+    Let,
+    LetRec,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+    Term,
+)
+
+"""
+Alpha-equivalence: hashing and naming that do not depend on the names binders choose.
+
+alpha_hash gives a digest of a term's structure in which every bound reference is
+replaced by its de Bruijn-style position: how many binder groups (a Let's, a LetRec's or
+an Abstract's) lie between it and its binder, and its binder's place in the group. Free
+references keep their names. Terms that differ only in the names of their binders hash
+the same.
+
+canonical_program renames every binder of a program, parameters included, to v0, v1, ...
+in the order the binders are reached, so alpha-equivalent programs come out identical.
+The names are unique, as uniqify's are.
+
+Both walk the term with an explicit stack and keep, for each name, a stack of the
+binders in scope, so they take linear time whatever the depth. Scoping follows check: a
+Let's values are outside its binders, a LetRec's are inside.
+"""
+
+# stack events; a _VISIT goes on to the term
+_VISIT, _BIND, _UNBIND, _BUILD = range(4)
+
+
+def _digest(label: str, children: list[bytes]) -> bytes:
+    digest = blake2b(f"{label}\0".encode(), digest_size=16)
+    for child in children:
+        digest.update(child)
+    return digest.digest()
+
+
+def alpha_hash(term: Term | Program) -> bytes:
+    # binder levels in scope for each name: (level, position in its group)
+    scopes: defaultdict[Identifier, list[tuple[int, int]]] = defaultdict(list)
+    level = 0
+    digests: list[bytes] = []
+    stack: list[tuple[int, object, object]] = [(_VISIT, term, None)]
+
+    while stack:
+        event, item, extra = stack.pop()
+
+        if event == _BIND:
+            level += 1
+            for position, name in enumerate(item):  # pyright: ignore[reportArgumentType]
+                scopes[name].append((level, position))
+            continue
+
+        if event == _UNBIND:
+            for name in item:  # pyright: ignore[reportGeneralTypeIssues]
+                scopes[name].pop()
+            level -= 1
+            continue
+
+        if event == _BUILD:
+            # item is the label, extra the number of children
+            children = digests[len(digests) - extra :]  # pyright: ignore[reportOperatorIssue]
+            del digests[len(digests) - extra :]  # pyright: ignore[reportOperatorIssue]
+            digests.append(_digest(item, children))  # pyright: ignore[reportArgumentType]
+            continue
+
+        children: list[Term]
+        match item:
+            case Program(parameters=parameters, body=body):
+                stack.append((_BUILD, f"program {len(parameters)}", 1))
+                stack.append((_UNBIND, parameters, None))
+                stack.append((_VISIT, body, None))
+                stack.append((_BIND, parameters, None))
+                continue
+
+            case Let(bindings=bindings, body=body):
+                names = [name for name, _ in bindings]
+                stack.append((_BUILD, f"let {len(bindings)}", len(bindings) + 1))
+                stack.append((_UNBIND, names, None))
+                stack.append((_VISIT, body, None))
+                stack.append((_BIND, names, None))
+                stack.extend((_VISIT, value, None) for _, value in reversed(bindings))
+                continue
+
+            case LetRec(bindings=bindings, body=body):
+                names = [name for name, _ in bindings]
+                stack.append((_BUILD, f"letrec {len(bindings)}", len(bindings) + 1))
+                stack.append((_UNBIND, names, None))
+                stack.append((_VISIT, body, None))
+                stack.extend((_VISIT, value, None) for _, value in reversed(bindings))
+                stack.append((_BIND, names, None))
+                continue
+
+            case Abstract(parameters=parameters, body=body):
+                stack.append((_BUILD, f"abstract {len(parameters)}", 1))
+                stack.append((_UNBIND, parameters, None))
+                stack.append((_VISIT, body, None))
+                stack.append((_BIND, parameters, None))
+                continue
+
+            case Reference(name=name):
+                if scopes[name]:
+                    binder, position = scopes[name][-1]
+                    digests.append(_digest(f"bound {level - binder} {position}", []))
+                else:
+                    digests.append(_digest(f"free {name}", []))
+                continue
+
+            case Apply(target=target, arguments=arguments):
+                label, children = f"apply {len(arguments)}", [target, *arguments]
+
+            case Immediate(value=value):
+                label, children = f"immediate {value}", []
+
+            case Primitive(operator=operator, left=left, right=right):
+                label, children = f"primitive {operator}", [left, right]
+
+            case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
+                label, children = f"branch {operator}", [left, right, consequent, otherwise]
+
+            case Allocate(count=count):
+                label, children = f"allocate {count}", []
+
+            case Load(base=base, index=index):
+                label, children = f"load {index}", [base]
+
+            case Store(base=base, index=index, value=value):
+                label, children = f"store {index}", [base, value]
+
+            case Begin(effects=effects, value=value):  # pragma: no branch
+                label, children = f"begin {len(effects)}", [*effects, value]
+
+        stack.append((_BUILD, label, len(children)))
+        stack.extend((_VISIT, child, None) for child in reversed(children))
+
+    return digests[0]
+
+
+def canonical_program(program: Program) -> tuple[SequentialNameGenerator, Program]:
+    fresh = SequentialNameGenerator()
+    scopes: defaultdict[Identifier, list[Identifier]] = defaultdict(list)
+    terms: list[Term] = []
+    # _VISIT a term, _BIND or _UNBIND names (to their new names) or _BUILD a node from the
+    # last terms built, given the node and its new binder names
+    stack: list[tuple[int, object, object]] = [(_VISIT, program.body, None)]
+
+    def bind(names: object, renamed: object) -> None:
+        for name, new in zip(names, renamed, strict=True):  # pyright: ignore[reportArgumentType]
+            scopes[name].append(new)
+
+    def unbind(names: object) -> None:
+        for name in names:  # pyright: ignore[reportGeneralTypeIssues]
+            scopes[name].pop()
+
+    parameters = [fresh("v") for _ in program.parameters]
+    bind(program.parameters, parameters)
+
+    while stack:
+        event, item, extra = stack.pop()
+
+        if event == _BIND:
+            bind(item, extra)
+            continue
+
+        if event == _UNBIND:
+            unbind(item)
+            continue
+
+        if event == _BUILD:
+            terms.append(_build(item, extra, terms))  # pyright: ignore[reportArgumentType]
+            continue
+
+        match item:
+            case Let(bindings=bindings, body=body):
+                names = [name for name, _ in bindings]
+                renamed = [fresh("v") for _ in bindings]
+                stack.append((_BUILD, item, renamed))
+                stack.append((_UNBIND, names, None))
+                stack.append((_VISIT, body, None))
+                stack.append((_BIND, names, renamed))
+                stack.extend((_VISIT, value, None) for _, value in reversed(bindings))
+
+            case LetRec(bindings=bindings, body=body):
+                names = [name for name, _ in bindings]
+                renamed = [fresh("v") for _ in bindings]
+                stack.append((_BUILD, item, renamed))
+                stack.append((_UNBIND, names, None))
+                stack.append((_VISIT, body, None))
+                stack.extend((_VISIT, value, None) for _, value in reversed(bindings))
+                stack.append((_BIND, names, renamed))
+
+            case Abstract(parameters=names, body=body):
+                renamed = [fresh("v") for _ in names]
+                stack.append((_BUILD, item, renamed))
+                stack.append((_UNBIND, names, None))
+                stack.append((_VISIT, body, None))
+                stack.append((_BIND, names, renamed))
+
+            case Reference(name=name):
+                terms.append(trusted(Reference, name=scopes[name][-1]) if scopes[name] else item)  # pyright: ignore[reportArgumentType]
+
+            case Immediate() | Allocate():
+                terms.append(item)  # pyright: ignore[reportArgumentType]
+
+            case Apply(target=target, arguments=arguments):
+                stack.append((_BUILD, item, None))
+                stack.extend((_VISIT, child, None) for child in reversed([target, *arguments]))
+
+            case Primitive(left=left, right=right):
+                stack.append((_BUILD, item, None))
+                stack.extend([(_VISIT, right, None), (_VISIT, left, None)])
+
+            case Branch(left=left, right=right, consequent=consequent, otherwise=otherwise):
+                stack.append((_BUILD, item, None))
+                stack.extend((_VISIT, child, None) for child in reversed([left, right, consequent, otherwise]))
+
+            case Load(base=base):
+                stack.append((_BUILD, item, None))
+                stack.append((_VISIT, base, None))
+
+            case Store(base=base, value=value):
+                stack.append((_BUILD, item, None))
+                stack.extend([(_VISIT, value, None), (_VISIT, base, None)])
+
+            case Begin(effects=effects, value=value):  # pragma: no branch
+                stack.append((_BUILD, item, None))
+                stack.extend((_VISIT, child, None) for child in reversed([*effects, value]))
+
+    return fresh, trusted(Program, parameters=parameters, body=terms[0])
+
+
+def _build(term: Term, renamed: list[Identifier] | None, terms: list[Term]) -> Term:
+    # term rebuilt from the last terms built, which are its children's new versions
+    def take(count: int) -> list[Term]:
+        children = terms[len(terms) - count :]
+        del terms[len(terms) - count :]
+        return children
+
+    match term:
+        case Let(bindings=bindings):
+            *values, body = take(len(bindings) + 1)
+            return trusted(Let, bindings=list(zip(renamed, values, strict=True)), body=body)  # pyright: ignore[reportArgumentType]
+
+        case LetRec(bindings=bindings):
+            *values, body = take(len(bindings) + 1)
+            return trusted(LetRec, bindings=list(zip(renamed, values, strict=True)), body=body)  # pyright: ignore[reportArgumentType]
+
+        case Abstract():
+            return trusted(Abstract, parameters=renamed, body=take(1)[0])
+
+        case Apply(arguments=arguments):
+            target, *arguments = take(len(arguments) + 1)
+            return trusted(Apply, target=target, arguments=arguments)
+
+        case Primitive(operator=operator):
+            left, right = take(2)
+            return trusted(Primitive, operator=operator, left=left, right=right)
+
+        case Branch(operator=operator):
+            left, right, consequent, otherwise = take(4)
+            return trusted(
+                Branch, operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise
+            )
+
+        case Load(index=index):
+            return trusted(Load, base=take(1)[0], index=index)
+
+        case Store(index=index):
+            base, value = take(2)
+            return trusted(Store, base=base, index=index, value=value)
+
+        case Begin(effects=effects):  # pragma: no branch
+            *effects, value = take(len(effects) + 1)
+            return trusted(Begin, effects=effects, value=value)
@@ -0,0 +1,29 @@
+from util.binary import Codec
+
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    LetRec,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+
+"""
+L3 programs in the binary IR format (see util.binary).
+
+The order of the classes fixes their tags; appending a class, or changing one's fields,
+changes the format's fingerprint, so files written before are rejected.
+"""
+
+CODEC = Codec(
+    "l3",
+    [Program, Let, LetRec, Reference, Abstract, Apply, Immediate, Primitive, Branch, Allocate, Load, Store, Begin],
+)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import sys
+import time
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import util
+from util.sequential_name_generator import SequentialNameGenerator
+
+from .binary import CODEC
+from .syntax import Program
+
+"""
+A persistent cache of checked and uniqified L3 programs.
+
+Entries are keyed on a hash of the source, the compiler (its version, a hash of its own
+source and the Python that runs it) and the options that change the front end's output,
+so a hit can go straight to letrec elimination. A compiler that changes without a new
+version number does not read the entries an older one wrote. Each
+entry holds the program and the state of the fresh-name generator that produced it,
+in the binary IR format (see L3.binary).
+"""
+
+# The start of every entry, and part of every key: changed whenever the entry format does.
+_MAGIC = b"L3C2"
+_SUFFIX = ".l3c"
+
+
+def _entry(value: object) -> tuple[dict[str, int], Program]:
+    match value:
+        case (Program() as program, tuple() as counters):
+            return dict(counters), program
+
+        case _:
+            raise ValueError("malformed cache entry")
+
+
+def compiler_version() -> str:
+    try:
+        return version("L3")
+    except PackageNotFoundError:  # pragma: no cover
+        return "unknown"
+
+
+@cache
+def compiler_digest() -> str:
+    # a hash of the source of the packages the cached programs come out of: the front end
+    # and the util it builds them with, grammar included
+    digest = hashlib.sha256()
+    for package in (sys.modules[__package__], util):
+        root = Path(package.__file__).parent  # pyright: ignore[reportArgumentType]
+        for path in sorted(path for path in root.rglob("*") if path.suffix in {".py", ".lark"}):
+            digest.update(f"{path.relative_to(root).as_posix()}\0".encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class ProgramCache:
+    def __init__(self, directory: Path, max_bytes: int = 64 << 20) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, path: Path, check: bool) -> str:
+        digest = hashlib.sha256()
+        parts = (_MAGIC, compiler_version(), compiler_digest(), sys.version, "check" if check else "no-check")
+        for part in parts:
+            digest.update(f"{part}\0".encode())
+        with path.open("rb") as file:
+            hashlib.file_digest(file, lambda: digest)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> tuple[SequentialNameGenerator, Program] | None:
+        path = self.directory / f"{key}{_SUFFIX}"
+
+        try:
+            data = path.read_bytes()
+            if not data.startswith(_MAGIC):
+                raise ValueError("not a cache entry")
+            counters, program = _entry(CODEC.loads(memoryview(data)[len(_MAGIC) :]))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except ValueError, TypeError, IndexError:
+            # a corrupt or foreign entry is dropped and treated as a miss
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        self._touch(path)
+        self.hits += 1
+        return SequentialNameGenerator(counters), program
+
+    def put(self, key: str, fresh: SequentialNameGenerator, program: Program) -> None:
+        path = self.directory / f"{key}{_SUFFIX}"
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+
+        temporary.write_bytes(_MAGIC + CODEC.dumps((program, tuple(fresh.counters.items()))))
+        temporary.replace(path)
+
+        self._touch(path)
+        self._evict()
+
+    def report(self) -> str:
+        return f"cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+    def _touch(self, path: Path) -> None:
+        # modification times order the entries from least to most recently used
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def _evict(self) -> None:
+        entries = [(entry.stat(), entry) for entry in self.directory.glob(f"*{_SUFFIX}")]
+        entries.sort(key=lambda entry: entry[0].st_mtime_ns)
+
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
@@ -1,6 +1,8 @@
 from collections import Counter
-from collections.abc import Mapping
-from functools import partial
+from collections.abc import Mapping, Sequence
+
+from util.scoped_map import ScopedMap
+from util.traverse import Traversal, Visit
 
 from .syntax import (
     Abstract,
@@ -21,85 +23,134 @@ from .syntax import (
 )
 
 type Context = Mapping[Identifier, None]
+# the names in scope during a walk, bound and unbound as it enters and leaves binders
+type Scope = ScopedMap[Identifier, None]
 
 
-def check_term(
-    term: Term,
-    context: Context,
-) -> None:
-    recur = partial(check_term, context=context)
+# The checks on binders and references, shared with the fused front end so that both
+# raise the same errors.
 
-    match term:
-        case Let(bindings=bindings, body=body):
-            counts = Counter(name for name, _ in bindings)
-            duplicates = {name: count for name, count in counts.items() if count > 1}
-            if duplicates:
-                raise ValueError(f"duplicate binders: {duplicates}")
 
-            for _, value in bindings:
-                recur(value)
+def check_binders(bindings: Sequence[tuple[Identifier, Term]]) -> None:
+    counts = Counter(name for name, _ in bindings)
+    duplicates = {name: count for name, count in counts.items() if count > 1}
+    if duplicates:
+        raise ValueError(f"duplicate binders: {duplicates}")
 
-            local = dict.fromkeys([name for name, _ in bindings])
-            recur(body, context={**context, **local})
 
-        case LetRec(bindings=bindings, body=body):
-            counts = Counter(name for name, _ in bindings)
-            duplicates = {name: count for name, count in counts.items() if count > 1}
-            if duplicates:
-                raise ValueError(f"duplicate binders: {duplicates}")
+def check_parameters(parameters: Sequence[Identifier]) -> None:
+    counts = Counter(parameters)
+    duplicates = {name for name, count in counts.items() if count > 1}
+    if duplicates:
+        raise ValueError(f"duplicate parameters: {duplicates}")
 
-            local = dict.fromkeys([name for name, _ in bindings])
 
-            for name, value in bindings:
-                recur(value, context={**context, **local})
+def check_reference(name: Identifier, context: Mapping[Identifier, object]) -> None:
+    if name not in context:
+        raise ValueError(f"unknown variable: {name}")
 
-            check_term(body, {**context, **local})
 
-        case Reference(name=name):
-            if name not in context:
-                raise ValueError(f"unknown variable: {name}")
+def _let(term: Let, context: Scope) -> Visit[None]:
+    check_binders(term.bindings)
 
-        case Abstract(parameters=parameters, body=body):
-            counts = Counter(parameters)
-            duplicates = {name for name, count in counts.items() if count > 1}
-            if duplicates:
-                raise ValueError(f"duplicate parameters: {duplicates}")
+    for _, value in term.bindings:
+        yield value, context
 
-            local = dict.fromkeys(parameters, None)
-            recur(body, context={**context, **local})
+    mark = context.mark()
+    for name, _ in term.bindings:
+        context.bind(name, None)
+    yield term.body, context
+    context.undo(mark)
+
+
+def _letrec(term: LetRec, context: Scope) -> Visit[None]:
+    check_binders(term.bindings)
+
+    mark = context.mark()
+    for name, _ in term.bindings:
+        context.bind(name, None)
+
+    for _, value in term.bindings:
+        yield value, context
+
+    yield term.body, context
+    context.undo(mark)
+
+
+def _reference(term: Reference, context: Scope) -> None:
+    check_reference(term.name, context)
+
+
+def _abstract(term: Abstract, context: Scope) -> Visit[None]:
+    check_parameters(term.parameters)
+
+    mark = context.mark()
+    for parameter in term.parameters:
+        context.bind(parameter, None)
+    yield term.body, context
+    context.undo(mark)
 
-        case Apply(target=target, arguments=arguments):
-            recur(target)
-            for argument in arguments:
-                recur(argument)
 
-        case Immediate(value=_value):
-            pass
+def _apply(term: Apply, context: Scope) -> Visit[None]:
+    yield term.target, context
+    for argument in term.arguments:
+        yield argument, context
 
-        case Primitive(operator=_operator, left=left, right=right):
-            recur(left)
-            recur(right)
 
-        case Branch(operator=_operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            recur(left)
-            recur(right)
-            recur(consequent)
-            recur(otherwise)
+def _leaf(term: Immediate | Allocate, context: Scope) -> None:
+    pass
 
-        case Allocate(count=_count):
-            pass
 
-        case Load(base=base, index=_index):
-            recur(base)
+def _primitive(term: Primitive, context: Scope) -> Visit[None]:
+    yield term.left, context
+    yield term.right, context
 
-        case Store(base=base, index=_index, value=value):
-            recur(base)
-            recur(value)
 
-        case Begin(effects=effects, value=value):  # pragma: no branch
-            for effect in effects:
-                recur(effect)
-            recur(value)
+def _branch(term: Branch, context: Scope) -> Visit[None]:
+    yield term.left, context
+    yield term.right, context
+    yield term.consequent, context
+    yield term.otherwise, context
+
+
+def _load(term: Load, context: Scope) -> Visit[None]:
+    yield term.base, context
+
+
+def _store(term: Store, context: Scope) -> Visit[None]:
+    yield term.base, context
+    yield term.value, context
+
+
+def _begin(term: Begin, context: Scope) -> Visit[None]:
+    for effect in term.effects:
+        yield effect, context
+    yield term.value, context
+
+
+_check = Traversal[None](
+    {
+        "let": _let,
+        "letrec": _letrec,
+        "reference": _reference,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _leaf,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _leaf,
+        "load": _load,
+        "store": _store,
+        "begin": _begin,
+    }
+)
+
+
+def check_term(
+    term: Term,
+    context: Context,
+) -> None:
+    _check(term, ScopedMap(context))
 
 
 def check_program(
@@ -107,10 +158,7 @@ def check_program(
 ) -> None:
     match program:
         case Program(parameters=parameters, body=body):  # pragma: no branch
-            counts = Counter(parameters)
-            duplicates = {name for name, count in counts.items() if count > 1}
-            if duplicates:
-                raise ValueError(f"duplicate parameters: {duplicates}")
+            check_parameters(parameters)
 
             local = dict.fromkeys(parameters, None)
             check_term(body, context=local)
@@ -1,106 +1,148 @@
 #  Made to convert L3 into L2
-
 # L3.Reference(name = name) becomes
 # if name is a recursive variable -> Load(reference name)))
 # else return Reference(name = name)
 # noqa: F841
 from collections.abc import Mapping
-from functools import partial
 
 from L2 import syntax as L2
+from util.scoped_map import ScopedMap
+from util.traverse import Traversal, Visit, each
+from util.trusted import trusted
 
 from . import syntax as L3
 
 type Context = Mapping[L3.Identifier, None]
+# the letrec binders in scope during a walk
+type Scope = ScopedMap[L3.Identifier, None]
+
+
+def _let(term: L3.Let, context: Scope) -> Visit[L2.Term]:
+    # we can just convert the let into an L2 let since it is the same in both languages
+    values = yield from each((value, context) for _, value in term.bindings)
+    return trusted(
+        L2.Let,
+        bindings=[(name, value) for (name, _), value in zip(term.bindings, values, strict=True)],
+        body=(yield term.body, context),
+    )
+
+
+def _letrec(term: L3.LetRec, context: Scope) -> Visit[L2.Term]:
+    # need to convert the letrec into a let
+    # the bindings can be rebound to the same name in the body
+    # the load should be obtained by reference I think
+    mark = context.mark()
+    for name, _ in term.bindings:
+        context.bind(name, None)
+    values = yield from each((value, context) for _, value in term.bindings)
+    body = yield term.body, context
+    context.undo(mark)
+    return trusted(
+        L2.Let,
+        bindings=[(name, value) for (name, _), value in zip(term.bindings, values, strict=True)],
+        body=body,
+    )
+
+
+def _reference(term: L3.Reference, context: Scope) -> L2.Term:
+    # if name is a recursive variable -> (Load (Reference name)))
+    # else (Reference name)
+    if term.name in context:
+        # if its not in the context then it is a recursive variable so we need to return a load of the reference
+        return trusted(L2.Load, base=trusted(L2.Reference, name=term.name), index=0)
+    else:  # otherwise we can just return the reference in L2
+        return trusted(L2.Reference, name=term.name)
+
+
+def _abstract(term: L3.Abstract, context: Scope) -> Visit[L2.Term]:  # unchanged
+    return trusted(
+        L2.Abstract,
+        parameters=term.parameters,
+        body=(yield term.body, context),
+    )
+
+
+def _apply(term: L3.Apply, context: Scope) -> Visit[L2.Term]:  # unchanged
+    return trusted(
+        L2.Apply,
+        target=(yield term.target, context),
+        arguments=(yield from each((arg, context) for arg in term.arguments)),
+    )
+
+
+def _immediate(term: L3.Immediate, context: Scope) -> L2.Term:
+    return trusted(L2.Immediate, value=term.value)
+
+
+def _primitive(term: L3.Primitive, context: Scope) -> Visit[L2.Term]:
+    return trusted(
+        L2.Primitive,
+        operator=term.operator,
+        left=(yield term.left, context),
+        right=(yield term.right, context),
+    )
+
+
+def _branch(term: L3.Branch, context: Scope) -> Visit[L2.Term]:  # unchanged
+    return trusted(
+        L2.Branch,
+        operator=term.operator,
+        left=(yield term.left, context),
+        right=(yield term.right, context),
+        consequent=(yield term.consequent, context),
+        otherwise=(yield term.otherwise, context),
+    )
+
+
+def _allocate(term: L3.Allocate, context: Scope) -> L2.Term:  # unchanged
+    return trusted(L2.Allocate, count=term.count)
+
+
+def _load(term: L3.Load, context: Scope) -> Visit[L2.Term]:  # unchanged
+    return trusted(
+        L2.Load,
+        base=(yield term.base, context),
+        index=term.index,
+    )
+
+
+def _store(term: L3.Store, context: Scope) -> Visit[L2.Term]:  # unchanged
+    return trusted(
+        L2.Store,
+        base=(yield term.base, context),
+        index=term.index,
+        value=(yield term.value, context),
+    )
+
+
+def _begin(term: L3.Begin, context: Scope) -> Visit[L2.Term]:
+    effects = yield from each((effect, context) for effect in term.effects)
+    return trusted(L2.Begin, effects=effects, value=(yield term.value, context))
+
+
+_eliminate_letrec = Traversal[L2.Term](
+    {
+        "let": _let,
+        "letrec": _letrec,
+        "reference": _reference,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _immediate,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _allocate,
+        "load": _load,
+        "store": _store,
+        "begin": _begin,
+    }
+)
 
 
 def eliminate_letrec_term(
     term: L3.Term,
     context: Context,
 ) -> L2.Term:
-    recur = partial(eliminate_letrec_term, context=context)
-
-    match term:
-        case L3.Let(
-            bindings=bindings, body=body
-        ):  # we can just convert the let into an L2 let since it is the same in both languages
-            return L2.Let(
-                bindings=[(name, recur(value)) for name, value in bindings],
-                body=recur(body),
-            )
-
-        case L3.LetRec(bindings=bindings, body=body):
-            # need to convert the letrec into a let
-            # the bindings can be rebound to the same name in the body
-            # the load should be obtained by reference I think
-            local: Context = dict.fromkeys((name for name, _ in bindings), None)
-            extended: Context = {**context, **local}
-            recur_extended = partial(eliminate_letrec_term, context=extended)
-            return L2.Let(
-                bindings=[(name, recur_extended(value)) for name, value in bindings],
-                body=recur_extended(body),
-            )
-
-        case L3.Reference(name=name):
-            # if name is a recursive variable -> (Load (Reference name)))
-            # else (Reference name)
-            if name in context:
-                # if its not in the context then it is a recursive variable so we need to return a load of the reference
-                return L2.Load(base=L2.Reference(name=name), index=0)
-            else:  # otherwise we can just return the reference in L2
-                return L2.Reference(name=name)
-
-        case L3.Abstract(parameters=_parameters, body=body):  # unchanged
-            return L2.Abstract(
-                parameters=_parameters,
-                body=recur(body),
-            )
-
-        case L3.Apply(target=_target, arguments=_arguments):  # unchanged
-            return L2.Apply(
-                target=recur(_target),
-                arguments=[recur(arg) for arg in _arguments],
-            )
-
-        case L3.Immediate(value=value):  # pragma: no branch
-            return L2.Immediate(value=value)
-
-        case L3.Primitive(operator=_operator, left=left, right=right):  # pragma: no branch
-            return L2.Primitive(
-                operator=_operator,
-                left=recur(left),
-                right=recur(right),
-            )
-
-        case L3.Branch(
-            operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise
-        ):  # unchanged
-            return L2.Branch(
-                operator=operator,
-                left=recur(left),
-                right=recur(right),
-                consequent=recur(consequent),
-                otherwise=recur(otherwise),
-            )
-
-        case L3.Allocate(count=count):  # unchanged
-            return L2.Allocate(count=count)
-
-        case L3.Load(base=base, index=index):  # unchanged
-            return L2.Load(
-                base=recur(base),
-                index=index,
-            )
-
-        case L3.Store(base=base, index=index, value=value):  # unchanged
-            return L2.Store(
-                base=recur(base),
-                index=index,
-                value=recur(value),
-            )
-
-        case L3.Begin(effects=effects, value=value):  # pragma: no branch
-            return L2.Begin(effects=[recur(effect) for effect in effects], value=recur(value))
+    return _eliminate_letrec(term, ScopedMap(context))
 
 
 def eliminate_letrec_program(
@@ -108,4 +150,4 @@ def eliminate_letrec_program(
 ) -> L2.Program:
     match program:
         case L3.Program(parameters=parameters, body=body):  # pragma: no branch
-            return L2.Program(parameters=parameters, body=eliminate_letrec_term(body, {}))
+            return trusted(L2.Program, parameters=parameters, body=eliminate_letrec_term(body, {}))
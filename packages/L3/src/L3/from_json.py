@@ -0,0 +1,180 @@
+import json
+import re
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, TextIO
+
+from pydantic import BaseModel
+
+from .syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    LetRec,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+
+"""
+Reads programs in the JSON interchange format (see examples/*.json).
+
+Every JSON object is turned into its L3 node, chosen by its "tag", as soon as the
+object closes, so only the node tree is ever built. This is a trust boundary: nodes
+are constructed with full validation.
+
+The streaming reader does the same from a file read in chunks, for inputs too large
+to hold as text and as a tree at the same time.
+"""
+
+_NODES: dict[str, type[BaseModel]] = {
+    "l3": Program,
+    "let": Let,
+    "letrec": LetRec,
+    "reference": Reference,
+    "abstract": Abstract,
+    "apply": Apply,
+    "immediate": Immediate,
+    "primitive": Primitive,
+    "branch": Branch,
+    "allocate": Allocate,
+    "load": Load,
+    "store": Store,
+    "begin": Begin,
+}
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        ([{}\[\]:,])                                   # punctuation
+      | ("(?:[^"\\]|\\.)*")                            # string
+      | (-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)  # number
+      | (true|false|null)                              # literal
+    )""",
+    re.VERBOSE,
+)
+_PUNCTUATION = 1
+
+
+def _node(fields: dict[str, Any]) -> BaseModel:
+    match fields:
+        case {"tag": str() as tag} if tag in _NODES:
+            return _NODES[tag].model_validate(fields)
+
+        case {"tag": tag}:
+            raise ValueError(f"unknown tag: {tag!r}")
+
+        case _:
+            raise ValueError(f"object without a tag: {sorted(fields)}")
+
+
+def _program(value: object) -> Program:
+    match value:
+        case Program():
+            return value
+
+        case _:
+            raise ValueError("expected an l3 program")
+
+
+def program_from_json(source: str | bytes) -> Program:
+    return _program(json.loads(source, object_hook=_node))
+
+
+def _tokens(file: TextIO, chunk_size: int) -> Iterator[tuple[int, str]]:
+    buffer = ""
+    position = 0
+    eof = False
+
+    while True:
+        match = _TOKEN.match(buffer, position)
+
+        # A token that runs to the end of the buffer may continue in the next chunk.
+        if match is None or (match.end() == len(buffer) and match.lastindex != _PUNCTUATION and not eof):
+            if eof:
+                if buffer[position:].strip():
+                    raise ValueError(f"invalid JSON near {buffer[position : position + 20]!r}")
+                return
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        position = match.end()
+        yield match.lastindex, match[match.lastindex]  # pyright: ignore[reportReturnType, reportArgumentType]
+
+
+def _read(file: TextIO, chunk_size: int) -> object:
+    # Objects and arrays under construction; each object's pending key is on `keys`.
+    stack: list[dict[str, object] | list[object]] = []
+    keys: list[str] = []
+    # "value", "key", "colon", "next" (a ',' or a close) or "done"
+    state = "value"
+    closable = False
+    result: object = None
+
+    for kind, text in _tokens(file, chunk_size):
+        match kind, text:
+            case 1, "}" | "]" if state == "next" or closable:
+                container = stack.pop()
+                if isinstance(container, dict) != (text == "}"):
+                    raise ValueError(f"mismatched {text!r} in JSON")
+                value = _node(container) if isinstance(container, dict) else container
+
+            case 1, "," if state == "next":
+                state = "key" if isinstance(stack[-1], dict) else "value"
+                continue
+
+            case 1, ":" if state == "colon":
+                state = "value"
+                continue
+
+            case 1, "{" | "[" if state == "value":
+                stack.append({} if text == "{" else [])
+                state = "key" if text == "{" else "value"
+                closable = True
+                continue
+
+            case 2, _ if state == "key":
+                keys.append(json.loads(text))
+                state = "colon"
+                closable = False
+                continue
+
+            case 2 | 3 | 4, _ if state == "value":
+                value = json.loads(text)
+
+            case _:
+                raise ValueError(f"unexpected {text!r} in JSON")
+
+        closable = False
+        state = "next"
+        match stack:
+            case []:
+                result = value
+                state = "done"
+
+            case [*_, list() as array]:
+                array.append(value)
+
+            case [*_, dict() as mapping]:  # pragma: no branch
+                mapping[keys.pop()] = value
+
+    if state != "done":
+        raise ValueError("unexpected end of JSON")
+
+    return result
+
+
+def program_from_json_file(path: Path, stream: bool = False, chunk_size: int = 1 << 16) -> Program:
+    with path.open(encoding="utf-8") as file:
+        if stream:
+            return _program(_read(file, chunk_size))
+
+        return _program(json.load(file, object_hook=_node))
@@ -0,0 +1,186 @@
+from collections.abc import Mapping
+
+from L2 import syntax as L2
+from util.scoped_map import ScopedMap
+from util.sequential_name_generator import SequentialNameGenerator
+from util.traverse import Traversal, Visit, each
+from util.trusted import trusted
+
+from . import syntax as L3
+from .check import check_binders, check_parameters, check_reference
+from .uniqify import Fresh
+
+"""
+check, uniqify and eliminate_letrec in one traversal.
+
+The three passes agree on scope: a name is in check's context exactly when uniqify has a
+fresh name for it, and eliminate_letrec turns a reference into a load exactly when its
+fresh name was bound by a letrec. So one context serves all three here: each name in
+scope maps to the L2 term its references become, a Reference to its fresh name or, for a
+letrec binder, a Load through it.
+
+The handlers visit nodes, check them and call fresh in the same order as the separate
+passes, so front_end_program raises the same errors and names binders the same way, and
+returns the same L2 Program as running the passes one after another. Those stay
+available for debugging, and to the cache, which keeps the uniqified L3.
+"""
+
+type Context = Mapping[L3.Identifier, L2.Term]
+type Scope = ScopedMap[L3.Identifier, L2.Term]
+
+
+def _let(term: L3.Let, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    if check:
+        check_binders(term.bindings)
+
+    bindings: list[tuple[L3.Identifier, L2.Term]] = []
+    for name, value in term.bindings:
+        # the value is outside the Let's scope; its name is fresh only after it
+        value = yield value, context, fresh, check
+        bindings.append((fresh(name), value))
+
+    mark = context.mark()
+    for (name, _), (fresh_name, _) in zip(term.bindings, bindings, strict=True):
+        context.bind(name, trusted(L2.Reference, name=fresh_name))
+    body = yield term.body, context, fresh, check
+    context.undo(mark)
+
+    return trusted(L2.Let, bindings=bindings, body=body)
+
+
+def _letrec(term: L3.LetRec, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    if check:
+        check_binders(term.bindings)
+
+    mark = context.mark()
+    names: dict[L3.Identifier, L3.Identifier] = {}
+    for name, _ in term.bindings:
+        names[name] = fresh(name)
+        context.bind(name, trusted(L2.Load, base=trusted(L2.Reference, name=names[name]), index=0))
+
+    values = yield from each((value, context, fresh, check) for _, value in term.bindings)
+    body = yield term.body, context, fresh, check
+    context.undo(mark)
+    return trusted(
+        L2.Let,
+        bindings=[(names[name], value) for (name, _), value in zip(term.bindings, values, strict=True)],
+        body=body,
+    )
+
+
+def _reference(term: L3.Reference, context: Scope, fresh: Fresh, check: bool) -> L2.Term:
+    if check:
+        check_reference(term.name, context)
+    return context[term.name]
+
+
+def _abstract(term: L3.Abstract, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    if check:
+        check_parameters(term.parameters)
+
+    mark = context.mark()
+    parameters: list[L3.Identifier] = []
+    for parameter in term.parameters:
+        parameters.append(fresh_name := fresh(parameter))
+        context.bind(parameter, trusted(L2.Reference, name=fresh_name))
+    body = yield term.body, context, fresh, check
+    context.undo(mark)
+
+    return trusted(L2.Abstract, parameters=parameters, body=body)
+
+
+def _apply(term: L3.Apply, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    target = yield term.target, context, fresh, check
+    arguments = yield from each((argument, context, fresh, check) for argument in term.arguments)
+    return trusted(L2.Apply, target=target, arguments=arguments)
+
+
+def _immediate(term: L3.Immediate, context: Scope, fresh: Fresh, check: bool) -> L2.Term:
+    return trusted(L2.Immediate, value=term.value)
+
+
+def _primitive(term: L3.Primitive, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    return trusted(
+        L2.Primitive,
+        operator=term.operator,
+        left=(yield term.left, context, fresh, check),
+        right=(yield term.right, context, fresh, check),
+    )
+
+
+def _branch(term: L3.Branch, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    return trusted(
+        L2.Branch,
+        operator=term.operator,
+        left=(yield term.left, context, fresh, check),
+        right=(yield term.right, context, fresh, check),
+        consequent=(yield term.consequent, context, fresh, check),
+        otherwise=(yield term.otherwise, context, fresh, check),
+    )
+
+
+def _allocate(term: L3.Allocate, context: Scope, fresh: Fresh, check: bool) -> L2.Term:
+    return trusted(L2.Allocate, count=term.count)
+
+
+def _load(term: L3.Load, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    return trusted(L2.Load, base=(yield term.base, context, fresh, check), index=term.index)
+
+
+def _store(term: L3.Store, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    base = yield term.base, context, fresh, check
+    value = yield term.value, context, fresh, check
+    return trusted(L2.Store, base=base, index=term.index, value=value)
+
+
+def _begin(term: L3.Begin, context: Scope, fresh: Fresh, check: bool) -> Visit[L2.Term]:
+    effects = yield from each((effect, context, fresh, check) for effect in term.effects)
+    return trusted(L2.Begin, effects=effects, value=(yield term.value, context, fresh, check))
+
+
+_front_end = Traversal[L2.Term](
+    {
+        "let": _let,
+        "letrec": _letrec,
+        "reference": _reference,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _immediate,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _allocate,
+        "load": _load,
+        "store": _store,
+        "begin": _begin,
+    }
+)
+
+
+def front_end_term(
+    term: L3.Term,
+    context: Context,
+    fresh: Fresh,
+    check: bool = True,
+) -> L2.Term:
+    return _front_end(term, ScopedMap(context), fresh, check)
+
+
+def front_end_program(
+    program: L3.Program,
+    check: bool = True,
+) -> tuple[SequentialNameGenerator, L2.Program]:
+    # check_program, uniqify_program and eliminate_letrec_program in one pass
+    fresh = SequentialNameGenerator()
+
+    match program:
+        case L3.Program(parameters=parameters, body=body):  # pragma: no branch
+            if check:
+                check_parameters(parameters)
+
+            local = {parameter: fresh(parameter) for parameter in parameters}
+            context = {parameter: trusted(L2.Reference, name=name) for parameter, name in local.items()}
+            return fresh, trusted(
+                L2.Program,
+                parameters=[local[parameter] for parameter in parameters],
+                body=front_end_term(body, context, fresh, check),
+            )
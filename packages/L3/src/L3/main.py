@@ -1,13 +1,21 @@
 from pathlib import Path
 
 import click
+from L2 import syntax as L2
 
 # from L2.cps_convert import cps_convert_program
-from L2.optimize import optimize_program
+from L2.cse import cse_statistics
+from L2.optimize import LEVELS, PASSES, optimize_program
+from L2.pass_manager import parse_pipeline
+from util.budget import Budget
+from util.symbols import with_symbols
 
+from .cache import ProgramCache
 from .check import check_program
 from .eliminate_letrec import eliminate_letrec_program
-from .parse import parse_program
+from .from_json import program_from_json_file
+from .front_end import front_end_program
+from .parse import Backend, parse_program_file
 from .uniqify import uniqify_program
 
 
@@ -23,11 +31,92 @@ from .uniqify import uniqify_program
     show_default=True,
     help="Enable or disable semantic analysis",
 )
+@click.option(
+    "--fuse/--no-fuse",
+    default=True,
+    show_default=True,
+    help="Check, uniqify and eliminate letrec in one traversal (the cache keeps them separate)",
+)
 @click.option(
     "--optimize/--no-optimize",
     default=True,
     show_default=True,
-    help="Enable or disable optimization",
+    help="Enable or disable optimization (--no-optimize is -O0)",
+)
+@click.option(
+    "-O",
+    "level",
+    type=click.IntRange(0, 3),
+    default=2,
+    show_default=True,
+    help="Optimization level: 0 none, 1 every pass once, 2 and 3 every pass to a fixed point",
+)
+@click.option(
+    "--passes",
+    default=None,
+    help=f"Optimization pipeline instead of -O's: passes separated by commas, each with an optional "
+    f"limit on its runs, e.g. fold:10,dce. Passes: {', '.join(PASSES)}",
+)
+@click.option(
+    "--budget-seconds",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Stop optimizing after about this many seconds, keeping what is done",
+)
+@click.option(
+    "--budget-visits",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Stop optimizing after about this many node visits, keeping what is done",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="Optimize the program's functions on this many workers at once (0: one per core), each on its "
+    "own first, which may optimize it differently than with one",
+)
+@click.option(
+    "--stats/--no-stats",
+    default=False,
+    show_default=True,
+    help="Report the redundant evaluations common subexpression elimination removed",
+)
+@click.option(
+    "--parser",
+    type=click.Choice(["lark", "sexp"]),
+    default="lark",
+    show_default=True,
+    help="Parser backend",
+)
+@click.option(
+    "--format",
+    "input_format",
+    type=click.Choice(["auto", "l3", "json"]),
+    default="auto",
+    show_default=True,
+    help="Input format (auto picks json for .json files)",
+)
+@click.option(
+    "--stream/--no-stream",
+    default=False,
+    show_default=True,
+    help="Read JSON input in chunks instead of all at once",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Cache checked programs in this directory",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    default=64 << 20,
+    show_default=True,
+    help="Maximum size of the cache in bytes",
 )
 @click.option(
     "-o",
@@ -40,23 +129,76 @@ from .uniqify import uniqify_program
     "input",
     type=click.Path(exists=True, readable=True, dir_okay=False, path_type=Path),
 )
+# each run a compilation, with a symbol table of its own
+@with_symbols
 def main(
     output: Path | None,
     check: bool,
+    fuse: bool,
     optimize: bool,
+    level: int,
+    passes: str | None,
+    budget_seconds: float | None,
+    budget_visits: int | None,
+    jobs: int,
+    stats: bool,
+    parser: Backend,
+    input_format: str,
+    stream: bool,
+    cache_dir: Path | None,
+    cache_size: int,
     input: Path,
 ) -> None:
-    l3 = parse_program(input.read_text())
+    if not optimize:
+        passes = LEVELS[0]
+    try:
+        pipeline = parse_pipeline(passes if passes is not None else LEVELS[level], PASSES)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="--passes") from None
+
+    cache = ProgramCache(cache_dir, cache_size) if cache_dir is not None else None
+    key = cache.key(input, check) if cache is not None else ""
+
+    cached = cache.get(key) if cache is not None else None
+    l2: L2.Program | None = None
+
+    if cached is not None:
+        # a hit is already checked and uniqified
+        fresh, l3 = cached
+    else:
+        if input_format == "json" or (input_format == "auto" and input.suffix == ".json"):
+            l3 = program_from_json_file(input, stream)
+        else:
+            l3 = parse_program_file(input, parser)
+
+        if fuse and cache is None:
+            # there is no uniqified L3 to cache, so go straight to L2
+            fresh, l2 = front_end_program(l3, check)
+        else:
+            if check:
+                check_program(l3)
+
+            fresh, l3 = uniqify_program(l3)
+
+            if cache is not None:
+                cache.put(key, fresh, l3)
 
-    if check:
-        check_program(l3)
+    if cache is not None:
+        click.echo(cache.report(), err=True)
 
-    fresh, l3 = uniqify_program(l3)
+    if l2 is None:
+        l2 = eliminate_letrec_program(l3)
 
-    l2 = eliminate_letrec_program(l3)
+    cse_statistics.clear()
+    if budget_seconds is None and budget_visits is None:
+        l2 = optimize_program(l2, pipeline, workers=jobs)
+    else:
+        budget = Budget(budget_seconds, budget_visits)
+        l2 = optimize_program(l2, pipeline, budget, jobs)
+        click.echo(budget.report(), err=True)
 
-    if optimize:
-        l2 = optimize_program(l2)
+    if stats:
+        click.echo(cse_statistics.report(), err=True)
 
     # l1 = cps_convert_program(l2, fresh)
 
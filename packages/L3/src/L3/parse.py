@@ -1,5 +1,9 @@
-from collections.abc import Sequence
+import mmap
+import re
+from collections.abc import Buffer, Sequence
+from functools import cache
 from pathlib import Path
+from typing import Literal
 
 from lark import Lark, Token, Transformer
 from lark.visitors import v_args  # pyright: ignore[reportUnknownVariableType]
@@ -194,15 +198,249 @@ class AstTransformer(Transformer[Token, Program | Term]):
         return Begin(effects=list(terms[:-1]), value=terms[-1])
 
 
-def parse_term(source: str) -> Term:
-    grammar = Path(__file__).with_name("L3.lark").read_text()
-    parser = Lark(grammar, start="term")
-    tree = parser.parse(source)  # pyright: ignore[reportUnknownMemberType]
-    return AstTransformer().transform(tree)  # pyright: ignore[reportReturnType]
+type Backend = Literal["lark", "sexp"]
+
+# The hand-written reader works on raw bytes (a str is encoded first) so it can scan a
+# memoryview or mmap of the input without copying it. Whitespace is skipped by finditer;
+# comments are matched so that parentheses inside them are never mistaken for structure.
+_TOKEN = re.compile(rb";[^\n]*|[()]|[^\s();]+")
+_IDENTIFIER = re.compile(rb"[a-zA-Z_][a-zA-Z0-9_]*")
+
+_LET = {b"let", b"letrec"}
+_LAMBDA = {b"\\", b"lambda", "λ".encode()}
+_OPERATORS = {b"+", b"-", b"*"}
+_COMPARATORS = {b"<", b"=="}
+_KEYWORDS = _LET | _LAMBDA | _OPERATORS | {b"if", b"allocate", b"load", b"store", b"begin"}
+
+# A frame is an open parenthesis: what the list means, the items read so far, and where it started.
+type _Kind = Literal["program", "parameters", "term", "bindings", "binding", "condition"]
+type _Frame = tuple[_Kind, list[object], int]
+
+
+def _term(item: object, offset: int) -> Term:
+    match item:
+        case bytes() if item.isdigit():
+            return Immediate(value=int(item))
+
+        case bytes() if _IDENTIFIER.fullmatch(item):
+            return Reference(name=item.decode())
+
+        case bytes():
+            raise ValueError(f"unexpected token {item!r} in form at offset {offset}")
+
+        case _:
+            return item  # pyright: ignore[reportReturnType]
+
+
+def _identifier(item: object, offset: int) -> Identifier:
+    match item:
+        case bytes() if _IDENTIFIER.fullmatch(item):
+            return item.decode()
+
+        case _:
+            raise ValueError(f"expected an identifier in form at offset {offset}")
+
+
+def _nat(item: object, offset: int) -> int:
+    match item:
+        case bytes() if item.isdigit():
+            return int(item)
+
+        case _:
+            raise ValueError(f"expected a number in form at offset {offset}")
+
+
+def _child(frame: _Frame, offset: int) -> _Kind:
+    # Decide what a nested list means from its position in the enclosing one.
+    kind, items, _ = frame
+    position = len(items)
+
+    match kind, items[:1]:
+        case "program", _:
+            return "parameters" if position == 1 else "term"
+
+        case "term", [bytes() as head] if position == 1 and head in _LET:
+            return "bindings"
+
+        case "term", [bytes() as head] if position == 1 and head in _LAMBDA:
+            return "parameters"
+
+        case "term", [b"if"] if position == 1:
+            return "condition"
+
+        case "bindings", _:
+            return "binding"
+
+        case "term" | "binding" | "condition", _:
+            return "term"
+
+        case _:
+            raise ValueError(f"unexpected '(' at offset {offset}")
+
+
+def _form(items: list[object], offset: int) -> Term:
+    match items:
+        case [b"let", list() as bindings, body]:
+            return Let(bindings=bindings, body=_term(body, offset))  # pyright: ignore[reportUnknownArgumentType]
+
+        case [b"letrec", list() as bindings, body]:
+            return LetRec(bindings=bindings, body=_term(body, offset))  # pyright: ignore[reportUnknownArgumentType]
+
+        case [bytes() as head, list() as parameters, body] if head in _LAMBDA:
+            return Abstract(parameters=parameters, body=_term(body, offset))  # pyright: ignore[reportUnknownArgumentType]
+
+        case [bytes() as operator, left, right] if operator in _OPERATORS:
+            return Primitive(
+                operator=operator.decode(),  # pyright: ignore[reportArgumentType]
+                left=_term(left, offset),
+                right=_term(right, offset),
+            )
+
+        case [b"if", (str() as operator, left, right), consequent, otherwise]:
+            return Branch(
+                operator=operator,  # pyright: ignore[reportArgumentType]
+                left=left,
+                right=right,
+                consequent=_term(consequent, offset),
+                otherwise=_term(otherwise, offset),
+            )
+
+        case [b"allocate", count]:
+            return Allocate(count=_nat(count, offset))
+
+        case [b"load", base, index]:
+            return Load(base=_term(base, offset), index=_nat(index, offset))
+
+        case [b"store", base, index, value]:
+            return Store(base=_term(base, offset), index=_nat(index, offset), value=_term(value, offset))
+
+        case [b"begin", *effects, value]:
+            return Begin(effects=[_term(effect, offset) for effect in effects], value=_term(value, offset))
+
+        case [bytes() as head, *_] if head in _KEYWORDS:
+            raise ValueError(f"malformed {head.decode()} form at offset {offset}")
 
+        case [target, *arguments]:
+            return Apply(target=_term(target, offset), arguments=[_term(argument, offset) for argument in arguments])
 
-def parse_program(source: str) -> Program:
+        case _:
+            raise ValueError(f"empty application at offset {offset}")
+
+
+def _reduce(frame: _Frame) -> object:
+    kind, items, offset = frame
+
+    match kind, items:
+        case "term", _:
+            return _form(items, offset)
+
+        case "parameters", _:
+            return [_identifier(item, offset) for item in items]
+
+        case "bindings", _:
+            if not all(isinstance(item, tuple) for item in items):
+                raise ValueError(f"expected bindings at offset {offset}")
+            return items
+
+        case "binding", [name, value]:
+            return _identifier(name, offset), _term(value, offset)
+
+        case "condition", [bytes() as operator, left, right] if operator in _COMPARATORS:
+            return operator.decode(), _term(left, offset), _term(right, offset)
+
+        case "program", [b"l3", list() as parameters, body]:
+            return Program(parameters=parameters, body=_term(body, offset))  # pyright: ignore[reportUnknownArgumentType]
+
+        case _:
+            raise ValueError(f"malformed {kind} at offset {offset}")
+
+
+def read(source: Buffer, start: Literal["program", "term"]) -> object:
+    """Read an s-expression into L3 syntax in a single pass with an explicit stack.
+
+    Nodes are built as each list closes, so nesting depth is bounded only by memory.
+    """
+    stack: list[_Frame] = []
+    result: object = None
+
+    for match in _TOKEN.finditer(source):  # pyright: ignore[reportCallIssue, reportArgumentType]
+        token = match.group()
+        offset = match.start()
+
+        if token.startswith(b";"):
+            continue
+
+        if result is not None:
+            raise ValueError(f"unexpected {token!r} after end of input at offset {offset}")
+
+        if token == b"(":
+            stack.append((_child(stack[-1], offset) if stack else start, [], offset))
+
+        elif token == b")":
+            if not stack:
+                raise ValueError(f"unmatched ')' at offset {offset}")
+            value = _reduce(stack.pop())
+            if stack:
+                stack[-1][1].append(value)
+            else:
+                result = value
+
+        elif stack:
+            stack[-1][1].append(token)
+
+        elif start == "term":
+            result = _term(token, offset)
+
+        else:
+            raise ValueError(f"expected '(' at offset {offset}")
+
+    if stack:
+        raise ValueError(f"unclosed '(' at offset {stack[-1][2]}")
+
+    if result is None:
+        raise ValueError("unexpected end of input")
+
+    return result
+
+
+@cache
+def parser() -> Lark:
+    # Built once per process: LALR with the contextual lexer, and the transformer
+    # runs inline so nodes are constructed during the parse with no intermediate tree.
     grammar = Path(__file__).with_name("L3.lark").read_text()
-    parser = Lark(grammar, start="program")
-    tree = parser.parse(source)  # pyright: ignore[reportUnknownMemberType]
-    return AstTransformer().transform(tree)  # pyright: ignore[reportReturnType]
+    return Lark(
+        grammar,
+        start=["program", "term"],
+        parser="lalr",
+        lexer="contextual",
+        transformer=AstTransformer(),
+    )
+
+
+def parse_term(source: str | Buffer, backend: Backend = "lark") -> Term:
+    match backend:
+        case "lark":
+            text = source if isinstance(source, str) else bytes(source).decode()
+            return parser().parse(text, start="term")  # pyright: ignore[reportReturnType, reportUnknownMemberType]
+
+        case "sexp":  # pragma: no branch
+            return read(source.encode() if isinstance(source, str) else source, "term")  # pyright: ignore[reportReturnType]
+
+
+def parse_program(source: str | Buffer, backend: Backend = "lark") -> Program:
+    match backend:
+        case "lark":
+            text = source if isinstance(source, str) else bytes(source).decode()
+            return parser().parse(text, start="program")  # pyright: ignore[reportReturnType, reportUnknownMemberType]
+
+        case "sexp":  # pragma: no branch
+            return read(source.encode() if isinstance(source, str) else source, "program")  # pyright: ignore[reportReturnType]
+
+
+def parse_program_file(path: Path, backend: Backend = "lark") -> Program:
+    # The s-expression reader scans a read-only mapping of the file rather than a copy.
+    if backend == "lark" or path.stat().st_size == 0:
+        return parse_program(path.read_bytes(), backend)
+
+    with path.open("rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        return parse_program(view, backend)
@@ -1,7 +1,7 @@
 import ast
-from functools import partial
 
-from util.encode import encode
+from util.symbols import encoded, with_symbols
+from util.traverse import Traversal, Visit, each
 
 from .syntax import (
     Abstract,
@@ -21,143 +21,177 @@ from .syntax import (
 )
 
 
+@with_symbols
 def to_ast_term(
     term: Term,
 ) -> ast.expr:
-    _term = partial(to_ast_term)
-
-    match term:
-        case Let(bindings=bindings, body=body):
-            return ast.Subscript(
-                value=ast.Tuple(
-                    elts=[
-                        *[
-                            ast.NamedExpr(target=ast.Name(id=encode(name), ctx=ast.Store()), value=_term(value))
-                            for name, value in bindings
-                        ],
-                        _term(body),
-                    ],
-                    ctx=ast.Load(),
+    return _to_ast_term(term)
+
+
+def _let(term: Let) -> Visit[ast.expr]:
+    values = yield from each(value for _, value in term.bindings)
+    return ast.Subscript(
+        value=ast.Tuple(
+            elts=[
+                *[
+                    ast.NamedExpr(target=ast.Name(id=encoded(name), ctx=ast.Store()), value=value)
+                    for (name, _), value in zip(term.bindings, values, strict=True)
+                ],
+                (yield term.body),
+            ],
+            ctx=ast.Load(),
+        ),
+        slice=ast.Constant(-1),
+        ctx=ast.Load(),
+    )
+
+
+def _letrec(term: LetRec) -> Visit[ast.expr]:
+    values = yield from each(value for _, value in term.bindings)
+    return ast.Subscript(
+        value=ast.Tuple(
+            elts=[
+                *[
+                    ast.NamedExpr(target=ast.Name(id=encoded(name), ctx=ast.Store()), value=ast.Constant(None))
+                    for name, _value in term.bindings
+                ],
+                *[
+                    ast.NamedExpr(target=ast.Name(id=encoded(name), ctx=ast.Store()), value=value)
+                    for (name, _), value in zip(term.bindings, values, strict=True)
+                ],
+                (yield term.body),
+            ],
+            ctx=ast.Load(),
+        ),
+        slice=ast.Constant(-1),
+        ctx=ast.Load(),
+    )
+
+
+def _reference(term: Reference) -> ast.expr:
+    return ast.Name(id=encoded(term.name), ctx=ast.Load())
+
+
+def _abstract(term: Abstract) -> Visit[ast.expr]:
+    return ast.Lambda(
+        args=ast.arguments(args=[ast.arg(arg=encoded(parameter)) for parameter in term.parameters]),
+        body=(yield term.body),
+    )
+
+
+def _apply(term: Apply) -> Visit[ast.expr]:
+    target = yield term.target
+    return ast.Call(
+        func=target,
+        args=(yield from each(term.arguments)),
+    )
+
+
+def _immediate(term: Immediate) -> ast.expr:
+    return ast.Constant(value=term.value)
+
+
+def _primitive(term: Primitive) -> Visit[ast.expr]:
+    match term.operator:
+        case "+":
+            op = ast.Add()
+
+        case "-":
+            op = ast.Sub()
+
+        case "*":  # pragma: no branch
+            op = ast.Mult()
+
+    return ast.BinOp(
+        left=(yield term.left),
+        op=op,
+        right=(yield term.right),
+    )
+
+
+def _branch(term: Branch) -> Visit[ast.expr]:
+    match term.operator:
+        case "<":
+            op = ast.Lt()
+
+        case "==":  # pragma: no branch
+            op = ast.Eq()
+
+    return ast.IfExp(
+        test=ast.Compare(
+            left=(yield term.left),
+            ops=[op],
+            comparators=[(yield term.right)],
+        ),
+        body=(yield term.consequent),
+        orelse=(yield term.otherwise),
+    )
+
+
+def _allocate(term: Allocate) -> ast.expr:
+    return ast.List(
+        elts=[ast.Constant(None) for _ in range(term.count)],
+        ctx=ast.Load(),
+    )
+
+
+def _load(term: Load) -> Visit[ast.expr]:
+    return ast.Call(
+        func=ast.Attribute(value=(yield term.base), attr="__getitem__", ctx=ast.Load()),
+        args=[ast.Constant(value=term.index)],
+    )
+
+
+def _store(term: Store) -> Visit[ast.expr]:
+    return ast.Subscript(
+        value=ast.Tuple(
+            elts=[
+                ast.Call(
+                    func=ast.Attribute(value=(yield term.base), attr="__setitem__", ctx=ast.Load()),
+                    args=[ast.Constant(value=term.index), (yield term.value)],
                 ),
-                slice=ast.Constant(-1),
-                ctx=ast.Load(),
-            )
-
-        case LetRec(bindings=bindings, body=body):
-            return ast.Subscript(
-                value=ast.Tuple(
-                    elts=[
-                        *[
-                            ast.NamedExpr(target=ast.Name(id=encode(name), ctx=ast.Store()), value=ast.Constant(None))
-                            for name, _value in bindings
-                        ],
-                        *[
-                            ast.NamedExpr(target=ast.Name(id=encode(name), ctx=ast.Store()), value=_term(value))
-                            for name, value in bindings
-                        ],
-                        _term(body),
-                    ],
-                    ctx=ast.Load(),
-                ),
-                slice=ast.Constant(-1),
-                ctx=ast.Load(),
-            )
-
-        case Reference(name=name):
-            return ast.Name(id=encode(name), ctx=ast.Load())
-
-        case Abstract(parameters=parameters, body=body):
-            return ast.Lambda(
-                args=ast.arguments(args=[ast.arg(arg=encode(parameter)) for parameter in parameters]),
-                body=_term(body),
-            )
-
-        case Apply(target=target, arguments=arguments):
-            return ast.Call(
-                func=_term(target),
-                args=[_term(argument) for argument in arguments],
-            )
-
-        case Immediate(value=value):
-            return ast.Constant(value=value)
-
-        case Primitive(operator=operator, left=left, right=right):
-            match operator:
-                case "+":
-                    op = ast.Add()
-
-                case "-":
-                    op = ast.Sub()
-
-                case "*":  # pragma: no branch
-                    op = ast.Mult()
-
-            return ast.BinOp(
-                left=_term(left),
-                op=op,
-                right=_term(right),
-            )
-
-        case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            match operator:
-                case "<":
-                    op = ast.Lt()
-
-                case "==":  # pragma: no branch
-                    op = ast.Eq()
-
-            return ast.IfExp(
-                test=ast.Compare(
-                    left=_term(left),
-                    ops=[op],
-                    comparators=[_term(right)],
-                ),
-                body=_term(consequent),
-                orelse=_term(otherwise),
-            )
-
-        case Allocate(count=count):
-            return ast.List(
-                elts=[ast.Constant(None) for _ in range(count)],
-                ctx=ast.Load(),
-            )
-
-        case Load(base=base, index=index):
-            return ast.Call(
-                func=ast.Attribute(value=_term(base), attr="__getitem__", ctx=ast.Load()),
-                args=[ast.Constant(value=index)],
-            )
-
-        case Store(base=base, index=index, value=value):
-            return ast.Subscript(
-                value=ast.Tuple(
-                    elts=[
-                        ast.Call(
-                            func=ast.Attribute(value=_term(base), attr="__setitem__", ctx=ast.Load()),
-                            args=[ast.Constant(value=index), _term(value)],
-                        ),
-                        ast.Constant(value=0),
-                    ],
-                    ctx=ast.Load(),
-                ),
-                slice=ast.Constant(-1),
-                ctx=ast.Load(),
-            )
-
-        case Begin(effects=effects, value=value):  # pragma: no branch
-            return ast.Subscript(
-                value=ast.Tuple(
-                    elts=[
-                        *[_term(effect) for effect in effects],
-                        _term(value),
-                    ],
-                    ctx=ast.Load(),
-                ),
-                slice=ast.Constant(-1),
-                ctx=ast.Load(),
-            )
+                ast.Constant(value=0),
+            ],
+            ctx=ast.Load(),
+        ),
+        slice=ast.Constant(-1),
+        ctx=ast.Load(),
+    )
+
+
+def _begin(term: Begin) -> Visit[ast.expr]:
+    return ast.Subscript(
+        value=ast.Tuple(
+            elts=[
+                *(yield from each(term.effects)),
+                (yield term.value),
+            ],
+            ctx=ast.Load(),
+        ),
+        slice=ast.Constant(-1),
+        ctx=ast.Load(),
+    )
+
+
+_to_ast_term = Traversal[ast.expr](
+    {
+        "let": _let,
+        "letrec": _letrec,
+        "reference": _reference,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _immediate,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _allocate,
+        "load": _load,
+        "store": _store,
+        "begin": _begin,
+    }
+)
 
 
+@with_symbols
 def to_ast_program(
     program: Program,
 ) -> str:
@@ -167,7 +201,7 @@ def to_ast_program(
                 body=[
                     ast.FunctionDef(
                         name="l3",
-                        args=ast.arguments(args=[ast.arg(arg=encode(parameter)) for parameter in parameters]),
+                        args=ast.arguments(args=[ast.arg(arg=encoded(parameter)) for parameter in parameters]),
                         body=[
                             ast.Return(value=to_ast_term(body)),
                         ],
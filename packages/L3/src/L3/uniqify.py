@@ -1,8 +1,12 @@
 from collections.abc import Callable, Mapping
 from functools import partial
 
+from util.scoped_map import ScopedMap
 from util.sequential_name_generator import SequentialNameGenerator
+from util.traverse import Traversal, Visit, each
+from util.trusted import trusted
 
+from .alpha import canonical_program
 from .syntax import (
     Abstract,
     Allocate,
@@ -22,103 +26,144 @@ from .syntax import (
 )
 
 type Context = Mapping[Identifier, Identifier]  # makes name unique
+type Fresh = Callable[[str], str]
+# the renaming during a walk, bound and unbound as it enters and leaves binders
+type Scope = ScopedMap[Identifier, Identifier]
+
+
+def _let(term: Let, context: Scope, fresh: Fresh) -> Visit[Term]:
+    new_bindings: list[tuple[Identifier, Term]] = []
+
+    for name, val in term.bindings:
+        # Process RHS first, using context BEFORE this name is added.
+        # So Reference("x") still looks up the OUTER "x" -> "y"
+        new_val = yield val, context, fresh
+        # Only AFTER processing RHS do we freshen this name; it is added
+        # to context once every RHS is done, for the body
+        new_bindings.append((fresh(name), new_val))
+
+    mark = context.mark()
+    for (name, _), (fresh_name, _) in zip(term.bindings, new_bindings, strict=True):
+        context.bind(name, fresh_name)
+    body = yield term.body, context, fresh
+    context.undo(mark)
+
+    return trusted(Let, bindings=new_bindings, body=body)
+
+
+def _letrec(term: LetRec, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # need to freshen all names first and then process things
+    mark = context.mark()
+    for name, _ in term.bindings:
+        context.bind(name, fresh(name))
+    values = yield from each((val, context, fresh) for _, val in term.bindings)
+    new_bindings = [(context[name], value) for (name, _), value in zip(term.bindings, values, strict=True)]
+    body = yield term.body, context, fresh
+    context.undo(mark)
+    return trusted(LetRec, bindings=new_bindings, body=body)
+
+
+def _reference(term: Reference, context: Scope, fresh: Fresh) -> Term:
+    # need to look at name in context to get replacement
+    return trusted(Reference, name=context[term.name])
+
+
+def _abstract(term: Abstract, context: Scope, fresh: Fresh) -> Visit[Term]:
+    mark = context.mark()
+    fresh_params: list[Identifier] = []
+    for param in term.parameters:
+        fresh_param = fresh(param)
+        context.bind(param, fresh_param)
+        fresh_params.append(fresh_param)
+    body = yield term.body, context, fresh
+    context.undo(mark)
+    return trusted(Abstract, parameters=fresh_params, body=body)
+
+
+def _apply(term: Apply, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # need to recurse into parts
+    target = yield term.target, context, fresh
+    arguments = yield from each((arg, context, fresh) for arg in term.arguments)
+    return trusted(Apply, target=target, arguments=arguments)
+
+
+def _leaf(term: Immediate | Allocate, context: Scope, fresh: Fresh) -> Term:
+    # no name return
+    return term
+
+
+def _primitive(term: Primitive, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # need to recurse into each part
+    left = yield term.left, context, fresh
+    right = yield term.right, context, fresh
+    return trusted(Primitive, operator=term.operator, left=left, right=right)
+
+
+def _branch(term: Branch, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # need to recurse into the branch parts
+    return trusted(
+        Branch,
+        operator=term.operator,
+        left=(yield term.left, context, fresh),
+        right=(yield term.right, context, fresh),
+        consequent=(yield term.consequent, context, fresh),
+        otherwise=(yield term.otherwise, context, fresh),
+    )
+
+
+def _load(term: Load, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # need to recur into base but index is just a flat num so its good
+    return trusted(Load, base=(yield term.base, context, fresh), index=term.index)
+
+
+def _store(term: Store, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # same as above just with value now which is able to be a variable
+    base = yield term.base, context, fresh
+    value = yield term.value, context, fresh
+    return trusted(Store, base=base, index=term.index, value=value)
+
+
+def _begin(term: Begin, context: Scope, fresh: Fresh) -> Visit[Term]:
+    # recursively uniqify each effect is the only special part
+    effects = yield from each((effect, context, fresh) for effect in term.effects)
+    return trusted(Begin, effects=effects, value=(yield term.value, context, fresh))
+
+
+_uniqify = Traversal[Term](
+    {
+        "let": _let,
+        "letrec": _letrec,
+        "reference": _reference,
+        "abstract": _abstract,
+        "apply": _apply,
+        "immediate": _leaf,
+        "primitive": _primitive,
+        "branch": _branch,
+        "allocate": _leaf,
+        "load": _load,
+        "store": _store,
+        "begin": _begin,
+    }
+)
 
 
 def uniqify_term(
     term: Term,
     context: Context,
-    fresh: Callable[[str], str],
+    fresh: Fresh,
 ) -> Term:
-    _term = partial(uniqify_term, context=context, fresh=fresh)
-
-    match term:
-        case Let(bindings=bindings, body=body):
-            local = dict(context)
-            new_bindings: list[tuple[Identifier, Term]] = []
-
-            for name, val in bindings:
-                # Process RHS first, using context BEFORE this name is added.
-                # So Reference("x") still looks up the OUTER "x" -> "y"
-                new_val = uniqify_term(val, context, fresh)
-                # Only AFTER processing RHS do we freshen this name
-                # and add it to context for subsequent bindings and body
-                fresh_name = fresh(name)
-                local[name] = fresh_name
-
-                new_bindings.append((fresh_name, new_val))
-
-            return Let(
-                bindings=new_bindings,
-                body=uniqify_term(body, local, fresh),
-            )
-
-        case LetRec(bindings=bindings, body=body):
-            # need to freshen all names first and then process things
-            local = dict(context)
-            for name, _ in bindings:
-                local[name] = fresh(name)
-            new_bindings = [(local[name], uniqify_term(val, local, fresh)) for name, val in bindings]
-            return LetRec(bindings=new_bindings, body=uniqify_term(body, local, fresh))
-
-        case Reference(name=name):
-            # need to look at name in context to get replacement
-            return Reference(name=context[name])
-
-        case Abstract(parameters=parameters, body=body):
-            local = dict(context)
-            fresh_params: list[Identifier] = []
-            for param in parameters:
-                fresh_param = fresh(param)
-                local[param] = fresh_param
-                fresh_params.append(fresh_param)
-            return Abstract(
-                parameters=fresh_params,
-                body=uniqify_term(body, local, fresh),
-            )
-
-        case Apply(target=target, arguments=arguments):
-            # need to recurse into parts
-            return Apply(target=_term(target), arguments=[_term(arg) for arg in arguments])
-
-        case Immediate():
-            # no name return
-            return term
-
-        case Primitive(operator=operator, left=left, right=right):
-            # need to recurse into each part
-            return Primitive(operator=operator, left=_term(left), right=_term(right))
-
-        case Branch(operator=operator, left=left, right=right, consequent=consequent, otherwise=otherwise):
-            # need to recurse into the branch parts
-            return Branch(
-                operator=operator,
-                left=_term(left),
-                right=_term(right),
-                consequent=_term(consequent),
-                otherwise=_term(otherwise),
-            )
-
-        case Allocate():
-            # no name return
-            return term
-
-        case Load(base=base, index=index):
-            # need to recur into base but index is just a flat num so its good
-            return Load(base=_term(base), index=index)
-
-        case Store(base=base, index=index, value=value):
-            # same as above just with value now which is able to be a variable
-            return Store(base=_term(base), index=index, value=_term(value))
-
-        case Begin(effects=effects, value=value):  # pragma: no branch
-            # recursively uniqify each effect is the only special part
-            return Begin(effects=[_term(effect) for effect in effects], value=_term(value))
+    return _uniqify(term, ScopedMap(context), fresh)
 
 
 # A sequential name generator made for name uniqueness
 def uniqify_program(
     program: Program,
-) -> tuple[Callable[[str], str], Program]:
+    canonical: bool = False,
+) -> tuple[SequentialNameGenerator, Program]:
+    # canonical names binders by position alone, so alpha-equivalent programs come out identical
+    if canonical:
+        return canonical_program(program)
+
     fresh = SequentialNameGenerator()
 
     _term = partial(uniqify_term, fresh=fresh)  # curried function(?) he says
@@ -128,7 +173,8 @@ def uniqify_program(
             local = {parameter: fresh(parameter) for parameter in parameters}
             return (
                 fresh,
-                Program(
+                trusted(
+                    Program,
                     parameters=[
                         local[parameter] for parameter in parameters
                     ],  # renamed to renames Look up new name of param and use it instead
@@ -0,0 +1,132 @@
+from pathlib import Path
+
+import pytest
+from L3.alpha import alpha_hash, canonical_program
+from L3.binary import CODEC
+from L3.check import check_program
+from L3.parse import parse_program, parse_term
+from L3.syntax import Abstract, Begin, Let, LetRec, Program, Reference
+from L3.uniqify import uniqify_program
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+
+# every kind of node, with shadowing across binder groups
+SOURCE = """
+(l3 (a b)
+  (let ((x (allocate 1)) (y 5))
+    (letrec ((f (\\ (n) (if (< n 1) (load x 0) (f (- n 1))))))
+      (begin
+        (store x 0 (* a b))
+        (let ((y (+ y 1))) (f y))))))
+"""
+
+
+def renamed(source: str) -> str:
+    # the same program with every binder renamed
+    for old, new in [("(a b)", "(p q)"), ("(* a b)", "(* p q)")]:
+        source = source.replace(old, new)
+    return source.replace("x", "z").replace("(n)", "(m)").replace("< n", "< m").replace("- n", "- m")
+
+
+def test_hash_ignores_binder_names():
+    assert alpha_hash(parse_program(SOURCE)) == alpha_hash(parse_program(renamed(SOURCE)))
+
+
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.l3")), ids=lambda path: path.stem)
+def test_hash_survives_uniqify(path: Path):
+    program = parse_program(path.read_text())
+
+    assert alpha_hash(uniqify_program(program)[1]) == alpha_hash(program)
+
+
+@pytest.mark.parametrize(
+    "left, right",
+    [
+        # which binder a reference points to matters
+        ("(\\ (x) (\\ (y) x))", "(\\ (x) (\\ (y) y))"),
+        ("(\\ (x y) x)", "(\\ (x y) y)"),
+        # a Let's values are outside its binders, a LetRec's are inside
+        ("(let ((x x)) x)", "(letrec ((x x)) x)"),
+        # free references keep their names
+        ("(+ a 1)", "(+ b 1)"),
+        ("(+ a 1)", "(- a 1)"),
+        ("1", "2"),
+        ("(allocate 1)", "(allocate 2)"),
+        ("(load a 0)", "(load a 1)"),
+    ],
+)
+def test_hash_distinguishes(left: str, right: str):
+    assert alpha_hash(parse_term(left)) != alpha_hash(parse_term(right))
+
+
+def test_hash_shadowing():
+    inner = alpha_hash(parse_term("(\\ (x) (\\ (x) x))"))
+
+    assert inner == alpha_hash(parse_term("(\\ (y) (\\ (x) x))"))
+    assert inner != alpha_hash(parse_term("(\\ (x) (\\ (y) x))"))
+
+
+def test_hash_parameters():
+    assert alpha_hash(parse_program("(l3 (a b) a)")) != alpha_hash(parse_program("(l3 (a b) b)"))
+    assert alpha_hash(parse_program("(l3 (a b) a)")) == alpha_hash(parse_program("(l3 (b a) b)"))
+
+
+def test_hash_deep():
+    # linear, and no recursion on the depth of the term
+    body = Reference(name="x")
+    other = Reference(name="y")
+    for _ in range(10_000):
+        body = Abstract(parameters=["x"], body=Begin(effects=[], value=body))
+        other = Abstract(parameters=["y"], body=Begin(effects=[], value=other))
+
+    assert alpha_hash(body) == alpha_hash(other)
+
+
+def test_canonical_program_is_identical_for_renamings():
+    _, first = canonical_program(parse_program(SOURCE))
+    _, second = canonical_program(parse_program(renamed(SOURCE)))
+
+    assert first == second
+    assert CODEC.dumps(first) == CODEC.dumps(second)
+    assert first.parameters == ["v0", "v1"]
+
+
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.l3")), ids=lambda path: path.stem)
+def test_canonical_program_is_uniqified(path: Path):
+    program = parse_program(path.read_text())
+
+    fresh, canonical = uniqify_program(program, canonical=True)
+
+    check_program(canonical)
+    assert alpha_hash(canonical) == alpha_hash(program)
+    # every binder has its own name, and the generator continues past them
+    assert fresh("v") == f"v{fresh.counters['v'] - 1}"
+    assert fresh.counters["v"] > len(canonical.parameters)
+
+
+def test_canonical_program_scoping():
+    program = parse_program("(l3 (x) (let ((x x)) (letrec ((x (\\ (x) x))) (x x))))")
+
+    _, canonical = canonical_program(program)
+
+    assert canonical == parse_program("(l3 (v0) (let ((v1 v0)) (letrec ((v2 (\\ (v3) v3))) (v2 v2))))")
+
+
+def test_canonical_program_keeps_free_references():
+    _, canonical = canonical_program(Program(parameters=[], body=Let(bindings=[], body=Reference(name="a"))))
+
+    assert canonical.body == Let(bindings=[], body=Reference(name="a"))
+
+
+def test_canonical_program_deep():
+    body = Reference(name="x")
+    for _ in range(10_000):
+        body = LetRec(bindings=[("x", Reference(name="x"))], body=body)
+
+    _, canonical = canonical_program(Program(parameters=[], body=body))
+
+    for index in range(10_000):
+        assert isinstance(canonical.body, LetRec)
+        assert canonical.body.bindings[0][0] == f"v{index}"
+        canonical = Program(parameters=[], body=canonical.body.body)
+    assert canonical.body == Reference(name="v9999")
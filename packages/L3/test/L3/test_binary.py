@@ -0,0 +1,72 @@
+from pathlib import Path
+
+import pytest
+from L3.binary import CODEC
+from L3.parse import parse_program
+from L3.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    LetRec,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+
+# one of each node, mixing list and tuple sequences
+PROGRAM = Program(
+    parameters=["a", "b"],
+    body=Let(
+        bindings=[("x", Allocate(count=1)), ("y", Immediate(value=-3))],
+        body=LetRec(
+            bindings=(("f", Abstract(parameters=("n",), body=Reference(name="n"))),),
+            body=Begin(
+                effects=[
+                    Store(base=Reference(name="x"), index=0, value=Reference(name="a")),
+                    Branch(
+                        operator="==",
+                        left=Load(base=Reference(name="x"), index=0),
+                        right=Reference(name="y"),
+                        consequent=Immediate(value=1 << 80),
+                        otherwise=Immediate(value=0),
+                    ),
+                ],
+                value=Apply(
+                    target=Reference(name="f"),
+                    arguments=[Primitive(operator="*", left=Reference(name="b"), right=Immediate(value=2))],
+                ),
+            ),
+        ),
+    ),
+)
+
+
+def test_round_trip_every_node():
+    assert CODEC.loads(CODEC.dumps(PROGRAM)) == PROGRAM
+
+
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.l3")), ids=lambda path: path.stem)
+def test_round_trip_examples(path: Path):
+    program = parse_program(path.read_text())
+
+    assert CODEC.loads(CODEC.dumps(program)) == program
+
+
+def test_lazy_view_from_file(tmp_path: Path):
+    path = tmp_path / "program.irb"
+    path.write_bytes(CODEC.dumps(PROGRAM))
+
+    with CODEC.open(path) as program:
+        assert list(program.parameters) == ["a", "b"]
+        assert program.body.tag == "let"
+        name, value = program.body.bindings[1]
+        assert (name, value.materialize()) == ("y", Immediate(value=-3))
+        assert program.materialize() == PROGRAM
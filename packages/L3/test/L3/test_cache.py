@@ -0,0 +1,217 @@
+import os
+import sys
+from pathlib import Path
+
+import L3.cache
+import pytest
+from L3.binary import CODEC
+from L3.cache import ProgramCache, compiler_digest
+from L3.parse import parse_program
+from L3.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    LetRec,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+from L3.uniqify import uniqify_program
+from util.sequential_name_generator import SequentialNameGenerator
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+
+
+# helpers
+def every_node() -> Program:
+    # one of each node, mixing list and tuple sequences
+    return Program(
+        parameters=["a", "b"],
+        body=Let(
+            bindings=[("x", Allocate(count=1)), ("y", Immediate(value=-3))],
+            body=LetRec(
+                bindings=(("f", Abstract(parameters=("n",), body=Reference(name="n"))),),
+                body=Begin(
+                    effects=[
+                        Store(base=Reference(name="x"), index=0, value=Reference(name="a")),
+                        Branch(
+                            operator="<",
+                            left=Load(base=Reference(name="x"), index=0),
+                            right=Reference(name="y"),
+                            consequent=Immediate(value=1),
+                            otherwise=Immediate(value=0),
+                        ),
+                    ],
+                    value=Apply(
+                        target=Reference(name="f"),
+                        arguments=[Primitive(operator="*", left=Reference(name="b"), right=Immediate(value=2))],
+                    ),
+                ),
+            ),
+        ),
+    )
+
+
+def write(tmp_path: Path, source: str) -> Path:
+    path = tmp_path / "program.l3"
+    path.write_text(source)
+    return path
+
+
+# entries
+def test_cache_roundtrip_every_node(tmp_path: Path):
+    cache = ProgramCache(tmp_path)
+    fresh = SequentialNameGenerator({"x": 2, "t": 5})
+
+    cache.put("key", fresh, every_node())
+    cached = cache.get("key")
+
+    assert cached is not None
+    assert cached[0].counters == {"x": 2, "t": 5}
+    assert cached[1] == every_node()
+
+
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.l3")), ids=lambda path: path.name)
+def test_cache_roundtrip_examples(tmp_path: Path, path: Path):
+    cache = ProgramCache(tmp_path / "cache")
+    fresh, program = uniqify_program(parse_program(path.read_text()))
+
+    cache.put("key", fresh, program)
+    cached = cache.get("key")
+
+    assert cached is not None
+    assert cached[1] == program
+
+
+def test_cache_deep(tmp_path: Path):
+    # encoding and decoding do not recurse on the depth of the program
+    body = Reference(name="x")
+    for _ in range(10_000):
+        body = Begin(effects=[], value=body)
+    cache = ProgramCache(tmp_path)
+    cache.put("key", SequentialNameGenerator(), Program(parameters=["x"], body=body))
+
+    cached = cache.get("key")
+
+    assert cached is not None
+    actual = cached[1]
+    for _ in range(10_000):
+        assert isinstance(actual.body, Begin)
+        actual = Program(parameters=["x"], body=actual.body.value)
+    assert actual.body == Reference(name="x")
+
+
+def test_cache_malformed_entry(tmp_path: Path):
+    # a well-formed encoding of something other than an entry is dropped too
+    cache = ProgramCache(tmp_path)
+    entry = tmp_path / "key.l3c"
+    entry.write_bytes(b"L3C2" + CODEC.dumps(Reference(name="x")))
+
+    assert cache.get("key") is None
+    assert not entry.exists()
+
+
+# cache
+def test_cache_miss_then_hit(tmp_path: Path):
+    cache = ProgramCache(tmp_path / "cache")
+    path = write(tmp_path, "(l3 (x) (let ((x 1)) x))")
+    fresh, program = uniqify_program(parse_program(path.read_text()))
+    key = cache.key(path, check=True)
+
+    assert cache.get(key) is None
+    cache.put(key, fresh, program)
+    cached = cache.get(key)
+
+    assert cached is not None
+    cached_fresh, cached_program = cached
+    assert cached_program == program
+    assert cached_fresh.counters == fresh.counters
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.report() == "cache: 1 hit(s), 1 miss(es)"
+
+
+def test_cache_key(tmp_path: Path):
+    cache = ProgramCache(tmp_path / "cache")
+    path = write(tmp_path, "(l3 (x) x)")
+    key = cache.key(path, check=True)
+
+    assert cache.key(path, check=True) == key
+    assert cache.key(path, check=False) != key
+
+    path.write_text("(l3 (y) y)")
+
+    assert cache.key(path, check=True) != key
+
+
+def test_cache_key_compiler(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache = ProgramCache(tmp_path / "cache")
+    path = write(tmp_path, "(l3 (x) x)")
+    key = cache.key(path, check=True)
+
+    # a change to the compiler's source, at the same version, or to the Python running it
+    assert compiler_digest() == compiler_digest()
+    monkeypatch.setattr(L3.cache, "compiler_digest", lambda: "changed")
+    assert cache.key(path, check=True) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(sys, "version", "0.0")
+    assert cache.key(path, check=True) != key
+
+
+def test_cache_persists(tmp_path: Path):
+    path = write(tmp_path, "(l3 (x) x)")
+    fresh, program = uniqify_program(parse_program(path.read_text()))
+    first = ProgramCache(tmp_path / "cache")
+    first.put(first.key(path, check=True), fresh, program)
+
+    second = ProgramCache(tmp_path / "cache")
+    cached = second.get(second.key(path, check=True))
+
+    assert cached is not None
+    assert cached[1] == program
+
+
+@pytest.mark.parametrize("content", [b"", b"garbage", b"L3C2garbage", b"L3C2IRB\x01" + b"\xe9\x00\x00\x00", b"L3C1IRB"])
+def test_cache_corrupt_entry(tmp_path: Path, content: bytes):
+    cache = ProgramCache(tmp_path)
+    entry = tmp_path / "key.l3c"
+    entry.write_bytes(content)
+
+    assert cache.get("key") is None
+    assert not entry.exists()
+    assert cache.misses == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = ProgramCache(tmp_path / "cache", max_bytes=0)
+    fresh = SequentialNameGenerator()
+    program = Program(parameters=[], body=Immediate(value=0))
+    cache.put("old", fresh, program)
+    cache.put("new", fresh, program)
+
+    # the newest entry is always kept, even over the limit
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+
+
+def test_cache_eviction_order(tmp_path: Path):
+    fresh = SequentialNameGenerator()
+    program = Program(parameters=[], body=Immediate(value=0))
+    cache = ProgramCache(tmp_path)
+    for key in ("a", "b"):
+        cache.put(key, fresh, program)
+    size = (tmp_path / "a.l3c").stat().st_size
+    os.utime(tmp_path / "a.l3c", ns=(0, 0))
+    os.utime(tmp_path / "b.l3c", ns=(1, 1))
+
+    # reading "a" makes it the most recently used, so "b" goes first
+    assert cache.get("a") is not None
+    cache.max_bytes = 2 * size
+    cache.put("c", fresh, program)
+
+    assert sorted(entry.stem for entry in tmp_path.glob("*.l3c")) == ["a", "c"]
@@ -302,3 +302,10 @@ def test_check_store_invalid():  # makes a store with base y and index 0 and val
     term = Store(base=x, index=0, value=Imm)
     with pytest.raises(ValueError):
         check_term(term, context())
+
+
+def test_check_deeper_than_the_recursion_limit():
+    term = Reference(name="x")
+    for _ in range(100_000):
+        term = Begin(effects=[Imm], value=Let(bindings=[("y", term)], body=Reference(name="y")))
+    check_term(term, context("x"))
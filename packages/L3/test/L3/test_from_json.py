@@ -0,0 +1,80 @@
+from pathlib import Path
+
+import pytest
+from L3.from_json import program_from_json, program_from_json_file
+from L3.parse import parse_program
+from L3.syntax import Apply, Immediate, Program, Reference
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+
+
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.json")), ids=lambda path: path.stem)
+def test_program_from_json_examples(path: Path):
+    expected = parse_program(path.with_suffix(".l3").read_text())
+
+    assert program_from_json(path.read_text()) == expected
+    assert program_from_json(path.read_bytes()) == expected
+    assert program_from_json_file(path) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.json")), ids=lambda path: path.stem)
+def test_program_from_json_file_stream(path: Path, chunk_size: int):
+    expected = parse_program(path.with_suffix(".l3").read_text())
+
+    assert program_from_json_file(path, stream=True, chunk_size=chunk_size) == expected
+
+
+def test_program_from_json_file_stream_escapes(tmp_path: Path):
+    path = tmp_path / "escapes.json"
+    path.write_text(
+        '{"tag": "l3", "parameters": ["\\u0078", "y\\"z"], "body": '
+        '{"tag": "apply", "target": {"tag": "reference", "name": "x"}, "arguments": []}}'
+    )
+
+    expected = Program(
+        parameters=["x", 'y"z'],
+        body=Apply(target=Reference(name="x"), arguments=[]),
+    )
+
+    assert program_from_json_file(path, stream=True, chunk_size=3) == expected
+
+
+def test_program_from_json_file_stream_numbers(tmp_path: Path):
+    path = tmp_path / "numbers.json"
+    path.write_text('{"tag": "l3", "parameters": [], "body": {"tag": "immediate", "value": -1234}}  \n')
+
+    expected = Program(parameters=[], body=Immediate(value=-1234))
+
+    assert program_from_json_file(path, stream=True, chunk_size=2) == expected
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        '{"tag": "nope"}',
+        '{"name": "x"}',
+        "{}",
+        '{"tag": "reference", "name": "x"}',
+        '[true, false, null, 1.5e3, [], "x"]',
+        '{"tag": "l3", "parameters": [], "body": {"tag": "immediate", "value": "one"}}',
+        '{"tag": "reference", "name": "x"]',
+        '["x"}',
+        '{"tag": "reference", "name": "x",}',
+        '{"tag": "reference" "name": "x"}',
+        '{"tag": "reference", "name": "x"} {}',
+        '{"tag": "reference", "name": "x"',
+        '{"tag": "reference", "name": @}',
+        '{1: "x"}',
+        "",
+    ],
+)
+def test_program_from_json_invalid(tmp_path: Path, source: str):
+    path = tmp_path / "invalid.json"
+    path.write_text(source)
+
+    with pytest.raises(ValueError):
+        program_from_json(source)
+
+    with pytest.raises(ValueError):
+        program_from_json_file(path, stream=True, chunk_size=4)
@@ -0,0 +1,121 @@
+from pathlib import Path
+
+import pytest
+from L2 import syntax as L2
+from L3.check import check_program
+from L3.eliminate_letrec import eliminate_letrec_program
+from L3.front_end import front_end_program
+from L3.parse import parse_program, parse_program_file
+from L3.syntax import (
+    Abstract,
+    Allocate,
+    Apply,
+    Begin,
+    Branch,
+    Immediate,
+    Let,
+    LetRec,
+    Load,
+    Primitive,
+    Program,
+    Reference,
+    Store,
+)
+from L3.uniqify import uniqify_program
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+
+
+def staged(program: Program, check: bool = True) -> tuple[dict[str, int], L2.Program]:
+    if check:
+        check_program(program)
+    fresh, program = uniqify_program(program)
+    return dict(fresh.counters), eliminate_letrec_program(program)
+
+
+def fused(program: Program, check: bool = True) -> tuple[dict[str, int], L2.Program]:
+    fresh, program = front_end_program(program, check)
+    return dict(fresh.counters), program
+
+
+x, y, f = Reference(name="x"), Reference(name="y"), Reference(name="f")
+
+# every kind of node, with shadowing across a let, a letrec and a lambda
+EVERYTHING = Program(
+    parameters=["x", "y"],
+    body=Let(
+        bindings=[("x", Primitive(operator="+", left=x, right=y)), ("y", x)],
+        body=LetRec(
+            bindings=[
+                (
+                    "f",
+                    Abstract(
+                        parameters=["x"],
+                        body=Branch(
+                            operator="<",
+                            left=x,
+                            right=Immediate(value=1),
+                            consequent=y,
+                            otherwise=Apply(target=f, arguments=[Primitive(operator="-", left=x, right=y)]),
+                        ),
+                    ),
+                ),
+                ("g", Allocate(count=2)),
+            ],
+            body=Begin(
+                effects=[Store(base=Reference(name="g"), index=0, value=Apply(target=f, arguments=[x]))],
+                value=Let(bindings=[("f", Load(base=Reference(name="g"), index=0))], body=f),
+            ),
+        ),
+    ),
+)
+
+
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.l3")), ids=lambda path: path.stem)
+def test_front_end_matches_passes_on_examples(path: Path):
+    program = parse_program_file(path)
+
+    assert fused(program) == staged(program)
+
+
+def test_front_end_matches_passes():
+    assert fused(EVERYTHING) == staged(EVERYTHING)
+
+
+def test_front_end_unchecked_matches_passes():
+    # without checking, duplicate binders are renamed the way uniqify renames them
+    program = parse_program("(l3 (x x) (letrec ((f x) (f 1)) (let ((a f) (a 2)) (\\ (b b) a))))")
+
+    assert fused(program, check=False) == staged(program, check=False)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "(l3 (x x) 0)",
+        "(l3 () (let ((a 0) (a 1)) a))",
+        "(l3 () (letrec ((a 0) (a 1)) a))",
+        "(l3 () (\\ (b b) b))",
+        "(l3 () (let ((a b)) a))",
+        "(l3 () (let ((a 0)) (+ a b)))",
+        # the first error in traversal order is the one raised
+        "(l3 () (begin (let ((a 0) (a 1)) a) c))",
+        "(l3 () (begin c (let ((a 0) (a 1)) a)))",
+    ],
+)
+def test_front_end_raises_the_same_errors(source: str):
+    program = parse_program(source)
+
+    with pytest.raises(ValueError) as expected:
+        staged(program)
+    with pytest.raises(ValueError) as actual:
+        fused(program)
+
+    assert str(actual.value) == str(expected.value)
+
+
+def test_front_end_unchecked_unknown_variable():
+    program = parse_program("(l3 () a)")
+
+    with pytest.raises(KeyError):
+        fused(program, check=False)
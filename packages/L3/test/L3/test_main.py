@@ -0,0 +1,123 @@
+from pathlib import Path
+
+from click.testing import CliRunner
+from L3.main import main
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+
+
+def test_main_cache(tmp_path: Path):
+    runner = CliRunner()
+    arguments = ["--cache-dir", str(tmp_path / "cache"), str(EXAMPLES / "fact.l3")]
+
+    first = runner.invoke(main, arguments)
+    second = runner.invoke(main, arguments)
+
+    assert first.exit_code == 0
+    assert "cache: 0 hit(s), 1 miss(es)" in first.output
+    assert second.exit_code == 0
+    assert "cache: 1 hit(s), 0 miss(es)" in second.output
+
+
+def test_main_no_cache():
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["--parser", "sexp", str(EXAMPLES / "sum.l3")])
+
+    assert result.exit_code == 0
+    assert "cache" not in result.output
+
+
+def test_main_no_check_no_optimize():
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["--no-check", "--no-optimize", str(EXAMPLES / "add_simple.l3")])
+
+    assert result.exit_code == 0
+
+
+def test_main_json():
+    runner = CliRunner()
+
+    result = runner.invoke(main, [str(EXAMPLES / "fact.json")])
+
+    assert result.exit_code == 0
+
+
+def test_main_json_stream(tmp_path: Path):
+    runner = CliRunner()
+    source = tmp_path / "fact.txt"
+    source.write_text((EXAMPLES / "fact.json").read_text())
+
+    result = runner.invoke(main, ["--format", "json", "--stream", str(source)])
+
+    assert result.exit_code == 0
+
+
+def test_main_no_fuse():
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["--no-fuse", "--no-check", str(EXAMPLES / "fib.l3")])
+
+    assert result.exit_code == 0
+
+
+def test_main_levels():
+    runner = CliRunner()
+
+    for level in ["-O0", "-O1", "-O3"]:
+        result = runner.invoke(main, [level, str(EXAMPLES / "fact.l3")])
+        assert result.exit_code == 0
+
+
+def test_main_passes():
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["--passes", "fold:3,dce", str(EXAMPLES / "fact.l3")])
+
+    assert result.exit_code == 0
+
+
+def test_main_bad_passes():
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["--passes", "fold,unroll", str(EXAMPLES / "fact.l3")])
+
+    assert result.exit_code == 2
+    assert "unknown pass 'unroll'" in result.output
+
+
+def test_main_budget():
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["--budget-visits", "0", str(EXAMPLES / "fact.l3")])
+    assert result.exit_code == 0
+    assert "skipped: inline, scalar, memory, sccp, cse, dce" in result.output
+
+    result = runner.invoke(main, ["--budget-seconds", "60", str(EXAMPLES / "fact.l3")])
+    assert result.exit_code == 0
+    assert "budget: " in result.output
+    assert "skipped" not in result.output
+
+
+def test_main_stats():
+    runner = CliRunner()
+
+    # the loop in sum reads i three times an iteration, until its cells are made variables
+    result = runner.invoke(main, ["--stats", "--passes", "cse", str(EXAMPLES / "sum.l3")])
+    assert result.exit_code == 0
+    assert "cse: 2 redundant evaluation(s) removed, 1 binding(s) added" in result.output
+
+    result = runner.invoke(main, [str(EXAMPLES / "sum.l3")])
+    assert "cse: " not in result.output
+
+
+def test_main_jobs():
+    runner = CliRunner()
+
+    for jobs in ["0", "2"]:
+        result = runner.invoke(main, ["-j", jobs, str(EXAMPLES / "fact.l3")])
+        assert result.exit_code == 0
+
+    result = runner.invoke(main, ["-j", "2", "--budget-seconds", "60", str(EXAMPLES / "fact.l3")])
+    assert result.exit_code == 0
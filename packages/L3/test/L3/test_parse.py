@@ -1,4 +1,7 @@
-from L3.parse import parse_program, parse_term
+from pathlib import Path
+
+import pytest
+from L3.parse import AstTransformer, Backend, parse_program, parse_program_file, parse_term, parser
 from L3.syntax import (
     Abstract,
     Allocate,
@@ -14,6 +17,10 @@ from L3.syntax import (
     Reference,
     Store,
 )
+from lark import Lark
+
+EXAMPLES = Path(__file__).parents[2] / "examples"
+GRAMMAR = Path(__file__).parents[2] / "src" / "L3" / "L3.lark"
 
 
 # Let
@@ -295,3 +302,176 @@ def test_parse_program_identity():
     actual = parse_program(source)
 
     assert actual == expected
+
+
+# Parser construction
+def test_parser_built_once():
+    assert parser() is parser()
+
+
+def test_parse_keywords_as_references():
+    source = "(f let begin l3)"
+
+    expected = Apply(
+        target=Reference(name="f"),
+        arguments=[Reference(name="let"), Reference(name="begin"), Reference(name="l3")],
+    )
+
+    actual = parse_term(source)
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("path", ["add_simple.l3", "add_complex.l3", "fact.l3", "fib.l3"])
+def test_parse_program_matches_earley(path: str):
+    # the LALR parser must build exactly the Program the original Earley parser did
+    source = (EXAMPLES / path).read_text()
+    earley = Lark(GRAMMAR.read_text(), start="program")
+
+    expected = AstTransformer().transform(earley.parse(source))  # pyright: ignore[reportUnknownMemberType]
+
+    actual = parse_program(source)
+
+    assert actual == expected
+
+
+# s-expression reader
+@pytest.mark.parametrize("path", sorted(EXAMPLES.glob("*.l3")), ids=lambda path: path.name)
+def test_parse_program_backends_agree(path: Path):
+    source = path.read_text()
+
+    expected = parse_program(source, backend="lark")
+
+    actual = parse_program(source, backend="sexp")
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "(let ((x 0) (y (+ x 1))) (begin (store y 0 x) (load y 0)))",
+        "(letrec ((f (lambda (n) (f n)))) (f 1))",
+        "(λ () (allocate 3))",
+        "(if (== a b) (- a b) (* a b))",
+        "((f x) y 1)",
+        "(f let begin l3)",
+        "42",
+        "x",
+    ],
+)
+def test_parse_term_backends_agree(source: str):
+    expected = parse_term(source, backend="lark")
+
+    actual = parse_term(source, backend="sexp")
+
+    assert actual == expected
+
+
+def test_parse_sexp_comments():
+    source = "(l3 (x) ; the parameter ( is ignored\n  x) ; trailing"
+
+    expected = Program(parameters=["x"], body=Reference(name="x"))
+
+    actual = parse_program(source, backend="sexp")
+
+    assert actual == expected
+
+
+def test_parse_sexp_buffer():
+    source = memoryview(b"(+ 1 x)")
+
+    expected = Primitive(operator="+", left=Immediate(value=1), right=Reference(name="x"))
+
+    assert parse_term(source, backend="sexp") == expected
+    assert parse_term(source, backend="lark") == expected
+
+
+def test_parse_sexp_deep_nesting():
+    # nesting far beyond the recursion limit is fine with an explicit stack
+    depth = 100_000
+    source = "(begin " * depth + "x" + ")" * depth
+
+    term = parse_term(source, backend="sexp")
+
+    for _ in range(depth):
+        assert isinstance(term, Begin)
+        term = term.value
+    assert term == Reference(name="x")
+
+
+@pytest.mark.parametrize("backend", ["lark", "sexp"])
+def test_parse_program_file(tmp_path: Path, backend: Backend):
+    path = tmp_path / "program.l3"
+    path.write_text("(l3 (x) x)")
+
+    expected = Program(parameters=["x"], body=Reference(name="x"))
+
+    actual = parse_program_file(path, backend)
+
+    assert actual == expected
+
+
+def test_parse_program_file_empty(tmp_path: Path):
+    path = tmp_path / "empty.l3"
+    path.write_text("")
+
+    with pytest.raises(ValueError, match="end of input"):
+        parse_program_file(path, "sexp")
+
+
+@pytest.mark.parametrize(
+    ("source", "message"),
+    [
+        ("()", "empty application"),
+        ("(let x y)", "malformed let"),
+        ("(let (x) y)", "expected bindings"),
+        ("(let ((1 2)) y)", "expected an identifier"),
+        ("(let ((x 1 2)) y)", "malformed binding"),
+        ("(lambda ((x)) x)", "unexpected '\\('"),
+        ("(if (<= 1 2) 1 2)", "malformed condition"),
+        ("(allocate x)", "expected a number"),
+        ("(load x)", "malformed load"),
+        ("(+ 1 +)", "unexpected token"),
+        ("(f (x y) ())", "empty application"),
+        ("(f (lambda () x) (if (< 1 2) 3 4) ((y)))", None),
+        ("(f (lambda (x) x) (x y))", None),
+        ("(begin (let ((x 1)) x) (let ((y 1)) y))", None),
+        ("x y", "after end of input"),
+        ("x)", "after end of input"),
+        (")", "unmatched"),
+        ("(x", "unclosed"),
+        ("", "end of input"),
+    ],
+)
+def test_parse_term_sexp_errors(source: str, message: str | None):
+    if message is None:
+        assert parse_term(source, backend="sexp") == parse_term(source, backend="lark")
+        return
+
+    with pytest.raises(ValueError, match=message):
+        parse_term(source, backend="sexp")
+
+
+@pytest.mark.parametrize(
+    ("source", "message"),
+    [
+        ("x", "expected '\\('"),
+        ("(l3 x x)", "malformed program"),
+        ("(l3 () (let () ()))", "empty application"),
+        ("(l3 () (f (l3 x)))", None),
+    ],
+)
+def test_parse_program_sexp_errors(source: str, message: str | None):
+    if message is None:
+        assert parse_program(source, backend="sexp") == Program(
+            parameters=[],
+            body=Apply(
+                target=Reference(name="f"),
+                arguments=[Apply(target=Reference(name="l3"), arguments=[Reference(name="x")])],
+            ),
+        )
+        return
+
+    with pytest.raises(ValueError, match=message):
+        parse_program(source, backend="sexp")
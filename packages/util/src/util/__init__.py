@@ -1,5 +1,7 @@
 from .sequential_name_generator import SequentialNameGenerator
+from .symbols import SymbolTable
 
 __all__ = [
     "SequentialNameGenerator",
+    "SymbolTable",
 ]
@@ -0,0 +1,351 @@
+import hashlib
+import mmap
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, overload
+
+from pydantic import BaseModel
+
+from .trusted import trusted
+
+"""
+A compact binary format for IR trees, one Codec per IR level.
+
+A file is a header followed by the root value in preorder:
+
+  header    b"IRB", the format version, the first 8 bytes of a fingerprint of the
+            level's node classes and their fields, then the string table: a count
+            and each string as a length and its UTF-8 bytes
+  value     a varint tag, then by tag:
+              INT            a zigzag varint
+              LIST, TUPLE    the item count, the size in bytes of the items, the items
+              a node class   the size in bytes of the fields, the fields in declaration
+                             order (the tag field is implied by the class)
+              a string       nothing; strings take the tags after the node classes, in
+                             string table order
+
+Varints are unsigned LEB128. Every sequence and node records its size, so a reader can
+skip it without decoding it: view() and open() give a lazy view of a tree over any
+buffer, including an mmap, and decode only the parts that are visited.
+
+The encoder walks the tree with an explicit stack, writing it backwards so that each
+size is known by the time it is written, and reverses the buffer at the end. Decoding
+is a stack machine too. Nodes are rebuilt with util.trusted: this format is for
+passing IR between stages and processes of the compiler, not a trust boundary. A file
+written for a different set of node classes is rejected by its fingerprint.
+"""
+
+_MAGIC = b"IRB"
+VERSION = 1
+
+INT = 0
+LIST = 1
+TUPLE = 2
+_NODE = 3
+
+
+class _Close:
+    # A pending node or sequence header, written once everything pushed after it has been.
+    __slots__ = ("count", "start", "tag")
+
+    def __init__(self, tag: int, start: int, count: int = -1) -> None:
+        self.tag = tag
+        self.start = start
+        self.count = count
+
+
+def _varint_bytes(value: int) -> bytes:
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _reversed_varint(value: int) -> bytes:
+    return _varint_bytes(value)[::-1]
+
+
+_SMALL = [_reversed_varint(value) for value in range(1 << 14)]
+
+
+def _varint(data: Any, position: int) -> tuple[int, int]:
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        position += 1
+        byte = data[position]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position + 1
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class Codec:
+    def __init__(self, name: str, nodes: Sequence[type[BaseModel]]) -> None:
+        self.name = name
+        self.nodes = list(nodes)
+        self.fields = [[field for field in node.model_fields if field != "tag"] for node in self.nodes]
+        self.tags = {node: tag for tag, node in enumerate(self.nodes, start=_NODE)}
+        self.strings = _NODE + len(self.nodes)
+
+        fingerprint = hashlib.sha256(f"{name}\0".encode())
+        for node, fields in zip(self.nodes, self.fields, strict=True):
+            fingerprint.update(f"{node.__name__}({','.join(fields)})\0".encode())
+        self.fingerprint = fingerprint.digest()[:8]
+
+    def dumps(self, root: object) -> bytes:
+        tags, fields, base = self.tags, self.fields, self.strings
+        out = bytearray()
+        strings: dict[str, int] = {}
+        stack: list[object] = [root]
+
+        # Dispatch on the exact type: this loop runs once per node, string and integer, and a
+        # match over class patterns costs an isinstance check per case.
+        while stack:
+            item = stack.pop()
+            kind = type(item)
+
+            if kind is str:
+                index = strings.setdefault(item, len(strings)) + base  # pyright: ignore[reportArgumentType]
+                out += _SMALL[index] if index < 1 << 14 else _reversed_varint(index)
+            elif kind is _Close:
+                out += _reversed_varint(len(out) - item.start)  # pyright: ignore[reportAttributeAccessIssue]
+                if item.count >= 0:  # pyright: ignore[reportAttributeAccessIssue]
+                    out += _reversed_varint(item.count)  # pyright: ignore[reportAttributeAccessIssue]
+                out += _SMALL[item.tag]  # pyright: ignore[reportAttributeAccessIssue]
+            elif kind is int:
+                out += _reversed_varint(_zigzag(item))  # pyright: ignore[reportArgumentType]
+                out += _SMALL[INT]
+            elif kind is list or kind is tuple:
+                stack.append(_Close(LIST if kind is list else TUPLE, len(out), len(item)))  # pyright: ignore[reportArgumentType]
+                stack.extend(item)  # pyright: ignore[reportArgumentType]
+            elif kind in tags:
+                tag = tags[kind]
+                values = item.__dict__
+                stack.append(_Close(tag, len(out)))
+                stack.extend([values[field] for field in fields[tag - _NODE]])
+            else:
+                raise TypeError(f"cannot encode {kind.__name__}")
+
+        out.reverse()
+
+        header = bytearray(_MAGIC)
+        header += _varint_bytes(VERSION)
+        header += self.fingerprint
+        header += _varint_bytes(len(strings))
+        for string in strings:
+            encoded = string.encode()
+            header += _varint_bytes(len(encoded))
+            header += encoded
+        return bytes(header + out)
+
+    def _header(self, data: Any) -> tuple[list[str], int]:
+        # The string table and the position of the root.
+        if bytes(data[: len(_MAGIC)]) != _MAGIC:
+            raise ValueError("not an IR file")
+        version, position = _varint(data, len(_MAGIC))
+        if version != VERSION:
+            raise ValueError(f"unsupported IR format version {version}")
+        if bytes(data[position : position + 8]) != self.fingerprint:
+            raise ValueError(f"not an {self.name} IR file")
+        count, position = _varint(data, position + 8)
+
+        strings: list[str] = []
+        for _ in range(count):
+            length, position = _varint(data, position)
+            strings.append(str(data[position : position + length], "utf-8"))
+            position += length
+        return strings, position
+
+    def loads(self, data: Any) -> Any:
+        # data is any buffer: bytes, a memoryview or an mmap.
+        strings, position = self._header(data)
+        value, position = self._decode(data, strings, position)
+        if position != len(data):
+            raise ValueError("trailing data after IR")
+        return value
+
+    def _decode(self, data: Any, strings: list[str], position: int) -> tuple[Any, int]:
+        nodes, fields, base = self.nodes, self.fields, self.strings
+        # Each frame is a node or sequence being filled: its tag, its arity and the values so far.
+        frames: list[tuple[int, int, list[Any]]] = []
+
+        while True:
+            tag = data[position]
+            position += 1
+            if tag >= 0x80:
+                tag, position = _varint(data, position - 1)
+
+            if tag >= base:
+                value = strings[tag - base]
+            elif tag >= _NODE:
+                _, position = _varint(data, position)
+                if fields[tag - _NODE]:
+                    frames.append((tag, len(fields[tag - _NODE]), []))
+                    continue
+                value = trusted(nodes[tag - _NODE])
+            elif tag == INT:
+                value, position = _varint(data, position)
+                value = _unzigzag(value)
+            else:
+                count, position = _varint(data, position)
+                _, position = _varint(data, position)
+                if count:
+                    frames.append((tag, count, []))
+                    continue
+                value = [] if tag == LIST else ()
+
+            # Hand the value to the innermost frame, closing every frame it completes.
+            while frames:
+                tag, arity, values = frames[-1]
+                values.append(value)
+                if len(values) < arity:
+                    break
+                frames.pop()
+                if tag >= _NODE:
+                    value = trusted(nodes[tag - _NODE], **dict(zip(fields[tag - _NODE], values, strict=True)))
+                else:
+                    value = values if tag == LIST else tuple(values)
+            else:
+                return value, position
+
+    def view(self, data: Any) -> Any:
+        # The root of a tree, with nodes and sequences as lazy views.
+        strings, position = self._header(data)
+        return _Reader(self, data, strings).value(position)
+
+    @contextmanager
+    def open(self, path: Path) -> Iterator[Any]:
+        # A lazy view of a file, mapped rather than read. Views are only valid inside the block.
+        with path.open("rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield self.view(mapped)
+
+
+class _Reader:
+    __slots__ = ("codec", "data", "strings")
+
+    def __init__(self, codec: Codec, data: Any, strings: list[str]) -> None:
+        self.codec = codec
+        self.data = data
+        self.strings = strings
+
+    def value(self, start: int) -> Any:
+        tag, position = _varint(self.data, start)
+
+        if tag >= self.codec.strings:
+            return self.strings[tag - self.codec.strings]
+        if tag == INT:
+            value, _ = _varint(self.data, position)
+            return _unzigzag(value)
+        if tag >= _NODE:
+            _, position = _varint(self.data, position)
+            return NodeView(self, start, tag, position)
+        count, position = _varint(self.data, position)
+        _, position = _varint(self.data, position)
+        return SequenceView(self, start, count, position)
+
+    def skip(self, position: int) -> int:
+        tag, position = _varint(self.data, position)
+
+        if tag >= self.codec.strings:
+            return position
+        if tag == INT:
+            return _varint(self.data, position)[1]
+        if tag < _NODE:
+            _, position = _varint(self.data, position)
+        size, position = _varint(self.data, position)
+        return position + size
+
+    def offsets(self, position: int, count: int) -> list[int]:
+        # Where each of count consecutive values starting at position begins.
+        offsets: list[int] = []
+        for _ in range(count):
+            offsets.append(position)
+            position = self.skip(position)
+        return offsets
+
+    def materialize(self, start: int) -> Any:
+        return self.codec._decode(self.data, self.strings, start)[0]  # pyright: ignore[reportPrivateUsage]
+
+
+class NodeView:
+    # A node read on demand: each attribute access decodes just that field.
+    __slots__ = ("_offsets", "_position", "_reader", "_start", "_tag")
+
+    def __init__(self, reader: _Reader, start: int, tag: int, position: int) -> None:
+        self._reader = reader
+        self._start = start
+        self._tag = tag
+        self._position = position
+        self._offsets: list[int] | None = None
+
+    @property
+    def cls(self) -> type[BaseModel]:
+        return self._reader.codec.nodes[self._tag - _NODE]
+
+    def __getattr__(self, name: str) -> Any:
+        fields = self._reader.codec.fields[self._tag - _NODE]
+        if name not in fields:
+            if name == "tag":
+                return self.cls.model_fields["tag"].default
+            raise AttributeError(name)
+
+        if self._offsets is None:
+            self._offsets = self._reader.offsets(self._position, len(fields))
+        return self._reader.value(self._offsets[fields.index(name)])
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.cls.__name__})"
+
+    def materialize(self) -> BaseModel:
+        # The node and everything under it, decoded.
+        return self._reader.materialize(self._start)
+
+
+class SequenceView(Sequence[Any]):
+    # A list or tuple read on demand, one item at a time.
+    __slots__ = ("_count", "_offsets", "_position", "_reader", "_start")
+
+    def __init__(self, reader: _Reader, start: int, count: int, position: int) -> None:
+        self._reader = reader
+        self._start = start
+        self._count = count
+        self._position = position
+        self._offsets: list[int] | None = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @overload
+    def __getitem__(self, index: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Any]: ...
+
+    def __getitem__(self, index: int | slice) -> Any:
+        if self._offsets is None:
+            self._offsets = self._reader.offsets(self._position, self._count)
+
+        if isinstance(index, slice):
+            return [self._reader.value(offset) for offset in self._offsets[index]]
+        return self._reader.value(self._offsets[index])
+
+    def __repr__(self) -> str:
+        return f"SequenceView({self._count})"
+
+    def materialize(self) -> list[Any] | tuple[Any, ...]:
+        return self._reader.materialize(self._start)
@@ -0,0 +1,104 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+"""
+A limit on how much work a compilation may do, in node visits and/or seconds.
+
+While a budget is applied, every Traversal counts the nodes it visits and charges them
+to it in batches, and raises BudgetExhausted from the middle of a walk once the budget
+has run out; a pass's own walks do the same through charge(), a batch of CHARGE_EVERY
+visits at a time, so that they too can be cut short. A caller that can do
+without the walk's result catches it and carries on with what it had before; the
+optimizer drops the pass that was cut short and keeps the term it started from, which
+is always a correct program. The budget keeps the names of
+what was cut short or skipped, for its report. Work done at the same time elsewhere runs
+under a share() of the budget, merged back when it is done.
+"""
+
+# How many visits a Traversal counts between charges.
+CHARGE_EVERY = 1024
+
+_active: ContextVar[Budget | None] = ContextVar("budget", default=None)
+
+
+def active_budget() -> Budget | None:
+    return _active.get()
+
+
+def charge(visits: int) -> None:
+    # charges visits made other than by a Traversal to the applied budget, if any
+    budget = _active.get()
+    if budget is not None:
+        budget.charge(visits)
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, seconds: float | None = None, visits: int | None = None) -> None:
+        self.seconds = seconds
+        self.visits = visits
+        self.spent = 0
+        self.start = time.perf_counter()
+        # names of the work that was interrupted, and of the work never started
+        self.cut: list[str] = []
+        self.skipped: list[str] = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @property
+    def used(self) -> float:
+        # the larger fraction of either limit spent so far
+        used = 0.0
+        if self.visits is not None:
+            used = self.spent / self.visits if self.visits else 1.0
+        if self.seconds is not None:
+            used = max(used, self.elapsed / self.seconds if self.seconds else 1.0)
+        return used
+
+    @property
+    def exhausted(self) -> bool:
+        return self.used >= 1.0
+
+    def spend(self, visits: int) -> None:
+        self.spent += visits
+
+    def charge(self, visits: int) -> None:
+        self.spend(visits)
+        if self.exhausted:
+            raise BudgetExhausted(self.report())
+
+    def share(self) -> Budget:
+        # a budget for work done alongside this one, maybe in another process: the same
+        # deadline (perf_counter is system-wide) and the visits left now
+        shared = Budget(self.seconds, None if self.visits is None else max(self.visits - self.spent, 0))
+        shared.start = self.start
+        return shared
+
+    def merge(self, shared: Budget) -> None:
+        # takes back what a shared budget spent
+        self.spend(shared.spent)
+        self.cut += shared.cut
+        self.skipped += shared.skipped
+
+    @contextmanager
+    def applied(self) -> Iterator[Budget]:
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def report(self) -> str:
+        report = f"budget: {self.spent} visit(s) in {self.elapsed:.2f}s"
+        if self.cut:
+            report += f"; cut short: {', '.join(dict.fromkeys(self.cut))}"
+        if self.skipped:
+            report += f"; skipped: {', '.join(dict.fromkeys(self.skipped))}"
+        return report
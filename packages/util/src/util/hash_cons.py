@@ -0,0 +1,232 @@
+from collections.abc import Callable, Mapping
+from threading import RLock
+from typing import Any
+from weakref import KeyedRef, ref
+
+from pydantic import BaseModel
+
+from .trusted import trusted
+
+"""
+Hash-consing of frozen pydantic trees.
+
+A node's key is its class and field values, with each child replaced by its identity,
+so building a key never hashes a subtree. The ways in:
+
+- cons(cls, **fields) is a constructor for passes: when the children are already
+  canonical it returns the one existing node equal to the result, or makes it canonical.
+  A pass that rebuilds an unchanged subtree gets the original object back.
+- rebuild(node, **fields) is cons for a node a pass has walked: given the node and the
+  fields it would rebuild it with, it returns the node itself when every field is the
+  one the node already has (children by identity), without building a key. So a pass
+  that changes nothing returns its input, and `result is term` tells a caller whether
+  anything changed.
+- intern(tree) canonicalizes a tree built some other way, children before parents,
+  with an explicit stack.
+- substitute(tree, replacements) swaps the subtrees given by id for others, rebuilding
+  only the nodes above them.
+
+The table holds its nodes weakly, so an entry lives exactly as long as some tree uses
+it, and it stops admitting new entries once it reaches max_size. Nodes that miss the
+table are still correct, only unshared.
+
+Threads may share a table. Looking a node up takes no lock; adding one does, and a thread
+that finds an equal node was added since it looked gets that one instead, so equal nodes
+are one object whichever threads built them. The hit and miss counts are not locked and
+may be off.
+
+Fields must hold either nodes or plain values (and sequences of them) consistently per
+class, since a child's key is its id.
+"""
+
+
+def _children(value: object) -> list[BaseModel]:
+    match value:
+        case BaseModel():
+            return [value]
+
+        case list() | tuple():
+            return [child for item in value for child in _children(item)]  # pyright: ignore[reportUnknownVariableType]
+
+        case _:
+            return []
+
+
+def children(node: BaseModel) -> list[BaseModel]:
+    # the nodes directly below node, in field order
+    return [child for field in node.__dict__.values() for child in _children(field)]
+
+
+def _key(value: Any) -> object:
+    match value:
+        case BaseModel():
+            return id(value)
+
+        case list() | tuple():
+            return (type(value), *map(_key, value))  # pyright: ignore[reportUnknownArgumentType]
+
+        case _:
+            return value
+
+
+def _same(new: Any, old: Any) -> bool:
+    # new is old, nodes compared by identity and sequences item by item
+    match new:
+        case BaseModel():
+            return new is old
+
+        case list() | tuple():
+            return (
+                isinstance(old, list | tuple)
+                and len(new) == len(old)  # pyright: ignore[reportUnknownArgumentType]
+                and all(item is was or _same(item, was) for item, was in zip(new, old, strict=True))  # pyright: ignore[reportUnknownArgumentType]
+            )
+
+        case _:
+            return new == old
+
+
+def _replace(value: Any, canonical: dict[int, BaseModel]) -> Any:
+    # the value with every node swapped for its canonical node; unchanged values are kept as they are
+    match value:
+        case BaseModel():
+            return canonical[id(value)]
+
+        case list() | tuple():
+            items = [_replace(item, canonical) for item in value]  # pyright: ignore[reportUnknownVariableType]
+            if all(new is old for new, old in zip(items, value, strict=True)):  # pyright: ignore[reportUnknownArgumentType]
+                return value
+            return items if isinstance(value, list) else tuple(items)
+
+        case _:
+            return value
+
+
+class InternTable:
+    def __init__(self, max_size: int = 1 << 20) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._refs: dict[tuple[object, ...], KeyedRef[BaseModel]] = {}
+        # every field of a class in declaration order, with its default for fields a caller may omit
+        self._fields: dict[type[BaseModel], list[tuple[str, Any]]] = {}
+        self._remove = self._remover(ref(self))
+        # reentrant, since a collection while the lock is held may run _remove in the same thread
+        self._lock = RLock()
+
+    @staticmethod
+    def _remover(table: ref[InternTable]) -> Callable[[KeyedRef[BaseModel]], None]:
+        # Drops the entry of a node that has been collected; holds the table weakly.
+        def remove(dead: KeyedRef[BaseModel]) -> None:
+            self = table()
+            if self is not None:
+                with self._lock:
+                    if self._refs.get(dead.key) is dead:  # pyright: ignore[reportUnknownMemberType]
+                        del self._refs[dead.key]  # pyright: ignore[reportUnknownMemberType]
+
+        return remove
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def _lookup(self, key: tuple[object, ...]) -> BaseModel | None:
+        entry = self._refs.get(key)
+        node = entry() if entry is not None else None
+        if node is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return node
+
+    def _add(self, key: tuple[object, ...], node: BaseModel) -> BaseModel:
+        # the canonical node for key: node, or one another thread added since the lookup
+        with self._lock:
+            entry = self._refs.get(key)
+            existing = entry() if entry is not None else None
+            if existing is not None:
+                return existing
+            if len(self._refs) < self.max_size:
+                self._refs[key] = KeyedRef(node, self._remove, key)
+            return node
+
+    def _key(self, cls: type[BaseModel], fields: dict[str, Any]) -> tuple[object, ...]:
+        try:
+            spec = self._fields[cls]
+        except KeyError:
+            spec = self._fields[cls] = [(name, field.default) for name, field in cls.model_fields.items()]
+
+        return (cls, *[_key(fields.get(name, default)) for name, default in spec])
+
+    def cons[T: BaseModel](self, cls: type[T], /, **fields: Any) -> T:
+        key = self._key(cls, fields)
+        node = self._lookup(key)
+        if node is None:
+            node = self._add(key, trusted(cls, **fields))
+        return node  # pyright: ignore[reportReturnType]
+
+    def rebuild[T: BaseModel](self, node: T, /, **fields: Any) -> T:
+        # node when fields change nothing in it, else cons of node with fields replaced
+        current = node.__dict__
+        for name, value in fields.items():
+            was = current[name]
+            if value is not was and not _same(value, was):
+                return self.cons(type(node), **{**current, **fields})
+        return node
+
+    def intern[T: BaseModel](self, node: T) -> T:
+        # canonical node of every node in this tree, by identity; the tree keeps the ids valid
+        canonical: dict[int, BaseModel] = {}
+        stack: list[tuple[BaseModel, bool]] = [(node, False)]
+
+        while stack:
+            item, ready = stack.pop()
+            if id(item) in canonical:
+                continue
+            if not ready:
+                stack.append((item, True))
+                stack.extend((child, False) for child in children(item))
+                continue
+            canonical[id(item)] = self._canonical(item, canonical)
+
+        return canonical[id(node)]  # pyright: ignore[reportReturnType]
+
+    def substitute[T: BaseModel](self, node: T, replacements: Mapping[int, BaseModel]) -> T:
+        # node with each subtree whose id is in replacements swapped for its replacement,
+        # and each node above one rebuilt; the rest of the tree is kept as it is
+        done: dict[int, BaseModel] = dict(replacements)
+        stack: list[tuple[BaseModel, bool]] = [(node, False)]
+
+        while stack:
+            item, ready = stack.pop()
+            if id(item) in done:
+                continue
+            if not ready:
+                stack.append((item, True))
+                stack.extend((child, False) for child in children(item))
+                continue
+            done[id(item)] = self.rebuild(
+                item, **{name: _replace(value, done) for name, value in item.__dict__.items()}
+            )
+
+        return done[id(node)]  # pyright: ignore[reportReturnType]
+
+    def _canonical(self, node: BaseModel, canonical: dict[int, BaseModel]) -> BaseModel:
+        fields = {name: _replace(value, canonical) for name, value in node.__dict__.items()}
+        key = self._key(type(node), fields)
+
+        existing = self._lookup(key)
+        if existing is not None:
+            return existing
+
+        if any(fields[name] is not value for name, value in node.__dict__.items()):
+            node = trusted(type(node), **fields)
+        return self._add(key, node)
+
+
+_table = InternTable()
+
+# A process-wide table, shared by every pass and IR.
+cons = _table.cons
+rebuild = _table.rebuild
+intern = _table.intern
+substitute = _table.substitute
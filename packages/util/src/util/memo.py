@@ -0,0 +1,46 @@
+"""
+Memo tables keyed on object identity.
+
+IR nodes are frozen, so a node's identity stands for its whole subtree, and looking it up
+costs one dict probe instead of the structural hash pydantic computes from every field.
+Each entry keeps its key alive, so an id is never reused while it is in the table. The
+table is bounded; when full, it starts over empty (dropping the oldest entry one at a
+time would make each eviction scan past every earlier deletion).
+
+Threads may share a table without a lock: each dict operation is atomic, and a value
+is a function of its key alone, so a race can only lose an entry or compute one twice,
+never give a wrong result. The hit and miss counts may be off.
+"""
+
+
+class IdentityMemo[K, V]:
+    def __init__(self, max_size: int = 1 << 16) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[int, tuple[K, V]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        # Values must not be None, which is reserved for misses.
+        entry = self._entries.get(id(key))
+        if entry is not None and entry[0] is key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key: K, value: V) -> V:
+        if self.max_size <= 0:
+            return value
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+        self._entries[id(key)] = (key, value)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
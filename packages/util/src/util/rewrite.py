@@ -0,0 +1,152 @@
+from collections.abc import Callable, Iterable, Sequence
+from operator import attrgetter
+from typing import Any
+
+"""
+Rewrite rules declared as data and compiled into one decision tree.
+
+A rule is a tuple of patterns, one for each subject the rules are applied to, and an
+action. A pattern is:
+
+- a Node, which matches a node with that tag whose fields match the given patterns,
+- a Var, which matches anything and binds it to its name (and, given a pattern, matches
+  only what that pattern does); a name bound twice in a rule must bind equal values,
+  and `_` binds nothing, or
+- any other value, which matches a value equal to it.
+
+Rules compiles a list of rules at construction into a decision tree. Each inner node of
+the tree reads one position in the subjects (the tag of a node, an operator, a value)
+and picks its next step by that position's value with one dict lookup, so a position is
+read at most once on the way down, and the time to match does not grow with the number
+of rules, only with how deep their patterns look. Called with the subjects, it runs the
+action of the first rule that matches, with its variables as keyword arguments, and
+returns None if none does.
+"""
+
+type Pattern = Node | Var | int | str
+
+# a position in the subjects: the index of a subject and the fields to read from it in turn
+type Path = tuple[int | str, ...]
+
+
+class Node:
+    def __init__(self, tag: str, **fields: Pattern) -> None:
+        self.tag = tag
+        self.fields = fields
+
+
+class Var:
+    def __init__(self, name: str, pattern: Pattern | None = None) -> None:
+        self.name = name
+        self.pattern = pattern
+
+
+class _Row:
+    # what is left to match of one rule: tests of the value at a path, in the order
+    # they may be read (a node's tag before its fields), and where each variable is
+    def __init__(self, tests: list[tuple[Path, object]], variables: dict[str, list[Path]], action: Callable[..., Any]):
+        self.tests = tests
+        self.variables = variables
+        self.action = action
+
+    def without(self, path: Path) -> _Row:
+        return _Row([test for test in self.tests if test[0] != path], self.variables, self.action)
+
+
+class _Switch:
+    def __init__(self, path: Path, branches: dict[object, _Tree], default: _Tree) -> None:
+        self.index, self.get = _reader(path)
+        self.branches = branches
+        self.default = default
+
+
+class _Leaf:
+    def __init__(self, row: _Row, otherwise: _Tree) -> None:
+        self.action = row.action
+        self.bindings = tuple((name, *_reader(paths[0])) for name, paths in row.variables.items())
+        # pairs of positions a repeated variable requires to be equal
+        self.guards = tuple(
+            (_reader(paths[0]), _reader(path)) for paths in row.variables.values() for path in paths[1:]
+        )
+        # where to go on when a guard fails
+        self.otherwise = otherwise
+
+
+type _Tree = _Switch | _Leaf | None
+
+# a rule's test of a position it does not read
+_UNTESTED = object()
+
+
+def _reader(path: Path) -> tuple[int, Callable[[Any], Any] | None]:
+    index, *fields = path
+    assert isinstance(index, int)
+    return index, attrgetter(".".join(map(str, fields))) if fields else None
+
+
+def _read(subjects: Sequence[Any], index: int, get: Callable[[Any], Any] | None) -> Any:
+    return subjects[index] if get is None else get(subjects[index])
+
+
+def _flatten(pattern: Pattern, path: Path, row: _Row) -> None:
+    match pattern:
+        case Node():
+            row.tests.append(((*path, "tag"), pattern.tag))
+            for field, child in pattern.fields.items():
+                _flatten(child, (*path, field), row)
+
+        case Var():
+            if pattern.name != "_":
+                row.variables.setdefault(pattern.name, []).append(path)
+            if pattern.pattern is not None:
+                _flatten(pattern.pattern, path, row)
+
+        case _:
+            row.tests.append((path, pattern))
+
+
+def _compile(rows: list[_Row]) -> _Tree:
+    if not rows:
+        return None
+
+    first = rows[0]
+    if not first.tests:
+        guarded = any(len(paths) > 1 for paths in first.variables.values())
+        return _Leaf(first, _compile(rows[1:]) if guarded else None)
+
+    # the first position the first rule reads; the rules before it have all been ruled out
+    path = first.tests[0][0]
+    tests = [dict(row.tests).get(path, _UNTESTED) for row in rows]
+    branches = {
+        value: _compile(
+            [row.without(path) for row, test in zip(rows, tests, strict=True) if test is _UNTESTED or test == value]
+        )
+        for value in dict.fromkeys(test for test in tests if test is not _UNTESTED)
+    }
+    return _Switch(path, branches, _compile([row for row, test in zip(rows, tests, strict=True) if test is _UNTESTED]))
+
+
+class Rules[R]:
+    def __init__(self, rules: Iterable[tuple[Sequence[Pattern], Callable[..., R]]]) -> None:
+        rows: list[_Row] = []
+        for patterns, action in rules:
+            row = _Row([], {}, action)
+            for index, pattern in enumerate(patterns):
+                _flatten(pattern, (index,), row)
+            rows.append(row)
+        self.tree = _compile(rows)
+
+    def __call__(self, *subjects: Any) -> R | None:
+        tree = self.tree
+        while tree is not None:
+            if type(tree) is _Switch:
+                value = subjects[tree.index] if tree.get is None else tree.get(subjects[tree.index])
+                tree = tree.branches.get(value, tree.default)
+            else:
+                assert isinstance(tree, _Leaf)
+                if not tree.guards or all(
+                    _read(subjects, *left) == _read(subjects, *right) for left, right in tree.guards
+                ):
+                    return tree.action(**{name: _read(subjects, index, get) for name, index, get in tree.bindings})
+                tree = tree.otherwise
+        return None
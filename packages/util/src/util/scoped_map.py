@@ -0,0 +1,71 @@
+from collections.abc import Iterator, Mapping
+
+"""
+A mutable map for lexical scopes, with an undo log.
+
+A pass that walks into a binder binds its names, walks the binder's scope, then undoes
+back to a mark taken before binding, which restores whatever the names meant outside:
+
+    mark = scope.mark()
+    for name in names:
+        scope.bind(name, value)
+    ...walk the body...
+    scope.undo(mark)
+
+Binding, hiding and lookup are one dict operation each, and undo costs one per change
+it reverts, so entering a scope costs its own size rather than a copy of every name
+around it. One map serves a whole traversal; it is a Mapping, so a handler that only
+looks names up treats it as one.
+"""
+
+
+class _Missing:
+    # What the log records for a key that was not in the map.
+    __slots__ = ()
+
+
+_MISSING = _Missing()
+
+
+class ScopedMap[K, V](Mapping[K, V]):
+    def __init__(self, entries: Mapping[K, V] | None = None) -> None:
+        self._entries: dict[K, V] = dict(entries) if entries is not None else {}
+        # (key, what it was before) for every change, oldest first
+        self._log: list[tuple[K, V | _Missing]] = []
+
+    def __getitem__(self, key: K) -> V:
+        return self._entries[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"ScopedMap({self._entries!r})"
+
+    def mark(self) -> int:
+        return len(self._log)
+
+    def bind(self, key: K, value: V) -> None:
+        self._log.append((key, self._entries.get(key, _MISSING)))
+        self._entries[key] = value
+
+    def hide(self, key: K) -> None:
+        # key is absent until undone, as if unbound in the inner scope
+        if key in self._entries:
+            self._log.append((key, self._entries.pop(key)))
+
+    def undo(self, mark: int) -> None:
+        # every change since mark reverted, newest first
+        log, entries = self._log, self._entries
+        while len(log) > mark:
+            key, previous = log.pop()
+            if previous is _MISSING:
+                del entries[key]
+            else:
+                entries[key] = previous  # pyright: ignore[reportArgumentType]
@@ -1,11 +1,30 @@
 from collections import defaultdict
+from collections.abc import Mapping
+
+from .symbols import SymbolTable, active_symbols
 
 
 class SequentialNameGenerator:
-    def __init__(self) -> None:
-        self._counters: dict[str, int] = defaultdict[str, int](int)
+    def __init__(self, counters: Mapping[str, int] | None = None, symbols: SymbolTable | None = None) -> None:
+        # fresh names are registered in symbols, or else in the table applied when the
+        # generator is made, if any
+        self._counters: dict[str, int] = defaultdict[str, int](int, counters or {})
+        self._symbols = symbols if symbols is not None else active_symbols()
 
     def __call__(self, candidate: str) -> str:
         current: int = self._counters[candidate]
         self._counters[candidate] += 1
-        return f"{candidate}{current}"
+        name = f"{candidate}{current}"
+
+        if self._symbols is None:
+            return name
+
+        # A digit suffix keeps a valid identifier valid and stops it being a keyword, so
+        # when the candidate needs no escaping neither does the fresh name.
+        python = name if self._symbols.encode(candidate) == candidate else None
+        return self._symbols.names[self._symbols.intern(name, python)]
+
+    @property
+    def counters(self) -> Mapping[str, int]:
+        # A snapshot of the generator's state; pass it back to the constructor to resume.
+        return dict(self._counters)
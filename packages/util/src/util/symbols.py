@@ -0,0 +1,109 @@
+import sys
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+
+from .encode import encode
+
+"""
+A table of interned identifiers.
+
+Each identifier gets a small integer id the first time it is seen, and its Python
+spelling (see util.encode) is worked out at most once, however many times a backend
+emits it. Interning also maps every occurrence of a name to one str object, so the
+stages that pass names along share them instead of holding copies.
+
+A table belongs to a compilation: while it is applied, the name generators made register
+their fresh names in it and the to_python backends encode through it, and when the
+compilation is done it goes with everything in it. Ids are never reused, so a table only
+grows, but only for as long as its program. A backend called outside a compilation
+applies a table of its own for the call (see with_symbols), and encoded() outside any
+encodes from scratch.
+
+A table may be shared by threads: a name missing from it is added under a lock, so two
+threads interning at once each get the id of the name they asked for, and a name is
+added once.
+"""
+
+
+class SymbolTable:
+    def __init__(self) -> None:
+        # names[id] is the identifier with that id; ids[name] is its id.
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+        self._python: dict[str, str] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.ids
+
+    def intern(self, name: str, python: str | None = None) -> int:
+        # python is the name's encoding, when the caller already knows it.
+        try:
+            return self.ids[name]
+        except KeyError:
+            pass
+        with self._lock:
+            # another thread may have added it since
+            symbol = self.ids.get(name)
+            if symbol is None:
+                name = sys.intern(name)
+                symbol = len(self.names)
+                # names before ids, so a reader that finds the id finds the name
+                self.names.append(name)
+                self.ids[name] = symbol
+                if python is not None:
+                    self._python[name] = python
+            return symbol
+
+    @contextmanager
+    def applied(self) -> Iterator[SymbolTable]:
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def name(self, symbol: int) -> str:
+        return self.names[symbol]
+
+    def encode(self, name: str) -> str:
+        try:
+            return self._python[name]
+        except KeyError:
+            self.intern(name)
+            python = self._python[name] = sys.intern(encode(name))
+            return python
+
+    def python(self, symbol: int) -> str:
+        return self.encode(self.names[symbol])
+
+
+_active: ContextVar[SymbolTable | None] = ContextVar("symbols", default=None)
+
+
+def active_symbols() -> SymbolTable | None:
+    return _active.get()
+
+
+def encoded(name: str) -> str:
+    # name's Python spelling, through the applied table if there is one
+    table = _active.get()
+    return table.encode(name) if table is not None else encode(name)
+
+
+def with_symbols[**P, R](function: Callable[P, R]) -> Callable[P, R]:
+    # function run with a table applied: the caller's, or else one for the call alone
+    @wraps(function)
+    def run(*args: P.args, **kwargs: P.kwargs) -> R:
+        if _active.get() is not None:
+            return function(*args, **kwargs)
+        with SymbolTable().applied():
+            return function(*args, **kwargs)
+
+    return run
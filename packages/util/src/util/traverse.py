@@ -0,0 +1,101 @@
+from collections.abc import Callable, Generator, Iterable, Mapping
+from inspect import isgeneratorfunction
+from typing import Any
+
+from .budget import CHARGE_EVERY, active_budget
+from .memo import IdentityMemo
+
+"""
+Stack-safe traversals of IR trees.
+
+A pass is a table from node tags to handlers. A handler is called with a node and the
+pass's other arguments (a context, a name generator, ...). It is either:
+
+- a plain function, which returns the node's result directly, for nodes whose result
+  needs nothing from their children (a Reference, an Immediate, ...), or
+- a generator function, which yields a request for each child result it needs and
+  returns the node's result. A request is a tuple of the child and its arguments, or
+  just the child for a pass with no other arguments; the yield evaluates to the child's
+  result, so `value = yield (child, context)` reads like the recursive call it replaces.
+
+Traversal runs a pass with its own stack of suspended handlers, so the depth of a tree
+is limited by memory rather than by the interpreter's recursion limit, and it picks each
+node's handler with one dict lookup on its tag instead of trying class patterns in turn.
+memoized() wraps a table so that a node already in a memo is not walked again. Under an
+applied util.budget.Budget, a traversal charges the nodes it visits to it.
+"""
+
+type Request = Any
+type Visit[R] = Generator[Request, Any, R]
+
+
+class Traversal[R]:
+    def __init__(self, handlers: Mapping[str, Callable[..., R | Visit[R]]]) -> None:
+        # Each tag's handler and whether it is a generator function, decided once here.
+        self.handlers = {tag: (handler, isgeneratorfunction(handler)) for tag, handler in handlers.items()}
+
+    def __call__(self, *request: Any) -> R:
+        handlers = self.handlers
+        suspended: list[Visit[Any]] = []
+        # visits not yet charged to the budget, if there is one
+        budget, count = active_budget(), 0
+
+        while True:
+            if budget is not None:
+                count += 1
+                if count == CHARGE_EVERY:
+                    budget.charge(count)
+                    count = 0
+
+            handler, visits = handlers[request[0].tag]
+
+            if visits:
+                frame = handler(*request)
+                value = None
+            else:
+                value = handler(*request)
+                if not suspended:
+                    if budget is not None:
+                        budget.spend(count)
+                    return value
+                frame = suspended.pop()
+
+            # Resume handlers with results until one asks for a child.
+            while True:
+                try:
+                    request = frame.send(value)
+                except StopIteration as done:
+                    if not suspended:
+                        if budget is not None:
+                            budget.spend(count)
+                        return done.value
+                    value = done.value
+                    frame = suspended.pop()
+                else:
+                    suspended.append(frame)
+                    if type(request) is not tuple:
+                        request = (request,)
+                    break
+
+
+def each(requests: Iterable[Request]) -> Visit[list[Any]]:
+    # The results of several requests, in order: `values = yield from each(...)`.
+    results: list[Any] = []
+    for request in requests:
+        results.append((yield request))
+    return results
+
+
+def memoized[H: Callable[..., Any]](handlers: Mapping[str, H], memo: IdentityMemo[Any, Any]) -> dict[str, H]:
+    # handlers with each generator handler's results kept in memo by node, and a node
+    # already there answered from it without walking its children again.
+    def wrap(handler: Callable[..., Visit[Any]]) -> Callable[..., Visit[Any]]:
+        def visit(node: Any, *arguments: Any) -> Visit[Any]:
+            cached = memo.get(node)
+            if cached is None:
+                cached = memo.put(node, (yield from handler(node, *arguments)))
+            return cached
+
+        return visit
+
+    return {tag: wrap(handler) if isgeneratorfunction(handler) else handler for tag, handler in handlers.items()}  # pyright: ignore[reportReturnType]
@@ -0,0 +1,47 @@
+from typing import Any
+
+from pydantic import BaseModel
+
+"""
+Construction of pydantic nodes without validation.
+
+Validation belongs at the trust boundary, where programs are read. Compiler passes
+only build nodes out of nodes that have already been validated, so they use trusted
+instead of the constructor and skip the validator and the discriminated-union
+dispatch for every child. The result is an ordinary instance: it compares, hashes,
+dumps and matches exactly like a validated one.
+
+Callers are responsible for passing every required field with the type the model
+declares; nothing is checked.
+"""
+
+# Fields with defaults (the tag) and the shared fields-set of each model, by class.
+# A module-level table, because attribute lookups on pydantic model classes are slow.
+_LAYOUTS: dict[type[BaseModel], tuple[dict[str, Any], set[str]]] = {}
+
+_new = object.__new__
+_set_dict = object.__setattr__
+_set_fields_set = BaseModel.__pydantic_fields_set__.__set__  # pyright: ignore[reportAttributeAccessIssue, reportUnknownMemberType, reportUnknownVariableType]
+_set_extra = BaseModel.__pydantic_extra__.__set__  # pyright: ignore[reportAttributeAccessIssue, reportUnknownMemberType, reportUnknownVariableType]
+_set_private = BaseModel.__pydantic_private__.__set__  # pyright: ignore[reportAttributeAccessIssue, reportUnknownMemberType, reportUnknownVariableType]
+
+
+def _layout(cls: type[BaseModel]) -> tuple[dict[str, Any], set[str]]:
+    defaults = {name: field.default for name, field in cls.model_fields.items() if not field.is_required()}
+    fields_set = {name for name, field in cls.model_fields.items() if field.is_required()}
+    _LAYOUTS[cls] = defaults, fields_set
+    return defaults, fields_set
+
+
+def trusted[T: BaseModel](cls: type[T], /, **fields: Any) -> T:
+    try:
+        defaults, fields_set = _LAYOUTS[cls]
+    except KeyError:
+        defaults, fields_set = _layout(cls)
+
+    node = _new(cls)
+    _set_dict(node, "__dict__", defaults | fields)
+    _set_fields_set(node, fields_set)
+    _set_extra(node, None)
+    _set_private(node, None)
+    return node
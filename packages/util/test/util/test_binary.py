@@ -0,0 +1,150 @@
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Literal
+
+import pytest
+from pydantic import BaseModel
+from util.binary import Codec, NodeView, SequenceView
+
+
+class Leaf(BaseModel, frozen=True):
+    tag: Literal["leaf"] = "leaf"
+    value: int
+
+
+class Name(BaseModel, frozen=True):
+    tag: Literal["name"] = "name"
+    name: str
+
+
+class Node(BaseModel, frozen=True):
+    tag: Literal["node"] = "node"
+    children: Sequence[Leaf | Name | Node]
+    bindings: Sequence[tuple[str, Leaf | Name | Node]] = ()
+
+
+class Empty(BaseModel, frozen=True):
+    tag: Literal["empty"] = "empty"
+
+
+CODEC = Codec("toy", [Leaf, Name, Node, Empty])
+
+TREE = Node(
+    children=[Leaf(value=0), Leaf(value=-1), Leaf(value=1 << 100), Leaf(value=-(1 << 70)), Name(name="λx")],
+    bindings=(("x", Node(children=[])), ("y", Name(name="x")), ("x", Node(children=[], bindings=()))),
+)
+
+
+def deep(depth: int) -> Node:
+    tree = Node(children=[Leaf(value=0)])
+    for index in range(depth):
+        tree = Node(children=[tree], bindings=[(f"v{index}", Leaf(value=index))])
+    return tree
+
+
+@pytest.mark.parametrize(
+    "root",
+    [
+        TREE,
+        Leaf(value=200),
+        Empty(),
+        [Empty(), Leaf(value=3)],
+        [Leaf(value=1), ("a", "b")],
+        (),
+        "s",
+        -5,
+    ],
+)
+def test_round_trip(root: object):
+    assert CODEC.loads(CODEC.dumps(root)) == root
+
+
+def test_round_trip_keeps_sequence_types():
+    decoded = CODEC.loads(CODEC.dumps(TREE))
+
+    assert isinstance(decoded.children, list)
+    assert isinstance(decoded.bindings, tuple)
+    assert isinstance(decoded.bindings[0], tuple)
+
+
+def test_round_trip_deep():
+    # too deep to compare with ==, which recurses; re-encoding compares byte for byte
+    data = CODEC.dumps(deep(5000))
+
+    assert CODEC.dumps(CODEC.loads(data)) == data
+
+
+def test_round_trip_many_strings():
+    # past 16384 strings, string tags take three bytes
+    tree = Node(children=[Name(name=f"n{index}") for index in range(20000)])
+
+    assert CODEC.loads(CODEC.dumps(tree)) == tree
+
+
+def test_strings_are_stored_once():
+    data = CODEC.dumps(Node(children=[Name(name="a-long-identifier")] * 100))
+
+    assert data.count(b"a-long-identifier") == 1
+
+
+def test_unsupported_value():
+    with pytest.raises(TypeError, match="float"):
+        CODEC.dumps(Leaf.model_construct(value=1.5))  # pyright: ignore[reportArgumentType]
+
+
+def test_rejects_other_data():
+    data = CODEC.dumps(TREE)
+
+    with pytest.raises(ValueError, match="not an IR file"):
+        CODEC.loads(b"JSON" + data)
+    with pytest.raises(ValueError, match="version"):
+        CODEC.loads(data[:3] + b"\x02" + data[4:])
+    with pytest.raises(ValueError, match="not an toy2 IR file"):
+        Codec("toy2", [Leaf, Name, Node, Empty]).loads(data)
+    with pytest.raises(ValueError, match="trailing"):
+        CODEC.loads(data + b"\x00")
+
+
+def test_view_is_lazy():
+    view = CODEC.view(CODEC.dumps(TREE))
+
+    assert isinstance(view, NodeView)
+    assert view.cls is Node
+    assert view.tag == "node"
+    assert repr(view) == "NodeView(Node)"
+
+    children = view.children
+    assert isinstance(children, SequenceView)
+    assert repr(children) == "SequenceView(5)"
+    assert len(children) == 5
+    assert [child.value for child in children[:4]] == [0, -1, 1 << 100, -(1 << 70)]
+    assert children[-1].name == "λx"
+
+    name, value = view.bindings[1]
+    assert (name, value.name) == ("y", "x")
+
+    with pytest.raises(AttributeError):
+        view.missing  # noqa: B018
+    with pytest.raises(IndexError):
+        view.bindings[0][1].children[0]
+
+
+def test_view_materialize():
+    view = CODEC.view(CODEC.dumps(TREE))
+
+    assert view.materialize() == TREE
+    assert view.bindings.materialize() == TREE.bindings
+    assert view.bindings[2][1].materialize() == TREE.bindings[2][1]
+    assert CODEC.view(CODEC.dumps(7)) == 7
+
+
+def test_open_maps_the_file(tmp_path: Path):
+    path = tmp_path / "tree.irb"
+    path.write_bytes(CODEC.dumps(deep(100)))
+
+    with CODEC.open(path) as view:
+        node = view
+        for _ in range(100):
+            node = node.children[0]
+        assert node.children[0].value == 0
+        assert view.bindings[0][0] == "v99"
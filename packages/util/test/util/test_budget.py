@@ -0,0 +1,120 @@
+from typing import Literal
+
+import pytest
+from pydantic import BaseModel
+from util.budget import CHARGE_EVERY, Budget, BudgetExhausted, active_budget, charge
+from util.traverse import Traversal, Visit
+
+
+class End(BaseModel, frozen=True):
+    tag: Literal["end"] = "end"
+
+
+class Chain(BaseModel, frozen=True):
+    tag: Literal["chain"] = "chain"
+    next: Chain | End
+
+
+def _chain(node: Chain) -> Visit[int]:
+    return (yield node.next) + 1
+
+
+def _end(node: End) -> int:
+    return 0
+
+
+length = Traversal[int]({"chain": _chain, "end": _end})
+
+
+def chain(depth: int) -> Chain | End:
+    node: Chain | End = End()
+    for _ in range(depth):
+        node = Chain(next=node)
+    return node
+
+
+def test_unlimited():
+    budget = Budget()
+    budget.charge(1 << 40)
+
+    assert budget.used == 0.0
+    assert not budget.exhausted
+
+
+def test_visits():
+    budget = Budget(visits=10)
+    budget.charge(4)
+    assert budget.used == 0.4
+
+    budget.spend(6)
+    assert budget.exhausted
+    with pytest.raises(BudgetExhausted, match="budget: 11 visit"):
+        budget.charge(1)
+
+
+def test_seconds():
+    assert not Budget(seconds=1000).exhausted
+    assert Budget(seconds=0).exhausted
+    assert Budget(visits=0).exhausted
+
+
+def test_applied():
+    budget = Budget()
+    assert active_budget() is None
+    with budget.applied():
+        assert active_budget() is budget
+    assert active_budget() is None
+
+
+def test_traversal_charges_visits():
+    budget = Budget(visits=10 * CHARGE_EVERY)
+    with budget.applied():
+        assert length(chain(100)) == 100
+        assert budget.spent == 101
+        assert length(End()) == 0
+        assert budget.spent == 102
+
+        # a walk that runs out part way stops there
+        with pytest.raises(BudgetExhausted):
+            length(chain(20 * CHARGE_EVERY))
+    assert budget.spent == 10 * CHARGE_EVERY + 102
+
+
+def test_traversal_without_budget():
+    assert length(chain(3)) == 3
+
+
+def test_report():
+    budget = Budget()
+    assert budget.report().startswith("budget: 0 visit(s) in ")
+
+    budget.cut.append("fold")
+    budget.skipped.extend(["dce", "branch", "dce"])
+    assert budget.report().endswith("; cut short: fold; skipped: dce, branch")
+
+
+def test_share_and_merge():
+    budget = Budget(seconds=60, visits=100)
+    budget.spend(30)
+
+    shared = budget.share()
+    assert (shared.seconds, shared.visits, shared.start, shared.spent) == (60, 70, budget.start, 0)
+    assert Budget().share().visits is None
+
+    shared.spend(10)
+    shared.cut.append("fold")
+    shared.skipped.append("dce")
+    budget.merge(shared)
+    assert (budget.spent, budget.cut, budget.skipped) == (40, ["fold"], ["dce"])
+
+
+def test_charge_the_applied_budget():
+    # nothing to charge outside a budget
+    charge(5)
+
+    budget = Budget(visits=10)
+    with budget.applied():
+        charge(5)
+        with pytest.raises(BudgetExhausted):
+            charge(5)
+    assert budget.spent == 10
@@ -0,0 +1,188 @@
+import gc
+from collections.abc import Sequence
+from typing import Literal
+from weakref import KeyedRef
+
+from pydantic import BaseModel
+from util.hash_cons import InternTable, intern
+
+
+class Leaf(BaseModel, frozen=True):
+    tag: Literal["leaf"] = "leaf"
+    value: int
+
+
+class Node(BaseModel, frozen=True):
+    tag: Literal["node"] = "node"
+    children: Sequence[Leaf | Node]
+    bindings: Sequence[tuple[str, Leaf | Node]] = ()
+
+
+def test_intern_shares_equal_subtrees():
+    tree = Node(children=[Leaf(value=1), Leaf(value=1), Node(children=[Leaf(value=1)])])
+
+    interned = InternTable().intern(tree)
+
+    assert interned == tree
+    first, second, inner = interned.children
+    assert first is second
+    assert isinstance(inner, Node)
+    assert inner.children[0] is first
+
+
+def test_intern_across_trees():
+    table = InternTable()
+
+    a = table.intern(Node(children=(Leaf(value=1),), bindings=[("x", Leaf(value=2))]))
+    b = table.intern(Node(children=(Leaf(value=1),), bindings=[("x", Leaf(value=2))]))
+
+    assert a is b
+    assert table.hits > 0
+
+
+def test_intern_keeps_canonical_nodes():
+    # a tree with no duplicates is its own canonical form
+    table = InternTable()
+    tree = Node(children=[Leaf(value=1), Leaf(value=2)])
+
+    assert table.intern(tree) is tree
+
+
+def test_intern_distinguishes_sequence_types():
+    table = InternTable()
+
+    a = table.intern(Node(children=[Leaf(value=1)]))
+    b = table.intern(Node(children=(Leaf(value=1),)))
+
+    assert a is not b
+    assert a == Node(children=[Leaf(value=1)])
+    assert b == Node(children=(Leaf(value=1),))
+
+
+def test_intern_table_is_weak():
+    table = InternTable()
+    table.intern(Node(children=[Leaf(value=1)]))
+    gc.collect()
+
+    assert len(table) == 0
+
+
+def test_intern_table_is_bounded():
+    table = InternTable(max_size=1)
+    tree = Node(children=[Leaf(value=1), Leaf(value=2)])
+
+    interned = table.intern(tree)
+
+    assert interned == tree
+    assert len(table) == 1
+
+
+def test_intern_default_table():
+    assert intern(Leaf(value=7)) is intern(Leaf(value=7))
+
+
+def test_cons_returns_existing_node():
+    table = InternTable()
+    leaf = table.intern(Leaf(value=1))
+
+    assert table.cons(Leaf, value=1) is leaf
+    assert table.cons(Node, children=(leaf,)) is table.cons(Node, children=(leaf,))
+    assert table.cons(Node, children=(leaf,)) is not table.cons(Node, children=(leaf,), bindings=[("x", leaf)])
+
+
+def test_cons_matches_intern():
+    # keys do not depend on keyword order or on whether a default was passed
+    table = InternTable()
+    leaf = table.cons(Leaf, value=1)
+
+    built = table.cons(Node, bindings=(), children=[leaf])
+
+    assert table.intern(Node(children=[Leaf(value=1)])) is built
+
+
+def test_cons_bounded():
+    table = InternTable(max_size=0)
+
+    assert table.cons(Leaf, value=1) is not table.cons(Leaf, value=1)
+    assert table.misses == 2
+
+
+def test_rebuild_returns_unchanged_node():
+    table = InternTable()
+    leaf = Leaf(value=1)
+    node = Node(children=[leaf], bindings=[("x", leaf)])
+
+    assert table.rebuild(node, children=(leaf,), bindings=(("x", leaf),)) is node
+    assert table.rebuild(leaf, value=1) is leaf
+    # plain values compare equal rather than identical
+    big = Leaf(value=10**30)
+    assert table.rebuild(big, value=int("1" + "0" * 30)) is big
+    assert table.misses == 0
+
+
+def test_rebuild_changed_node():
+    table = InternTable()
+    leaf, other = Leaf(value=1), Leaf(value=1)
+    node = Node(children=[leaf], bindings=[("x", leaf)])
+
+    # equal children that are not the same object count as a change
+    rebuilt = table.rebuild(node, children=(other,))
+    assert rebuilt is not node
+    assert rebuilt.children == (other,) and rebuilt.bindings is node.bindings
+    assert table.rebuild(node, bindings=()) == Node(children=[leaf])
+    assert table.rebuild(node, bindings=leaf) is not node
+
+
+def test_substitute():
+    table = InternTable()
+    one, two, three = Leaf(value=1), Leaf(value=2), Leaf(value=3)
+    kept = Node(children=[one])
+    tree = Node(children=[kept, Node(children=[two], bindings=[("x", two)])])
+
+    substituted = table.substitute(tree, {id(two): three})
+
+    assert substituted == Node(children=[kept, Node(children=[three], bindings=[("x", three)])])
+    # what is not above a replaced node is kept as it is
+    assert substituted.children[0] is kept
+    assert table.substitute(tree, {id(Leaf(value=4)): three}) is tree
+
+
+def test_dead_entries_are_dropped():
+    table = InternTable()
+    leaf = table.cons(Leaf, value=1)
+
+    assert len(table) == 1
+    del leaf
+    gc.collect()
+    assert len(table) == 0
+
+
+def test_stale_removal_keeps_live_entry():
+    # a late callback for an entry that has since been replaced leaves the new entry alone
+    table = InternTable()
+    leaf = table.cons(Leaf, value=1)
+    key = next(iter(table._refs))  # pyright: ignore[reportPrivateUsage]
+
+    table._remove(KeyedRef(leaf, None, key))  # pyright: ignore[reportPrivateUsage]
+
+    assert len(table) == 1
+
+
+def test_intern_visits_shared_nodes_once():
+    leaf = Leaf(value=1)
+    table = InternTable()
+
+    interned = table.intern(Node(children=[leaf, leaf]))
+
+    assert interned.children[0] is interned.children[1] is leaf
+    assert table.misses == 2
+
+
+def test_cons_after_a_concurrent_add():
+    table = InternTable()
+    first = table.cons(Leaf, value=1)
+
+    # as if another thread added the node between this one's lookup and its add
+    table._lookup = lambda key: None  # pyright: ignore[reportPrivateUsage]
+    assert table.cons(Leaf, value=1) is first
+    assert table.intern(Node(children=[Leaf(value=1)])).children[0] is first
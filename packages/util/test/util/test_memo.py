@@ -0,0 +1,53 @@
+from util.memo import IdentityMemo
+
+
+def test_identity_memo_hit_and_miss():
+    memo = IdentityMemo[object, int]()
+    key = ["a"]
+
+    assert memo.get(key) is None
+    assert memo.put(key, 1) == 1
+    assert memo.get(key) == 1
+    # an equal but distinct key is a different entry
+    assert memo.get(["a"]) is None
+    assert (memo.hits, len(memo)) == (1, 1)
+
+
+def test_identity_memo_keeps_keys_alive():
+    memo = IdentityMemo[object, int]()
+    memo.put(["x"], 1)
+
+    # the list is only referenced by the memo, so its id cannot be reused by another key
+    assert memo.get(["y"]) is None
+
+
+def test_identity_memo_starts_over_when_full():
+    memo = IdentityMemo[object, int](max_size=2)
+    a, b, c = object(), object(), object()
+
+    memo.put(a, 1)
+    memo.put(b, 2)
+    memo.put(c, 3)
+
+    assert (memo.get(a), memo.get(b), memo.get(c)) == (None, None, 3)
+    assert len(memo) == 1
+
+
+def test_identity_memo_disabled():
+    memo = IdentityMemo[object, int](max_size=0)
+    key = object()
+
+    assert memo.put(key, 1) == 1
+    assert memo.get(key) is None
+    assert len(memo) == 0
+
+
+def test_identity_memo_clear():
+    memo = IdentityMemo[object, int]()
+    key = object()
+    memo.put(key, 1)
+    memo.get(key)
+
+    memo.clear()
+
+    assert (len(memo), memo.hits, memo.misses) == (0, 0, 0)
@@ -0,0 +1,88 @@
+from typing import Literal
+
+from pydantic import BaseModel
+from util.rewrite import Node, Rules, Var
+
+
+class Number(BaseModel, frozen=True):
+    tag: Literal["number"] = "number"
+    value: int
+
+
+class Name(BaseModel, frozen=True):
+    tag: Literal["name"] = "name"
+    name: str
+
+
+class Negate(BaseModel, frozen=True):
+    tag: Literal["negate"] = "negate"
+    operand: Number | Name | Negate
+
+
+x, y, _ = Var("x"), Var("y"), Var("_")
+
+
+def test_first_matching_rule_wins():
+    rules = Rules[str](
+        [
+            ((Node("number", value=0),), lambda: "zero"),
+            ((Node("number", value=x),), lambda x: f"number {x}"),
+            ((Node("negate", operand=Node("negate", operand=x)),), lambda x: f"double {x.tag}"),
+            ((x,), lambda x: f"other {x.tag}"),
+        ]
+    )
+
+    assert rules(Number(value=0)) == "zero"
+    assert rules(Number(value=5)) == "number 5"
+    assert rules(Negate(operand=Negate(operand=Name(name="a")))) == "double name"
+    assert rules(Negate(operand=Name(name="a"))) == "other negate"
+
+
+def test_no_rule_matches():
+    rules = Rules[str]([(("+", Node("number", value=x)), lambda x: "sum")])
+
+    assert rules("-", Number(value=1)) is None
+    assert rules("+", Name(name="a")) is None
+    assert Rules[str]([])("+") is None
+
+
+def test_repeated_variable():
+    rules = Rules[str](
+        [
+            ((Node("name", name=x), Node("name", name=x)), lambda x: f"same {x}"),
+            ((Node("name", name=x), y), lambda x, y: f"different {x}"),
+        ]
+    )
+
+    assert rules(Name(name="a"), Name(name="a")) == "same a"
+    # the first rule's guard fails and matching goes on with the rules after it
+    assert rules(Name(name="a"), Name(name="b")) == "different a"
+
+
+def test_variable_with_pattern():
+    rules = Rules[object]([((_, Var("n", Node("number", value=_))), lambda n: n)])
+
+    assert rules(Name(name="a"), Number(value=3)) == Number(value=3)
+    assert rules(Name(name="a"), Name(name="b")) is None
+
+
+class Counted:
+    # a node that counts the reads of its tag
+    def __init__(self, tag: str, value: int) -> None:
+        self._tag = tag
+        self.value = value
+        self.reads = 0
+
+    @property
+    def tag(self) -> str:
+        self.reads += 1
+        return self._tag
+
+
+def test_positions_read_once():
+    rules = Rules[int]([((Node("number", value=value),), lambda value=value: value) for value in range(50)])
+    node = Counted("number", 42)
+
+    # matched in turn, the rules before the one for 42 would each read the tag again
+    assert rules(node) == 42
+    assert node.reads == 1
@@ -0,0 +1,43 @@
+from util.scoped_map import ScopedMap
+
+
+def test_scoped_map_is_a_mapping():
+    scope = ScopedMap({"x": 1})
+
+    assert scope["x"] == 1
+    assert "x" in scope
+    assert "y" not in scope
+    assert scope.get("y") is None
+    assert list(scope) == ["x"]
+    assert len(scope) == 1
+    assert dict(scope) == {"x": 1}
+    assert repr(scope) == "ScopedMap({'x': 1})"
+
+
+def test_scoped_map_does_not_share_its_entries():
+    entries = {"x": 1}
+    scope = ScopedMap(entries)
+    scope.bind("y", 2)
+
+    assert entries == {"x": 1}
+    assert dict(ScopedMap[str, int]()) == {}
+
+
+def test_scoped_map_undo_restores_outer_scopes():
+    scope = ScopedMap({"x": 1})
+
+    outer = scope.mark()
+    scope.bind("x", 2)
+    scope.bind("y", 3)
+    inner = scope.mark()
+    scope.bind("y", 4)
+    scope.hide("x")
+    scope.hide("z")  # absent already: nothing to undo
+    assert dict(scope) == {"y": 4}
+
+    scope.undo(inner)
+    assert dict(scope) == {"x": 2, "y": 3}
+
+    scope.undo(outer)
+    assert dict(scope) == {"x": 1}
+    assert scope.mark() == outer
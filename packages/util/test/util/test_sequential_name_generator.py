@@ -0,0 +1,29 @@
+from util.sequential_name_generator import SequentialNameGenerator
+
+
+def test_sequential_names():
+    fresh = SequentialNameGenerator()
+
+    assert [fresh("x"), fresh("y"), fresh("x")] == ["x0", "y0", "x1"]
+
+
+def test_counters_resume():
+    # a generator rebuilt from a snapshot continues where the original left off
+    fresh = SequentialNameGenerator()
+    fresh("x")
+    fresh("x")
+    fresh("t")
+
+    resumed = SequentialNameGenerator(fresh.counters)
+
+    assert [resumed("x"), resumed("t"), resumed("k")] == ["x2", "t1", "k0"]
+
+
+def test_counters_snapshot():
+    fresh = SequentialNameGenerator()
+    snapshot = fresh.counters
+
+    fresh("x")
+
+    assert snapshot == {}
+    assert fresh.counters == {"x": 1}
@@ -0,0 +1,127 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from util.encode import encode
+from util.sequential_name_generator import SequentialNameGenerator
+from util.symbols import SymbolTable, active_symbols, encoded, with_symbols
+
+
+def test_intern_assigns_stable_ids():
+    symbols = SymbolTable()
+
+    assert [symbols.intern("x"), symbols.intern("y"), symbols.intern("x")] == [0, 1, 0]
+    assert (symbols.name(1), len(symbols)) == ("y", 2)
+    assert "x" in symbols
+    assert "z" not in symbols
+
+
+def test_intern_shares_one_string():
+    symbols = SymbolTable()
+    # two equal strings, built at run time so they are not one constant
+    part = "na"
+    first = f"{part}me"
+    second = f"{part}me"
+    assert first is not second
+
+    symbols.intern(first)
+    symbols.intern(second)
+
+    assert symbols.name(symbols.ids[second]) is symbols.name(symbols.ids[first])
+
+
+def test_encode_matches_util_encode():
+    symbols = SymbolTable()
+
+    for name in ["x", "if", "λ", "a-b", "0", "x0"]:
+        assert symbols.encode(name) == encode(name)
+        assert symbols.python(symbols.ids[name]) == encode(name)
+
+
+def test_encode_is_computed_once(monkeypatch):
+    symbols = SymbolTable()
+    calls: list[str] = []
+
+    def counting(name: str) -> str:
+        calls.append(name)
+        return encode(name)
+
+    monkeypatch.setattr("util.symbols.encode", counting)
+
+    for _ in range(3):
+        symbols.encode("a-b")
+
+    assert calls == ["a-b"]
+
+
+def test_generator_registers_fresh_names():
+    symbols = SymbolTable()
+    fresh = SequentialNameGenerator(symbols=symbols)
+
+    names = [fresh("x"), fresh("if"), fresh("a-b")]
+
+    assert names == ["x0", "if0", "a-b0"]
+    assert all(name in symbols for name in names)
+    # fresh names from a plain candidate are encoded without calling util.encode
+    assert [symbols.encode(name) for name in names] == [encode(name) for name in names]
+
+
+def test_generator_without_symbols():
+    # outside a compilation there is no table to register in
+    fresh = SequentialNameGenerator()
+
+    assert fresh("x") == "x0"
+    assert active_symbols() is None
+
+
+def test_applied_table():
+    symbols = SymbolTable()
+
+    with symbols.applied():
+        fresh = SequentialNameGenerator()
+        assert active_symbols() is symbols
+        assert encoded("a-b") == encode("a-b")
+    fresh("x")
+
+    # the generator keeps the table it was made under, and the table goes with the scope
+    assert active_symbols() is None
+    assert "x0" in symbols
+    assert "a-b" in symbols
+    assert encoded("if") == encode("if")
+
+
+def test_with_symbols():
+    tables: list[SymbolTable | None] = []
+
+    @with_symbols
+    def compile() -> None:
+        tables.append(active_symbols())
+
+    # a table for each call, or the caller's
+    compile()
+    compile()
+    symbols = SymbolTable()
+    with symbols.applied():
+        compile()
+
+    assert tables[0] is not None and tables[1] is not None
+    assert tables[0] is not tables[1]
+    assert tables[2] is symbols
+    assert active_symbols() is None
+
+
+def test_intern_from_threads():
+    # only a free-threaded build runs the threads at once; with the GIL a switch between
+    # them is as close as this gets
+    symbols = SymbolTable()
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            ids = list(pool.map(lambda worker: [symbols.intern(f"n{i}") for i in range(2000)], range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    # every thread got the same id for a name, and that id names it
+    assert all(found == ids[0] for found in ids)
+    assert [symbols.name(symbol) for symbol in ids[0]] == [f"n{i}" for i in range(2000)]
+    assert len(symbols) == 2000
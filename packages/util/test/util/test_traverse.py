@@ -0,0 +1,93 @@
+from typing import Literal
+
+import pytest
+from pydantic import BaseModel
+from util.memo import IdentityMemo
+from util.traverse import Traversal, Visit, each, memoized
+
+
+class Leaf(BaseModel, frozen=True):
+    tag: Literal["leaf"] = "leaf"
+    value: int
+
+
+class Node(BaseModel, frozen=True):
+    tag: Literal["node"] = "node"
+    children: tuple[Leaf | Node, ...]
+
+
+def _leaf(leaf: Leaf, scale: int) -> int:
+    return leaf.value * scale
+
+
+def _node(node: Node, scale: int) -> Visit[int]:
+    values = yield from each((child, scale) for child in node.children)
+    return sum(values)
+
+
+total = Traversal[int]({"leaf": _leaf, "node": _node})
+
+
+def chain(depth: int) -> Node:
+    tree = Node(children=(Leaf(value=1),))
+    for _ in range(depth):
+        tree = Node(children=(Leaf(value=1), tree))
+    return tree
+
+
+def test_plain_handler_at_the_root():
+    assert total(Leaf(value=3), 2) == 6
+
+
+def test_generator_handlers():
+    tree = Node(children=(Leaf(value=1), Node(children=(Leaf(value=2), Leaf(value=3))), Node(children=())))
+
+    assert total(tree, 10) == 60
+
+
+def test_bare_requests():
+    # a pass with no other arguments can yield the child itself
+    def node(node: Node) -> Visit[int]:
+        return 1 + sum((yield from each(node.children)))
+
+    count = Traversal[int]({"leaf": lambda _: 1, "node": node})
+
+    assert count(Node(children=(Leaf(value=0), Node(children=(Leaf(value=0),))))) == 4
+
+
+def test_deeper_than_the_recursion_limit():
+    assert total(chain(100_000), 1) == 100_001
+
+
+def test_exceptions_propagate():
+    def leaf(leaf: Leaf, scale: int) -> int:
+        raise ValueError(leaf.value)
+
+    failing = Traversal[int]({"leaf": leaf, "node": _node})
+
+    with pytest.raises(ValueError, match="7"):
+        failing(Node(children=(Node(children=(Leaf(value=7),)),)), 1)
+
+
+def test_unknown_tag():
+    with pytest.raises(KeyError, match="node"):
+        Traversal[int]({"leaf": _leaf})(Node(children=()), 1)
+
+
+def test_memoized_visits_shared_nodes_once():
+    visits: list[Node] = []
+
+    def node(node: Node, scale: int) -> Visit[int]:
+        visits.append(node)
+        return (yield from _node(node, scale))
+
+    memo = IdentityMemo[Node, int]()
+    shared = Node(children=(Leaf(value=2),))
+    tree = Node(children=(shared, shared, Node(children=(shared,))))
+    counting = Traversal[int](memoized({"leaf": _leaf, "node": node}, memo))
+
+    assert counting(tree, 1) == 6
+    assert len(visits) == 3
+    assert counting(tree, 1) == 6
+    assert len(visits) == 3
+    assert memo.get(shared) == 2
@@ -0,0 +1,54 @@
+from collections.abc import Sequence
+from typing import Literal
+
+from pydantic import BaseModel
+from util.trusted import trusted
+
+
+class Leaf(BaseModel, frozen=True):
+    tag: Literal["leaf"] = "leaf"
+    value: int
+
+
+class Pair(BaseModel, frozen=True):
+    tag: Literal["pair"] = "pair"
+    left: Leaf | Pair
+    right: Leaf | Pair
+    names: Sequence[str]
+
+
+def test_trusted_equals_validated():
+    expected = Pair(left=Leaf(value=1), right=Leaf(value=2), names=["a"])
+
+    actual = trusted(Pair, left=trusted(Leaf, value=1), right=trusted(Leaf, value=2), names=["a"])
+
+    assert actual == expected
+    assert hash(trusted(Leaf, value=1)) == hash(Leaf(value=1))
+    assert actual.model_dump() == expected.model_dump()
+    assert repr(actual) == repr(expected)
+
+
+def test_trusted_fills_defaults():
+    assert trusted(Leaf, value=1).tag == "leaf"
+
+
+def test_trusted_matches():
+    match trusted(Pair, left=trusted(Leaf, value=1), right=trusted(Leaf, value=2), names=()):
+        case Pair(left=Leaf(value=1), right=Leaf(value=right)):
+            assert right == 2
+
+        case _:  # pragma: no cover
+            raise AssertionError("no match")
+
+
+def test_trusted_skips_validation():
+    # values are stored as given, so callers must pass what the model declares
+    assert trusted(Leaf, value="one").value == "one"  # pyright: ignore[reportArgumentType]
+    assert trusted(Pair, left=Leaf(value=1), right=Leaf(value=2), names=("a",)).names == ("a",)
+
+
+def test_trusted_copy():
+    node = trusted(Leaf, value=1)
+
+    assert node.model_copy(update={"value": 2}) == Leaf(value=2)
+    assert node == Leaf(value=1)